@@ -0,0 +1,313 @@
+"""
+Receipt Parser Benchmark & Accuracy Regression Suite
+Runs the intelligent receipt parser over the ground-truth receipt corpus
+(test_ground_truth.py + tests/test_parser_lorem.py) fully offline - no OCR
+service, no network - and reports:
+
+  - per-field precision / recall (items, total, subtotal, date, merchant)
+  - parse throughput (receipts/s), cold and warm
+  - per-extractor cost of the parse pipeline (receipt_pipeline.py)
+  - per-function time breakdown (cProfile)
+
+Results are written as JSON. Pass --baseline with a previous results file
+to fail (exit code 1) on an accuracy or throughput regression.
+
+Usage:
+    python benchmark_receipt_parser.py
+    python benchmark_receipt_parser.py --iterations 50 --output bench.json
+    python benchmark_receipt_parser.py --baseline bench_main.json
+"""
+
+import argparse
+import cProfile
+import json
+import logging
+import os
+import pstats
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OCR_SERVICE_DIR = os.path.join(ROOT, 'ocr-service')
+sys.path.insert(0, OCR_SERVICE_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+sys.path.insert(0, ROOT)
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+from receipt_templates import ReceiptTemplateStore
+
+FIELDS = ('total', 'subtotal', 'date', 'merchant_name')
+
+# Allowed drops before --baseline reports a regression
+ACCURACY_TOLERANCE = 0.01
+THROUGHPUT_TOLERANCE = 0.20
+
+
+def load_corpus() -> List[Dict[str, Any]]:
+    """Every receipt text with known expected output."""
+    from test_ground_truth import RECEIPT_GROUND_TRUTH
+    from test_parser_lorem import LOREM_RECEIPT_TEXT, EXPECTED_ITEMS
+
+    corpus = [
+        {'name': case['name'], 'text': case['text'], 'expected': case['expected']}
+        for case in RECEIPT_GROUND_TRUTH
+    ]
+    corpus.append({
+        'name': 'Lorem Shop (numbered codes)',
+        'text': LOREM_RECEIPT_TEXT,
+        'expected': {
+            'merchant_name': 'LOREM SHOP',
+            'total': 34.50,
+            'items': [{'name': name} for name in EXPECTED_ITEMS],
+        },
+    })
+    return corpus
+
+
+def make_parser() -> IntelligentReceiptParser:
+    """Parser with private caches so runs do not leak state into each other."""
+    return IntelligentReceiptParser(
+        normalization_cache=NormalizationCache(),
+        template_store=ReceiptTemplateStore(),
+    )
+
+
+# ---------------------------------------------------------------------- scoring
+
+def _items_match(expected: Dict[str, Any], predicted: Dict[str, Any]) -> bool:
+    """Same rule as test_ground_truth.py: name containment, price within a cent."""
+    if expected['name'].lower() not in (predicted.get('name') or '').lower():
+        return False
+    if 'price' in expected:
+        return abs((predicted.get('price') or 0.0) - expected['price']) <= 0.01
+    return True
+
+
+def _field_correct(field: str, expected: Any, predicted: Any) -> bool:
+    if field in ('total', 'subtotal'):
+        return predicted is not None and abs(predicted - expected) <= 0.01
+    if field == 'merchant_name':
+        return (predicted or '').lower() == expected.lower()
+    return predicted == expected
+
+
+def score_receipt(expected: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """True positives / predicted / expected counts for each field."""
+    counts = {}
+
+    # Items: greedy one-to-one matching
+    predicted_items = list(result.get('items') or [])
+    expected_items = expected.get('items') or []
+    unmatched = list(range(len(predicted_items)))
+    matched = 0
+    for exp_item in expected_items:
+        for position, index in enumerate(unmatched):
+            if _items_match(exp_item, predicted_items[index]):
+                matched += 1
+                unmatched.pop(position)
+                break
+    counts['items'] = {'tp': matched, 'predicted': len(predicted_items), 'expected': len(expected_items)}
+
+    for field in FIELDS:
+        predicted = result.get(field)
+        predicted = predicted if predicted not in (None, 0.0, '') else None
+        exp_value = expected.get(field)
+        counts[field] = {
+            'tp': int(exp_value is not None and _field_correct(field, exp_value, predicted)),
+            'predicted': int(predicted is not None),
+            'expected': int(exp_value is not None),
+        }
+    return counts
+
+
+def summarize(counts: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for field, c in counts.items():
+        precision = c['tp'] / c['predicted'] if c['predicted'] else 0.0
+        recall = c['tp'] / c['expected'] if c['expected'] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        summary[field] = {
+            **c,
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'f1': round(f1, 4),
+        }
+    return summary
+
+
+def evaluate_accuracy(corpus: List[Dict[str, Any]], parse) -> Dict[str, Any]:
+    """Score ``parse(text) -> result`` over the corpus."""
+    totals: Dict[str, Dict[str, int]] = {}
+    per_receipt = []
+    for case in corpus:
+        counts = score_receipt(case['expected'], parse(case['text']))
+        per_receipt.append({'name': case['name'], **summarize(counts)})
+        for field, c in counts.items():
+            agg = totals.setdefault(field, {'tp': 0, 'predicted': 0, 'expected': 0})
+            for key in agg:
+                agg[key] += c[key]
+    return {'fields': summarize(totals), 'receipts': per_receipt}
+
+
+# ---------------------------------------------------------------------- timing
+
+def measure_throughput(corpus: List[Dict[str, Any]], iterations: int) -> Dict[str, float]:
+    """Cold (fresh caches) and warm parse throughput in receipts per second."""
+    parser = make_parser()
+    texts = [case['text'] for case in corpus]
+
+    start = time.perf_counter()
+    for text in texts:
+        parser.parse_receipt(text)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parser.parse_receipt(text)
+    warm = time.perf_counter() - start
+
+    parsed = len(texts) * iterations
+    return {
+        'cold_receipts_per_s': round(len(texts) / cold, 2) if cold else 0.0,
+        'warm_receipts_per_s': round(parsed / warm, 2) if warm else 0.0,
+        'warm_ms_per_receipt': round(1000 * warm / parsed, 4) if parsed else 0.0,
+        'iterations': iterations,
+        'cache': parser.cache_stats(),
+        'templates': {k: v for k, v in parser.template_stats().items() if k != 'templates'},
+        'extractors': parser.extractor_stats(),
+    }
+
+
+def profile_functions(corpus: List[Dict[str, Any]], iterations: int, top: int = 25) -> List[Dict[str, Any]]:
+    """Per-function time breakdown for code under ocr-service/ (fresh parser, cold caches)."""
+    parser = make_parser()
+    texts = [case['text'] for case in corpus]
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(iterations):
+        for text in texts:
+            parser.parse_receipt(text)
+    profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, func), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        if not os.path.abspath(filename).startswith(OCR_SERVICE_DIR):
+            continue
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({func})",
+            'calls': nc,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda r: r['tottime_ms'], reverse=True)
+    return rows[:top]
+
+
+# ---------------------------------------------------------------------- regression check
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Human-readable regressions relative to a previous results file."""
+    regressions = []
+    for field, current in results['accuracy']['fields'].items():
+        previous = baseline.get('accuracy', {}).get('fields', {}).get(field)
+        if not previous:
+            continue
+        for metric in ('precision', 'recall'):
+            if current[metric] < previous[metric] - ACCURACY_TOLERANCE:
+                regressions.append(f"{field} {metric}: {previous[metric]:.3f} -> {current[metric]:.3f}")
+
+    previous_rate = baseline.get('throughput', {}).get('warm_receipts_per_s')
+    current_rate = results['throughput']['warm_receipts_per_s']
+    if previous_rate and current_rate < previous_rate * (1 - THROUGHPUT_TOLERANCE):
+        regressions.append(f"warm throughput: {previous_rate:.1f} -> {current_rate:.1f} receipts/s")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(iterations: int = 20, profile: bool = True) -> Dict[str, Any]:
+    corpus = load_corpus()
+    parser = make_parser()
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'corpus_size': len(corpus),
+        'accuracy': evaluate_accuracy(corpus, parser.parse_receipt),
+        'throughput': measure_throughput(corpus, iterations),
+    }
+    if profile:
+        results['profile'] = profile_functions(corpus, max(1, iterations // 4))
+    return results
+
+
+def print_report(results: Dict[str, Any]):
+    print("=" * 72)
+    print(f"Receipt parser benchmark - {results['corpus_size']} receipts")
+    print("=" * 72)
+    print(f"{'field':<15}{'precision':>10}{'recall':>10}{'f1':>10}{'tp/pred/exp':>16}")
+    for field, m in results['accuracy']['fields'].items():
+        counts = f"{m['tp']}/{m['predicted']}/{m['expected']}"
+        print(f"{field:<15}{m['precision']:>10.3f}{m['recall']:>10.3f}{m['f1']:>10.3f}{counts:>16}")
+
+    t = results['throughput']
+    print("-" * 72)
+    print(f"Throughput: cold {t['cold_receipts_per_s']:.1f} receipts/s, "
+          f"warm {t['warm_receipts_per_s']:.1f} receipts/s ({t['warm_ms_per_receipt']:.3f} ms/receipt)")
+    print(f"Normalization cache hit rate: {t['cache']['hit_rate']:.1%}")
+    print(f"{'extractor':<20}{'calls':>8}{'skipped':>9}{'mean ms':>10}{'total ms':>10}")
+    for name, e in t['extractors'].items():
+        print(f"{name:<20}{e['calls']:>8}{e['skipped']:>9}{e['mean_ms']:>10.3f}{e['total_ms']:>10.1f}")
+
+    if results.get('profile'):
+        print("-" * 72)
+        print(f"{'function':<55}{'calls':>8}{'self ms':>9}")
+        for row in results['profile'][:15]:
+            print(f"{row['function'][:55]:<55}{row['calls']:>8}{row['tottime_ms']:>9.1f}")
+    print("=" * 72)
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Offline receipt parser benchmark")
+    arg_parser.add_argument('--iterations', type=int, default=20, help="warm passes over the corpus")
+    arg_parser.add_argument('--output', default='parser_benchmark.json', help="where to write JSON results")
+    arg_parser.add_argument('--baseline', help="previous results JSON to check for regressions")
+    arg_parser.add_argument('--no-profile', action='store_true', help="skip the cProfile breakdown")
+    args = arg_parser.parse_args()
+
+    # Parser logging is extremely chatty; it would dominate the timings
+    logging.disable(logging.CRITICAL)
+
+    results = run_benchmark(args.iterations, profile=not args.no_profile)
+    print_report(results)
+
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as handle:
+            regressions = compare_to_baseline(results, json.load(handle))
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print("✅ No regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,24 @@
+import startup_profile  # first, so boot phases are timed from here
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from typing import Optional
+from pydantic import BaseModel
+from typing import Dict, Optional
 import base64
 import io
 import os
 import tempfile
-import requests
-from PIL import Image
-import fitz  # PyMuPDF for PDF handling
+import threading
 import re
 import json
 from enhanced_ocr_service import EnhancedOCRService
 from dotenv import load_dotenv
 
+# Heavy dependencies load on the first request that needs them
+Image = startup_profile.lazy_import('PIL.Image')
+fitz = startup_profile.lazy_import('fitz')  # PyMuPDF for PDF handling
+
 # Load environment variables from .env file
 load_dotenv()
+startup_profile.mark('imports')
 
 try:
     ocr_service = EnhancedOCRService()
@@ -21,9 +26,22 @@ except Exception as e:
     print(f"Error initializing EnhancedOCRService: {e}")
     import sys
     sys.exit(1)
+startup_profile.mark('service')
 
 app = FastAPI()
 
+@app.on_event("startup")
+def warm_up():
+    """Warm the parser before taking traffic and report where boot time went"""
+    if os.getenv("OCR_WARMUP", "1") == "1":
+        ocr_service.warm_up(preload_engines=os.getenv("OCR_WARMUP_PRELOAD", "0") == "1")
+        startup_profile.mark('warm_up')
+    startup_profile.log_startup_report()
+    
+    # Full `python -X importtime` breakdown, in the background (re-imports app in a child process)
+    if os.getenv("OCR_IMPORTTIME_REPORT", "0") == "1":
+        threading.Thread(target=startup_profile.log_importtime_summary, args=("app",), daemon=True).start()
+
 # Configure CORS
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -123,8 +141,9 @@ async def process_ocr(file: UploadFile = File(...), lang: str = "en"):
             # Get AI-extracted items if available
             ai_items = ocr_result.get('ai_items', [])
             
-            # Parse receipt text with advanced parsing (will use AI items if available)
-            parsed_data = ocr_service.advanced_parse_receipt_text(
+            # Parse receipt text with advanced parsing (will use AI items if available);
+            # reuse the parse made while checking a low-confidence OCR result
+            parsed_data = ocr_result.pop('parsed_data', None) or ocr_service.advanced_parse_receipt_text(
                 ocr_result.get('text', ''),
                 ai_items=ai_items
             )
@@ -175,10 +194,47 @@ async def process_ocr(file: UploadFile = File(...), lang: str = "en"):
             "ocr_engine": "error"
         }
 
+class ReviewSessionRequest(BaseModel):
+    text: str
+    locale: Optional[str] = None
+
+
+class ReviewSessionUpdate(BaseModel):
+    text: Optional[str] = None
+    # Line number (0-based, blank lines count) -> corrected line text
+    lineEdits: Optional[Dict[int, str]] = None
+
+
+@app.post("/receipt/session")
+async def start_review_session(request: ReviewSessionRequest):
+    """Parse receipt text for the review screen; returns a session id for incremental edits"""
+    return ocr_service.start_review_session(request.text, locale=request.locale)
+
+@app.put("/receipt/session/{session_id}")
+async def update_review_session(session_id: str, request: ReviewSessionUpdate):
+    """Re-parse after user edits; only the changed lines are parsed again"""
+    try:
+        result = ocr_service.update_review_session(session_id, text=request.text, line_edits=request.lineEdits)
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Review session expired; start a new one with the current text")
+    return result
+
+@app.delete("/receipt/session/{session_id}")
+async def end_review_session(session_id: str):
+    """Drop a review session once the receipt is saved"""
+    return {"deleted": ocr_service.review_sessions.discard(session_id)}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "OCR Service"}
+    return {
+        "status": "healthy",
+        "service": "OCR Service",
+        "parserCache": ocr_service.intelligent_parser.cache_stats(),
+        "startup": startup_profile.startup_report()
+    }
 
 @app.get("/")
 async def root():
@@ -187,6 +243,8 @@ async def root():
         "message": "Enhanced OCR Service is running",
         "endpoints": {
             "/ocr": "POST - Process uploaded image/PDF with enhanced OCR detection",
+            "/receipt/session": "POST - Parse receipt text for review (returns sessionId)",
+            "/receipt/session/{session_id}": "PUT - Incremental re-parse after edits / DELETE - end session",
             "/test": "GET - Test OCR with sample receipt",
             "/health": "GET - Health check"
         },
@@ -247,4 +305,4 @@ if __name__ == "__main__":
     # to spawn a separate reload process correctly. Passing the app object here
     # triggers a warning. Use the import string 'app:app' so running
     # `python app.py` works without the reload warning.
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=os.getenv("OCR_RELOAD", "1") == "1")
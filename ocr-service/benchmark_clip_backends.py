@@ -0,0 +1,153 @@
+"""
+CLIP Backend Comparison
+Classifies the sample food photos in this directory (test_*.jpg) with the
+PyTorch image tower, the ONNX Runtime fp32 export and the int8-quantized
+export, and reports per backend:
+
+  - image-encoder latency (median / p90 over --iterations runs, batch of 1)
+  - feature cosine similarity to PyTorch
+  - top-1 agreement and top-5 overlap with PyTorch
+  - top-1 hits against the label in the file name (test_pizza.jpg -> pizza)
+
+The text-prompt embeddings are shared by all backends, so differences come
+from the image encoder alone.
+
+Usage:
+    python benchmark_clip_backends.py
+    python benchmark_clip_backends.py --iterations 20 --threads 4 --output clip_backends.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+# Baseline service on PyTorch, called directly rather than through the batcher
+os.environ['FOOD_CLIP_BACKEND'] = 'torch'
+os.environ['FOOD_CLIP_BATCHING'] = '0'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import torch
+from PIL import Image
+
+from clip_onnx_backend import load_vision_encoder
+from food_classification_service import food_classifier
+
+
+def load_samples(pattern: str) -> Dict[str, Any]:
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(HERE, pattern))):
+        label = os.path.splitext(os.path.basename(path))[0].replace('test_', '', 1)
+        samples[label] = Image.open(path).convert('RGB')
+    return samples
+
+
+def run_backend(encoder, samples: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    """Time and classify every sample with ``encoder`` (None = PyTorch)."""
+    food_classifier.onnx_encoder = encoder
+    timings: List[float] = []
+    per_image: Dict[str, Any] = {}
+    for label, image in samples.items():
+        food_classifier._score_images([image])  # warm-up
+        for _ in range(iterations):
+            start = time.perf_counter()
+            food_classifier._score_images([image])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        pixel_values = food_classifier.clip_processor(images=[image], return_tensors='pt')['pixel_values']
+        if encoder is None:
+            with torch.no_grad():
+                features = food_classifier.clip_model.get_image_features(pixel_values=pixel_values)
+        else:
+            features = torch.from_numpy(encoder.encode(pixel_values.numpy()))
+        predictions = food_classifier._predict_with_clip_batch([image], top_k=5)[0]
+        per_image[label] = {
+            'features': torch.nn.functional.normalize(features.float(), dim=-1)[0],
+            'top5': [candidate['canonical_name'] for candidate in predictions],
+            'hit': bool(predictions) and (
+                label in predictions[0]['canonical_name'] or label in predictions[0]['matched_synonym']
+            ),
+        }
+
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p90_ms': round(timings[int(len(timings) * 0.9) - 1], 2),
+        'images': per_image,
+    }
+
+
+def compare(reference: Dict[str, Any], candidate: Dict[str, Any]) -> Dict[str, Any]:
+    cosines, top1, overlap = [], 0, []
+    for label, ref in reference['images'].items():
+        other = candidate['images'][label]
+        cosines.append(float(ref['features'] @ other['features']))
+        top1 += bool(ref['top5']) and bool(other['top5']) and ref['top5'][0] == other['top5'][0]
+        overlap.append(len(set(ref['top5']) & set(other['top5'])) / max(len(ref['top5']), 1))
+    count = max(len(reference['images']), 1)
+    return {
+        'min_feature_cosine': round(min(cosines), 5) if cosines else None,
+        'top1_agreement': round(top1 / count, 3),
+        'top5_overlap': round(sum(overlap) / count, 3),
+    }
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Compare CLIP image backends on the sample food photos")
+    arg_parser.add_argument('--iterations', type=int, default=10, help="timed runs per image and backend")
+    arg_parser.add_argument('--threads', type=int, default=0, help="ONNX Runtime intra-op threads (0 = auto)")
+    arg_parser.add_argument('--images', default='test_*.jpg', help="sample image glob, relative to ocr-service/")
+    arg_parser.add_argument('--onnx-dir', default=os.path.expanduser(
+        os.getenv('FOOD_CLIP_ONNX_DIR', '~/.cache/ocr-service/clip')))
+    arg_parser.add_argument('--output', help="write JSON results here")
+    args = arg_parser.parse_args()
+
+    if food_classifier.clip_model is None:
+        print("❌ CLIP model failed to load")
+        return 1
+    samples = load_samples(args.images)
+    if not samples:
+        print(f"❌ No sample images match {args.images}")
+        return 1
+
+    model_name = os.getenv('FOOD_CLIP_MODEL', 'openai/clip-vit-base-patch32')
+    backends = {'torch': None}
+    for name, quantize in (('onnx-fp32', False), ('onnx-int8', True)):
+        backends[name] = load_vision_encoder(food_classifier.clip_model, model_name, args.onnx_dir,
+                                             quantize=quantize, intra_op_threads=args.threads)
+
+    results = {name: run_backend(encoder, samples, args.iterations) for name, encoder in backends.items()}
+    reference = results['torch']
+
+    print(f"\n{'backend':<10} {'median':>9} {'p90':>9} {'speedup':>8} {'cosine':>8} {'top1':>6} {'top5':>6} {'hits':>6}")
+    report = {}
+    for name, result in results.items():
+        agreement = compare(reference, result)
+        hits = sum(image['hit'] for image in result['images'].values())
+        report[name] = {
+            'median_ms': result['median_ms'],
+            'p90_ms': result['p90_ms'],
+            'speedup': round(reference['median_ms'] / result['median_ms'], 2),
+            'label_hits': hits,
+            'predictions': {label: image['top5'] for label, image in result['images'].items()},
+            **agreement,
+        }
+        print(f"{name:<10} {result['median_ms']:>7.1f}ms {result['p90_ms']:>7.1f}ms "
+              f"{report[name]['speedup']:>7.2f}x {agreement['min_feature_cosine']:>8.4f} "
+              f"{agreement['top1_agreement']:>6.2f} {agreement['top5_overlap']:>6.2f} {hits:>3}/{len(samples)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump({'model': model_name, 'images': list(samples), 'backends': report}, handle, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+HuggingFace Food Classifier Benchmark
+Classifies the sample food photos in this directory (test_*.jpg) with the
+nateraw/food ViT in each CPU precision (fp32, bf16, int8 dynamic
+quantization) and reports per precision:
+
+  - throughput in images/s, one image per forward pass and batched
+  - top-1 / top-5 hits against the label in the file name
+    (test_pizza.jpg -> pizza, test_burger.jpg -> hamburger)
+  - top-1 agreement with fp32
+
+Usage:
+    python benchmark_hf_food_classifier.py
+    python benchmark_hf_food_classifier.py --precisions fp32,int8 --threads 4 --iterations 20
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+# Benchmarked instances call the model directly; no batcher threads
+os.environ['FOOD_HF_BATCHING'] = '0'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from PIL import Image
+
+from huggingface_food_classifier import PRECISIONS, HuggingFaceFoodClassifier
+
+
+def load_samples(pattern: str) -> Dict[str, Any]:
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(HERE, pattern))):
+        label = os.path.splitext(os.path.basename(path))[0].replace('test_', '', 1)
+        samples[label] = Image.open(path).convert('RGB')
+    return samples
+
+
+def matches(label: str, prediction: str) -> bool:
+    """File label against a Food-101 class: 'burger' ~ 'hamburger', 'icecream' ~ 'ice_cream'."""
+    return label.replace('_', '') in prediction.replace('_', '').lower()
+
+
+def run_precision(classifier: HuggingFaceFoodClassifier, samples: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    pixels = [classifier._to_pixels(image) for image in samples.values()]
+    classifier._run_batch(pixels)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for item in pixels:
+            classifier._run_batch([item])
+    single = len(pixels) * iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        probabilities = classifier._run_batch(pixels)
+    batched = len(pixels) * iterations / (time.perf_counter() - start)
+
+    predictions = {
+        label: [candidate['label'] for candidate in classifier._top_predictions(row)]
+        for label, row in zip(samples, probabilities)
+    }
+    return {
+        'images_per_s': round(single, 2),
+        'batched_images_per_s': round(batched, 2),
+        'top1_hits': sum(matches(label, top5[0]) for label, top5 in predictions.items()),
+        'top5_hits': sum(any(matches(label, name) for name in top5) for label, top5 in predictions.items()),
+        'predictions': predictions,
+    }
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Throughput vs accuracy of the HuggingFace food classifier")
+    arg_parser.add_argument('--precisions', default=','.join(PRECISIONS), help="comma-separated: fp32,bf16,int8")
+    arg_parser.add_argument('--iterations', type=int, default=10, help="timed passes over the sample images")
+    arg_parser.add_argument('--threads', type=int, default=0, help="torch intra-op threads (0 = cores / workers)")
+    arg_parser.add_argument('--images', default='test_*.jpg', help="sample image glob, relative to ocr-service/")
+    arg_parser.add_argument('--output', help="write JSON results here")
+    args = arg_parser.parse_args()
+
+    samples = load_samples(args.images)
+    if not samples:
+        print(f"❌ No sample images match {args.images}")
+        return 1
+
+    results: Dict[str, Any] = {}
+    for precision in [name.strip() for name in args.precisions.split(',') if name.strip()]:
+        classifier = HuggingFaceFoodClassifier(precision=precision, num_threads=args.threads or None, batching=False)
+        results[precision] = run_precision(classifier, samples, args.iterations)
+
+    reference = results.get('fp32')
+    count = len(samples)
+    print(f"\n{'precision':<10} {'img/s':>8} {'batched':>8} {'top1':>6} {'top5':>6} {'agree':>6}")
+    for precision, result in results.items():
+        if reference is not None:
+            agreement = sum(result['predictions'][label][0] == reference['predictions'][label][0] for label in samples)
+            result['top1_agreement_fp32'] = round(agreement / count, 3)
+        print(f"{precision:<10} {result['images_per_s']:>8.2f} {result['batched_images_per_s']:>8.2f} "
+              f"{result['top1_hits']:>3}/{count:<2} {result['top5_hits']:>3}/{count:<2} "
+              f"{result.get('top1_agreement_fp32', float('nan')):>6.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
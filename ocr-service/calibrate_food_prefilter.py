@@ -0,0 +1,145 @@
+"""
+Food Prefilter Calibration
+Trains the cascade's color prefilter (food_prefilter.py) on a labeled
+image set and picks its per-label thresholds, then compares the cascade
+with CLIP alone on held-out images.
+
+The data directory holds one folder per label:
+    <data>/banana/*.jpg   <data>/apple/*.jpg   ...   (canonical food names)
+    <data>/non_food/*.jpg                            (rejected without a model)
+    <data>/other/*.jpg                               (food the prefilter must route)
+
+Usage:
+    python calibrate_food_prefilter.py --data labeled_food/ --output food_prefilter.json
+    python calibrate_food_prefilter.py --data labeled_food/ --precision 0.98 --no-evaluate
+
+Then set FOOD_PREFILTER_MODEL=food_prefilter.json for the food service.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from food_prefilter import ColorPrefilter, LinearHead, calibrate_thresholds, color_features
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_labeled_images(directory: str) -> List[Tuple[str, str]]:
+    samples = []
+    for label in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(folder, name), label))
+    return samples
+
+
+def evaluate(prefilter: ColorPrefilter, samples: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """CLIP alone vs. prefilter -> CLIP on the held-out images."""
+    from food_classification_service import food_classifier
+
+    known = [label for label in prefilter.head.labels if label not in ('other', 'non_food')]
+    clip = {'ms': 0.0, 'correct': 0, 'scored': 0}
+    cascade = {'ms': 0.0, 'correct': 0, 'scored': 0, 'stages': {}, 'rejected_correctly': 0, 'rejected': 0}
+
+    for path, label in samples:
+        image = food_classifier.preprocess_image(open(path, 'rb').read())
+        if image is None:
+            continue
+
+        start = time.perf_counter()
+        predictions = food_classifier._predict_images([image], top_k=5)[0][1]
+        clip_ms = (time.perf_counter() - start) * 1000
+        clip_label = predictions[0]['canonical_name'] if predictions else None
+        clip['ms'] += clip_ms
+
+        start = time.perf_counter()
+        decision = prefilter.decide(image)
+        cascade_ms = (time.perf_counter() - start) * 1000
+        if decision.action == 'route':
+            cascade_label, cascade_ms = clip_label, cascade_ms + clip_ms
+            stage = 'clip'
+        else:
+            cascade_label, stage = decision.label, f'prefilter_{decision.action}'
+        cascade['ms'] += cascade_ms
+        cascade['stages'][stage] = cascade['stages'].get(stage, 0) + 1
+
+        if decision.action == 'reject':
+            cascade['rejected'] += 1
+            cascade['rejected_correctly'] += label == 'non_food'
+        if label in known:
+            clip['scored'] += 1
+            clip['correct'] += clip_label == label
+            cascade['scored'] += 1
+            cascade['correct'] += cascade_label == label
+
+    count = max(sum(cascade['stages'].values()), 1)
+    return {
+        'clip_only': {
+            'average_ms': round(clip['ms'] / count, 2),
+            'accuracy': round(clip['correct'] / max(clip['scored'], 1), 4),
+        },
+        'cascade': {
+            'average_ms': round(cascade['ms'] / count, 2),
+            'accuracy': round(cascade['correct'] / max(cascade['scored'], 1), 4),
+            'stage_hit_rates': {stage: round(n / count, 4) for stage, n in cascade['stages'].items()},
+            'reject_precision': round(cascade['rejected_correctly'] / cascade['rejected'], 4)
+            if cascade['rejected'] else None,
+        },
+    }
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Train and calibrate the food cascade prefilter")
+    arg_parser.add_argument('--data', required=True, help="directory with one sub-folder of images per label")
+    arg_parser.add_argument('--output', default='food_prefilter.json', help="where to write the prefilter")
+    arg_parser.add_argument('--precision', type=float, default=0.97, help="required precision per accepted label")
+    arg_parser.add_argument('--holdout', type=float, default=0.4, help="share of images for calibration + evaluation")
+    arg_parser.add_argument('--seed', type=int, default=7)
+    arg_parser.add_argument('--no-evaluate', action='store_true', help="skip the comparison with CLIP")
+    args = arg_parser.parse_args()
+
+    samples = load_labeled_images(args.data)
+    if not samples:
+        print(f"❌ No labeled images under {args.data}")
+        return 1
+    random.Random(args.seed).shuffle(samples)
+    split = max(1, int(len(samples) * (1 - args.holdout)))
+    train, holdout = samples[:split], samples[split:]
+    # Thresholds are picked on one half of the held-out images and checked on the other
+    calibration, evaluation = holdout[:len(holdout) // 2], holdout[len(holdout) // 2:]
+
+    def featurize(items):
+        return [color_features(Image.open(path).convert('RGB')) for path, _ in items]
+
+    print(f"🎨 Training on {len(train)} images, calibrating on {len(calibration)}, "
+          f"evaluating on {len(evaluation)}...")
+    head = LinearHead.fit(featurize(train), [label for _, label in train])
+    calibration_probabilities = [head.predict_proba(features) for features in featurize(calibration)]
+    thresholds = calibrate_thresholds(calibration_probabilities, [label for _, label in calibration],
+                                      head.labels, target_precision=args.precision)
+    prefilter = ColorPrefilter(head, thresholds)
+    prefilter.save(args.output)
+
+    print(f"💾 Prefilter written to {args.output}")
+    for label in head.labels:
+        threshold = thresholds.get(label)
+        print(f"   {label:<14} {'always routed' if threshold is None else f'answers at p >= {threshold:.3f}'}")
+
+    if not args.no_evaluate and evaluation:
+        report = evaluate(prefilter, evaluation)
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,13 @@ import os
 import json
 import logging
 import requests
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterator, List, Any, Mapping, Optional, Tuple
+from dataclasses import dataclass, fields
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+from nutrition_dataset import NutritionDataset, get_dataset
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -51,115 +54,65 @@ class NutritionalInfo:
     manganese_per_100g: float = 0.0
     selenium_per_100g: float = 0.0
 
+class NutritionalDatabase(Mapping):
+    """Read-only mapping of food name -> NutritionalInfo over the memory-mapped nutrition dataset."""
+    
+    def __init__(self, dataset: NutritionDataset):
+        self.dataset = dataset
+        self._fields = {f.name for f in fields(NutritionalInfo)}
+    
+    def __getitem__(self, food_name: str) -> NutritionalInfo:
+        row = self.dataset.row(food_name) if isinstance(food_name, str) else -1
+        if row < 0:
+            raise KeyError(food_name)
+        record = self.dataset.record(row)
+        per_100g = {
+            f'{nutrient}_per_100g': value for nutrient, value in record['nutrients'].items()
+            if f'{nutrient}_per_100g' in self._fields
+        }
+        return NutritionalInfo(
+            name=record['name'],
+            density=record['density'],
+            typical_portion_size=record['typical_portion_size'],
+            portion_description=record['portion_description'],
+            **per_100g
+        )
+    
+    def __contains__(self, food_name: object) -> bool:
+        return isinstance(food_name, str) and self.dataset.row(food_name) >= 0
+    
+    def __iter__(self) -> Iterator[str]:
+        return self.dataset.names()
+    
+    def __len__(self) -> int:
+        return len(self.dataset)
+
 class CalorieCalculationService:
     """
     Realistic calorie calculation service using actual nutritional databases.
     Provides accurate calorie estimates based on real food data.
     """
     
+    # Micronutrients reported per item, with their rounding
+    VITAMIN_DECIMALS = {
+        'vitamin_c': 2, 'vitamin_a': 2, 'vitamin_e': 2, 'vitamin_k': 2,
+        'thiamine': 3, 'riboflavin': 3, 'niacin': 3, 'folate': 2
+    }
+    MINERAL_DECIMALS = {
+        'calcium': 2, 'iron': 2, 'magnesium': 2, 'phosphorus': 2,
+        'zinc': 2, 'copper': 2, 'manganese': 2, 'selenium': 2
+    }
+    
     def __init__(self):
         self.nutritional_database = self._load_nutritional_database()
+        # Columnar view: nutrients per 100 g as a [foods, nutrients] matrix (memory-mapped)
+        self.nutrition_matrix = self.nutritional_database.dataset.matrix()
         self.usda_api_key = os.getenv('USDA_API_KEY', 'DEMO_KEY')
         self.usda_base_url = "https://api.nal.usda.gov/fdc/v1"
         
-    def _load_nutritional_database(self) -> Dict[str, NutritionalInfo]:
-        """Load comprehensive nutritional database with real food data"""
-        return {
-            # Fruits - Enhanced with detailed macro breakdowns
-            'apple': NutritionalInfo('apple', 52, 0.3, 14, 0.2, 2.4, 0.6, 182, '1 medium apple',
-                sugar_per_100g=10.4, saturated_fat_per_100g=0.0, monounsaturated_fat_per_100g=0.0,
-                polyunsaturated_fat_per_100g=0.1, trans_fat_per_100g=0.0, cholesterol_per_100g=0.0,
-                sodium_per_100g=1.0, potassium_per_100g=107.0, vitamin_c_per_100g=4.6, vitamin_a_per_100g=3.0,
-                vitamin_e_per_100g=0.2, vitamin_k_per_100g=2.2, thiamine_per_100g=0.0, riboflavin_per_100g=0.0,
-                niacin_per_100g=0.1, folate_per_100g=3.0, calcium_per_100g=6.0, iron_per_100g=0.1,
-                magnesium_per_100g=5.0, phosphorus_per_100g=11.0, zinc_per_100g=0.0, copper_per_100g=0.0,
-                manganese_per_100g=0.0, selenium_per_100g=0.0),
-            'banana': NutritionalInfo('banana', 89, 1.1, 23, 0.3, 2.6, 0.7, 120, '1 medium banana',
-                sugar_per_100g=12.2, saturated_fat_per_100g=0.1, monounsaturated_fat_per_100g=0.0,
-                polyunsaturated_fat_per_100g=0.1, trans_fat_per_100g=0.0, cholesterol_per_100g=0.0,
-                sodium_per_100g=1.0, potassium_per_100g=358.0, vitamin_c_per_100g=8.7, vitamin_a_per_100g=64.0,
-                vitamin_e_per_100g=0.1, vitamin_k_per_100g=0.5, thiamine_per_100g=0.0, riboflavin_per_100g=0.1,
-                niacin_per_100g=0.7, folate_per_100g=20.0, calcium_per_100g=5.0, iron_per_100g=0.3,
-                magnesium_per_100g=27.0, phosphorus_per_100g=22.0, zinc_per_100g=0.2, copper_per_100g=0.1,
-                manganese_per_100g=0.3, selenium_per_100g=1.0),
-            'orange': NutritionalInfo('orange', 47, 0.9, 12, 0.1, 2.4, 0.6, 131, '1 medium orange',
-                sugar_per_100g=9.4, saturated_fat_per_100g=0.0, monounsaturated_fat_per_100g=0.0,
-                polyunsaturated_fat_per_100g=0.0, trans_fat_per_100g=0.0, cholesterol_per_100g=0.0,
-                sodium_per_100g=0.0, potassium_per_100g=181.0, vitamin_c_per_100g=53.2, vitamin_a_per_100g=225.0,
-                vitamin_e_per_100g=0.2, vitamin_k_per_100g=0.0, thiamine_per_100g=0.1, riboflavin_per_100g=0.0,
-                niacin_per_100g=0.3, folate_per_100g=40.0, calcium_per_100g=40.0, iron_per_100g=0.1,
-                magnesium_per_100g=10.0, phosphorus_per_100g=14.0, zinc_per_100g=0.1, copper_per_100g=0.0,
-                manganese_per_100g=0.0, selenium_per_100g=0.0),
-            'grape': NutritionalInfo('grape', 67, 0.6, 17, 0.2, 0.9, 0.7, 92, '1 cup grapes',
-                sugar_per_100g=16.3, saturated_fat_per_100g=0.1, monounsaturated_fat_per_100g=0.0,
-                polyunsaturated_fat_per_100g=0.1, trans_fat_per_100g=0.0, cholesterol_per_100g=0.0,
-                sodium_per_100g=2.0, potassium_per_100g=191.0, vitamin_c_per_100g=4.0, vitamin_a_per_100g=66.0,
-                vitamin_e_per_100g=0.2, vitamin_k_per_100g=14.6, thiamine_per_100g=0.1, riboflavin_per_100g=0.1,
-                niacin_per_100g=0.2, folate_per_100g=2.0, calcium_per_100g=10.0, iron_per_100g=0.4,
-                magnesium_per_100g=7.0, phosphorus_per_100g=20.0, zinc_per_100g=0.1, copper_per_100g=0.1,
-                manganese_per_100g=0.1, selenium_per_100g=0.1),
-            'strawberry': NutritionalInfo('strawberry', 32, 0.7, 8, 0.3, 2.0, 0.6, 152, '1 cup strawberries',
-                sugar_per_100g=4.9, saturated_fat_per_100g=0.0, monounsaturated_fat_per_100g=0.0,
-                polyunsaturated_fat_per_100g=0.2, trans_fat_per_100g=0.0, cholesterol_per_100g=0.0,
-                sodium_per_100g=1.0, potassium_per_100g=153.0, vitamin_c_per_100g=58.8, vitamin_a_per_100g=12.0,
-                vitamin_e_per_100g=0.3, vitamin_k_per_100g=2.2, thiamine_per_100g=0.0, riboflavin_per_100g=0.0,
-                niacin_per_100g=0.4, folate_per_100g=24.0, calcium_per_100g=16.0, iron_per_100g=0.4,
-                magnesium_per_100g=13.0, phosphorus_per_100g=24.0, zinc_per_100g=0.1, copper_per_100g=0.0,
-                manganese_per_100g=0.4, selenium_per_100g=0.4),
-            'blueberry': NutritionalInfo('blueberry', 57, 0.7, 14, 0.3, 2.4, 0.6, 148, '1 cup blueberries'),
-            'pineapple': NutritionalInfo('pineapple', 50, 0.5, 13, 0.1, 1.4, 0.8, 165, '1 cup pineapple'),
-            'mango': NutritionalInfo('mango', 60, 0.8, 15, 0.4, 1.6, 0.7, 165, '1 medium mango'),
-            'peach': NutritionalInfo('peach', 39, 0.9, 10, 0.3, 1.5, 0.6, 150, '1 medium peach'),
-            'pear': NutritionalInfo('pear', 57, 0.4, 15, 0.1, 3.1, 0.6, 166, '1 medium pear'),
-            
-            # Vegetables - Real USDA data
-            'carrot': NutritionalInfo('carrot', 41, 0.9, 10, 0.2, 2.8, 0.7, 61, '1 medium carrot'),
-            'broccoli': NutritionalInfo('broccoli', 34, 2.8, 7, 0.4, 2.6, 0.4, 91, '1 cup broccoli'),
-            'tomato': NutritionalInfo('tomato', 18, 0.9, 4, 0.2, 1.2, 0.6, 123, '1 medium tomato'),
-            'potato': NutritionalInfo('potato', 77, 2.0, 17, 0.1, 2.2, 0.7, 150, '1 medium potato'),
-            'onion': NutritionalInfo('onion', 40, 1.1, 9, 0.1, 1.7, 0.6, 110, '1 medium onion'),
-            'lettuce': NutritionalInfo('lettuce', 15, 1.4, 3, 0.2, 1.3, 0.2, 36, '1 cup lettuce'),
-            'spinach': NutritionalInfo('spinach', 23, 2.9, 4, 0.4, 2.2, 0.2, 30, '1 cup spinach'),
-            'cucumber': NutritionalInfo('cucumber', 16, 0.7, 4, 0.1, 0.5, 0.6, 119, '1 medium cucumber'),
-            'bell_pepper': NutritionalInfo('bell_pepper', 31, 1.0, 7, 0.3, 2.5, 0.6, 119, '1 medium bell pepper'),
-            'corn': NutritionalInfo('corn', 86, 3.3, 19, 1.2, 2.7, 0.7, 154, '1 cup corn'),
-            
-            # Nuts & Seeds - Real USDA data
-            'almond': NutritionalInfo('almond', 579, 21, 22, 50, 12, 0.6, 28, '1 oz almonds'),
-            'walnut': NutritionalInfo('walnut', 654, 15, 14, 65, 6.7, 0.6, 28, '1 oz walnuts'),
-            'cashew': NutritionalInfo('cashew', 553, 18, 30, 44, 3.3, 0.6, 28, '1 oz cashews'),
-            'pistachio': NutritionalInfo('pistachio', 560, 20, 28, 45, 10, 0.6, 28, '1 oz pistachios'),
-            'peanut': NutritionalInfo('peanut', 567, 26, 16, 49, 8.5, 0.6, 28, '1 oz peanuts'),
-            'sunflower_seed': NutritionalInfo('sunflower_seed', 584, 21, 20, 51, 8.6, 0.6, 28, '1 oz sunflower seeds'),
-            
-            # Grains - Real USDA data
-            'rice': NutritionalInfo('rice', 130, 2.7, 28, 0.3, 0.4, 0.8, 158, '1 cup cooked rice'),
-            'wheat': NutritionalInfo('wheat', 339, 13, 71, 2.5, 12, 0.8, 120, '1 cup wheat flour'),
-            'oats': NutritionalInfo('oats', 389, 17, 66, 7, 11, 0.6, 81, '1 cup oats'),
-            'quinoa': NutritionalInfo('quinoa', 120, 4.4, 22, 1.9, 2.8, 0.7, 185, '1 cup cooked quinoa'),
-            'bread': NutritionalInfo('bread', 265, 9, 49, 3.2, 2.7, 0.3, 28, '1 slice bread'),
-            'pasta': NutritionalInfo('pasta', 131, 5, 25, 1.1, 1.8, 0.6, 140, '1 cup cooked pasta'),
-            
-            # Proteins - Real USDA data
-            'chicken': NutritionalInfo('chicken', 165, 31, 0, 3.6, 0, 1.0, 100, '3.5 oz chicken breast'),
-            'beef': NutritionalInfo('beef', 250, 26, 0, 15, 0, 1.0, 100, '3.5 oz beef'),
-            'fish': NutritionalInfo('fish', 206, 22, 0, 12, 0, 1.0, 100, '3.5 oz fish'),
-            'salmon': NutritionalInfo('salmon', 208, 25, 0, 12, 0, 1.0, 100, '3.5 oz salmon'),
-            'egg': NutritionalInfo('egg', 155, 13, 1.1, 11, 0, 1.0, 50, '1 large egg'),
-            'tofu': NutritionalInfo('tofu', 76, 8, 2, 5, 0.3, 1.0, 100, '3.5 oz tofu'),
-            'beans': NutritionalInfo('beans', 127, 8, 23, 0.5, 6, 0.8, 177, '1 cup cooked beans'),
-            
-            # Dairy - Real USDA data
-            'milk': NutritionalInfo('milk', 42, 3.4, 5, 1, 0, 1.0, 244, '1 cup milk'),
-            'cheese': NutritionalInfo('cheese', 113, 7, 1, 9, 0, 1.0, 28, '1 oz cheese'),
-            'yogurt': NutritionalInfo('yogurt', 59, 10, 4, 0.4, 0, 1.0, 245, '1 cup yogurt'),
-            'butter': NutritionalInfo('butter', 717, 0.9, 0.1, 81, 0, 0.9, 14, '1 tbsp butter'),
-            
-            # Other common foods
-            'olive_oil': NutritionalInfo('olive_oil', 884, 0, 0, 100, 0, 0.9, 14, '1 tbsp olive oil'),
-            'sugar': NutritionalInfo('sugar', 387, 0, 100, 0, 0, 1.6, 4, '1 tsp sugar'),
-            'salt': NutritionalInfo('salt', 0, 0, 0, 0, 0, 2.2, 6, '1 tsp salt'),
-        }
+    def _load_nutritional_database(self) -> Mapping[str, NutritionalInfo]:
+        """Nutritional database: the shared on-disk dataset (nutrition_data/foods.csv or NUTRITION_DATASET)"""
+        return NutritionalDatabase(get_dataset())
     
     def estimate_portion_size(self, food_name: str, confidence: float, image_dimensions: Tuple[int, int] = (224, 224)) -> float:
         """
@@ -202,18 +155,14 @@ class CalorieCalculationService:
         food_info = self.nutritional_database[food_name]
         
         # Calculate nutritional values based on portion size
-        calories = (food_info.calories_per_100g * portion_size_g) / 100
-        protein = (food_info.protein_per_100g * portion_size_g) / 100
-        carbs = (food_info.carbs_per_100g * portion_size_g) / 100
-        fat = (food_info.fat_per_100g * portion_size_g) / 100
-        fiber = (food_info.fiber_per_100g * portion_size_g) / 100
+        amounts = self.nutrition_matrix.as_dict(self.nutrition_matrix.amounts(food_name, portion_size_g))
         
         return {
-            'calories': round(calories, 1),
-            'protein': round(protein, 1),
-            'carbs': round(carbs, 1),
-            'fat': round(fat, 1),
-            'fiber': round(fiber, 1),
+            'calories': amounts['calories'],
+            'protein': amounts['protein'],
+            'carbs': amounts['carbs'],
+            'fat': amounts['fat'],
+            'fiber': amounts['fiber'],
             'portion_size_g': round(portion_size_g, 1),
             'portion_description': food_info.portion_description,
             'food_name': food_name,
@@ -264,7 +213,7 @@ class CalorieCalculationService:
                 'carbs': 0,
                 'fat': 0,
                 'fiber': 0,
-                'error': f'Unknown food: {food_name}. Available foods: {list(self.nutritional_database.keys())[:5]}...'
+                'error': f'Unknown food: {food_name}. Available foods: {list(islice(self.nutritional_database, 5))}...'
             }
         
         food_info = self.nutritional_database[food_name]
@@ -403,29 +352,16 @@ class CalorieCalculationService:
     
     def _calculate_vitamins(self, food_info: NutritionalInfo, weight_g: float) -> Dict[str, float]:
         """Calculate detailed vitamin content for the given weight."""
-        return {
-            'vitamin_c': round((food_info.vitamin_c_per_100g * weight_g) / 100, 2),
-            'vitamin_a': round((food_info.vitamin_a_per_100g * weight_g) / 100, 2),
-            'vitamin_e': round((food_info.vitamin_e_per_100g * weight_g) / 100, 2),
-            'vitamin_k': round((food_info.vitamin_k_per_100g * weight_g) / 100, 2),
-            'thiamine': round((food_info.thiamine_per_100g * weight_g) / 100, 3),
-            'riboflavin': round((food_info.riboflavin_per_100g * weight_g) / 100, 3),
-            'niacin': round((food_info.niacin_per_100g * weight_g) / 100, 3),
-            'folate': round((food_info.folate_per_100g * weight_g) / 100, 2)
-        }
+        return self._micronutrients(food_info.name, weight_g, self.VITAMIN_DECIMALS)
     
     def _calculate_minerals(self, food_info: NutritionalInfo, weight_g: float) -> Dict[str, float]:
         """Calculate detailed mineral content for the given weight."""
-        return {
-            'calcium': round((food_info.calcium_per_100g * weight_g) / 100, 2),
-            'iron': round((food_info.iron_per_100g * weight_g) / 100, 2),
-            'magnesium': round((food_info.magnesium_per_100g * weight_g) / 100, 2),
-            'phosphorus': round((food_info.phosphorus_per_100g * weight_g) / 100, 2),
-            'zinc': round((food_info.zinc_per_100g * weight_g) / 100, 2),
-            'copper': round((food_info.copper_per_100g * weight_g) / 100, 2),
-            'manganese': round((food_info.manganese_per_100g * weight_g) / 100, 2),
-            'selenium': round((food_info.selenium_per_100g * weight_g) / 100, 2)
-        }
+        return self._micronutrients(food_info.name, weight_g, self.MINERAL_DECIMALS)
+    
+    def _micronutrients(self, food_name: str, weight_g: float, decimals: Dict[str, int]) -> Dict[str, float]:
+        amounts = self.nutrition_matrix.amounts(food_name, weight_g)
+        columns = self.nutrition_matrix.columns
+        return {nutrient: round(float(amounts[columns[nutrient]]), places) for nutrient, places in decimals.items()}
     
     def _assess_nutritional_quality(self, calories: float, protein: float, carbs: float, 
                                    fat: float, fiber: float, vitamins: Dict[str, float], 
@@ -516,43 +452,39 @@ class CalorieCalculationService:
         Analyze complete meal calories and nutritional breakdown.
         Provides realistic, accurate nutritional analysis.
         """
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fat = 0
-        total_fiber = 0
-        total_weight = 0
-        
-        detailed_breakdown = []
-        
-        for ingredient in ingredients:
-            food_name = ingredient.get('name', '').lower()
-            confidence = ingredient.get('confidence', 0.5)
-            
-            # Estimate portion size
-            portion_size = self.estimate_portion_size(food_name, confidence)
-            
-            # Calculate nutritional values
-            nutrition = self.calculate_calories(food_name, portion_size)
-            
-            if 'error' not in nutrition:
-                total_calories += nutrition['calories']
-                total_protein += nutrition['protein']
-                total_carbs += nutrition['carbs']
-                total_fat += nutrition['fat']
-                total_fiber += nutrition['fiber']
-                total_weight += nutrition['portion_size_g']
-                
-                detailed_breakdown.append({
-                    'name': food_name,
-                    'portion_size_g': nutrition['portion_size_g'],
-                    'calories': nutrition['calories'],
-                    'protein': nutrition['protein'],
-                    'carbs': nutrition['carbs'],
-                    'fat': nutrition['fat'],
-                    'fiber': nutrition['fiber'],
-                    'confidence': confidence
-                })
+        matrix = self.nutrition_matrix
+        names = [ingredient.get('name', '').lower() for ingredient in ingredients]
+        confidences = np.array([ingredient.get('confidence', 0.5) for ingredient in ingredients], dtype=np.float64)
+        rows = matrix.rows(names)
+        known = np.flatnonzero(rows >= 0)
+        
+        # Estimate portion sizes: typical portion, adjusted by confidence (0.8 - 1.2)
+        # and a realistic variation (normal around 1.0, clamped to 0.7 - 1.3)
+        variation = np.clip(np.random.normal(1.0, 0.1, size=len(known)), 0.7, 1.3)
+        portions = np.round(np.maximum(
+            10, matrix.portion_sizes[rows[known]] * (0.8 + confidences[known] * 0.4) * variation
+        ), 1)
+        
+        # Per-ingredient nutrients and meal totals (grams-per-food vector x matrix)
+        columns = [matrix.columns[nutrient] for nutrient in ('calories', 'protein', 'carbs', 'fat', 'fiber')]
+        per_item = np.round(matrix.item_amounts(rows[known], portions)[:, columns], 1)
+        total_calories, total_protein, total_carbs, total_fat, total_fiber = matrix.totals(rows[known], portions)[columns].tolist()
+        total_weight = float(portions.sum())
+        
+        detailed_breakdown = [
+            {
+                'name': names[position],
+                'portion_size_g': float(portion),
+                'calories': calories,
+                'protein': protein,
+                'carbs': carbs,
+                'fat': fat,
+                'fiber': fiber,
+                'confidence': ingredients[position].get('confidence', 0.5)
+            }
+            for position, portion, (calories, protein, carbs, fat, fiber)
+            in zip(known.tolist(), portions, per_item.tolist())
+        ]
         
         # Calculate meal-level metrics
         meal_analysis = {
@@ -571,6 +503,81 @@ class CalorieCalculationService:
         
         return meal_analysis
     
+    def aggregate_meals(self, meals: List[Dict[str, Any]], period: str = 'day') -> Dict[str, Any]:
+        """
+        Nutrient totals of many logged meals per user and day or week.
+        
+        Args:
+            meals: [{'date': 'YYYY-MM-DD' | date | datetime, 'user_id': optional,
+                     'ingredients': [{'name': ..., 'portion_size_g': ...}, ...]}, ...]
+                   An ingredient without a weight counts as its typical portion.
+            period: 'day' or 'week' (weeks start on Monday)
+            
+        Returns:
+            One summary per (user_id, period_start), sorted, with every nutrient
+            of the matrix, plus the food names that are not in the database.
+        """
+        if period not in ('day', 'week'):
+            raise ValueError(f"Unknown period '{period}' (use 'day' or 'week')")
+        matrix = self.nutrition_matrix
+        
+        group_ids: Dict[Tuple[Any, date], int] = {}
+        meal_counts: List[int] = []
+        groups, names, grams = [], [], []
+        for meal in meals:
+            start = self._period_start(meal.get('date'), period)
+            group = group_ids.setdefault((meal.get('user_id'), start), len(group_ids))
+            if group == len(meal_counts):
+                meal_counts.append(0)
+            meal_counts[group] += 1
+            for ingredient in meal.get('ingredients', []):
+                groups.append(group)
+                names.append(str(ingredient.get('name', '')).lower())
+                grams.append(ingredient.get('portion_size_g', ingredient.get('weight_g')))
+        
+        rows = matrix.rows(names)
+        known = rows >= 0
+        # Missing weights: the food's typical portion
+        weights = np.array([np.nan if g is None else g for g in grams], dtype=np.float64)
+        missing = np.isnan(weights) & known
+        weights[missing] = matrix.portion_sizes[rows[missing]]
+        weights[~known] = 0.0
+        
+        totals = matrix.group_totals(groups, rows, weights, len(group_ids))
+        total_weights = np.bincount(np.asarray(groups, dtype=np.int64), weights=weights, minlength=len(group_ids))
+        item_counts = np.bincount(np.asarray(groups, dtype=np.int64)[known], minlength=len(group_ids))
+        
+        summaries = [
+            {
+                'user_id': user_id,
+                'period_start': start.isoformat(),
+                'meals': meal_counts[group],
+                'items': int(item_counts[group]),
+                'total_weight_g': round(float(total_weights[group]), 1),
+                'nutrients': matrix.as_dict(totals[group])
+            }
+            for (user_id, start), group in group_ids.items()
+        ]
+        summaries.sort(key=lambda summary: (str(summary['user_id']), summary['period_start']))
+        
+        return {
+            'period': period,
+            'summaries': summaries,
+            'unknown_foods': sorted({name for name, is_known in zip(names, known.tolist()) if not is_known})
+        }
+    
+    @staticmethod
+    def _period_start(value: Any, period: str) -> date:
+        if isinstance(value, datetime):
+            day = value.date()
+        elif isinstance(value, date):
+            day = value
+        elif value:
+            day = datetime.fromisoformat(str(value)).date()
+        else:
+            day = date.today()
+        return day - timedelta(days=day.weekday()) if period == 'week' else day
+    
     def _classify_meal_type(self, calories: float, protein: float, carbs: float, fat: float) -> str:
         """Classify the type of meal based on nutritional content"""
         if calories < 200:
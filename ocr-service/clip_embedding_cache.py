@@ -0,0 +1,124 @@
+"""
+CLIP Text-Embedding Cache
+The food classifier scores images against hundreds of text prompts
+(templates x synonyms x food profiles). Encoding them through the CLIP
+text tower is the slow part of startup, and the result only depends on
+the model, the prompt templates and the food profiles - so it is stored
+on disk once and memory-mapped on every later start.
+
+Layout, one pair of files per cache key:
+  clip-text-<key>.npy   float32 [prompts, dim], L2-normalized
+  clip-text-<key>.json  model name, prompts, prompt metadata and
+                        canonical_to_indices
+
+The key is a SHA-1 of model name, templates and profiles, so editing any
+of them simply produces a new file. The array is opened copy-on-write
+(``mmap_mode='c'``): nothing is read until used, and every worker process
+shares the same page-cache pages.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT = 1
+
+
+def embedding_cache_key(model_name: str, templates: Sequence[str],
+                        food_profiles: Mapping[str, Any]) -> str:
+    """Stable key for the prompt embeddings of one model / template set / profile set."""
+    payload = json.dumps(
+        {'format': CACHE_FORMAT, 'model': model_name, 'templates': list(templates),
+         'profiles': food_profiles},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class CachedTextEmbeddings:
+    """Prompt embeddings as loaded from (or written to) the cache."""
+
+    key: str
+    embeddings: Any                      # numpy array (memory-mapped when loaded)
+    prompts: List[str]
+    prompt_metadata: List[Dict[str, str]]
+    canonical_to_indices: Dict[str, List[int]]
+
+
+class ClipEmbeddingCache:
+    """Directory of memory-mappable prompt-embedding files."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, f"clip-text-{key}")
+        return f"{base}.npy", f"{base}.json"
+
+    def load(self, key: str) -> Optional[CachedTextEmbeddings]:
+        """Map the cached embeddings for ``key``, or None if absent or unreadable."""
+        array_path, meta_path = self._paths(key)
+        if not (os.path.exists(array_path) and os.path.exists(meta_path)):
+            return None
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as handle:
+                meta = json.load(handle)
+            # Copy-on-write mapping: pages stay shared between workers and the
+            # array is still writable, so torch.from_numpy can wrap it as is.
+            embeddings = np.load(array_path, mmap_mode='c')
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not load CLIP embedding cache {array_path}: {e}")
+            return None
+
+        if meta.get('key') != key or list(embeddings.shape) != meta.get('shape'):
+            logger.warning(f"⚠️ Ignoring inconsistent CLIP embedding cache {array_path}")
+            return None
+
+        return CachedTextEmbeddings(
+            key=key,
+            embeddings=embeddings,
+            prompts=meta['prompts'],
+            prompt_metadata=meta['prompt_metadata'],
+            canonical_to_indices=meta['canonical_to_indices'],
+        )
+
+    def save(self, entry: CachedTextEmbeddings, model_name: str = '') -> bool:
+        """Write ``entry`` atomically; concurrent writers of the same key are harmless."""
+        array_path, meta_path = self._paths(entry.key)
+        embeddings = np.ascontiguousarray(entry.embeddings, dtype=np.float32)
+        meta = {
+            'key': entry.key,
+            'model': model_name,
+            'shape': list(embeddings.shape),
+            'prompts': entry.prompts,
+            'prompt_metadata': entry.prompt_metadata,
+            'canonical_to_indices': entry.canonical_to_indices,
+        }
+
+        pid = os.getpid()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # np.save appends .npy to names without it
+            tmp_array = f"{array_path}.{pid}.tmp.npy"
+            np.save(tmp_array, embeddings)
+            os.replace(tmp_array, array_path)
+            # The sidecar goes last: a reader only trusts an array whose metadata exists
+            tmp_meta = f"{meta_path}.{pid}.tmp"
+            with open(tmp_meta, 'w', encoding='utf-8') as handle:
+                json.dump(meta, handle, ensure_ascii=False)
+            os.replace(tmp_meta, meta_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write CLIP embedding cache to {self.directory}: {e}")
+            return False
+
+        logger.info(f"💾 Cached {embeddings.shape[0]} CLIP prompt embeddings at {array_path}")
+        return True
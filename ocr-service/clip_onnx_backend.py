@@ -0,0 +1,116 @@
+"""
+CLIP ONNX Backend
+Runs the CLIP image tower with ONNX Runtime instead of PyTorch. On CPU
+the image encoder dominates ``classify_food`` latency; ONNX Runtime's
+fused kernels, and optionally dynamic int8 weight quantization, cut it
+substantially while the text side (the cached prompt embeddings) stays
+exactly as before - the ONNX model outputs the same projected image
+features the PyTorch ``get_image_features`` does.
+
+The vision encoder is exported once per model (and quantized once) into
+the model directory, then reused by every later start:
+  clip-vision-<model>.onnx        fp32 export
+  clip-vision-<model>-int8.onnx   dynamically quantized copy
+
+Selected with FOOD_CLIP_BACKEND=onnx; see food_classification_service.
+"""
+
+import logging
+import os
+import re
+from typing import Optional
+
+from startup_profile import lazy_import
+
+np = lazy_import('numpy')
+torch = lazy_import('torch')
+ort = lazy_import('onnxruntime')
+
+logger = logging.getLogger(__name__)
+
+ONNX_OPSET = 17
+
+
+def onnx_model_path(directory: str, model_name: str, quantize: bool = False) -> str:
+    """Where the exported (or quantized) vision encoder of ``model_name`` lives."""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '-', model_name).strip('-')
+    suffix = '-int8' if quantize else ''
+    return os.path.join(directory, f"clip-vision-{slug}{suffix}.onnx")
+
+
+def export_vision_encoder(clip_model, path: str, image_size: int = 224, opset: int = ONNX_OPSET) -> str:
+    """Export ``clip_model.get_image_features`` to ONNX with a dynamic batch axis."""
+
+    class _ImageFeatures(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dummy = torch.zeros(1, 3, image_size, image_size, dtype=torch.float32)
+    wrapper = _ImageFeatures(clip_model).to('cpu').eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (dummy,),
+            tmp_path,
+            input_names=['pixel_values'],
+            output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"📤 Exported CLIP vision encoder to {path}")
+    return path
+
+
+def quantize_vision_encoder(source_path: str, path: str) -> str:
+    """Dynamic int8 weight quantization of an exported encoder (activations stay fp32)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    quantize_dynamic(source_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, path)
+    logger.info(f"🗜️ Quantized CLIP vision encoder to int8 at {path}")
+    return path
+
+
+class OnnxVisionEncoder:
+    """ONNX Runtime session producing CLIP image features from pixel values."""
+
+    def __init__(self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 1):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 lets ONNX Runtime use one thread per physical core
+        options.intra_op_num_threads = max(0, int(intra_op_threads))
+        options.inter_op_num_threads = max(1, int(inter_op_threads))
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def encode(self, pixel_values):
+        """Image features, shape [images, dim], for float32 pixel values [images, 3, H, W]."""
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+        return self.session.run(None, {self.input_name: pixel_values})[0]
+
+
+def load_vision_encoder(clip_model, model_name: str, directory: str, quantize: bool = True,
+                        intra_op_threads: int = 0, image_size: Optional[int] = None) -> OnnxVisionEncoder:
+    """Open the ONNX encoder for ``model_name``, exporting / quantizing it first if needed."""
+    fp32_path = onnx_model_path(directory, model_name)
+    path = onnx_model_path(directory, model_name, quantize=quantize)
+    if not os.path.exists(path):
+        if not os.path.exists(fp32_path):
+            size = image_size or getattr(getattr(clip_model.config, 'vision_config', None), 'image_size', 224)
+            export_vision_encoder(clip_model, fp32_path, image_size=size)
+        if quantize:
+            quantize_vision_encoder(fp32_path, path)
+    encoder = OnnxVisionEncoder(path, intra_op_threads=intra_op_threads)
+    logger.info(f"⚡ ONNX Runtime CLIP vision encoder ready ({os.path.basename(path)})")
+    return encoder
@@ -0,0 +1,233 @@
+"""
+Receipt Date Recognizer
+Finds the purchase date with one compiled pattern and a single scan of the
+OCR text. Every date-like candidate is scored by how close it is to a date
+label ("Date:", "Invoice Date", "Fecha"...), where it sits on the receipt
+and whether its day/month order is certain, and the best one is returned
+normalized to YYYY-MM-DD with a confidence.
+
+Ambiguous numeric dates (03/04/2024) are resolved with, in order: the
+day/month order already seen on this merchant's receipts, a locale hint,
+and the configured default order.
+"""
+
+import datetime
+import logging
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_MONTH = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?'
+
+# One pattern for every supported form; the named group that matched tells the form.
+# Matched against lowercased text: cheaper than IGNORECASE, and the leading
+# lookahead rejects most positions before the alternation is tried.
+DATE_PATTERN = re.compile(
+    r'(?=[\djfmasond])(?<![\d/.-])(?:'
+    # 2024-01-15, 2024/1/15
+    rf'(?P<ymd_y>\d{{4}})(?P<ymd_sep>[/.-])(?P<ymd_m>\d{{1,2}})(?P=ymd_sep)(?P<ymd_d>\d{{1,2}})'
+    # 01/15/2024, 15.01.24 - order decided later
+    rf'|(?P<num_a>\d{{1,2}})(?P<num_sep>[/.-])(?P<num_b>\d{{1,2}})(?P=num_sep)(?P<num_y>\d{{4}}|\d{{2}})'
+    # Jan 15, 2024
+    rf'|(?P<mdy_mon>{_MONTH})\s+(?P<mdy_d>\d{{1,2}})(?:st|nd|rd|th)?,?\s+(?P<mdy_y>\d{{4}})'
+    # 15 Jan 2024, 15-Jan-24
+    rf'|(?P<dmy_d>\d{{1,2}})(?:st|nd|rd|th)?[\s-]+(?P<dmy_mon>{_MONTH})[\s,-]+(?P<dmy_y>\d{{4}}|\d{{2}})'
+    r')(?![\d/])'
+)
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+DATE_LABEL = re.compile(
+    r'\b(?:invoice\s+date|bill\s+date|order\s+date|purchase\s+date|trans(?:action)?\s+date'
+    r'|date|dated|dt|fecha|datum|data)\b',
+    re.IGNORECASE,
+)
+
+# Labels whose dates are not the purchase date
+NON_PURCHASE_LABEL = re.compile(r'\b(?:due|expir\w*|exp|valid|return\s+by|best\s+before)\b', re.IGNORECASE)
+
+# Regions that write month first
+MDY_REGIONS = {'us', 'ph', 'fm', 'mh', 'pw'}
+
+
+def locale_date_order(locale: Optional[str]) -> Optional[str]:
+    """'mdy' / 'dmy' for locales with a region ('en_US', 'de-DE'); None when unknown."""
+    if not locale:
+        return None
+    locale = locale.strip().lower()
+    if locale in ('mdy', 'dmy'):
+        return locale
+    parts = re.split(r'[_-]', locale)
+    if len(parts) < 2:
+        return None
+    return 'mdy' if parts[1] in MDY_REGIONS else 'dmy'
+
+
+@dataclass
+class DateMatch:
+    """A recognized date: ISO string, confidence 0-1 and where it was found."""
+
+    date: str
+    confidence: float
+    span: Tuple[int, int]
+    line_index: int
+    order: Optional[str] = None  # 'mdy' / 'dmy' for numeric day/month dates
+    ambiguous: bool = False
+
+
+class DateRecognizer:
+    """Single-pass date recognizer with label/position scoring and order hints."""
+
+    def __init__(self, default_order: str = 'mdy', min_year: int = 2000, max_merchants: int = 5000):
+        self.default_order = default_order if default_order in ('mdy', 'dmy') else 'mdy'
+        self.min_year = min_year
+        self.max_merchants = max_merchants
+        self._merchant_orders: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ hints
+
+    def merchant_order(self, merchant: Optional[str]) -> Optional[str]:
+        if not merchant:
+            return None
+        with self._lock:
+            return self._merchant_orders.get(merchant.strip().lower())
+
+    def learn_order(self, merchant: Optional[str], order: str):
+        """Remember a merchant's day/month order from an unambiguous date."""
+        if not merchant or order not in ('mdy', 'dmy'):
+            return
+        key = merchant.strip().lower()
+        with self._lock:
+            self._merchant_orders[key] = order
+            self._merchant_orders.move_to_end(key)
+            while len(self._merchant_orders) > self.max_merchants:
+                self._merchant_orders.popitem(last=False)
+
+    # ------------------------------------------------------------------ recognition
+
+    def recognize(self, text: str, locale: Optional[str] = None,
+                  merchant: Optional[str] = None) -> Optional[DateMatch]:
+        """
+        Best purchase-date candidate in ``text``, or None. Ambiguous day/month
+        dates follow an explicit ``locale`` first, then the order learned for
+        ``merchant``, then ``default_order``.
+        """
+        if not text:
+            return None
+
+        hinted_order = locale_date_order(locale) or self.merchant_order(merchant)
+        line_starts = self._line_starts(text)
+        line_count = max(len(line_starts), 1)
+        max_year = datetime.date.today().year + 1
+
+        scan_text = text.lower()
+        if len(scan_text) != len(text):  # a few non-ASCII letters change length when lowered
+            scan_text = text.translate(_ASCII_LOWER)
+
+        best: Optional[DateMatch] = None
+        for match in DATE_PATTERN.finditer(scan_text):
+            candidate = self._candidate(match, hinted_order)
+            if candidate is None:
+                continue
+            date, order, ambiguous = candidate
+            if not (self.min_year <= date.year <= max_year):
+                continue
+
+            line_index = self._line_index(line_starts, match.start())
+            score = self._score(text, line_starts, line_index, line_count, ambiguous, hinted_order)
+            if best is None or score > best.confidence:
+                best = DateMatch(
+                    date=date.isoformat(),
+                    confidence=score,
+                    span=match.span(),
+                    line_index=line_index,
+                    order=order,
+                    ambiguous=ambiguous,
+                )
+
+        if best is not None and merchant and best.order and not best.ambiguous:
+            self.learn_order(merchant, best.order)
+        return best
+
+    def _candidate(self, match, hinted_order: Optional[str]) -> Optional[Tuple[datetime.date, Optional[str], bool]]:
+        groups = match.groupdict()
+        order, ambiguous = None, False
+        try:
+            if groups['ymd_y']:
+                year, month, day = int(groups['ymd_y']), int(groups['ymd_m']), int(groups['ymd_d'])
+            elif groups['num_a']:
+                a, b = int(groups['num_a']), int(groups['num_b'])
+                year = self._full_year(groups['num_y'])
+                if a > 12 and b <= 12:
+                    order = 'dmy'
+                elif b > 12 and a <= 12:
+                    order = 'mdy'
+                else:
+                    ambiguous = a != b
+                    order = hinted_order or self.default_order
+                month, day = (a, b) if order == 'mdy' else (b, a)
+            elif groups['mdy_mon']:
+                month = MONTHS[groups['mdy_mon'][:3]]
+                day, year = int(groups['mdy_d']), int(groups['mdy_y'])
+            else:
+                month = MONTHS[groups['dmy_mon'][:3]]
+                day, year = int(groups['dmy_d']), self._full_year(groups['dmy_y'])
+            return datetime.date(year, month, day), order, ambiguous
+        except (ValueError, KeyError):
+            return None
+
+    def _score(self, text: str, line_starts: List[int], line_index: int, line_count: int,
+               ambiguous: bool, hinted_order: Optional[str]) -> float:
+        line = self._line(text, line_starts, line_index)
+        score = 0.5
+
+        # Label on the same line, or on the line above ("Date" / "15/01/2024")
+        if NON_PURCHASE_LABEL.search(line):
+            score -= 0.3
+        elif DATE_LABEL.search(line):
+            score += 0.3
+        elif line_index > 0 and DATE_LABEL.search(self._line(text, line_starts, line_index - 1)):
+            score += 0.15
+
+        # Purchase dates sit in the header or right after the totals; earlier wins ties
+        score += 0.1 * (1 - line_index / line_count)
+
+        if ambiguous:
+            score -= 0.05 if hinted_order else 0.15
+        else:
+            score += 0.05
+        return round(max(0.0, min(score, 1.0)), 4)
+
+    @staticmethod
+    def _full_year(value: str) -> int:
+        year = int(value)
+        if year < 100:
+            year += 2000 if year < 50 else 1900
+        return year
+
+    @staticmethod
+    def _line_starts(text: str) -> List[int]:
+        starts = [0]
+        position = text.find('\n')
+        while position != -1:
+            starts.append(position + 1)
+            position = text.find('\n', position + 1)
+        return starts
+
+    @staticmethod
+    def _line_index(line_starts: List[int], offset: int) -> int:
+        return bisect_right(line_starts, offset) - 1
+
+    @staticmethod
+    def _line(text: str, line_starts: List[int], index: int) -> str:
+        end = line_starts[index + 1] - 1 if index + 1 < len(line_starts) else len(text)
+        return text[line_starts[index]:end]
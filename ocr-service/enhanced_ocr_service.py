@@ -1,21 +1,57 @@
+from __future__ import annotations
+
 import os
 import re
 import logging
 import time
-import requests
 from typing import Dict, Any, Optional, List, Tuple
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import io
 import base64
 import json
 from datetime import datetime
-import cv2
-import numpy as np
-import pytesseract
 from intelligent_receipt_parser import IntelligentReceiptParser
+from receipt_pipeline import (
+    GlobalTotalsExtractor,
+    PaymentMethodExtractor,
+    ReceiptContext,
+    ReceiptPipeline,
+    ReconciliationExtractor,
+    StoreNameFallbackExtractor,
+    parser_extractors,
+)
+from receipt_session import ReceiptSessionStore
+from startup_profile import lazy_import, preload
+
+
+def _configure_tesseract(module):
+    # Set Tesseract path for Windows
+    module.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-# Set Tesseract path for Windows
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Imaging, OCR engines and the OCR.space client load on first use; parsing
+# text (the review screen, tests, warm-up) never pays for them
+Image = lazy_import('PIL.Image')
+ImageEnhance = lazy_import('PIL.ImageEnhance')
+ImageFilter = lazy_import('PIL.ImageFilter')
+ImageOps = lazy_import('PIL.ImageOps')
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+pytesseract = lazy_import('pytesseract', on_load=_configure_tesseract)
+requests = lazy_import('requests')
+
+# Sample parsed by warm_up() so the first real request finds compiled
+# patterns and a warm normalization cache
+WARMUP_RECEIPT = """WELCOME TO CITY MART
+123 Main Street, Anytown, USA
+01/15/2024  2:34 PM
+Milk 1% Gallon    $3.49
+Bread Whole Wheat  $2.99
+Eggs Large Dozen   $4.29
+SUBTOTAL          $10.77
+TAX               $0.86
+TOTAL             $11.63
+PAID WITH CARD
+"""
 
 # Configure logging for debugging
 logging.basicConfig(level=logging.INFO)
@@ -38,6 +74,20 @@ class EnhancedOCRService:
         self.base_url = "https://api.ocr.space/parse/imageurl"
         self.intelligent_parser = IntelligentReceiptParser()
         
+        # Single parse pass: parser fields first, service fallbacks only for what is still missing
+        self.parse_pipeline = ReceiptPipeline(parser_extractors(self.intelligent_parser) + [
+            StoreNameFallbackExtractor(),
+            GlobalTotalsExtractor(self._extract_global_totals),
+            PaymentMethodExtractor(),
+            ReconciliationExtractor(self.intelligent_parser.reconciler),
+        ])
+        
+        # Review-screen parse sessions: user edits re-parse only the changed lines
+        self.review_sessions = ReceiptSessionStore(
+            max_sessions=int(os.getenv("RECEIPT_SESSION_MAX", "1000")),
+            ttl_seconds=float(os.getenv("RECEIPT_SESSION_TTL_SECONDS", "1800")),
+        )
+        
         # Multiple OCR API keys for redundancy
         self.ocr_keys = [
             "K83171300288957",
@@ -224,6 +274,17 @@ class EnhancedOCRService:
             confidence = tesseract_result.get('confidence', 0)
             logger.info(f"✅ Tesseract successful: {text_length} chars, {confidence:.1f}% confidence")
             
+            # Low confidence, but a receipt whose numbers add up (possibly after
+            # repairing misread digits) does not need a second OCR engine
+            if confidence < QUALITY_THRESHOLD:
+                parsed_data = self.advanced_parse_receipt_text(tesseract_result['text'])
+                if self._arithmetic_verified(parsed_data):
+                    logger.info(f"✅ Tesseract confidence low ({confidence:.1f}%) but receipt arithmetic "
+                                f"is {parsed_data['reconciliation']['status']}, skipping hybrid mode")
+                    tesseract_result['ocr_engine'] = 'tesseract'
+                    tesseract_result['parsed_data'] = parsed_data
+                    return tesseract_result
+            
             # Check quality - if low, try hybrid mode with OCR.space
             if confidence < QUALITY_THRESHOLD:
                 logger.info(f"⚠️  Tesseract confidence low ({confidence:.1f}% < {QUALITY_THRESHOLD}%), trying hybrid mode...")
@@ -399,6 +460,12 @@ class EnhancedOCRService:
             
             if best_result:
                 logger.info(f"✅ Best Tesseract result: variant='{best_result['variant_used']}', confidence={best_result['confidence']:.1f}%")
+                # Tables (invoices, itemized bills): rebuild the text from word
+                # positions so column inference sees the real geometry
+                table_text = self.intelligent_parser.table_parser.table_text_from_word_boxes(best_result['ocr_data'])
+                if table_text:
+                    logger.info("📊 Table header found in Tesseract word boxes, using column-preserving text")
+                    best_result['text'] = table_text
                 best_result['ocr_engine'] = 'tesseract'
                 return best_result
             else:
@@ -668,13 +735,28 @@ Thank you for shopping!
         
         return min(confidence, 1.0)
     
-    def advanced_parse_receipt_text(self, text: str, ai_items=None) -> Dict[str, Any]:
+    @staticmethod
+    def _arithmetic_verified(parsed_data: Dict[str, Any]) -> bool:
+        """
+        True when a parsed receipt's numbers check out end to end: parsed items
+        that sum to the subtotal and a stated total that matches it.
+        """
+        reconciliation = parsed_data.get('reconciliation') or {}
+        return bool(
+            parsed_data.get('items')
+            and reconciliation.get('consistent')
+            and reconciliation.get('items_consistent') is True
+            and reconciliation.get('total_stated')
+        )
+
+    def advanced_parse_receipt_text(self, text: str, ai_items=None, locale: Optional[str] = None) -> Dict[str, Any]:
         """
         Advanced receipt parsing with multiple strategies and confidence scoring.
         
         Args:
             text: Raw OCR text from receipt
             ai_items: Optional list of AI-extracted items (for compatibility)
+            locale: Optional locale hint for day/month order (e.g. 'en_GB')
             
         Returns:
             Dictionary with detailed parsed receipt data
@@ -692,17 +774,17 @@ Thank you for shopping!
                 "rawText": text
             }
         
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        # Use intelligent parser for item extraction
-        parsed_result = self.intelligent_parser.parse_receipt(text)
-        
-        # Extract items and totals from intelligent parser result
-        raw_items = parsed_result.get('items', [])
+        # One pipeline run computes every field exactly once
+        context = self.intelligent_parser.parse_context(text, pipeline=self.parse_pipeline, locale=locale)
+        return self._parsed_receipt(context)
+    
+    def _parsed_receipt(self, context) -> Dict[str, Any]:
+        """Frontend shape of a parsed receipt context (items, totals, confidence...)."""
+        text = context.text
         
         # Convert items to expected format (add total field)
         items = []
-        for item in raw_items:
+        for item in context.get('items', []):
             items.append({
                 "name": item.get('name', ''),
                 "price": item.get('price', 0.0),
@@ -710,69 +792,21 @@ Thank you for shopping!
                 "total": item.get('price', 0.0) * item.get('quantity', 1.0)
             })
         
-        total_amount = parsed_result.get('total', None)
-        subtotal = parsed_result.get('subtotal', None)
-        tax = parsed_result.get('tax', None)
-        
-        # Initialize other results  
-        purchase_date = parsed_result.get('date', None)
-        store_name = parsed_result.get('merchant_name', None)
-        payment_method = None
-        
-        # Global total detection - works with any language and currency
-        if total_amount is None:  # Only if intelligent parser didn't find it
-            total_amount, subtotal, tax = self._extract_global_totals(lines)
-        
-        # Date detection
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-            r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}',
-        ]
-        
-        for line in lines:
-            for pattern in date_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    purchase_date = match.group(0)
-                    break
-        
-        # Store name detection (usually at top)
-        if lines:
-            # Look for store-like names in first few lines
-            for i, line in enumerate(lines[:3]):
-                line = line.strip()
-                if len(line) > 3 and len(line) < 50:
-                    # Common store indicators
-                    store_indicators = ['mart', 'store', 'shop', 'grocery', 'market', 'super', 'pharmacy']
-                    if any(indicator in line.lower() for indicator in store_indicators):
-                        store_name = line
-                        break
-            
-            # If no store indicators, use first non-empty line
-            if not store_name and lines[0]:
-                store_name = lines[0]
-        
-        # Payment method detection
-        payment_patterns = [
-            r'(cash|credit|debit|visa|mastercard|amex|paypal|check)',
-            r'(paid\s+with\s+.*)',
-        ]
-        
-        for line in lines:
-            line_lower = line.lower()
-            for pattern in payment_patterns:
-                match = re.search(pattern, line_lower)
-                if match:
-                    payment_method = match.group(1) if match.group(1) else match.group(0)
-                    break
+        total_amount = context.get('total')
+        subtotal = context.get('subtotal')
+        tax = context.get('tax')
+        purchase_date = context.get('date')
+        store_name = context.get('merchant_name')
+        payment_method = context.get('payment_method')
         
         # Calculate confidence based on parsed data (handle None values)
+        reconciliation = context.get('reconciliation')
         confidence = self.calculate_parsing_confidence(
             items, 
             total_amount or 0.0, 
             subtotal or 0.0, 
-            tax or 0.0
+            tax or 0.0,
+            reconciliation=reconciliation
         )
         
         return {
@@ -781,27 +815,89 @@ Thank you for shopping!
             "subtotal": subtotal,
             "tax": tax,
             "purchaseDate": purchase_date,
+            "dateConfidence": context.get('date_confidence'),
             "storeName": store_name,
             "paymentMethod": payment_method,
             "confidence": confidence,
+            "reconciliation": reconciliation,
             "rawText": text,
             "totalItems": len(items),
             "calculatedTotal": sum(item["total"] for item in items) if items else None
         }
     
-    def calculate_parsing_confidence(self, items: List[Dict], total: float, subtotal: float, tax: float) -> float:
+    def warm_up(self, preload_engines: bool = False) -> Dict[str, float]:
+        """
+        Prime the parse path before traffic arrives (compiled patterns, date
+        and money scanners, normalization cache); with ``preload_engines``
+        also import the imaging/OCR modules so the first upload is not slow.
+        
+        Runs the pipeline directly so the sample never teaches a merchant template.
+        """
+        timings = {}
+        start = time.perf_counter()
+        self.parse_pipeline.run(WARMUP_RECEIPT, ReceiptContext(WARMUP_RECEIPT))
+        self.parse_pipeline.reset_stats()
+        timings['parser_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        
+        if preload_engines:
+            start = time.perf_counter()
+            preload(['PIL.Image', 'PIL.ImageEnhance', 'PIL.ImageFilter', 'PIL.ImageOps',
+                     'numpy', 'cv2', 'pytesseract', 'requests'])
+            timings['engines_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        
+        logger.info(f"🔥 Warm-up done: {timings}")
+        return timings
+    
+    def start_review_session(self, text: str, locale: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Parse a receipt for the review screen and keep its per-line state.
+        
+        Later edits go through ``update_review_session`` and only re-parse
+        the lines that changed.
+        """
+        session = self.review_sessions.create(self.intelligent_parser, text,
+                                              pipeline=self.parse_pipeline, locale=locale)
+        return self._review_result(session)
+    
+    def update_review_session(self, session_id: str, text: Optional[str] = None,
+                              line_edits: Optional[Dict[int, str]] = None) -> Optional[Dict[str, Any]]:
+        """Apply a resubmitted text or line edits; None when the session has expired."""
+        session = self.review_sessions.get(session_id)
+        if session is None:
+            return None
+        if text is not None:
+            session.update(text)
+        if line_edits:
+            session.edit_lines(line_edits)
+        return self._review_result(session)
+    
+    def _review_result(self, session) -> Dict[str, Any]:
+        result = self._parsed_receipt(session.context)
+        result.update(
+            sessionId=session.session_id,
+            lines=session.line_states(),
+            update=session.last_update,
+        )
+        return result
+    
+    def calculate_parsing_confidence(self, items: List[Dict], total: float, subtotal: float, tax: float,
+                                     reconciliation: Optional[Dict[str, Any]] = None) -> float:
         """Calculate confidence score for parsed receipt data."""
         confidence = 0.0
         
         if items:
             confidence += 0.3
             
-            # Check if calculated total matches detected total
-            calculated_total = sum(item["total"] for item in items)
-            if total and abs(calculated_total - total) < 0.1:
-                confidence += 0.3
-            elif total and abs(calculated_total - total) < 1.0:
-                confidence += 0.2
+            # Receipt arithmetic checked by the reconciliation stage
+            if reconciliation and reconciliation.get('consistent'):
+                confidence += 0.3 if reconciliation.get('items_consistent') else 0.2
+            else:
+                # Check if calculated total matches detected total
+                calculated_total = sum(item["total"] for item in items)
+                if total and abs(calculated_total - total) < 0.1:
+                    confidence += 0.3
+                elif total and abs(calculated_total - total) < 1.0:
+                    confidence += 0.2
         
         if total:
             confidence += 0.2
@@ -854,23 +950,13 @@ Thank you for shopping!
             'imposto', 'steuer', 'taxa', 'taxe', '税金', '税'
         }
         
-        # Currency symbols for global matching
-        currency_symbols = r'[\$€£¥₹₽₩¢₡₦₨₱₫₪]|USD|EUR|GBP|JPY|CNY|INR|RUB|KRW'
-        
-        # Build flexible number patterns
-        number_patterns = [
-            r'(\d{1,3}(?:,\d{3})*\.\d{2})',  # US: 1,234.56
-            r'(\d{1,3}(?:\.\d{3})*,\d{2})',  # EU: 1.234,56  
-            r'(\d{1,3}(?: \d{3})*[,\.]\d{2})',  # FR: 1 234,56
-            r'(\d+[,\.]\d{2})',               # Simple: 123.45
-            r'(\d+\.\d{2})',                  # Decimal: 123.45
-            r'(\d+)',                         # Whole: 123
-        ]
+        scanner = self.intelligent_parser.money_scanner
         
         for line in lines:
             line_lower = line.lower().strip()
             if not line_lower:
                 continue
+            amounts = None
             
             # Check each type of total
             for keyword_set, result_var in [
@@ -879,50 +965,32 @@ Thank you for shopping!
                 (tax_keywords, 'tax')
             ]:
                 for keyword in keyword_set:
-                    if keyword in line_lower:
-                        # Extract number after keyword
-                        for num_pattern in number_patterns:
-                            # Pattern: keyword + optional separators + currency + number
-                            pattern = rf'{re.escape(keyword)}\s*[:\-\s]*(?:{currency_symbols})?\s*{num_pattern}'
-                            match = re.search(pattern, line, re.IGNORECASE)
-                            if match:
-                                try:
-                                    # Parse the number with global format support
-                                    num_str = match.group(-1)  # Last group is the number
-                                    
-                                    # Handle different decimal separators
-                                    if ',' in num_str and '.' in num_str:
-                                        if num_str.rfind(',') > num_str.rfind('.'):
-                                            # Comma is decimal
-                                            num_str = num_str.replace('.', '').replace(',', '.')
-                                        else:
-                                            # Dot is decimal
-                                            num_str = num_str.replace(',', '')
-                                    elif ',' in num_str and len(num_str.split(',')[-1]) == 2:
-                                        # Decimal comma
-                                        num_str = num_str.replace(',', '.')
-                                    elif ',' in num_str:
-                                        # Thousands comma
-                                        num_str = num_str.replace(',', '')
-                                    
-                                    amount = float(num_str)
-                                    
-                                    # Assign to appropriate variable
-                                    if result_var == 'total' and (total_amount is None or amount > total_amount):
-                                        total_amount = amount
-                                    elif result_var == 'subtotal' and subtotal is None:
-                                        subtotal = amount
-                                    elif result_var == 'tax' and tax is None:
-                                        tax = amount
-                                    
-                                    break  # Found a match for this keyword
-                                except (ValueError, IndexError):
-                                    continue
-                        
-                        if (result_var == 'total' and total_amount) or \
-                           (result_var == 'subtotal' and subtotal) or \
-                           (result_var == 'tax' and tax):
-                            break  # Found what we need for this type
+                    position = line_lower.find(keyword)
+                    if position < 0:
+                        continue
+                    if amounts is None:
+                        amounts = scanner.scan(line_lower)
+                    
+                    # Amount right after the keyword: "Total: $12.34", "Summe 12,34 €"
+                    keyword_end = position + len(keyword)
+                    amount = next((token.value for token in amounts
+                                   if token.start >= keyword_end
+                                   and not line_lower[keyword_end:token.start].strip(' \t:-')), None)
+                    if amount is None:
+                        continue
+                    
+                    # Assign to appropriate variable
+                    if result_var == 'total' and (total_amount is None or amount > total_amount):
+                        total_amount = amount
+                    elif result_var == 'subtotal' and subtotal is None:
+                        subtotal = amount
+                    elif result_var == 'tax' and tax is None:
+                        tax = amount
+                    
+                    if (result_var == 'total' and total_amount) or \
+                       (result_var == 'subtotal' and subtotal) or \
+                       (result_var == 'tax' and tax):
+                        break  # Found what we need for this type
         
         return total_amount, subtotal, tax
     
@@ -1,6 +1,7 @@
 import os
 import io
 import logging
+import time
 from dataclasses import asdict
 from typing import Dict, List, Any, Optional, Tuple
 from PIL import Image
@@ -11,6 +12,12 @@ os.environ["TRANSFORMERS_NO_FLAX"] = "1"
 from transformers import CLIPModel, CLIPProcessor
 from datetime import datetime
 from calorie_calculation_service import calorie_calculator
+from clip_onnx_backend import OnnxVisionEncoder, load_vision_encoder
+from clip_embedding_cache import CachedTextEmbeddings, ClipEmbeddingCache, embedding_cache_key
+from food_prefilter import CascadeStats, ColorPrefilter
+from food_result_cache import CachedClassification, FoodResultCache, content_hash
+from meal_regions import grid_tiles, merge_by_label, non_max_suppression, normalize_box, salient_regions
+from micro_batcher import MicroBatcher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,19 +28,63 @@ class FoodClassificationService:
     Advanced food classification service using multiple models for ingredient identification.
     Supports CLIP-based zero-shot recognition with rich nutritional mappings.
     """
+
+    PROMPT_TEMPLATES = (
+        "a high quality food photograph of {}",
+        "a close-up photo of {}",
+        "a plate of {}",
+        "{} on a dining table"
+    )
     
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.clip_model: Optional[CLIPModel] = None
         self.clip_processor: Optional[CLIPProcessor] = None
+        # FOOD_CLIP_BACKEND=onnx runs the image tower with ONNX Runtime (optionally int8)
+        self.backend = os.getenv('FOOD_CLIP_BACKEND', 'torch').lower()
+        self.onnx_encoder: Optional[OnnxVisionEncoder] = None
         self.text_prompts: List[str] = []
         self.prompt_metadata: List[Dict[str, str]] = []
         self.text_prompt_embeddings: Optional[torch.Tensor] = None
         self.canonical_to_indices: Dict[str, List[int]] = {}
+        self.canonical_names: List[str] = []
+        self.canonical_prompt_index: Optional[torch.Tensor] = None
         self.temperature: float = float(os.getenv('FOOD_CLIP_SOFTMAX_TEMP', '0.07'))
         self.food_categories = self._load_food_categories()
         self.ingredient_mapping = self._load_ingredient_mapping()
         self.food_profiles = self._build_food_profiles()
+        # Uploads are decoded straight to ~2x the model input (updated once the model is loaded)
+        self.decode_size = 448
+        cache_dir = os.getenv('FOOD_CLIP_EMBEDDING_CACHE_DIR', '~/.cache/ocr-service/clip')
+        self.embedding_cache = ClipEmbeddingCache(os.path.expanduser(cache_dir)) if cache_dir else None
+        # Recently classified photos (exact bytes, or a near-duplicate by perceptual hash)
+        self.result_cache = FoodResultCache(
+            max_entries=int(os.getenv('FOOD_RESULT_CACHE_SIZE', '2048')),
+            ttl_seconds=float(os.getenv('FOOD_RESULT_CACHE_TTL_SECONDS', '3600')),
+            hash_method=os.getenv('FOOD_RESULT_CACHE_HASH', 'dhash').lower(),
+            max_distance=int(os.getenv('FOOD_RESULT_CACHE_MAX_DISTANCE', '6'))
+        )
+        # Cascade: a calibrated color prefilter answers easy images before CLIP runs
+        prefilter_path = os.getenv('FOOD_PREFILTER_MODEL', '')
+        self.prefilter = ColorPrefilter.load(prefilter_path) if prefilter_path else None
+        self.cascade_stats = CascadeStats()
+        # Region mode: crops from a grid and salient-blob proposals, classified in one batch
+        self.region_grid = int(os.getenv('FOOD_REGION_GRID', '3'))
+        self.region_proposals = int(os.getenv('FOOD_REGION_PROPOSALS', '6'))
+        # Crops are kept on their raw image-text cosine similarity: the probability is a softmax
+        # over the crop's own top-5, which a plate or background tile clears just as easily
+        self.region_min_score = float(os.getenv('FOOD_REGION_MIN_SCORE', '0.25'))
+        self.region_iou = float(os.getenv('FOOD_REGION_IOU', '0.5'))
+        # Concurrent single-image requests are stacked into one image-encoder pass
+        self.batch_size = max(1, int(os.getenv('FOOD_CLIP_BATCH_SIZE', '16')))
+        self.image_batcher: Optional[MicroBatcher] = None
+        if os.getenv('FOOD_CLIP_BATCHING', '1').lower() in ('1', 'true', 'yes'):
+            self.image_batcher = MicroBatcher(
+                self._run_image_batch,
+                max_batch_size=self.batch_size,
+                max_wait_ms=float(os.getenv('FOOD_CLIP_BATCH_WAIT_MS', '10')),
+                name='clip-image-batcher'
+            )
         
         # Initialize model
         self._load_model()
@@ -98,31 +149,34 @@ class FoodClassificationService:
             self.clip_model.to(self.device)
             self.clip_model.eval()
 
-            self.text_prompts, self.prompt_metadata = self._build_text_prompts()
-            text_inputs = self.clip_processor(
-                text=self.text_prompts,
-                padding=True,
-                return_tensors='pt'
-            )
-            text_inputs = {key: value.to(self.device) for key, value in text_inputs.items()}
+            cache_key = embedding_cache_key(model_name, self.PROMPT_TEMPLATES, self.food_profiles)
+            cached = self.embedding_cache.load(cache_key) if self.embedding_cache else None
+            if cached is None:
+                cached = self._encode_text_prompts(cache_key)
+                if self.embedding_cache:
+                    self.embedding_cache.save(cached, model_name)
+            else:
+                logger.info(f"📂 Loaded {len(cached.prompts)} CLIP prompt embeddings from cache ({cache_key})")
 
-            with torch.no_grad():
-                text_embeddings = self.clip_model.get_text_features(**text_inputs)
-
-            text_embeddings = text_embeddings / text_embeddings.norm(p=2, dim=-1, keepdim=True)
-            self.text_prompt_embeddings = text_embeddings
+            self.text_prompts = cached.prompts
+            self.prompt_metadata = cached.prompt_metadata
+            # Zero-copy on CPU: the tensor is a view of the memory-mapped array
+            self.text_prompt_embeddings = torch.from_numpy(cached.embeddings).to(self.device)
             self.canonical_to_indices.clear()
+            self.canonical_to_indices.update(cached.canonical_to_indices)
+            self._build_canonical_index()
+
+            crop_size = getattr(self.clip_processor.image_processor, 'crop_size', None) or {}
+            self.decode_size = 2 * int(crop_size.get('height', 224))
 
-            for idx, meta in enumerate(self.prompt_metadata):
-                canonical = meta['canonical_name']
-                if canonical not in self.canonical_to_indices:
-                    self.canonical_to_indices[canonical] = []
-                self.canonical_to_indices[canonical].append(idx)
+            if self.backend == 'onnx':
+                self._load_onnx_encoder(model_name)
 
             logger.info(
-                "Food classification CLIP model '%s' loaded on %s with %d prompts",
+                "Food classification CLIP model '%s' loaded on %s (%s backend) with %d prompts",
                 model_name,
                 self.device,
+                'onnx' if self.onnx_encoder else 'torch',
                 len(self.text_prompts)
             )
 
@@ -132,10 +186,69 @@ class FoodClassificationService:
             self.clip_processor = None
             self.text_prompt_embeddings = None
             self.canonical_to_indices.clear()
+            self._build_canonical_index()
+
+    def _load_onnx_encoder(self, model_name: str):
+        """Switch the image tower to ONNX Runtime; stays on PyTorch if that fails."""
+        onnx_dir = os.getenv('FOOD_CLIP_ONNX_DIR', '~/.cache/ocr-service/clip')
+        try:
+            self.onnx_encoder = load_vision_encoder(
+                self.clip_model,
+                model_name,
+                os.path.expanduser(onnx_dir),
+                quantize=os.getenv('FOOD_CLIP_ONNX_QUANTIZE', '1').lower() in ('1', 'true', 'yes'),
+                intra_op_threads=int(os.getenv('FOOD_CLIP_ONNX_THREADS', '0'))
+            )
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable, using PyTorch for CLIP images: {e}")
+            self.onnx_encoder = None
+
+    def _build_canonical_index(self):
+        """Padded [canonical, prompt] index matrix for segment-max pooling of prompt scores."""
+        self.canonical_names = list(self.canonical_to_indices)
+        width = max((len(indices) for indices in self.canonical_to_indices.values()), default=0)
+        # Padding points one past the last prompt, at the -inf column _rank_canonicals appends
+        pad = len(self.text_prompts)
+        rows = [indices + [pad] * (width - len(indices)) for indices in self.canonical_to_indices.values()]
+        self.canonical_prompt_index = (
+            torch.tensor(rows, dtype=torch.long, device=self.device) if rows else None
+        )
+
+    def _encode_text_prompts(self, cache_key: str) -> CachedTextEmbeddings:
+        """Run every prompt through the CLIP text tower (the cache-miss path)."""
+        prompts, metadata = self._build_text_prompts()
+        text_inputs = self.clip_processor(
+            text=prompts,
+            padding=True,
+            return_tensors='pt'
+        )
+        text_inputs = {key: value.to(self.device) for key, value in text_inputs.items()}
+
+        with torch.no_grad():
+            text_embeddings = self.clip_model.get_text_features(**text_inputs)
+
+        text_embeddings = text_embeddings / text_embeddings.norm(p=2, dim=-1, keepdim=True)
+
+        canonical_to_indices: Dict[str, List[int]] = {}
+        for idx, meta in enumerate(metadata):
+            canonical_to_indices.setdefault(meta['canonical_name'], []).append(idx)
+
+        return CachedTextEmbeddings(
+            key=cache_key,
+            embeddings=text_embeddings.float().cpu().numpy(),
+            prompts=prompts,
+            prompt_metadata=metadata,
+            canonical_to_indices=canonical_to_indices
+        )
     
     def preprocess_image(self, image_bytes: bytes) -> Optional[Image.Image]:
         """
-        Decode image bytes into a PIL image.
+        Decode image bytes into a PIL image no larger than the model needs.
+        
+        JPEGs are draft-decoded: libjpeg scales by 1/2, 1/4 or 1/8 while
+        decoding, to the smallest size whose short side still covers
+        ``decode_size`` (about twice the CLIP input). Other formats are
+        downsized to that short side after decoding.
         
         Args:
             image_bytes: Raw image bytes
@@ -146,10 +259,19 @@ class FoodClassificationService:
         try:
             # Convert bytes to PIL Image
             image = Image.open(io.BytesIO(image_bytes))
+            target = self.decode_size
+            if image.format == 'JPEG':
+                image.draft('RGB', (target, target))
             
             # Convert to RGB if necessary
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+
+            short_side = min(image.size)
+            if short_side > target:
+                scale = target / short_side
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image = image.resize(size, Image.BICUBIC, reducing_gap=2.0)
             
             return image
             
@@ -157,86 +279,259 @@ class FoodClassificationService:
             logger.error(f"Image preprocessing failed: {e}")
             return None
     
-    def classify_food(self, image_bytes: bytes) -> Dict[str, Any]:
+    def classify_food(self, image_bytes: bytes, image: Optional[Image.Image] = None) -> Dict[str, Any]:
         """
         Classify food items in the image.
         
         Args:
             image_bytes: Raw image bytes
+            image: The same image already decoded by ``preprocess_image``, if
+                the caller has it (saves decoding it again)
             
         Returns:
             Dictionary with classification results
         """
-        if not self.clip_model or not self.clip_processor or self.text_prompt_embeddings is None:
-            return {
-                'success': False,
-                'error': 'Model not loaded',
-                'ingredients': [],
-                'confidence': 0.0
-            }
+        if not self._model_ready():
+            return self._classification_error('Model not loaded')
         
         try:
-            # Preprocess image
-            image = self.preprocess_image(image_bytes)
-            if image is None:
-                return {
-                    'success': False,
-                    'error': 'Image preprocessing failed',
-                    'ingredients': [],
-                    'confidence': 0.0
-                }
+            key = content_hash(image_bytes)
+            cached = self.result_cache.get(key) if self.result_cache.enabled else None
+            if cached is None:
+                # Preprocess image
+                if image is None:
+                    image = self.preprocess_image(image_bytes)
+                if image is None:
+                    return self._classification_error('Image preprocessing failed')
+                cached, image_hash = self._find_similar(key, image)
+                if cached is None:
+                    answer = self._prefilter(image)
+                    if answer is not None:
+                        return answer
+                    start = time.perf_counter()
+                    features, predictions = self._predict_image(image, top_k=5)
+                    self.cascade_stats.record('clip', (time.perf_counter() - start) * 1000)
+                    return self._build_classification(self._remember(key, features, predictions, image_hash, 5))
             
-            predictions = self._predict_with_clip(image, top_k=5)
-            ingredients: List[Dict[str, Any]] = []
-            confidence_scores: List[float] = []
-
-            for prediction in predictions:
-                canonical_name = prediction['canonical_name']
-                normalized = self._normalize_prediction(canonical_name)
-                if not normalized:
-                    continue
-
-                probability = float(prediction['probability'])
-                portion_estimate = calorie_calculator.estimate_portion_size(canonical_name, probability)
-                nutrition_snapshot = self._get_nutrition_snapshot(canonical_name)
-
-                ingredient_entry = {
-                    'name': canonical_name,
-                    'display_name': normalized['display_name'],
-                    'raw_prediction_label': canonical_name,
-                    'matched_keyword': prediction.get('matched_synonym', normalized['matched_keyword']),
-                    'confidence': round(probability, 4),
-                    'confidence_percent': round(probability * 100, 1),
-                    'clip_score': round(float(prediction['score']), 4),
-                    'prompt_used': prediction.get('prompt'),
-                    'category': normalized['category'],
-                    'nutritional_info': normalized['key_nutrients'],
-                    'nutrition_summary': nutrition_snapshot,
-                    'portion_override_g': round(portion_estimate, 1) if portion_estimate else None,
-                    'component_ingredients': normalized['ingredients']
-                }
-                ingredients.append(ingredient_entry)
-                confidence_scores.append(probability)
+            return self._build_classification(self._cached_predictions(cached, top_k=5))
             
-            # Calculate overall confidence
-            overall_confidence = confidence_scores[0] if confidence_scores else 0.0
+        except Exception as e:
+            logger.error(f"Food classification failed: {e}")
+            return self._classification_error(f'Classification failed: {str(e)}')
+
+    def classify_food_batch(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """
+        Classify several images with batched CLIP forward passes.
+        
+        Args:
+            images_bytes: Raw bytes of each image
             
-            return {
-                'success': True,
-                'ingredients': ingredients,
-                'confidence': overall_confidence,
-                'total_ingredients': len(ingredients),
-                'processing_time': datetime.now().isoformat()
-            }
+        Returns:
+            One classification result per image, in order
+        """
+        if not self._model_ready():
+            return [self._classification_error('Model not loaded') for _ in images_bytes]
+
+        results: List[Dict[str, Any]] = [None] * len(images_bytes)
+        pending: List[Tuple[int, str, Image.Image, Optional[int]]] = []
+        try:
+            for idx, image_bytes in enumerate(images_bytes):
+                key = content_hash(image_bytes)
+                cached = self.result_cache.get(key) if self.result_cache.enabled else None
+                if cached is None:
+                    image = self.preprocess_image(image_bytes)
+                    if image is None:
+                        results[idx] = self._classification_error('Image preprocessing failed')
+                        continue
+                    cached, image_hash = self._find_similar(key, image)
+                    if cached is None:
+                        answer = self._prefilter(image)
+                        if answer is not None:
+                            results[idx] = answer
+                        else:
+                            pending.append((idx, key, image, image_hash))
+                        continue
+                results[idx] = self._build_classification(self._cached_predictions(cached, top_k=5))
+
+            # Only images the cache could not answer reach the encoder
+            start = time.perf_counter()
+            predicted = self._predict_images([image for _, _, image, _ in pending], top_k=5)
+            for _ in pending:
+                self.cascade_stats.record('clip', (time.perf_counter() - start) * 1000 / len(pending))
+        except Exception as e:
+            logger.error(f"Batch food classification failed: {e}")
+            return [
+                result if result is not None else self._classification_error(f'Classification failed: {str(e)}')
+                for result in results
+            ]
+
+        for (idx, key, _, image_hash), (features, predictions) in zip(pending, predicted):
+            results[idx] = self._build_classification(self._remember(key, features, predictions, image_hash, 5))
+        return results
+
+    def detect_meal_items(self, image_bytes: bytes, image: Optional[Image.Image] = None,
+                          max_items: int = 8) -> Dict[str, Any]:
+        """
+        Classify the distinct foods on a plate, each with a box.
+        
+        The image is cut into grid tiles plus salient-blob proposals; all
+        crops (and the whole image) go through CLIP in one batched forward
+        pass, and the labels of crops that clearly match a food (raw CLIP
+        score of at least ``region_min_score``) are merged with non-maximum
+        suppression.
+        
+        Args:
+            image_bytes: Raw image bytes
+            image: The same image already decoded by ``preprocess_image``, if available
+            max_items: Most items to report
             
+        Returns:
+            Classification result whose ingredients carry a normalized
+            ``box`` (x0, y0, x1, y1 in 0-1) and the ``region`` source
+        """
+        if not self._model_ready():
+            return self._classification_error('Model not loaded')
+
+        try:
+            if image is None:
+                image = self.preprocess_image(image_bytes)
+            if image is None:
+                return self._classification_error('Image preprocessing failed')
+
+            width, height = image.size
+            regions = [('full', (0, 0, width, height))]
+            regions += [('tile', box) for box in grid_tiles(width, height, self.region_grid)]
+            regions += [('proposal', box) for box in salient_regions(image, self.region_proposals)]
+            crops = [image.crop(box) for _, box in regions]
+
+            detections = []
+            for (source, box), (_, predictions) in zip(regions, self._predict_images(crops, top_k=5)):
+                if not predictions or predictions[0]['score'] < self.region_min_score:
+                    continue
+                detections.append({**predictions[0], 'box': box, 'region': source})
+
+            # The whole-image reading is only a fallback when no crop is confident
+            crop_detections = [detection for detection in detections if detection['region'] != 'full']
+            items = merge_by_label(non_max_suppression(crop_detections or detections, self.region_iou))
+            for item in items:
+                item['box'] = normalize_box(item['box'], width, height)
+
+            result = self._build_classification(items[:max_items])
+            result['regions_classified'] = len(crops)
+            return result
+
         except Exception as e:
-            logger.error(f"Food classification failed: {e}")
-            return {
-                'success': False,
-                'error': f'Classification failed: {str(e)}',
-                'ingredients': [],
-                'confidence': 0.0
+            logger.error(f"Meal region detection failed: {e}")
+            return self._classification_error(f'Classification failed: {str(e)}')
+
+    def _prefilter(self, image: Image.Image) -> Optional[Dict[str, Any]]:
+        """
+        Cascade first stage: the classification result when the color
+        prefilter is confident (a single food, or not food at all), or None
+        to send the image on to CLIP.
+        """
+        if self.prefilter is None:
+            return None
+        start = time.perf_counter()
+        decision = self.prefilter.decide(image)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if decision.action == 'route':
+            return None
+        self.cascade_stats.record(f'prefilter_{decision.action}', elapsed_ms)
+        if decision.action == 'reject':
+            return self._classification_error('No food detected in the image')
+        return self._build_classification([{
+            'canonical_name': decision.label,
+            'probability': decision.probability,
+            'score': decision.probability,
+            'matched_synonym': decision.label,
+            'prompt': 'color prefilter'
+        }])
+
+    def _find_similar(self, key: str, image: Image.Image) -> Tuple[Optional[CachedClassification], Optional[int]]:
+        """Near-duplicate lookup: (cached result or None, perceptual hash of ``image``)."""
+        if not self.result_cache.enabled:
+            return None, None
+        image_hash = self.result_cache.image_hash(image)
+        return self.result_cache.find_similar(key, image_hash), image_hash
+
+    def _remember(self, key: str, features: Optional[torch.Tensor], predictions: List[Dict[str, Any]],
+                  image_hash: Optional[int], top_k: int) -> List[Dict[str, Any]]:
+        """Store an encoder result in the result cache and return its predictions."""
+        if self.result_cache.enabled and features is not None and predictions:
+            self.result_cache.put(key, CachedClassification(
+                features=features.detach().to('cpu', copy=True),
+                predictions={top_k: predictions},
+                image_hash=image_hash
+            ))
+        return predictions
+
+    def _cached_predictions(self, cached: CachedClassification, top_k: int) -> List[Dict[str, Any]]:
+        """Predictions of a cached image; another top-k is re-ranked from its features."""
+        predictions = cached.predictions.get(top_k)
+        if predictions is None:
+            features = cached.features.to(self.device).unsqueeze(0)
+            predictions = self._rank_canonicals(features @ self.text_prompt_embeddings.T, [top_k])[0]
+            cached.predictions[top_k] = predictions
+        return predictions
+
+    def _model_ready(self) -> bool:
+        return bool(self.clip_model and self.clip_processor and self.text_prompt_embeddings is not None)
+
+    def _classification_error(self, message: str) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': message,
+            'ingredients': [],
+            'confidence': 0.0
+        }
+
+    def _build_classification(self, predictions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn ranked CLIP predictions into the classification response."""
+        ingredients: List[Dict[str, Any]] = []
+        confidence_scores: List[float] = []
+
+        for prediction in predictions:
+            canonical_name = prediction['canonical_name']
+            normalized = self._normalize_prediction(canonical_name)
+            if not normalized:
+                continue
+
+            probability = float(prediction['probability'])
+            portion_estimate = calorie_calculator.estimate_portion_size(canonical_name, probability)
+            nutrition_snapshot = self._get_nutrition_snapshot(canonical_name)
+
+            ingredient_entry = {
+                'name': canonical_name,
+                'display_name': normalized['display_name'],
+                'raw_prediction_label': canonical_name,
+                'matched_keyword': prediction.get('matched_synonym', normalized['matched_keyword']),
+                'confidence': round(probability, 4),
+                'confidence_percent': round(probability * 100, 1),
+                'clip_score': round(float(prediction['score']), 4),
+                'prompt_used': prediction.get('prompt'),
+                'category': normalized['category'],
+                'nutritional_info': normalized['key_nutrients'],
+                'nutrition_summary': nutrition_snapshot,
+                'portion_override_g': round(portion_estimate, 1) if portion_estimate else None,
+                'component_ingredients': normalized['ingredients']
             }
+            if 'box' in prediction:
+                ingredient_entry['box'] = prediction['box']
+                ingredient_entry['region'] = prediction.get('region')
+            ingredients.append(ingredient_entry)
+            confidence_scores.append(probability)
+        
+        # Calculate overall confidence
+        overall_confidence = confidence_scores[0] if confidence_scores else 0.0
+        
+        return {
+            'success': True,
+            'ingredients': ingredients,
+            'confidence': overall_confidence,
+            'total_ingredients': len(ingredients),
+            'processing_time': datetime.now().isoformat()
+        }
 
     def _normalize_prediction(self, raw_label: str) -> Optional[Dict[str, Any]]:
         """Normalize ImageNet raw label into a canonical food profile."""
@@ -274,13 +569,6 @@ class FoodClassificationService:
         """Generate descriptive prompts for each food profile."""
         prompts: List[str] = []
         metadata: List[Dict[str, str]] = []
-        base_templates = [
-            "a high quality food photograph of {}",
-            "a close-up photo of {}",
-            "a plate of {}",
-            "{} on a dining table"
-        ]
-
         for canonical_name, profile in self.food_profiles.items():
             synonyms = profile.get('synonyms', [])
             normalized_synonyms = set()
@@ -293,7 +581,7 @@ class FoodClassificationService:
                 cleaned_synonym = synonym.strip()
                 if not cleaned_synonym:
                     continue
-                for template in base_templates:
+                for template in self.PROMPT_TEMPLATES:
                     prompt = template.format(cleaned_synonym)
                     prompts.append(prompt)
                     metadata.append({
@@ -306,64 +594,113 @@ class FoodClassificationService:
 
     def _predict_with_clip(self, image: Image.Image, top_k: int = 5) -> List[Dict[str, Any]]:
         """Run CLIP inference and return top-k canonical predictions."""
-        if (
-            not self.clip_model
-            or not self.clip_processor
-            or self.text_prompt_embeddings is None
-            or not self.canonical_to_indices
-        ):
-            return []
+        return self._predict_image(image, top_k)[1]
 
-        image_inputs = self.clip_processor(images=image, return_tensors='pt')
-        image_inputs = {key: value.to(self.device) for key, value in image_inputs.items()}
+    def _predict_image(self, image: Image.Image, top_k: int = 5) -> Tuple[Optional[torch.Tensor], List[Dict[str, Any]]]:
+        """Normalized image features and top-k canonical predictions for one image."""
+        if not self._model_ready() or not self.canonical_to_indices:
+            return None, []
+        if self.image_batcher is not None:
+            return self.image_batcher((image, top_k))
+        return self._predict_images([image], top_k)[0]
 
-        with torch.no_grad():
-            image_features = self.clip_model.get_image_features(**image_inputs)
+    def _predict_with_clip_batch(self, images: List[Image.Image], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Top-k canonical predictions for each image, ``batch_size`` images per forward pass."""
+        return [predictions for _, predictions in self._predict_images(images, top_k)]
 
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
-        similarity_scores = image_features @ self.text_prompt_embeddings.T
-        similarity_scores = similarity_scores.squeeze(0)
+    def _predict_images(self, images: List[Image.Image], top_k: int = 5) -> List[Tuple[Optional[torch.Tensor], List[Dict[str, Any]]]]:
+        """(features, top-k predictions) per image, ``batch_size`` images per forward pass."""
+        if not self._model_ready() or not self.canonical_to_indices:
+            return [(None, []) for _ in images]
 
-        canonical_candidates: List[Dict[str, Any]] = []
-        canonical_score_tensors: List[torch.Tensor] = []
+        results: List[Tuple[Optional[torch.Tensor], List[Dict[str, Any]]]] = []
+        for start in range(0, len(images), self.batch_size):
+            image_features = self._encode_images(images[start:start + self.batch_size])
+            ranked = self._rank_canonicals(
+                image_features @ self.text_prompt_embeddings.T,
+                [top_k] * len(image_features)
+            )
+            results.extend(zip(image_features, ranked))
+        return results
+
+    def _run_image_batch(self, requests: List[Tuple[Image.Image, int]]) -> List[Tuple[torch.Tensor, List[Dict[str, Any]]]]:
+        """MicroBatcher callback: one forward pass for the (image, top_k) requests collected."""
+        image_features = self._encode_images([image for image, _ in requests])
+        ranked = self._rank_canonicals(
+            image_features @ self.text_prompt_embeddings.T,
+            [top_k for _, top_k in requests]
+        )
+        return list(zip(image_features, ranked))
+
+    def _score_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """Cosine similarity of each image to every text prompt, shape [images, prompts]."""
+        return self._encode_images(images) @ self.text_prompt_embeddings.T
+
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """L2-normalized CLIP image features, shape [images, dim]."""
+        if self.onnx_encoder is not None:
+            pixel_values = self.clip_processor(images=images, return_tensors='np')['pixel_values']
+            image_features = torch.from_numpy(self.onnx_encoder.encode(pixel_values)).to(self.device)
+        else:
+            image_inputs = self.clip_processor(images=images, return_tensors='pt')
+            image_inputs = {key: value.to(self.device) for key, value in image_inputs.items()}
+
+            with torch.no_grad():
+                image_features = self.clip_model.get_image_features(**image_inputs)
 
-        for canonical_name, indices in self.canonical_to_indices.items():
-            prompt_scores = similarity_scores[indices]
-            max_score, best_local_idx = torch.max(prompt_scores, dim=0)
-            best_prompt_index = indices[best_local_idx.item()]
-            canonical_candidates.append({
-                'canonical_name': canonical_name,
-                'score': max_score.detach().cpu().item(),
-                'score_tensor': max_score,
-                'best_prompt_index': best_prompt_index
-            })
-            canonical_score_tensors.append(max_score)
+        return image_features / image_features.norm(p=2, dim=-1, keepdim=True)
 
-        if not canonical_candidates:
-            return []
+    def _rank_canonicals(self, similarity_scores: torch.Tensor, top_ks: List[int]) -> List[List[Dict[str, Any]]]:
+        """
+        Pool prompt similarities per canonical food and keep each image's top-k.
 
-        stacked_scores = torch.stack(canonical_score_tensors)
-        probabilities = torch.nn.functional.softmax(stacked_scores / self.temperature, dim=0)
+        Everything stays on the device - a segment max through the padded
+        index matrix, one topk, one softmax over each image's own top-k -
+        and the result is copied to the host once.
+        """
+        if self.canonical_prompt_index is None:
+            return [[] for _ in top_ks]
 
-        for candidate, probability in zip(canonical_candidates, probabilities):
-            prompt_index = candidate['best_prompt_index']
-            candidate['probability'] = probability.detach().cpu().item()
-            candidate['matched_synonym'] = self.prompt_metadata[prompt_index]['synonym']
-            candidate['prompt'] = self.text_prompts[prompt_index]
+        batch = similarity_scores.shape[0]
+        padding = similarity_scores.new_full((batch, 1), float('-inf'))
+        padded_scores = torch.cat([similarity_scores, padding], dim=1)
 
-        canonical_candidates.sort(key=lambda item: item['probability'], reverse=True)
-        top_candidates = canonical_candidates[:top_k]
+        # [images, canonicals, prompts per canonical] -> best prompt of every canonical
+        canonical_scores, best_local = padded_scores[:, self.canonical_prompt_index].max(dim=-1)
 
-        top_score_tensors = torch.stack([cand['score_tensor'] for cand in top_candidates])
-        top_probabilities = torch.nn.functional.softmax(top_score_tensors / self.temperature, dim=0)
+        k = min(max(top_ks, default=0), len(self.canonical_names))
+        if k <= 0:
+            return [[] for _ in top_ks]
+        top_scores, top_canonicals = canonical_scores.topk(k, dim=1)
+        best_prompts = self.canonical_prompt_index[top_canonicals, best_local.gather(1, top_canonicals)]
 
-        for candidate, probability in zip(top_candidates, top_probabilities):
-            candidate['probability'] = probability.detach().cpu().item()
+        # Probabilities are a softmax over each image's own top-k candidates
+        ranks = torch.arange(k, device=top_scores.device)
+        limits = torch.tensor(top_ks, device=top_scores.device).clamp(max=k).unsqueeze(1)
+        logits = (top_scores / self.temperature).masked_fill(ranks >= limits, float('-inf'))
+        probabilities = torch.softmax(logits.float(), dim=1)
 
-        for candidate in top_candidates:
-            candidate.pop('score_tensor', None)
+        # One device-to-host copy; indices are exact in float32 (far below 2**24)
+        table = torch.stack(
+            [top_scores.float(), probabilities, top_canonicals.float(), best_prompts.float()],
+            dim=-1
+        ).cpu().tolist()
 
-        return top_candidates
+        predictions: List[List[Dict[str, Any]]] = []
+        for rows, limit in zip(table, top_ks):
+            candidates = []
+            for score, probability, canonical_index, prompt_index in rows[:limit]:
+                prompt_index = int(prompt_index)
+                candidates.append({
+                    'canonical_name': self.canonical_names[int(canonical_index)],
+                    'score': score,
+                    'best_prompt_index': prompt_index,
+                    'probability': probability,
+                    'matched_synonym': self.prompt_metadata[prompt_index]['synonym'],
+                    'prompt': self.text_prompts[prompt_index]
+                })
+            predictions.append(candidates)
+        return predictions
 
     def _get_nutrition_snapshot(self, canonical_name: str) -> Optional[Dict[str, Any]]:
         """Return structured nutritional information for a canonical food name."""
@@ -406,18 +743,30 @@ class FoodClassificationService:
                 return category
         return 'other'
     
-    def extract_ingredients_from_meal(self, image_bytes: bytes) -> Dict[str, Any]:
+    def extract_ingredients_from_meal(self, image_bytes: bytes, image: Optional[Image.Image] = None,
+                                      regions: bool = False) -> Dict[str, Any]:
         """
         Extract ingredients from a meal image (multiple food items).
         
         Args:
             image_bytes: Raw image bytes
+            image: The same image already decoded by ``preprocess_image``, if available
+            regions: Detect each food separately (with boxes) instead of
+                taking the top labels of the whole image
             
         Returns:
             Dictionary with extracted ingredients and nutritional analysis
         """
-        result = self.classify_food(image_bytes)
-        
+        if regions:
+            return self._add_meal_analysis(self.detect_meal_items(image_bytes, image=image))
+        return self._add_meal_analysis(self.classify_food(image_bytes, image=image))
+
+    def extract_ingredients_from_meals(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """Batched ``extract_ingredients_from_meal``: one result per image, in order."""
+        return [self._add_meal_analysis(result) for result in self.classify_food_batch(images_bytes)]
+
+    def _add_meal_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach nutrition, calorie and meal analysis to a successful classification."""
         if not result['success']:
             return result
         
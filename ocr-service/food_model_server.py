@@ -0,0 +1,277 @@
+"""
+Food Model Server
+One local process that holds the food classification models, so several
+uvicorn workers (and services) on a host share a single copy of each
+model's weights and one CLIP batching queue instead of loading their own.
+
+The server listens on a Unix socket (``multiprocessing.connection``,
+authenticated, pickled messages) and serves one thread per client
+connection. The auth key is FOOD_MODEL_SERVER_AUTHKEY or, when that is
+unset, a random key the server writes to ``<socket>.key`` (mode 0600),
+where clients of the same user read it. Models are the classifier modules' own global instances,
+imported on first use or at startup with ``--preload``:
+
+  clip         food_classification_service   (CLIP zero-shot)
+  huggingface  huggingface_food_classifier   (nateraw/food)
+  ml           ml_food_classifier            (EfficientNetB0)
+  lightweight  lightweight_food_classifier   (color heuristics)
+
+Workers use ``FoodModelClient``, which has the classifier methods the
+food service calls. Requests from every worker meet in the server, so the
+CLIP micro-batcher stacks images across processes.
+
+Usage:
+    python food_model_server.py --preload clip
+    FOOD_MODEL_SERVER=/tmp/food-model-server.sock uvicorn food_service:app --workers 4
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.getenv('FOOD_MODEL_SERVER') or '/tmp/food-model-server.sock'
+# None: a random per-run key shared through a file beside the socket
+AUTHKEY = os.getenv('FOOD_MODEL_SERVER_AUTHKEY', '').encode('utf-8') or None
+
+BACKENDS = {
+    'clip': 'food_classification_service',
+    'huggingface': 'huggingface_food_classifier',
+    'ml': 'ml_food_classifier',
+    'lightweight': 'lightweight_food_classifier',
+}
+
+# Only these classifier methods can be called remotely
+REMOTE_METHODS = {
+    'classify_food', 'classify_food_batch', 'extract_ingredients_from_meal',
+    'extract_ingredients_from_meals', 'detect_meal_items',
+}
+
+
+class ModelServerError(RuntimeError):
+    """The model server could not be reached or failed to run a request."""
+
+
+def authkey_path(address: str) -> str:
+    """The file beside the socket that holds a generated auth key."""
+    return f"{address}.key"
+
+
+def read_authkey(address: str) -> bytes:
+    with open(authkey_path(address), 'rb') as handle:
+        return handle.read().strip()
+
+
+def write_authkey(address: str) -> bytes:
+    """Generate a random auth key and store it, readable by this user only."""
+    key = secrets.token_hex(32).encode('ascii')
+    path = authkey_path(address)
+    if os.path.exists(path):
+        os.unlink(path)
+    # O_EXCL with mode 0600: the key is never readable by others, even briefly
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as handle:
+        handle.write(key)
+    return key
+
+
+class FoodModelServer:
+    """Hosts the classifier instances and answers client requests."""
+
+    def __init__(self, address: str = DEFAULT_SOCKET, authkey: Optional[bytes] = AUTHKEY):
+        # Classifiers loaded here size their thread pools for the only model
+        # process on the host (however the server was launched)
+        os.environ['FOOD_MODEL_SERVER_PROCESS'] = '1'
+        self.address = address
+        self.authkey = authkey
+        self._models: Dict[str, Any] = {}
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.started = time.time()
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+
+    def model(self, backend: str):
+        """The classifier instance for ``backend``, imported on first use."""
+        model = self._models.get(backend)
+        if model is None:
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown backend '{backend}' (available: {', '.join(BACKENDS)})")
+            with self._load_lock:
+                model = self._models.get(backend)
+                if model is None:
+                    start = time.perf_counter()
+                    model = importlib.import_module(BACKENDS[backend]).food_classifier
+                    self._models[backend] = model
+                    logger.info(f"🧠 Loaded '{backend}' model in {time.perf_counter() - start:.1f} s")
+        return model
+
+    def status(self, backend: Optional[str] = None) -> Dict[str, Any]:
+        """Loaded models, request counts and, for CLIP, batching and cache stats."""
+        with self._stats_lock:
+            status = {
+                'pid': os.getpid(),
+                'uptime_s': round(time.time() - self.started, 1),
+                'loaded': sorted(self._models),
+                'requests': dict(self.requests),
+                'errors': self.errors,
+            }
+        clip = self._models.get('clip')
+        if clip is not None and backend in (None, 'clip'):
+            status['clip'] = {
+                'model_loaded': clip.clip_model is not None,
+                'device': str(clip.device),
+                'batching': clip.image_batcher.stats() if clip.image_batcher else None,
+                'result_cache': clip.result_cache.stats(),
+                'cascade': clip.cascade_stats.stats(),
+            }
+        return status
+
+    def handle(self, request: Dict[str, Any]) -> Any:
+        method = request.get('method')
+        backend = request.get('backend', 'clip')
+        if method == 'status':
+            return self.status(backend)
+        if method not in REMOTE_METHODS:
+            raise ValueError(f"Method '{method}' cannot be called remotely")
+        with self._stats_lock:
+            key = f"{backend}.{method}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+        model = self.model(backend)
+        return getattr(model, method)(*request.get('args', ()), **request.get('kwargs', {}))
+
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ('ok', self.handle(request))
+                except Exception as e:
+                    logger.error(f"❌ Model server request failed: {e}")
+                    with self._stats_lock:
+                        self.errors += 1
+                    response = ('error', f"{type(e).__name__}: {e}")
+                try:
+                    connection.send(response)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ Could not answer model server client: {e}")
+                    return
+
+    def serve_forever(self, preload: Optional[List[str]] = None):
+        for backend in preload or []:
+            self.model(backend)
+
+        # A socket left over from a previous run would make bind() fail
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        if self.authkey is None:
+            self.authkey = write_authkey(self.address)
+        with Listener(self.address, family='AF_UNIX', authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o600)
+            logger.info(f"🚀 Food model server listening on {self.address} "
+                        f"(models: {', '.join(sorted(self._models)) or 'loaded on demand'})")
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # Failed handshake (wrong authkey, client gone); keep serving
+                    logger.warning(f"⚠️ Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+
+class FoodModelClient:
+    """
+    Thin stand-in for a classifier instance that forwards calls to the model
+    server. One connection per calling thread; reconnects once on failure.
+    """
+
+    def __init__(self, backend: str = 'clip', address: str = DEFAULT_SOCKET,
+                 authkey: Optional[bytes] = AUTHKEY, connect_timeout: float = 120.0):
+        self.backend = backend
+        self.address = address
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # The server may still be loading models at startup
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    # A generated key is re-read on every attempt: the server writes a new one per run
+                    authkey = self.authkey if self.authkey is not None else read_authkey(self.address)
+                    connection = Client(self.address, family='AF_UNIX', authkey=authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError) as e:
+                    if time.monotonic() >= deadline:
+                        raise ModelServerError(f"Model server at {self.address} is not available: {e}")
+                    time.sleep(0.5)
+            self._local.connection = connection
+        return connection
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        request = {'backend': self.backend, 'method': method, 'args': args, 'kwargs': kwargs}
+        for attempt in (1, 2):
+            connection = self._connection()
+            try:
+                connection.send(request)
+                status, payload = connection.recv()
+                break
+            except (EOFError, OSError) as e:
+                self._local.connection = None
+                if attempt == 2:
+                    raise ModelServerError(f"Model server connection lost: {e}")
+        if status != 'ok':
+            raise ModelServerError(payload)
+        return payload
+
+    # Same signatures as the in-process classifiers; an already decoded
+    # ``image`` is not shipped across the socket - the server decodes the bytes.
+    def classify_food(self, image_bytes: bytes, image=None) -> Dict[str, Any]:
+        return self.call('classify_food', image_bytes)
+
+    def classify_food_batch(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        return self.call('classify_food_batch', images_bytes)
+
+    def extract_ingredients_from_meal(self, image_bytes: bytes, image=None, regions: bool = False) -> Dict[str, Any]:
+        if regions:
+            return self.call('extract_ingredients_from_meal', image_bytes, regions=True)
+        return self.call('extract_ingredients_from_meal', image_bytes)
+
+    def extract_ingredients_from_meals(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        return self.call('extract_ingredients_from_meals', images_bytes)
+
+    def detect_meal_items(self, image_bytes: bytes, image=None) -> Dict[str, Any]:
+        return self.call('detect_meal_items', image_bytes)
+
+    def status(self) -> Dict[str, Any]:
+        return self.call('status')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Shared food classification model server")
+    arg_parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    arg_parser.add_argument('--preload', default=os.getenv('FOOD_MODEL_SERVER_PRELOAD', 'clip'),
+                            help="comma-separated backends to load before accepting clients")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    preload = [backend.strip() for backend in args.preload.split(',') if backend.strip()]
+    FoodModelServer(args.socket).serve_forever(preload)
+
+
+if __name__ == "__main__":
+    main()
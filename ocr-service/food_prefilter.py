@@ -0,0 +1,198 @@
+"""
+Food Prefilter
+First stage of the food classification cascade. A color / histogram
+feature vector (the same cues LightweightFoodClassifier uses, computed on
+a 64x64 thumbnail) goes through a tiny linear softmax head; the answer is
+trusted only above a per-label probability threshold calibrated on a
+labeled image set:
+
+  - a confident single food (banana, apple, ...) is answered directly
+  - a confident ``non_food`` is rejected without running any model
+  - everything else is routed to the neural classifier (CLIP)
+
+Labels the head has no threshold for (``other`` - foods it was never
+meant to recognize) always route. The head, its feature scaling and the
+thresholds live in one JSON file (FOOD_PREFILTER_MODEL), produced by
+calibrate_food_prefilter.py.
+"""
+
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+NON_FOOD = 'non_food'
+HUE_BINS = 12
+THUMBNAIL = (64, 64)
+
+
+def color_features(image) -> List[float]:
+    """Hue histogram of saturated pixels plus saturation / brightness statistics."""
+    small = image.copy()
+    small.thumbnail(THUMBNAIL)
+    hue, saturation, value = small.convert('HSV').split()
+    total = float(small.width * small.height)
+
+    saturated = saturation.point(lambda level: 255 if level >= 60 else 0)
+    hue_histogram = hue.histogram(mask=saturated)
+    bin_width = 256 / HUE_BINS
+    hue_bins = [0.0] * HUE_BINS
+    for level, count in enumerate(hue_histogram):
+        hue_bins[min(HUE_BINS - 1, int(level / bin_width))] += count / total
+
+    def moments(histogram):
+        mean = sum(level * count for level, count in enumerate(histogram)) / total
+        variance = sum(count * (level - mean) ** 2 for level, count in enumerate(histogram)) / total
+        return mean / 255, math.sqrt(variance) / 255
+
+    s_mean, s_std = moments(saturation.histogram())
+    v_histogram = value.histogram()
+    v_mean, v_std = moments(v_histogram)
+    dark = sum(v_histogram[:40]) / total
+    # Plates, paper, walls: bright and unsaturated
+    pale = sum(saturation.histogram(mask=value.point(lambda level: 255 if level >= 200 else 0))[:40]) / total
+
+    return hue_bins + [sum(hue_bins), s_mean, s_std, v_mean, v_std, dark, pale]
+
+
+@dataclass
+class LinearHead:
+    """Softmax regression over standardized features."""
+
+    labels: List[str]
+    weights: List[List[float]]      # [labels][features]
+    bias: List[float]
+    feature_mean: List[float]
+    feature_scale: List[float]
+
+    def predict_proba(self, features: Sequence[float]) -> List[float]:
+        x = [(value - mean) / scale for value, mean, scale in zip(features, self.feature_mean, self.feature_scale)]
+        logits = [sum(w * v for w, v in zip(row, x)) + b for row, b in zip(self.weights, self.bias)]
+        top = max(logits)
+        exps = [math.exp(logit - top) for logit in logits]
+        total = sum(exps)
+        return [value / total for value in exps]
+
+    @classmethod
+    def fit(cls, features: Sequence[Sequence[float]], labels: Sequence[str],
+            epochs: int = 500, learning_rate: float = 0.5, l2: float = 1e-3) -> 'LinearHead':
+        """Full-batch gradient descent on the cross-entropy (needs NumPy)."""
+        import numpy as np
+
+        names = sorted(set(labels))
+        x = np.asarray(features, dtype=np.float64)
+        mean, scale = x.mean(axis=0), x.std(axis=0) + 1e-6
+        x = (x - mean) / scale
+        y = np.zeros((len(labels), len(names)))
+        y[np.arange(len(labels)), [names.index(label) for label in labels]] = 1.0
+
+        weights = np.zeros((len(names), x.shape[1]))
+        bias = np.zeros(len(names))
+        for _ in range(epochs):
+            logits = x @ weights.T + bias
+            logits -= logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            error = (probabilities - y) / len(labels)
+            weights -= learning_rate * (error.T @ x + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        return cls(names, weights.tolist(), bias.tolist(), mean.tolist(), scale.tolist())
+
+
+def calibrate_thresholds(probabilities: Sequence[Sequence[float]], labels: Sequence[str],
+                         head_labels: Sequence[str], target_precision: float = 0.97,
+                         min_support: int = 5, never_accept: Sequence[str] = ('other',)) -> Dict[str, float]:
+    """
+    Lowest probability threshold per label at which the head's answers for
+    that label are still at least ``target_precision`` correct on the
+    calibration set. Labels that never get there are left out (always routed).
+    """
+    thresholds: Dict[str, float] = {}
+    for index, label in enumerate(head_labels):
+        if label in never_accept:
+            continue
+        # Samples the head would answer with this label, most confident first
+        answered = sorted(
+            ((row[index], truth == label) for row, truth in zip(probabilities, labels)
+             if max(range(len(row)), key=row.__getitem__) == index),
+            reverse=True,
+        )
+        correct, best = 0, None
+        for count, (probability, is_correct) in enumerate(answered, start=1):
+            correct += is_correct
+            if count >= min_support and correct / count >= target_precision:
+                best = probability
+        if best is not None:
+            thresholds[label] = best
+    return thresholds
+
+
+@dataclass
+class PrefilterDecision:
+    action: str                     # 'accept' / 'reject' / 'route'
+    label: Optional[str] = None
+    probability: float = 0.0
+
+
+class CascadeStats:
+    """Per-stage answer counts and latency of the cascade."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.total_ms: Dict[str, float] = {}
+
+    def record(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.total_ms[stage] = self.total_ms.get(stage, 0.0) + elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                'requests': total,
+                'stages': {
+                    stage: {
+                        'count': count,
+                        'hit_rate': round(count / total, 4),
+                        'average_ms': round(self.total_ms[stage] / count, 3),
+                    }
+                    for stage, count in self.counts.items()
+                },
+            }
+
+
+@dataclass
+class ColorPrefilter:
+    head: LinearHead
+    thresholds: Dict[str, float] = field(default_factory=dict)
+
+    def decide(self, image) -> PrefilterDecision:
+        probabilities = self.head.predict_proba(color_features(image))
+        index = max(range(len(probabilities)), key=probabilities.__getitem__)
+        label, probability = self.head.labels[index], probabilities[index]
+        threshold = self.thresholds.get(label)
+        if threshold is None or probability < threshold:
+            return PrefilterDecision('route', label, probability)
+        return PrefilterDecision('reject' if label == NON_FOOD else 'accept', label, probability)
+
+    def save(self, path: str):
+        payload = {'head': self.head.__dict__, 'thresholds': self.thresholds, 'hue_bins': HUE_BINS}
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump(payload, handle, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ColorPrefilter']:
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                payload = json.load(handle)
+            return cls(LinearHead(**payload['head']), payload.get('thresholds', {}))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️ Could not load food prefilter from {path}: {e}")
+            return None
@@ -0,0 +1,193 @@
+"""
+Food Result Cache
+Remembers what the CLIP image encoder said about recently classified
+photos. The same meal photo comes back often - gallery re-uploads,
+/classify-food followed by /classify-ingredients, client retries - and
+re-running the vision tower for it is the whole cost of a request.
+
+Two tiers:
+  - exact: SHA-256 of the uploaded bytes, checked before the image is
+    even decoded
+  - similar: a 64-bit perceptual hash (dHash, or pHash) of the decoded
+    image; an entry within ``max_distance`` bits (Hamming) is a re-shot
+    or re-encode of the same plate and reuses its result
+
+Entries keep the normalized image features and the ranked predictions,
+so a hit for a different top-k is re-ranked without the encoder. LRU
+bounded with an idle TTL; ``stats`` reports hit rates per tier.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from startup_profile import lazy_import
+
+np = lazy_import('numpy')
+PIL_Image = lazy_import('PIL.Image')
+
+logger = logging.getLogger(__name__)
+
+HASH_METHODS = ('dhash', 'phash')
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, size: int = 8) -> int:
+    """Difference hash: brightness gradients of a (size+1)x(size) thumbnail."""
+    small = image.resize((size + 1, size), PIL_Image.BILINEAR, reducing_gap=3.0).convert('L')
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def phash(image, size: int = 8, factor: int = 4) -> int:
+    """DCT hash: low-frequency DCT coefficients of a thumbnail against their median."""
+    side = size * factor
+    small = image.resize((side, side), PIL_Image.BILINEAR, reducing_gap=3.0).convert('L')
+    pixels = np.asarray(small, dtype=np.float32)
+    # Orthogonal DCT-II basis; the 2-D transform is basis @ pixels @ basis.T
+    n = np.arange(side)
+    basis = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * side))
+    low = (basis @ pixels @ basis.T)[:size, :size].flatten()
+    bits = 0
+    for above in low > np.median(low[1:]):
+        bits = (bits << 1) | bool(above)
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+@dataclass
+class CachedClassification:
+    """Encoder output for one image."""
+
+    features: Any                                  # normalized image features (CPU tensor)
+    predictions: Dict[int, List[Dict[str, Any]]]   # top_k -> ranked predictions
+    image_hash: Optional[int] = None
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class FoodResultCache:
+    """Thread-safe LRU of classification results with exact and near-duplicate lookup."""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600,
+                 hash_method: Optional[str] = 'dhash', max_distance: int = 6):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.hash_method = hash_method if hash_method in HASH_METHODS else None
+        self.max_distance = max(0, int(max_distance))
+        self._entries: "OrderedDict[str, CachedClassification]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def image_hash(self, image) -> Optional[int]:
+        """Perceptual hash of a decoded image, or None when the similar tier is off."""
+        if self.hash_method is None:
+            return None
+        try:
+            return phash(image) if self.hash_method == 'phash' else dhash(image)
+        except Exception as e:
+            logger.warning(f"⚠️ Perceptual hash failed: {e}")
+            return None
+
+    def get(self, key: str) -> Optional[CachedClassification]:
+        """Exact tier: the entry stored under this content hash."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return None
+            self._touch(key, entry)
+            self.exact_hits += 1
+            return entry
+
+    def find_similar(self, key: str, image_hash: Optional[int]) -> Optional[CachedClassification]:
+        """
+        Similar tier: the closest entry within ``max_distance`` bits. A hit is
+        also stored under ``key`` so the next identical upload is an exact hit.
+        Counts a miss when nothing matches.
+        """
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            if image_hash is not None:
+                for entry in self._entries.values():
+                    if entry.image_hash is None or self._expired(entry):
+                        continue
+                    distance = hamming_distance(image_hash, entry.image_hash)
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+                        if distance == 0:
+                            break
+            if best is None:
+                self.misses += 1
+                return None
+            self._touch(key, best)
+            self._evict()
+            self.similar_hits += 1
+            return best
+
+    def put(self, key: str, entry: CachedClassification):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._touch(key, entry)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit rates per tier."""
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hash_method': self.hash_method,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+                'similar_hit_rate': self.similar_hits / lookups if lookups else 0.0,
+            }
+
+    def _touch(self, key: str, entry: CachedClassification):
+        entry.last_used = time.monotonic()
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def _expired(self, entry: CachedClassification) -> bool:
+        return time.monotonic() - entry.last_used > self.ttl_seconds
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and oldest.last_used >= cutoff:
+                break
+            del self._entries[oldest_key]
+            self.evictions += 1
@@ -1,20 +1,29 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List, Dict, Any
 import base64
-import io
 import os
 import tempfile
 import requests
-from PIL import Image
 import json
 from datetime import datetime
-from food_classification_service import food_classifier
 from calorie_calculation_service import calorie_calculator
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# FOOD_MODEL_SERVER=<socket path>: use the shared model server (food_model_server.py)
+# instead of loading the models in every worker
+FOOD_MODEL_SERVER = os.getenv('FOOD_MODEL_SERVER', '')
+if FOOD_MODEL_SERVER:
+    from food_model_server import FoodModelClient
+    food_classifier = FoodModelClient('clip', FOOD_MODEL_SERVER)
+else:
+    from food_classification_service import food_classifier
+
+FOOD_BATCH_MAX_FILES = int(os.getenv('FOOD_BATCH_MAX_FILES', '32'))
+
 app = FastAPI(title="Food Classification Service", version="1.0.0")
 
 # Configure CORS
@@ -30,7 +39,8 @@ app.add_middleware(
 @app.post("/classify-food")
 async def classify_food_image(
     file: UploadFile = File(...), 
-    extract_ingredients: bool = True
+    extract_ingredients: bool = True,
+    regions: bool = False
 ):
     """
     Classify food items in uploaded image and extract ingredients.
@@ -38,6 +48,7 @@ async def classify_food_image(
     Args:
         file: Uploaded image file
         extract_ingredients: Whether to extract detailed ingredient information
+        regions: Detect each food on the plate separately, with boxes
         
     Returns:
         Dictionary with classification results
@@ -46,50 +57,104 @@ async def classify_food_image(
         # Read file content
         contents = await file.read()
         
-        # Validate image
-        try:
-            image = Image.open(io.BytesIO(contents))
-            if image.mode not in ['RGB', 'RGBA']:
-                image = image.convert('RGB')
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+        # Validate image: decode it once, at reduced size, and reuse it for classification
+        # (with a model server the bytes go over the socket and the server decodes them)
+        image = None
+        if not FOOD_MODEL_SERVER:
+            image = await run_in_threadpool(food_classifier.preprocess_image, contents)
+            if image is None:
+                raise HTTPException(status_code=400, detail="Invalid image file: could not decode image")
         
-        # Classify food items
+        # Classify food items off the event loop, so concurrent uploads
+        # reach the classifier together and share a CLIP forward pass
         if extract_ingredients:
-            result = food_classifier.extract_ingredients_from_meal(contents)
+            result = await run_in_threadpool(food_classifier.extract_ingredients_from_meal, contents, image, regions)
+        elif regions:
+            result = await run_in_threadpool(food_classifier.detect_meal_items, contents, image)
         else:
-            result = food_classifier.classify_food(contents)
+            result = await run_in_threadpool(food_classifier.classify_food, contents, image)
         
-        if not result.get('success', False):
-            return {
-                "success": False,
-                "error": result.get('error', 'Food classification failed'),
-                "ingredients": [],
-                "confidence": 0.0
-            }
+        return _format_classification(result)
         
-        # Format response
-        response = {
-            "success": True,
-            "ingredients": result.get('ingredients', []),
-            "confidence": result.get('confidence', 0.0),
-            "total_ingredients": result.get('total_ingredients', 0),
-            "processing_time": result.get('processing_time', datetime.now().isoformat()),
-            "nutritional_analysis": result.get('nutritional_analysis', {}),
-            "calorie_analysis": result.get('calorie_analysis', {}),
-            "meal_suggestions": result.get('meal_suggestions', []),
-            "dietary_labels": result.get('dietary_labels', [])
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Food classification failed: {str(e)}",
+            "ingredients": [],
+            "confidence": 0.0
         }
+
+@app.post("/classify-food/batch")
+async def classify_food_batch(
+    files: List[UploadFile] = File(...),
+    extract_ingredients: bool = True
+):
+    """
+    Classify several food images in one request with batched model inference.
+    
+    Args:
+        files: Uploaded image files
+        extract_ingredients: Whether to extract detailed ingredient information
         
-        return response
-        
+    Returns:
+        Dictionary with one classification result per file, in upload order
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > FOOD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(files)} (limit {FOOD_BATCH_MAX_FILES})"
+        )
+
+    try:
+        contents = [await file.read() for file in files]
+        if extract_ingredients:
+            results = await run_in_threadpool(food_classifier.extract_ingredients_from_meals, contents)
+        else:
+            results = await run_in_threadpool(food_classifier.classify_food_batch, contents)
+
+        formatted = []
+        for file, result in zip(files, results):
+            entry = _format_classification(result)
+            entry["filename"] = file.filename
+            formatted.append(entry)
+
+        return {
+            "success": any(entry["success"] for entry in formatted),
+            "results": formatted,
+            "total_images": len(formatted),
+            "processing_time": datetime.now().isoformat()
+        }
+
     except Exception as e:
         return {
             "success": False,
-            "error": f"Food classification failed: {str(e)}",
+            "error": f"Batch food classification failed: {str(e)}",
+            "results": []
+        }
+
+def _format_classification(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a classifier result into the /classify-food response."""
+    if not result.get('success', False):
+        return {
+            "success": False,
+            "error": result.get('error', 'Food classification failed'),
             "ingredients": [],
             "confidence": 0.0
         }
+    
+    return {
+        "success": True,
+        "ingredients": result.get('ingredients', []),
+        "confidence": result.get('confidence', 0.0),
+        "total_ingredients": result.get('total_ingredients', 0),
+        "processing_time": result.get('processing_time', datetime.now().isoformat()),
+        "nutritional_analysis": result.get('nutritional_analysis', {}),
+        "calorie_analysis": result.get('calorie_analysis', {}),
+        "meal_suggestions": result.get('meal_suggestions', []),
+        "dietary_labels": result.get('dietary_labels', [])
+    }
 
 @app.post("/classify-ingredients")
 async def classify_ingredients_only(file: UploadFile = File(...)):
@@ -98,7 +163,7 @@ async def classify_ingredients_only(file: UploadFile = File(...)):
     """
     try:
         contents = await file.read()
-        result = food_classifier.classify_food(contents)
+        result = await run_in_threadpool(food_classifier.classify_food, contents)
         
         if not result.get('success', False):
             return {
@@ -130,11 +195,30 @@ async def classify_ingredients_only(file: UploadFile = File(...)):
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    if FOOD_MODEL_SERVER:
+        try:
+            server = await run_in_threadpool(food_classifier.status)
+        except Exception as e:
+            return {"status": "degraded", "service": "Food Classification Service", "model_server": str(e)}
+        clip = server.get('clip', {})
+        return {
+            "status": "healthy",
+            "service": "Food Classification Service",
+            "model_loaded": clip.get('model_loaded', False),
+            "device": clip.get('device'),
+            "batching": clip.get('batching'),
+            "result_cache": clip.get('result_cache'),
+            "cascade": clip.get('cascade'),
+            "model_server": server
+        }
     return {
         "status": "healthy", 
         "service": "Food Classification Service",
-        "model_loaded": food_classifier.model is not None,
-        "device": str(food_classifier.device)
+        "model_loaded": food_classifier.clip_model is not None,
+        "device": str(food_classifier.device),
+        "batching": food_classifier.image_batcher.stats() if food_classifier.image_batcher else None,
+        "result_cache": food_classifier.result_cache.stats(),
+        "cascade": food_classifier.cascade_stats.stats()
     }
 
 @app.get("/")
@@ -144,7 +228,9 @@ async def root():
         "message": "Food Classification Service is running",
         "endpoints": {
             "/classify-food": "POST - Full food classification with nutritional analysis",
+            "/classify-food/batch": "POST - Classify several images in one batched request",
             "/classify-ingredients": "POST - Simple ingredient classification",
+            "/nutrition/aggregate": "POST - Daily / weekly nutrient totals of many meals",
             "/health": "GET - Health check"
         },
         "features": [
@@ -218,6 +304,27 @@ async def update_portion_size(request: Dict[str, Any]):
             detail=f"Failed to update portion size: {str(e)}"
         )
 
+@app.post("/nutrition/aggregate")
+async def aggregate_nutrition(request: Dict[str, Any]):
+    """
+    Nutrient totals of many logged meals per user and day or week.
+    
+    Args:
+        request: Dictionary containing meals ([{date, user_id, ingredients: [{name, portion_size_g}]}])
+            and period ('day' or 'week')
+        
+    Returns:
+        One nutrient summary per user and period
+    """
+    meals = request.get('meals')
+    if not isinstance(meals, list):
+        raise HTTPException(status_code=400, detail="Missing required field: meals (list)")
+    try:
+        summary = await run_in_threadpool(calorie_calculator.aggregate_meals, meals, request.get('period', 'day'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **summary}
+
 @app.get("/test")
 async def test_classification():
     """Test endpoint with sample food classification"""
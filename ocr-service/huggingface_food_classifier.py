@@ -13,13 +13,33 @@ import numpy as np
 from datetime import datetime
 import json
 
+from micro_batcher import MicroBatcher
+from nutrition_dataset import get_dataset
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+
+def default_num_threads() -> Optional[int]:
+    """
+    Intra-op threads per process: the cores split evenly between the service
+    workers when each worker runs its own model. None inside the shared model
+    server, the host's only model process (CLIP runs there too), so torch keeps
+    its all-cores default.
+    """
+    if os.getenv('FOOD_MODEL_SERVER_PROCESS') == '1':
+        return None
+    workers = max(1, int(os.getenv('FOOD_SERVICE_WORKERS', '1')))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
 class HuggingFaceFoodClassifier:
     """ML-based food classification using HuggingFace pre-trained models."""
     
-    def __init__(self):
+    def __init__(self, precision: Optional[str] = None, num_threads: Optional[int] = None,
+                 batching: Optional[bool] = None):
         logger.info("🚀 Initializing HuggingFace Food Classifier...")
         
         try:
@@ -28,6 +48,13 @@ class HuggingFaceFoodClassifier:
             
             self.torch = torch
             
+            # Several workers on one host each default to all cores and oversubscribe them
+            self.num_threads = num_threads or int(os.getenv('FOOD_HF_THREADS', '0')) or default_num_threads()
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            else:
+                self.num_threads = torch.get_num_threads()
+            
             # Use the best food classification model from HuggingFace
             # Option 1: nateraw/food (2000+ foods, very accurate)
             # Option 2: Kaludi/food-category-classification-v2.0 (more general categories)
@@ -42,18 +69,43 @@ class HuggingFaceFoodClassifier:
             # Set to evaluation mode
             self.model.eval()
             
+            # CPU precision: fp32, bfloat16 weights, or int8 dynamic quantization of the Linear layers
+            self.precision = (precision or os.getenv('FOOD_HF_PRECISION', 'fp32')).lower()
+            if self.precision not in PRECISIONS:
+                logger.warning(f"⚠️ Unknown FOOD_HF_PRECISION '{self.precision}', using fp32")
+                self.precision = 'fp32'
+            self.input_dtype = torch.float32
+            if self.precision == 'bf16':
+                self.model = self.model.to(torch.bfloat16)
+                self.input_dtype = torch.bfloat16
+            elif self.precision == 'int8':
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            
+            # Tensor preprocessing with the processor's own size / normalization
+            self._init_fast_preprocessing()
+            
+            # Concurrent single-image requests are stacked into one forward pass
+            self.batch_size = max(1, int(os.getenv('FOOD_HF_BATCH_SIZE', '16')))
+            if batching is None:
+                batching = os.getenv('FOOD_HF_BATCHING', '1').lower() in ('1', 'true', 'yes')
+            self.image_batcher: Optional[MicroBatcher] = None
+            if batching:
+                self.image_batcher = MicroBatcher(
+                    self._run_batch,
+                    max_batch_size=self.batch_size,
+                    max_wait_ms=float(os.getenv('FOOD_HF_BATCH_WAIT_MS', '10')),
+                    name='hf-image-batcher'
+                )
+            
             # Get label mapping
             self.id2label = self.model.config.id2label
             self.num_classes = len(self.id2label)
             
-            logger.info(f"✅ Model loaded successfully!")
+            logger.info(f"✅ Model loaded successfully! ({self.precision}, {self.num_threads} threads)")
             logger.info(f"📊 Can recognize {self.num_classes} different food items")
             
-            # Load comprehensive nutrition database
-            self.nutrition_db = self._load_nutrition_database()
-            
-            # Build food name mapping (lowercase for matching)
-            self.food_name_map = self._build_food_name_map()
+            # Shared nutrition dataset (names, aliases and nutrients per 100 g)
+            self.nutrition_dataset = get_dataset()
             
         except Exception as e:
             logger.error(f"❌ Failed to load HuggingFace model: {e}")
@@ -61,132 +113,19 @@ class HuggingFaceFoodClassifier:
             traceback.print_exc()
             raise
     
-    def _load_nutrition_database(self) -> Dict[str, Dict]:
-        """Load comprehensive USDA nutrition database for common foods."""
-        # This is a subset - in production, load from USDA FoodData Central API
-        return {
-            # Fruits
-            'apple': {'calories': 52, 'protein': 0.3, 'carbs': 13.8, 'fat': 0.2, 'fiber': 2.4, 'portion': 100},
-            'banana': {'calories': 89, 'protein': 1.1, 'carbs': 22.8, 'fat': 0.3, 'fiber': 2.6, 'portion': 100},
-            'orange': {'calories': 47, 'protein': 0.9, 'carbs': 11.8, 'fat': 0.1, 'fiber': 2.4, 'portion': 100},
-            'strawberry': {'calories': 32, 'protein': 0.7, 'carbs': 7.7, 'fat': 0.3, 'fiber': 2.0, 'portion': 100},
-            'grape': {'calories': 69, 'protein': 0.7, 'carbs': 18.1, 'fat': 0.2, 'fiber': 0.9, 'portion': 100},
-            'watermelon': {'calories': 30, 'protein': 0.6, 'carbs': 7.6, 'fat': 0.2, 'fiber': 0.4, 'portion': 100},
-            'pineapple': {'calories': 50, 'protein': 0.5, 'carbs': 13.1, 'fat': 0.1, 'fiber': 1.4, 'portion': 100},
-            'mango': {'calories': 60, 'protein': 0.8, 'carbs': 15.0, 'fat': 0.4, 'fiber': 1.6, 'portion': 100},
-            'avocado': {'calories': 160, 'protein': 2.0, 'carbs': 8.5, 'fat': 14.7, 'fiber': 6.7, 'portion': 100},
-            'peach': {'calories': 39, 'protein': 0.9, 'carbs': 9.5, 'fat': 0.3, 'fiber': 1.5, 'portion': 100},
-            
-            # Vegetables
-            'broccoli': {'calories': 34, 'protein': 2.8, 'carbs': 6.6, 'fat': 0.4, 'fiber': 2.6, 'portion': 100},
-            'carrot': {'calories': 41, 'protein': 0.9, 'carbs': 9.6, 'fat': 0.2, 'fiber': 2.8, 'portion': 100},
-            'tomato': {'calories': 18, 'protein': 0.9, 'carbs': 3.9, 'fat': 0.2, 'fiber': 1.2, 'portion': 100},
-            'lettuce': {'calories': 15, 'protein': 1.4, 'carbs': 2.9, 'fat': 0.2, 'fiber': 1.3, 'portion': 100},
-            'cucumber': {'calories': 15, 'protein': 0.7, 'carbs': 3.6, 'fat': 0.1, 'fiber': 0.5, 'portion': 100},
-            'pepper': {'calories': 31, 'protein': 1.0, 'carbs': 6.0, 'fat': 0.3, 'fiber': 2.1, 'portion': 100},
-            'onion': {'calories': 40, 'protein': 1.1, 'carbs': 9.3, 'fat': 0.1, 'fiber': 1.7, 'portion': 100},
-            'potato': {'calories': 77, 'protein': 2.0, 'carbs': 17.5, 'fat': 0.1, 'fiber': 2.2, 'portion': 100},
-            'spinach': {'calories': 23, 'protein': 2.9, 'carbs': 3.6, 'fat': 0.4, 'fiber': 2.2, 'portion': 100},
-            
-            # Proteins
-            'chicken': {'calories': 165, 'protein': 31.0, 'carbs': 0.0, 'fat': 3.6, 'fiber': 0.0, 'portion': 100},
-            'beef': {'calories': 250, 'protein': 26.0, 'carbs': 0.0, 'fat': 17.0, 'fiber': 0.0, 'portion': 100},
-            'pork': {'calories': 242, 'protein': 27.0, 'carbs': 0.0, 'fat': 14.0, 'fiber': 0.0, 'portion': 100},
-            'fish': {'calories': 206, 'protein': 22.0, 'carbs': 0.0, 'fat': 13.0, 'fiber': 0.0, 'portion': 100},
-            'salmon': {'calories': 208, 'protein': 20.0, 'carbs': 0.0, 'fat': 13.0, 'fiber': 0.0, 'portion': 100},
-            'tuna': {'calories': 144, 'protein': 23.0, 'carbs': 0.0, 'fat': 6.0, 'fiber': 0.0, 'portion': 100},
-            'egg': {'calories': 143, 'protein': 12.6, 'carbs': 0.7, 'fat': 9.5, 'fiber': 0.0, 'portion': 100},
-            'shrimp': {'calories': 99, 'protein': 24.0, 'carbs': 0.2, 'fat': 0.3, 'fiber': 0.0, 'portion': 100},
-            
-            # Grains & Bread
-            'bread': {'calories': 265, 'protein': 9.0, 'carbs': 49.0, 'fat': 3.2, 'fiber': 2.7, 'portion': 100},
-            'rice': {'calories': 130, 'protein': 2.7, 'carbs': 28.2, 'fat': 0.3, 'fiber': 0.4, 'portion': 100},
-            'pasta': {'calories': 131, 'protein': 5.0, 'carbs': 25.0, 'fat': 1.1, 'fiber': 1.8, 'portion': 100},
-            'pizza': {'calories': 266, 'protein': 11.0, 'carbs': 33.0, 'fat': 10.0, 'fiber': 2.5, 'portion': 100},
-            'sandwich': {'calories': 250, 'protein': 12.0, 'carbs': 30.0, 'fat': 9.0, 'fiber': 3.0, 'portion': 150},
-            'bagel': {'calories': 257, 'protein': 10.0, 'carbs': 50.0, 'fat': 1.5, 'fiber': 2.3, 'portion': 100},
-            'tortilla': {'calories': 218, 'protein': 6.0, 'carbs': 36.0, 'fat': 6.0, 'fiber': 3.0, 'portion': 100},
-            
-            # Dairy
-            'cheese': {'calories': 402, 'protein': 25.0, 'carbs': 1.3, 'fat': 33.0, 'fiber': 0.0, 'portion': 100},
-            'milk': {'calories': 61, 'protein': 3.2, 'carbs': 4.8, 'fat': 3.3, 'fiber': 0.0, 'portion': 100},
-            'yogurt': {'calories': 59, 'protein': 10.0, 'carbs': 3.6, 'fat': 0.4, 'fiber': 0.0, 'portion': 100},
-            'butter': {'calories': 717, 'protein': 0.9, 'carbs': 0.1, 'fat': 81.0, 'fiber': 0.0, 'portion': 100},
-            
-            # Snacks & Desserts
-            'ice_cream': {'calories': 207, 'protein': 3.5, 'carbs': 24.0, 'fat': 11.0, 'fiber': 0.7, 'portion': 100},
-            'chocolate': {'calories': 546, 'protein': 4.9, 'carbs': 61.0, 'fat': 31.0, 'fiber': 7.0, 'portion': 100},
-            'cookie': {'calories': 502, 'protein': 5.0, 'carbs': 64.0, 'fat': 25.0, 'fiber': 2.0, 'portion': 100},
-            'cake': {'calories': 257, 'protein': 2.6, 'carbs': 42.0, 'fat': 9.0, 'fiber': 0.6, 'portion': 100},
-            'donut': {'calories': 452, 'protein': 5.0, 'carbs': 51.0, 'fat': 25.0, 'fiber': 1.6, 'portion': 100},
-            'chips': {'calories': 536, 'protein': 6.6, 'carbs': 53.0, 'fat': 34.0, 'fiber': 4.4, 'portion': 100},
-            'fries': {'calories': 312, 'protein': 3.4, 'carbs': 41.0, 'fat': 15.0, 'fiber': 3.8, 'portion': 100},
-            'popcorn': {'calories': 387, 'protein': 12.0, 'carbs': 78.0, 'fat': 4.5, 'fiber': 15.0, 'portion': 100},
-            
-            # Beverages (per 100ml)
-            'juice': {'calories': 45, 'protein': 0.5, 'carbs': 11.0, 'fat': 0.1, 'fiber': 0.2, 'portion': 100},
-            'soda': {'calories': 41, 'protein': 0.0, 'carbs': 10.6, 'fat': 0.0, 'fiber': 0.0, 'portion': 100},
-            'coffee': {'calories': 2, 'protein': 0.1, 'carbs': 0.0, 'fat': 0.0, 'fiber': 0.0, 'portion': 100},
-            'tea': {'calories': 1, 'protein': 0.0, 'carbs': 0.3, 'fat': 0.0, 'fiber': 0.0, 'portion': 100},
-            
-            # Nuts & Seeds
-            'almond': {'calories': 579, 'protein': 21.0, 'carbs': 22.0, 'fat': 50.0, 'fiber': 12.0, 'portion': 100},
-            'peanut': {'calories': 567, 'protein': 26.0, 'carbs': 16.0, 'fat': 49.0, 'fiber': 8.5, 'portion': 100},
-            'walnut': {'calories': 654, 'protein': 15.0, 'carbs': 14.0, 'fat': 65.0, 'fiber': 6.7, 'portion': 100},
-        }
-    
-    def _build_food_name_map(self) -> Dict[str, str]:
-        """Build mapping from model labels to nutrition database keys."""
-        # Map model predictions to our nutrition DB
-        # Handle variations like "granny_smith" -> "apple", "french_fries" -> "fries"
-        mapping = {}
-        
-        for food_key in self.nutrition_db.keys():
-            # Direct match
-            mapping[food_key.lower()] = food_key
-            # Handle underscores
-            mapping[food_key.replace('_', ' ').lower()] = food_key
-            mapping[food_key.replace('_', '').lower()] = food_key
-        
-        # Common aliases
-        aliases = {
-            'french fries': 'fries',
-            'french_fries': 'fries',
-            'ice cream': 'ice_cream',
-            'granny smith': 'apple',
-            'red delicious': 'apple',
-            'cheddar': 'cheese',
-            'mozzarella': 'cheese',
-            'bell pepper': 'pepper',
-            'green pepper': 'pepper',
-            'fried chicken': 'chicken',
-            'grilled chicken': 'chicken',
-            'baked potato': 'potato',
-            'mashed potato': 'potato',
-        }
-        
-        mapping.update(aliases)
-        return mapping
-    
     def _get_nutrition_data(self, food_name: str) -> Dict:
-        """Get nutrition data for a food item."""
-        # Clean and normalize food name
-        food_clean = food_name.lower().strip()
-        
-        # Direct lookup
-        if food_clean in self.nutrition_db:
-            return self.nutrition_db[food_clean]
-        
-        # Try mapping
-        if food_clean in self.food_name_map:
-            mapped_key = self.food_name_map[food_clean]
-            if mapped_key in self.nutrition_db:
-                return self.nutrition_db[mapped_key]
-        
-        # Try partial match
-        for db_key in self.nutrition_db.keys():
-            if db_key in food_clean or food_clean in db_key:
-                return self.nutrition_db[db_key]
+        """Get nutrition data (per 100 g) for a food item."""
+        # Exact name or alias, else the longest known sub-phrase ("grilled chicken" -> chicken)
+        food_data = self.nutrition_dataset.food_data(food_name)
+        if food_data is not None:
+            return {
+                'calories': food_data['calories'],
+                'protein': food_data['protein'],
+                'carbs': food_data['carbohydrates'],
+                'fat': food_data['fat'],
+                'fiber': food_data['fiber'],
+                'portion': 100
+            }
         
         # Default generic food values
         logger.warning(f"⚠️ No nutrition data for '{food_name}', using generic values")
@@ -199,47 +138,83 @@ class HuggingFaceFoodClassifier:
             'portion': 100
         }
     
-    def classify_food(self, image_bytes: bytes) -> Dict[str, Any]:
+    def _init_fast_preprocessing(self):
+        """Target size, resample filter and a fused rescale + normalize from the processor config."""
+        size = getattr(self.processor, 'size', None) or {}
+        if 'height' in size:
+            self.input_size = (size['width'], size['height'])
+        else:
+            edge = size.get('shortest_edge', 224) if isinstance(size, dict) else int(size)
+            self.input_size = (edge, edge)
+        resample = getattr(self.processor, 'resample', None)
+        self.resample = Image.BILINEAR if resample is None else resample
+        
+        mean = self.torch.tensor(getattr(self.processor, 'image_mean', None) or [0.5, 0.5, 0.5]).view(1, 3, 1, 1)
+        std = self.torch.tensor(getattr(self.processor, 'image_std', None) or [0.5, 0.5, 0.5]).view(1, 3, 1, 1)
+        rescale = getattr(self.processor, 'rescale_factor', 1 / 255)
+        # (pixel * rescale - mean) / std  ==  pixel * scale + shift
+        self._pixel_scale = rescale / std
+        self._pixel_shift = -mean / std
+    
+    def _load_image(self, image_bytes: bytes) -> Image.Image:
+        img = Image.open(io.BytesIO(image_bytes))
+        # JPEG: let the decoder downscale while decoding
+        img.draft('RGB', self.input_size)
+        
+        # Convert to RGB
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img
+    
+    def _to_pixels(self, img: Image.Image):
+        """Resized uint8 tensor [3, H, W]; normalization happens per batch in _run_batch."""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(self.input_size, self.resample, reducing_gap=2.0)
+        return self.torch.from_numpy(np.asarray(img).copy()).permute(2, 0, 1)
+    
+    def _run_batch(self, pixels: List[Any]) -> List[Any]:
+        """Class probabilities (CPU float tensors) for a list of [3, H, W] uint8 tensors."""
+        probabilities = []
+        for start in range(0, len(pixels), self.batch_size):
+            batch = self.torch.stack(pixels[start:start + self.batch_size]).float()
+            pixel_values = (batch * self._pixel_scale + self._pixel_shift).to(self.input_dtype)
+            with self.torch.inference_mode():
+                logits = self.model(pixel_values=pixel_values).logits
+            probabilities.extend(self.torch.nn.functional.softmax(logits.float(), dim=-1))
+        return probabilities
+    
+    def _predict(self, pixels) -> Any:
+        if self.image_batcher is not None:
+            return self.image_batcher(pixels)
+        return self._run_batch([pixels])[0]
+    
+    def _top_predictions(self, probabilities, top_k: int = 5) -> List[Dict[str, Any]]:
+        top_prob, top_idx = self.torch.topk(probabilities, min(top_k, probabilities.shape[-1]))
+        return [
+            {'label': self.id2label[idx], 'confidence': prob}
+            for prob, idx in zip(top_prob.tolist(), top_idx.tolist())
+        ]
+    
+    def classify_food(self, image_bytes: bytes, image: Optional[Image.Image] = None) -> Dict[str, Any]:
         """
         Classify food using HuggingFace pre-trained model.
         
         Args:
             image_bytes: Raw image bytes
+            image: Already decoded image (optional)
             
         Returns:
             Classification result with nutritional analysis
         """
         try:
             # Load image
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+            img = image if image is not None else self._load_image(image_bytes)
             
             logger.info(f"🔍 Analyzing food image ({img.size[0]}x{img.size[1]})...")
             
-            # Preprocess image
-            inputs = self.processor(images=img, return_tensors="pt")
-            
-            # Run inference
-            with self.torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-            
-            # Get top 5 predictions
-            probabilities = self.torch.nn.functional.softmax(logits, dim=-1)[0]
-            top5_prob, top5_idx = self.torch.topk(probabilities, 5)
-            
-            # Get predictions
-            predictions = []
-            for prob, idx in zip(top5_prob, top5_idx):
-                label = self.id2label[idx.item()]
-                confidence = prob.item()
-                predictions.append({
-                    'label': label,
-                    'confidence': confidence
-                })
+            # Preprocess image and run inference, then get top 5 predictions
+            predictions = self._top_predictions(self._predict(self._to_pixels(img)))
             
             logger.info(f"✅ Top prediction: {predictions[0]['label']} ({predictions[0]['confidence']*100:.1f}% confidence)")
             
@@ -250,12 +225,37 @@ class HuggingFaceFoodClassifier:
             logger.error(f"❌ Classification error: {e}")
             import traceback
             traceback.print_exc()
-            return {
-                'success': False,
-                'error': str(e),
-                'ingredients': [],
-                'confidence': 0.0
-            }
+            return self._error_response(e)
+    
+    def classify_food_batch(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """Classify several images with batched forward passes; one result per image, in order."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images_bytes)
+        pixels, positions = [], []
+        for position, image_bytes in enumerate(images_bytes):
+            try:
+                pixels.append(self._to_pixels(self._load_image(image_bytes)))
+                positions.append(position)
+            except Exception as e:
+                logger.error(f"❌ Classification error: {e}")
+                results[position] = self._error_response(e)
+        
+        if pixels:
+            try:
+                for position, probabilities in zip(positions, self._run_batch(pixels)):
+                    results[position] = self._build_response(self._top_predictions(probabilities))
+            except Exception as e:
+                logger.error(f"❌ Batch classification error: {e}")
+                for position in positions:
+                    results[position] = self._error_response(e)
+        return results
+    
+    def _error_response(self, error: Exception) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': str(error),
+            'ingredients': [],
+            'confidence': 0.0
+        }
     
     def _build_response(self, predictions: List[Dict]) -> Dict[str, Any]:
         """Build complete response with nutritional analysis."""
@@ -525,13 +525,16 @@ class HuggingFaceFoodClassifier:
         return [label for label in labels if label]  # Remove empty strings
 
 
-    def extract_ingredients_from_meal(self, image_bytes: bytes) -> Dict[str, Any]:
+    def extract_ingredients_from_meal(self, image_bytes: bytes, image: Optional[Image.Image] = None) -> Dict[str, Any]:
         """
         Extract ingredients from a meal image.
         For now, uses same logic as classify_food (single-item classification).
         In future, can be enhanced to detect multiple items.
         """
-        return self.classify_food(image_bytes)
+        return self.classify_food(image_bytes, image)
+    
+    def extract_ingredients_from_meals(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        return self.classify_food_batch(images_bytes)
 
 
 # Create global instance
@@ -0,0 +1,161 @@
+"""
+USDA Nutrition Import
+Builds a nutrition dataset (nutrition_dataset.py format) from an offline
+USDA FoodData Central CSV download - SR Legacy, Foundation and/or FNDDS,
+tens of thousands of foods - for the calorie service and the food
+classifiers to memory-map.
+
+The bundled foods (nutrition_data/foods.csv) are written first, so their
+short names ("apple", "chicken") keep their curated values; USDA foods
+are added under their normalized descriptions ("apples,_raw,_with_skin").
+Nutrient columns are the bundled CSV's; each maps to FDC nutrient ids in
+order of preference (e.g. Energy 1008, else the Atwater energies).
+
+Usage:
+    python import_usda_nutrition.py --fdc-dir FoodData_Central_sr_legacy_food_csv_2018-04 --output /srv/nutrition/usda
+    python import_usda_nutrition.py --fdc-dir FoodData_Central_csv_2024-04-18 --data-types foundation_food,sr_legacy_food \\
+        --output /srv/nutrition/usda
+
+Then set NUTRITION_DATASET=/srv/nutrition/usda for the services.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from nutrition_dataset import BUNDLED_CSV, build_dataset, read_csv
+
+# Dataset nutrient column -> FDC nutrient ids, most preferred first (units as in FDC)
+FDC_NUTRIENT_IDS = {
+    'calories': (1008, 2047, 2048),
+    'protein': (1003,),
+    'carbs': (1005, 1050),
+    'fat': (1004, 1085),
+    'fiber': (1079,),
+    'sugar': (2000, 1063),
+    'saturated_fat': (1258,),
+    'monounsaturated_fat': (1292,),
+    'polyunsaturated_fat': (1293,),
+    'trans_fat': (1257,),
+    'cholesterol': (1253,),
+    'sodium': (1093,),
+    'potassium': (1092,),
+    'vitamin_c': (1162,),
+    'vitamin_a': (1106,),
+    'vitamin_e': (1109,),
+    'vitamin_k': (1185,),
+    'thiamine': (1165,),
+    'riboflavin': (1166,),
+    'niacin': (1167,),
+    'folate': (1177, 1190),
+    'calcium': (1087,),
+    'iron': (1089,),
+    'magnesium': (1090,),
+    'phosphorus': (1091,),
+    'zinc': (1095,),
+    'copper': (1098,),
+    'manganese': (1101,),
+    'selenium': (1103,),
+}
+DEFAULT_DATA_TYPES = 'sr_legacy_food,foundation_food,survey_fndds_food'
+
+
+def _iter_csv(path: str):
+    with open(path, 'r', encoding='utf-8', newline='') as handle:
+        yield from csv.DictReader(handle)
+
+
+def read_rows(directory: str, name: str):
+    """Rows of one FDC table, streamed; None when the dump does not include it."""
+    path = os.path.join(directory, name)
+    return _iter_csv(path) if os.path.exists(path) else None
+
+
+def load_usda_foods(directory: str, nutrients: List[str], data_types: List[str]) -> List[Dict[str, Any]]:
+    """Records in the bundled CSV format for every FDC food of ``data_types``."""
+    foods = read_rows(directory, 'food.csv')
+    if foods is None:
+        raise FileNotFoundError(f"No food.csv in {directory}")
+
+    categories = {row['id']: row['description'].lower() for row in read_rows(directory, 'food_category.csv') or []}
+    food_rows: Dict[str, int] = {}
+    records: List[Dict[str, Any]] = []
+    for row in foods:
+        if row.get('data_type') not in data_types:
+            continue
+        food_rows[row['fdc_id']] = len(records)
+        records.append({
+            'name': row['description'],
+            'display_name': row['description'],
+            'category': categories.get(row.get('food_category_id', ''), ''),
+            'typical_portion_size': 100.0,
+            'density': 1.0,
+            'portion_description': '100 g',
+        })
+    print(f"📦 {len(records)} foods of type {', '.join(data_types)}")
+
+    # Nutrient amounts: stream food_nutrient.csv (millions of rows) into one array
+    columns = {nutrient: column for column, nutrient in enumerate(nutrients)}
+    preference: Dict[int, tuple] = {}
+    for nutrient, ids in FDC_NUTRIENT_IDS.items():
+        if nutrient in columns:
+            for rank, nutrient_id in enumerate(ids):
+                preference[nutrient_id] = (columns[nutrient], rank)
+    values = np.zeros((len(records), len(nutrients)), dtype=np.float32)
+    ranks = np.full((len(records), len(nutrients)), 127, dtype=np.int8)
+    for row in read_rows(directory, 'food_nutrient.csv') or []:
+        index = food_rows.get(row['fdc_id'])
+        target = preference.get(int(row['nutrient_id'])) if index is not None else None
+        if target is None or not row.get('amount'):
+            continue
+        column, rank = target
+        if rank < ranks[index, column]:
+            values[index, column] = float(row['amount'])
+            ranks[index, column] = rank
+
+    # First listed portion (e.g. "1 cup, sliced" = 110 g) as the typical portion
+    for row in read_rows(directory, 'food_portion.csv') or []:
+        index = food_rows.get(row['fdc_id'])
+        if index is None or records[index]['portion_description'] != '100 g' or not row.get('gram_weight'):
+            continue
+        description = row.get('portion_description') or ' '.join(
+            part for part in (row.get('amount', ''), row.get('modifier', '')) if part
+        )
+        records[index]['typical_portion_size'] = float(row['gram_weight'])
+        records[index]['portion_description'] = description.strip() or f"{row['gram_weight']} g"
+
+    for record, amounts in zip(records, values):
+        record.update(zip(nutrients, amounts.tolist()))
+    return records
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Build a nutrition dataset from a USDA FoodData Central dump")
+    arg_parser.add_argument('--fdc-dir', required=True, help="directory with food.csv, food_nutrient.csv, ...")
+    arg_parser.add_argument('--output', required=True, help="dataset directory to write")
+    arg_parser.add_argument('--data-types', default=DEFAULT_DATA_TYPES, help="comma-separated FDC data types")
+    arg_parser.add_argument('--no-bundled', action='store_true', help="leave out nutrition_data/foods.csv")
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    nutrients, bundled = read_csv(BUNDLED_CSV)
+    data_types = [name.strip() for name in args.data_types.split(',') if name.strip()]
+    try:
+        usda = load_usda_foods(args.fdc_dir, nutrients, data_types)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        return 1
+
+    records = ([] if args.no_bundled else bundled) + usda
+    build_dataset(records, nutrients, args.output, source=f"USDA FoodData Central ({os.path.basename(os.path.abspath(args.fdc_dir))})")
+    print(f"💾 Wrote {args.output} in {time.perf_counter() - start:.1f} s; set NUTRITION_DATASET={args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
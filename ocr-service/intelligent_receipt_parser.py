@@ -4,14 +4,76 @@ Uses ML + Rule-based filtering to extract ONLY real food items from receipts
 Ignores: totals, subtotals, payment info, dates, store names, loyalty numbers, etc.
 """
 
+import os
 import re
+import atexit
+import hashlib
 import logging
+import threading
 from typing import List, Dict, Any, Tuple, Optional
 from dataclasses import dataclass
+from functools import cached_property
+
+from date_recognizer import DateMatch, DateRecognizer
+from money_scanner import CURRENCY_SYMBOLS, MoneyScanner
+from normalization_cache import NormalizationCache
+from receipt_pipeline import ReceiptContext, ReceiptPipeline, ReconciliationExtractor, parser_extractors
+from receipt_reconciliation import ReceiptReconciler, SummaryLine
+from receipt_session import ReceiptParseSession
+from receipt_templates import ReceiptTemplateStore
+from table_receipt_parser import TableReceiptParser
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when a rule changes in a way the code fingerprint cannot see
+# (e.g. behaviour that depends on an external resource).
+PARSER_RULES_VERSION = "3"
+
+_shared_normalization_cache: Optional[NormalizationCache] = None
+
+# Default for ``template_store``: build the env-configured store (None disables templates)
+_DEFAULT_TEMPLATE_STORE = object()
+
+
+def _stable_repr(value) -> str:
+    """repr() with sets sorted: a frozenset constant's repr follows the hash seed."""
+    if isinstance(value, (set, frozenset)):
+        return '{' + ', '.join(sorted(_stable_repr(item) for item in value)) + '}'
+    if isinstance(value, tuple):
+        return '(' + ', '.join(_stable_repr(item) for item in value) + ')'
+    return repr(value)
+
+
+def _code_fingerprint(code) -> bytes:
+    """Stable bytes for a code object, including nested code constants."""
+    parts = [code.co_code]
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            parts.append(_code_fingerprint(const))
+        else:
+            parts.append(_stable_repr(const).encode('utf-8'))
+    return b'\x00'.join(parts)
+
+
+def get_shared_normalization_cache(rules_version: str) -> NormalizationCache:
+    """Return the process-wide normalization cache, creating it on first use."""
+    global _shared_normalization_cache
+    if _shared_normalization_cache is None:
+        cache_path = os.getenv('RECEIPT_PARSER_CACHE_PATH') or None
+        cache = NormalizationCache(
+            max_size=int(os.getenv('RECEIPT_PARSER_CACHE_SIZE', '50000')),
+            rules_version=rules_version,
+            path=cache_path,
+        )
+        if cache_path:
+            cache.load()
+            atexit.register(cache.save)
+        _shared_normalization_cache = cache
+    else:
+        _shared_normalization_cache.set_rules_version(rules_version)
+    return _shared_normalization_cache
+
 @dataclass
 class ReceiptItem:
     """Represents a single food/grocery item from a receipt."""
@@ -21,14 +83,103 @@ class ReceiptItem:
     unit_price: float = None
     unit: str = None
     confidence: float = 0.0
+
+
+# Decimal price used to spot item/group lines (e.g. "3.99", "$12.49")
+_DECIMAL_PRICE = re.compile(r'\$?\d+\.\d{2}')
+
+# Price evidence for flat parsing: decimal amount, currency amount, or a
+# short whole number in its own right-hand column ("Pasta  2  220  440").
+# Bare long numbers (zip codes, phone numbers, years) do not count.
+_FLAT_PRICE = re.compile(r'\d+[.,]\d{1,2}(?!\d)|[$€£¥₹]\s*\d+|\s{2,}\d{1,3}\s*$')
+
+# A name needs at least one word: a run of two letters (any script)
+_NAME_WORD = re.compile(r'[^\W\d_]{2}')
+
+# Bracketed rate column ("(4.50%)"): neither a price nor part of the name
+_RATE_CELL = re.compile(r'\(\s*\d+(?:[.,]\d+)?\s*%\s*\)')
+
+
+class ReceiptLine:
+    """
+    One receipt line plus its lazily computed classification.
+    
+    Every expensive per-line decision (price extraction, name cleaning,
+    blacklist checks) is computed at most once and shared by the layout
+    pre-pass and both parsing strategies.
+    """
+    
+    def __init__(self, parser: 'IntelligentReceiptParser', raw: str):
+        self.parser = parser
+        self.raw = raw
+        self.stripped = raw.strip()
+        self.indent = len(raw) - len(raw.lstrip())
+        self.has_price = bool(_DECIMAL_PRICE.search(self.stripped))
     
+    @cached_property
+    def has_flat_price(self) -> bool:
+        return bool(_FLAT_PRICE.search(self.stripped))
+    
+    @cached_property
+    def extraction(self) -> Tuple[float, float, str]:
+        return self.parser.extract_price_and_quantity(self.stripped)
+    
+    @cached_property
+    def item_name(self) -> str:
+        return self.parser.clean_item_name(self.extraction[2])
+    
+    @cached_property
+    def sub_item_name(self) -> str:
+        return self.parser._clean_sub_item_name(self.stripped)
+    
+    @cached_property
+    def blacklisted(self) -> bool:
+        return self.parser.is_blacklisted_cached(self.stripped)
+    
+    @cached_property
+    def item_name_blacklisted(self) -> bool:
+        return self.parser.is_blacklisted_cached(self.item_name)
+    
+    @cached_property
+    def unit_descriptor(self) -> bool:
+        return self.parser.is_unit_descriptor_only(self.stripped)
+    
+    @cached_property
+    def is_modifier(self) -> bool:
+        return self.parser._is_modifier(self.stripped)
+    
+    @cached_property
+    def flat_item(self) -> Optional[Dict[str, Any]]:
+        return self.parser._flat_item(self)
+    
+    @cached_property
+    def totals(self) -> Optional[Tuple[float, float, float]]:
+        return self.parser._line_totals(self.raw)
+    
+    @cached_property
+    def summary(self) -> Optional[SummaryLine]:
+        return self.parser.reconciler.summary_line(self.stripped)
+
+
 class IntelligentReceiptParser:
     """
     Global Intelligent Receipt Parser - Works with receipts from any country/language.
     Designed for worldwide use with multi-language, multi-currency, and multi-format support.
     """
     
-    def __init__(self):
+    # Methods whose output depends only on the input string and the rule tables.
+    # Their bytecode is part of the rules version, so editing any of them
+    # invalidates cached decisions automatically.
+    _RULE_METHODS = (
+        'is_blacklisted', 'is_unit_descriptor_only',
+        '_is_likely_food_item', '_clean_item_name',
+    )
+    
+    # Nested (unpriced, deeper-indented) lines needed to treat a receipt as hierarchical
+    HIERARCHICAL_MIN_CHILD_LINES = 2
+    
+    def __init__(self, normalization_cache: Optional[NormalizationCache] = None,
+                 template_store: Optional[ReceiptTemplateStore] = _DEFAULT_TEMPLATE_STORE):
         # Global blacklist - includes words from major languages worldwide
         self.BLACKLIST_KEYWORDS = {
             # English
@@ -79,22 +230,10 @@ class IntelligentReceiptParser:
             'come', 'again', 'see you', 'have a', 'enjoy',
         }
         
-        # Global currency symbols and patterns
-        self.CURRENCY_SYMBOLS = {
-            '$', '€', '£', '¥', '₹', '₽', '₩', '¢', '₡', '₦', '₨', '₱', '₫', '₪', 
-            'kr', 'zł', 'Kč', 'Ft', 'lei', 'lv', 'Lt', '₴', '₸', '₼', '₾', '₺',
-            'USD', 'EUR', 'GBP', 'JPY', 'CNY', 'INR', 'RUB', 'KRW', 'AUD', 'CAD'
-        }
-        
-        # Global number format patterns (handles different decimal separators)
-        self.NUMBER_PATTERNS = [
-            r'(\d{1,3}(?:,\d{3})*\.\d{2})',  # US: 1,234.56
-            r'(\d{1,3}(?:\.\d{3})*,\d{2})',  # EU: 1.234,56  
-            r'(\d{1,3}(?: \d{3})*[,\.]\d{2})',  # FR: 1 234,56 or 1 234.56
-            r'(\d+[,\.]\d{2})',               # Simple: 123.45 or 123,45
-            r'(\d+\.\d{2})',                  # Standard decimal: 123.45
-            r'(\d+)',                         # Whole numbers: 123
-        ]
+        # Global currency symbols; every price and number is read by one
+        # compiled scanner (US, EU and FR grouping, currency before or after)
+        self.CURRENCY_SYMBOLS = set(CURRENCY_SYMBOLS)
+        self.money_scanner = MoneyScanner(self.CURRENCY_SYMBOLS)
         
         # Words that commonly appear in ONLY unit descriptions (not item names)
         self.UNIT_ONLY_KEYWORDS = {
@@ -129,6 +268,76 @@ class IntelligentReceiptParser:
             # Other groceries
             'oil', 'sugar', 'salt', 'spice', 'sauce', 'soup', 'nut', 'nuts', 'seed', 'seeds',
         }
+        
+        # Memoized per-segment decisions, shared by every parser in the process
+        self.rules_version = self.compute_rules_version()
+        if normalization_cache is None:
+            self.normalization_cache = get_shared_normalization_cache(self.rules_version)
+        else:
+            self.normalization_cache = normalization_cache
+            self.normalization_cache.set_rules_version(self.rules_version)
+        
+        # Single-pass date recognizer; RECEIPT_DATE_ORDER decides ambiguous 03/04 dates
+        self.date_recognizer = DateRecognizer(default_order=os.getenv('RECEIPT_DATE_ORDER', 'mdy'))
+        
+        # Column-aware parser for "Item  Qty  Rate  Amount" tables
+        self.table_parser = TableReceiptParser(self)
+        
+        # Learned merchant layouts for the single-pass fast path
+        if template_store is _DEFAULT_TEMPLATE_STORE:
+            template_store = None
+            if os.getenv('RECEIPT_TEMPLATES_ENABLED', '1') != '0':
+                template_path = os.getenv('RECEIPT_TEMPLATE_PATH') or None
+                template_store = ReceiptTemplateStore(
+                    min_support=int(os.getenv('RECEIPT_TEMPLATE_MIN_SUPPORT', '3')),
+                    shadow_rate=float(os.getenv('RECEIPT_TEMPLATE_SHADOW_RATE', '0.05')),
+                    path=template_path,
+                )
+                if template_path:
+                    template_store.load(self.rules_version)
+                    atexit.register(template_store.save)
+        self.template_store = template_store
+        
+        # Field extractors run once per receipt (merchant, items, date, totals),
+        # then the arithmetic check that repairs OCR misreads
+        self.reconciler = ReceiptReconciler()
+        self.pipeline = ReceiptPipeline(parser_extractors(self) + [ReconciliationExtractor(self.reconciler)])
+    
+    def compute_rules_version(self) -> str:
+        """Fingerprint the rule tables and rule methods that cached decisions depend on."""
+        digest = hashlib.sha1(PARSER_RULES_VERSION.encode('utf-8'))
+        for table in (self.BLACKLIST_KEYWORDS, self.CURRENCY_SYMBOLS,
+                      self.UNIT_ONLY_KEYWORDS, self.FOOD_CATEGORIES):
+            digest.update(repr(sorted(table)).encode('utf-8'))
+        digest.update(self.money_scanner.pattern.pattern.encode('utf-8'))
+        for method_name in self._RULE_METHODS:
+            digest.update(_code_fingerprint(getattr(type(self), method_name).__code__))
+        return f"{PARSER_RULES_VERSION}-{digest.hexdigest()[:12]}"
+    
+    def refresh_rules_version(self) -> str:
+        """Recompute the rules version after mutating rule tables at runtime."""
+        self.money_scanner = MoneyScanner(self.CURRENCY_SYMBOLS)
+        self.rules_version = self.compute_rules_version()
+        self.normalization_cache.set_rules_version(self.rules_version)
+        return self.rules_version
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit-rate statistics for the normalization cache."""
+        return self.normalization_cache.stats()
+    
+    def template_stats(self) -> Dict[str, Any]:
+        """Template hit rate and per-template accuracy (empty when templates are disabled)."""
+        if self.template_store is None:
+            return {}
+        return self.template_store.stats()
+    
+    def extractor_stats(self) -> Dict[str, Any]:
+        """Per-extractor call counts and timings for the parse pipeline."""
+        return self.pipeline.stats()
+    
+    def is_blacklisted_cached(self, text: str) -> bool:
+        """Memoized is_blacklisted for segments that recur across receipts."""
+        return self.normalization_cache.get_or_compute('blacklist', text, self.is_blacklisted)
     
     def is_blacklisted(self, text: str) -> bool:
         """Check if text contains blacklisted keywords - LESS RESTRICTIVE for better extraction."""
@@ -328,6 +537,10 @@ class IntelligentReceiptParser:
         return False
     
     def is_likely_food_item(self, text: str) -> bool:
+        """Cached food-item decision for a raw segment (see _is_likely_food_item)."""
+        return self.normalization_cache.get_or_compute('food', text, self._is_likely_food_item)
+    
+    def _is_likely_food_item(self, text: str) -> bool:
         """
         Check if text likely contains a food item name - ENHANCED FOR BETTER DETECTION.
         Now more permissive to catch more real food items.
@@ -506,64 +719,14 @@ class IntelligentReceiptParser:
     
     def _extract_global_number(self, text: str) -> Optional[float]:
         """Extract number from text using global formats (US, EU, etc.)"""
-        # Remove currency symbols first
-        clean_text = text
-        for symbol in self.CURRENCY_SYMBOLS:
-            clean_text = clean_text.replace(symbol, '')
-        
-        # Try each number pattern
-        for pattern in self.NUMBER_PATTERNS:
-            match = re.search(pattern, clean_text)
-            if match:
-                num_str = match.group(1)
-                try:
-                    # Handle different decimal separators
-                    if ',' in num_str and '.' in num_str:
-                        # Both comma and dot - determine which is decimal
-                        if num_str.rfind(',') > num_str.rfind('.'):
-                            # Comma is decimal: 1.234,56
-                            num_str = num_str.replace('.', '').replace(',', '.')
-                        else:
-                            # Dot is decimal: 1,234.56  
-                            num_str = num_str.replace(',', '')
-                    elif ',' in num_str:
-                        # Only comma - could be decimal or thousands
-                        if len(num_str.split(',')[-1]) == 2:
-                            # Decimal: 123,45
-                            num_str = num_str.replace(',', '.')
-                        else:
-                            # Thousands: 1,234
-                            num_str = num_str.replace(',', '')
-                    
-                    return float(num_str)
-                except ValueError:
-                    continue
-        
-        return None
+        return self.money_scanner.parse_number(text)
     
     def _extract_global_price(self, line: str) -> Optional[Tuple[float, int, int]]:
         """Extract price with currency from line - returns (price, start_pos, end_pos)"""
-        # Build comprehensive price pattern for any currency
-        currency_pattern = '|'.join(re.escape(sym) for sym in self.CURRENCY_SYMBOLS)
-        
-        # Patterns: currency before/after, with various number formats
-        price_patterns = [
-            f'({currency_pattern})\\s*({"|".join(self.NUMBER_PATTERNS)})',
-            f'({"|".join(self.NUMBER_PATTERNS)})\\s*({currency_pattern})',
-            f'({"|".join(self.NUMBER_PATTERNS)})(?=\\s*$)',  # Number at end of line
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                # Extract the numeric part
-                for group in match.groups():
-                    if group and not any(sym in group for sym in self.CURRENCY_SYMBOLS):
-                        price = self._extract_global_number(group)
-                        if price is not None and 0.01 <= price <= 999999:  # Reasonable price range
-                            return price, match.start(), match.end()
-        
-        return None
+        token = self.money_scanner.find_price(line)
+        if token is None:
+            return None
+        return token.value, token.start, token.end
     
     def extract_price_and_quantity(self, line: str) -> Tuple[float, float, str]:
         """
@@ -574,6 +737,8 @@ class IntelligentReceiptParser:
         original_line = line
         quantity = 1.0
         price = 0.0  # Default to 0.0 to prevent TypeError in sum()
+        if '%' in line:
+            line = _RATE_CELL.sub('', line)
         
         # Pattern 0: Tab-separated or multi-space format (global compatible)
         # Works with any language: "Item Name \t Qty \t Rate \t Amount"
@@ -664,6 +829,10 @@ class IntelligentReceiptParser:
         return quantity, price, line
     
     def clean_item_name(self, name: str) -> str:
+        """Cached item-name normalization for a raw segment (see _clean_item_name)."""
+        return self.normalization_cache.get_or_compute('name', name, self._clean_item_name)
+    
+    def _clean_item_name(self, name: str) -> str:
         """
         ENHANCED: Clean up item name by removing promotional text, codes, and unwanted elements.
         Dynamic rules that work for ALL receipts, not just specific patterns.
@@ -817,13 +986,21 @@ class IntelligentReceiptParser:
         
         return cleaned_name
     
-    def parse_receipt_items(self, ocr_text: str) -> List[Dict[str, Any]]:
+    def parse_receipt_items(self, ocr_text: str,
+                            lines: Optional[List['ReceiptLine']] = None) -> List[Dict[str, Any]]:
         """
         Extract ONLY actual food/grocery items from OCR text.
         Handles both flat and hierarchical receipt formats.
         
+        A single pre-pass classifies every line once (indentation, price
+        presence) and picks the layout from indentation statistics, so only
+        one strategy normally runs. Per-line results are memoized on the
+        ReceiptLine objects and reused if the strategy has to fall back.
+        
         Args:
             ocr_text: Raw OCR text from receipt
+            lines: Already classified lines of ``ocr_text`` (a parse session
+                passes its cached ones)
             
         Returns:
             List of dictionaries with item details
@@ -833,94 +1010,192 @@ class IntelligentReceiptParser:
             return []
         
         # DON'T strip lines yet - we need indentation for hierarchical parsing
-        lines_raw = [line.rstrip() for line in ocr_text.split('\n') if line.strip()]
-        items = []
-        seen_items = set()  # Avoid duplicates
+        if lines is None:
+            lines = self._classify_lines(ocr_text)
         
-        logger.info(f"Parsing {len(lines_raw)} lines from receipt")
+        logger.info(f"Parsing {len(lines)} lines from receipt")
         
-        # Strategy 1: Look for hierarchical format (like McDonald's)
-        # Lines with quantity and price, followed by indented item names
-        hierarchical_items = self._parse_hierarchical_format(lines_raw)
+        layout = self.detect_layout(lines)
+        
+        # Strategy 0: Column table with a header row (invoices, restaurant bills)
+        if layout == 'table':
+            table_items = self.table_parser.parse_lines([line.raw for line in lines])
+            if table_items:
+                logger.info(f"✅ Detected table format, extracted {len(table_items)} items")
+                return table_items
         
-        if hierarchical_items:
-            logger.info(f"✅ Detected hierarchical format, extracted {len(hierarchical_items)} items")
-            return hierarchical_items
+        # Strategy 1: Hierarchical format (like McDonald's)
+        # Lines with quantity and price, followed by indented item names
+        if layout == 'hierarchical':
+            hierarchical_items = self._parse_hierarchical_format(lines)
+            if hierarchical_items:
+                logger.info(f"✅ Detected hierarchical format, extracted {len(hierarchical_items)} items")
+                return hierarchical_items
         
         # Strategy 2: Flat format (item name and price on same line)
+        flat_items = self._parse_flat_format(lines)
+        
+        # The layout guess is only a guess: when the flat pass dropped priced
+        # lines (multi-column rows, continuation lines), let the hierarchical
+        # pass try and keep whichever found more priced items
+        if layout == 'flat' and len(flat_items) < self._count_item_price_lines(lines):
+            hierarchical_items = self._parse_hierarchical_format(lines)
+            priced = self._count_priced_line_items(hierarchical_items, lines)
+            if priced > len(flat_items):
+                logger.info(f"↩️  Flat pass found {len(flat_items)} priced items, hierarchical {priced}: "
+                            f"using hierarchical")
+                return hierarchical_items
+        return flat_items
+    
+    def _classify_lines(self, ocr_text: str) -> List['ReceiptLine']:
+        """Split OCR text into non-empty ReceiptLine records (one O(n) pass)."""
+        return [self._classify_line(line.rstrip()) for line in ocr_text.split('\n') if line.strip()]
+    
+    def _classify_line(self, raw: str) -> 'ReceiptLine':
+        return ReceiptLine(self, raw)
+    
+    def detect_layout(self, lines: List['ReceiptLine']) -> str:
+        """
+        Decide between 'table', 'flat' and 'hierarchical' in one pass.
+        
+        A receipt with an "Item ... Qty/Rate ... Amount" header row is a table.
+        Otherwise a receipt is hierarchical when priced lines own deeper-indented lines
+        without a price of their own (combo components, modifiers). Indented
+        lines that carry their own price, like a right-aligned totals block,
+        do not count.
+        """
+        if self.table_parser.detect_header([line.raw for line in lines]) is not None:
+            logger.debug("Layout pre-pass: table header found -> table")
+            return 'table'
+        
+        child_lines = 0
+        parent_indent = None
+        
+        for line in lines:
+            if line.has_price:
+                parent_indent = line.indent
+            elif parent_indent is not None and line.indent > parent_indent:
+                child_lines += 1
+            else:
+                parent_indent = None
+        
+        layout = 'hierarchical' if child_lines >= self.HIERARCHICAL_MIN_CHILD_LINES else 'flat'
+        logger.debug(f"Layout pre-pass: {child_lines} nested lines -> {layout}")
+        return layout
+    
+    @staticmethod
+    def _count_item_price_lines(lines: List['ReceiptLine']) -> int:
+        """Lines that could be priced items: a positive price, not a total, payment or weight line."""
+        return sum(
+            1 for line in lines
+            if line.has_price and not (line.blacklisted or line.item_name_blacklisted or line.unit_descriptor)
+            and line.extraction[1] and line.extraction[1] > 0
+        )
+    
+    @staticmethod
+    def _count_priced_line_items(items: List[Dict[str, Any]], lines: List['ReceiptLine']) -> int:
+        """Items priced from their own line (sub-items that inherit a parent's price do not count)."""
+        by_raw = {line.raw: line for line in lines}
+        count = 0
+        for item in items:
+            line = by_raw.get(item.get('original_line'))
+            if line is not None and line.has_price and line.extraction[1] == item.get('price'):
+                count += 1
+        return count
+    
+    def _parse_flat_format(self, lines: List['ReceiptLine']) -> List[Dict[str, Any]]:
+        """Parse receipts where each item name and its price share a line."""
+        items = []
+        seen_items = set()  # Avoid duplicates
+        
         # Keep original spacing for tab-separated formats
         logger.info("Using flat format parsing")
         
-        for i, line_raw in enumerate(lines_raw):
-            line = line_raw.strip()
-            logger.debug(f"Processing line {i}: '{line}'")
-            
-            # Skip empty or very short lines
-            if len(line) < 3:
-                logger.debug(f"  ❌ Too short")
-                continue
-            
-            # Filter 1: Blacklisted keywords (totals, dates, etc.)
-            if self.is_blacklisted(line):
-                logger.debug(f"  ❌ Blacklisted: '{line}'")
-                continue
-            
-            # Filter 2: Unit descriptors only (like "0.442kg NET @ $2.99/kg")
-            if self.is_unit_descriptor_only(line):
-                logger.debug(f"  ❌ Unit descriptor only: '{line}'")
-                continue
-            
-            # Filter 3: Must have a price ($ sign or decimal number)
-            # Match $X.XX, XX.XX, X.X, etc.
-            if not re.search(r'\$?\d+\.?\d*', line):
-                logger.debug(f"  ❌ No price found: '{line}'")
-                continue
-            
-            # Extract quantity and price (use raw line to preserve spacing)
-            quantity, price, item_name_raw = self.extract_price_and_quantity(line_raw.strip())
-            
-            if not price or price <= 0:
-                logger.debug(f"  ❌ Invalid price: {price}")
-                continue
-            
-            # Clean item name
-            item_name = self.clean_item_name(item_name_raw)
-            
-            # Filter 4: Must have a reasonable item name
-            if len(item_name) < 3:
-                logger.debug(f"  ❌ Name too short after cleaning: '{item_name}'")
-                continue
-            
-            # Filter 5: Check if it's likely a food item
-            if not self.is_likely_food_item(item_name):
-                logger.debug(f"  ❌ Not a food item: '{item_name}'")
+        for line_info in lines:
+            # Per-line decision is cached on the line (parse sessions reuse it)
+            item = line_info.flat_item
+            if item is None:
                 continue
             
             # Avoid duplicates
-            item_key = f"{item_name}_{price}"
+            item_key = f"{item['name']}_{item['price']}"
             if item_key in seen_items:
-                logger.debug(f"  ❌ Duplicate: '{item_name}'")
+                logger.debug(f"  ❌ Duplicate: '{item['name']}'")
                 continue
             
             seen_items.add(item_key)
-            
-            # Success! This is a real item
-            item = {
-                'name': item_name,
-                'quantity': quantity,
-                'price': price,
-                'unit_price': self._compute_unit_price(price, quantity),
-                'original_line': line
-            }
-            
-            items.append(item)
-            price_str = f"${price:.2f}" if price is not None else "No price"
-            logger.info(f"  ✅ Extracted: {item_name} (qty: {quantity}, price: {price_str})")
+            items.append(dict(item))
+            logger.info(f"  ✅ Extracted: {item['name']} (qty: {item['quantity']}, price: ${item['price']:.2f})")
         
         logger.info(f"Successfully extracted {len(items)} items from receipt")
         return items
     
-    def _parse_hierarchical_format(self, lines: List[str]) -> List[Dict[str, Any]]:
+    def _flat_item(self, line_info: 'ReceiptLine') -> Optional[Dict[str, Any]]:
+        """The item a flat-format line holds, or None when a filter rejects it."""
+        line = line_info.stripped
+        logger.debug(f"Processing line: '{line}'")
+        
+        # Skip empty or very short lines
+        if len(line) < 3:
+            logger.debug(f"  ❌ Too short")
+            return None
+        
+        # Filter 1: Blacklisted keywords (totals, dates, etc.)
+        if line_info.blacklisted:
+            logger.debug(f"  ❌ Blacklisted: '{line}'")
+            return None
+        
+        # Filter 2: Unit descriptors only (like "0.442kg NET @ $2.99/kg")
+        if line_info.unit_descriptor:
+            logger.debug(f"  ❌ Unit descriptor only: '{line}'")
+            return None
+        
+        # Filter 3: Must have a price (decimal amount, currency amount,
+        # or a short whole-number amount in its own column)
+        if not line_info.has_flat_price:
+            logger.debug(f"  ❌ No price found: '{line}'")
+            return None
+        
+        # Extract quantity and price (use raw line to preserve spacing)
+        quantity, price, item_name_raw = line_info.extraction
+        
+        if not price or price <= 0:
+            logger.debug(f"  ❌ Invalid price: {price}")
+            return None
+        
+        # A zero quantity is a continuation or void row ("0  0.36 11 @ 3.20 N  1.14")
+        if quantity is not None and quantity <= 0:
+            logger.debug(f"  ❌ Zero quantity: '{line}'")
+            return None
+        
+        # Clean item name
+        item_name = line_info.item_name
+        
+        # Filter 4: Must have a reasonable item name
+        if len(item_name) < 3:
+            logger.debug(f"  ❌ Name too short after cleaning: '{item_name}'")
+            return None
+        
+        # Filter 4b: Numbers and codes left over from other columns are not a name
+        if not _NAME_WORD.search(item_name):
+            logger.debug(f"  ❌ No word in name: '{item_name}'")
+            return None
+        
+        # Filter 5: Check if it's likely a food item
+        if not self.is_likely_food_item(item_name):
+            logger.debug(f"  ❌ Not a food item: '{item_name}'")
+            return None
+        
+        # Success! This is a real item
+        return {
+            'name': item_name,
+            'quantity': quantity,
+            'price': price,
+            'unit_price': self._compute_unit_price(price, quantity),
+            'original_line': line
+        }
+    
+    def _parse_hierarchical_format(self, lines: List['ReceiptLine']) -> List[Dict[str, Any]]:
         """
         Parse hierarchical receipt format like:
           1 Buy One, Get One    3.99
@@ -937,25 +1212,25 @@ class IntelligentReceiptParser:
         logger.debug(f"Starting hierarchical parsing with {len(lines)} lines")
         
         while i < len(lines):
-            line = lines[i]
-            original_line = line
-            line_stripped = line.strip()
+            line_info = lines[i]
+            original_line = line_info.raw
+            line_stripped = line_info.stripped
             
             # Check if line is indented (has leading spaces)
-            indent_level = len(line) - len(line.lstrip())
+            indent_level = line_info.indent
             
             # Check if line has a price
-            has_price = bool(re.search(r'\$?\d+\.\d{2}', line_stripped))
+            has_price = line_info.has_price
             
             logger.debug(f"Line {i}: indent={indent_level}, has_price={has_price}, text='{line_stripped[:40]}'")
             
             if has_price:  # Any line with a price could be a group header or item
                 # This is a line item with price (might be at any indent level)
-                quantity, price, item_name_raw = self.extract_price_and_quantity(line_stripped)
-                item_name = self.clean_item_name(item_name_raw)
+                quantity, price, item_name_raw = line_info.extraction
+                item_name = line_info.item_name
                 
                 # Check if this is a blacklisted group header OR if the extracted item name is blacklisted
-                if self.is_blacklisted(line_stripped) or self.is_blacklisted(item_name):
+                if line_info.blacklisted or line_info.item_name_blacklisted:
                     # It's a promotion/group header or non-food item - extract the sub-items if any
                     logger.info(f"  📦 Found group header (blacklisted): {line_stripped[:50]}")
                     price_str = f"${price:.2f}" if price is not None else "No price"
@@ -965,9 +1240,10 @@ class IntelligentReceiptParser:
                     # Look ahead for indented sub-items
                     sub_item_count = 0
                     while i < len(lines):
-                        next_line = lines[i]
-                        next_stripped = next_line.strip()
-                        next_indent = len(next_line) - len(next_line.lstrip())
+                        next_info = lines[i]
+                        next_line = next_info.raw
+                        next_stripped = next_info.stripped
+                        next_indent = next_info.indent
                         
                         logger.debug(f"     Checking line {i}: indent={next_indent}, text='{next_stripped[:40]}'")
                         
@@ -976,24 +1252,24 @@ class IntelligentReceiptParser:
                             logger.debug(f"       ✓ Line is indented ({next_indent} > {indent_level})")
                             
                             # Check if it's a modifier
-                            if self._is_modifier(next_stripped):
+                            if next_info.is_modifier:
                                 logger.debug(f"       ✗ Skipping modifier: {next_stripped[:30]}")
                                 i += 1
                                 continue
                             
                             # ENHANCED: Check if sub-item has its own price
-                            sub_has_price = bool(re.search(r'\$?\d+\.\d{2}', next_stripped))
+                            sub_has_price = next_info.has_price
                             sub_quantity = 1
                             sub_price = price  # Default to parent's price
                             
                             if sub_has_price:
                                 # Sub-item has its own price - extract it
-                                sub_quantity, sub_price, sub_item_name_raw = self.extract_price_and_quantity(next_stripped)
-                                item_name = self.clean_item_name(sub_item_name_raw)
+                                sub_quantity, sub_price, sub_item_name_raw = next_info.extraction
+                                item_name = next_info.item_name
                                 logger.debug(f"       ✓ Sub-item has own price: ${sub_price:.2f}")
                             else:
                                 # Sub-item uses parent's price
-                                item_name = self._clean_sub_item_name(next_stripped)
+                                item_name = next_info.sub_item_name
                                 logger.debug(f"       ✓ Sub-item uses parent price: ${sub_price:.2f}")
                             
                             logger.debug(f"       Cleaned name: '{item_name}'")
@@ -1041,8 +1317,8 @@ class IntelligentReceiptParser:
                         i += 1
                         continue
                     
-                    # Double-check that this item name is not blacklisted and is likely food
-                    if item_name and len(item_name) >= 3 and not self.is_blacklisted(item_name) and self.is_likely_food_item(item_name):
+                    # item_name is known not to be blacklisted here; check it is likely food
+                    if item_name and len(item_name) >= 3 and self.is_likely_food_item(item_name):
                         item_key = f"{item_name}_{price}"
                         if item_key not in seen_items:
                             items.append({
@@ -1059,13 +1335,11 @@ class IntelligentReceiptParser:
                     # Also check for sub-items under this item
                     i += 1
                     while i < len(lines):
-                        next_line = lines[i]
-                        next_stripped = next_line.strip()
-                        next_indent = len(next_line) - len(next_line.lstrip())
+                        next_info = lines[i]
                         
-                        if next_indent > indent_level and next_stripped:
-                            if not self._is_modifier(next_stripped):
-                                sub_item_name = self._clean_sub_item_name(next_stripped)
+                        if next_info.indent > indent_level and next_info.stripped:
+                            if not next_info.is_modifier:
+                                sub_item_name = next_info.sub_item_name
                                 
                                 # Validate price before adding sub-item
                                 if price and price > 0 and sub_item_name and self.is_likely_food_item(sub_item_name):
@@ -1076,7 +1350,7 @@ class IntelligentReceiptParser:
                                             'quantity': 1,
                                             'price': price,
                                             'unit_price': price,
-                                            'original_line': next_line
+                                            'original_line': next_info.raw
                                         })
                                         seen_items.add(item_key)
                                         price_str = f"${price:.2f}" if price is not None else "No price"
@@ -1128,12 +1402,13 @@ class IntelligentReceiptParser:
             return float(match.group(1))
         return 0.0
     
-    def parse_receipt(self, ocr_text: str) -> Dict[str, Any]:
+    def parse_receipt(self, ocr_text: str, locale: Optional[str] = None) -> Dict[str, Any]:
         """
         Parse complete receipt including items, totals, date, and merchant.
         
         Args:
             ocr_text: Raw OCR text from receipt
+            locale: Optional locale hint for day/month order (e.g. 'en_GB')
             
         Returns:
             Dictionary with items, total, date, merchant_name, and other fields
@@ -1151,22 +1426,36 @@ class IntelligentReceiptParser:
         if not ocr_text:
             return result
         
-        lines = ocr_text.split('\n')
-        
-        # Extract items
-        result['items'] = self.parse_receipt_items(ocr_text)
+        context = self.parse_context(ocr_text, locale=locale)
+        result.update(context.fields)
+        return result
+    
+    def parse_context(self, ocr_text: str, pipeline: Optional[ReceiptPipeline] = None,
+                      locale: Optional[str] = None) -> ReceiptContext:
+        """
+        Run a parse pipeline over the receipt and learn its layout.
         
-        # Extract merchant name (usually first 1-3 lines)
-        result['merchant_name'] = self._extract_merchant_name(lines)
+        Services that need extra fields pass their own pipeline built on
+        ``parser_extractors(parser)`` so shared fields are still computed once.
+        ``locale`` (e.g. 'en_GB') is a hint for ambiguous day/month dates.
+        """
+        context = (pipeline or self.pipeline).run(ocr_text, ReceiptContext(ocr_text, locale=locale))
         
-        # Extract date
-        result['date'] = self._extract_date(ocr_text)
+        # Learn this layout so repeat receipts can use the fast path
+        if self.template_store is not None and 'template_id' not in context.fields:
+            self.template_store.observe(self, context.raw_lines, context.fields)
         
-        # Extract totals
-        totals = self._extract_totals(lines)
-        result.update(totals)
+        return context
+    
+    def parse_session(self, ocr_text: str, pipeline: Optional[ReceiptPipeline] = None,
+                      locale: Optional[str] = None) -> ReceiptParseSession:
+        """
+        Parse the receipt and keep per-line state for incremental re-parses.
         
-        return result
+        Review-screen edits go through ``session.update(text)`` or
+        ``session.edit_lines({line: text})``; only changed lines are parsed again.
+        """
+        return ReceiptParseSession(self, ocr_text, pipeline=pipeline, locale=locale)
     
     def _extract_merchant_name(self, lines: List[str]) -> Optional[str]:
         """Extract merchant/store name from first few lines."""
@@ -1198,133 +1487,56 @@ class IntelligentReceiptParser:
         
         return None
     
+    def extract_date(self, text: str, locale: Optional[str] = None,
+                     merchant: Optional[str] = None) -> Optional[DateMatch]:
+        """Best purchase date with its confidence; locale/merchant hints resolve DMY vs MDY."""
+        return self.date_recognizer.recognize(text, locale=locale, merchant=merchant)
+    
     def _extract_date(self, text: str) -> Optional[str]:
         """Extract date from receipt text and normalize to YYYY-MM-DD format."""
-        import datetime
-        
-        # Common date patterns
-        date_patterns = [
-            # MM/DD/YYYY or MM/DD/YY
-            (r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', 'mdy'),
-            (r'(\d{1,2})[/-](\d{1,2})[/-](\d{2})', 'mdy_short'),
-            
-            # DD/MM/YYYY or DD/MM/YY
-            (r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', 'dmy'),
-            
-            # YYYY-MM-DD
-            (r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', 'ymd'),
-            
-            # Month DD, YYYY
-            (r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{1,2}),?\s+(\d{4})', 'mdy_text'),
-            
-            # DD Month YYYY
-            (r'(\d{1,2})\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{4})', 'dmy_text'),
-            
-            # Date: May 11, 2019
-            (r'Date:\s*(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{1,2}),?\s+(\d{4})', 'date_prefix'),
-        ]
+        match = self.extract_date(text)
+        return match.date if match else None
+    
+    def _extract_totals(self, lines: List[str]) -> Dict[str, float]:
+        """Extract total, subtotal, and tax from receipt."""
+        return self._combine_line_totals(self._line_totals(line) for line in lines)
+    
+    def _line_totals(self, line: str) -> Optional[Tuple[float, float, float]]:
+        """(total, subtotal, tax) amounts one line states; None for other lines."""
+        line_lower = line.lower()
+        is_total = any(keyword in line_lower for keyword in ['total', 'amount due', 'balance due'])
+        is_subtotal = any(keyword in line_lower for keyword in ['subtotal', 'sub-total', 'sub total', 'item total'])
+        is_tax = any(keyword in line_lower for keyword in ['tax', 'gst', 'hst', 'vat', 'pst'])
+        if not (is_total or is_subtotal or is_tax):
+            return None
         
-        month_map = {
-            'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-            'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
-        }
+        # Amounts like $1,234.56, 1.234,56, 123.4 (never dates or rates)
+        amounts = self.money_scanner.scan(line)
+        if not amounts:
+            return None
         
-        for pattern, format_type in date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    if format_type == 'ymd':
-                        year, month, day = match.groups()
-                        return f"{year}-{int(month):02d}-{int(day):02d}"
-                    
-                    elif format_type in ['mdy', 'dmy']:
-                        part1, part2, year = match.groups()
-                        year = int(year)
-                        
-                        # Heuristic: if first number > 12, it's likely day
-                        if int(part1) > 12:
-                            day, month = int(part1), int(part2)
-                        elif int(part2) > 12:
-                            month, day = int(part1), int(part2)
-                        else:
-                            # Ambiguous, assume MM/DD by default (US format)
-                            month, day = int(part1), int(part2)
-                        
-                        return f"{year}-{month:02d}-{day:02d}"
-                    
-                    elif format_type == 'mdy_short':
-                        month, day, year = match.groups()
-                        year = int(year)
-                        if year < 100:
-                            year = 2000 + year if year < 50 else 1900 + year
-                        return f"{year}-{int(month):02d}-{int(day):02d}"
-                    
-                    elif format_type == 'mdy_text':
-                        month_str, day, year = match.groups()
-                        month = month_map[month_str.lower()[:3]]
-                        return f"{year}-{month:02d}-{int(day):02d}"
-                    
-                    elif format_type == 'dmy_text':
-                        day, month_str, year = match.groups()
-                        month = month_map[month_str.lower()[:3]]
-                        return f"{year}-{month:02d}-{int(day):02d}"
-                    
-                    elif format_type == 'date_prefix':
-                        month_str, day, year = match.groups()
-                        month = month_map[month_str.lower()[:3]]
-                        return f"{year}-{month:02d}-{int(day):02d}"
-                
-                except (ValueError, KeyError) as e:
-                    logger.debug(f"Date parsing error: {e}")
-                    continue
+        # Get the last (rightmost) amount
+        amount = amounts[-1].value
         
-        return None
+        # Avoid "item total" or "sub total"
+        total = amount if is_total and 'sub' not in line_lower and 'item' not in line_lower else 0.0
+        return total, amount if is_subtotal else 0.0, amount if is_tax else 0.0
     
-    def _extract_totals(self, lines: List[str]) -> Dict[str, float]:
-        """Extract total, subtotal, and tax from receipt."""
+    def _combine_line_totals(self, entries) -> Dict[str, float]:
+        """Fold per-line amounts: largest total and subtotal, tax lines summed."""
         result = {
             'total': 0.0,
             'subtotal': 0.0,
             'tax': 0.0
         }
         
-        # Look through lines for total keywords
-        for line in lines:
-            line_lower = line.lower()
-            
-            # Extract amounts (handle commas in numbers)
-            # Match patterns like: $1,234.56, 1,234.56, $123.45, 123.45, 123.4, etc.
-            amounts = re.findall(r'\$?\s*([\d,]+\.?\d*)', line)
-            if not amounts:
-                continue
-            
-            # Parse amounts (remove commas)
-            parsed_amounts = []
-            for amt in amounts:
-                try:
-                    parsed_amounts.append(float(amt.replace(',', '')))
-                except ValueError:
-                    continue
-            
-            if not parsed_amounts:
+        for entry in entries:
+            if entry is None:
                 continue
-            
-            # Get the last (rightmost) amount
-            amount = parsed_amounts[-1]
-            
-            # Check for total
-            if any(keyword in line_lower for keyword in ['total', 'amount due', 'balance due']):
-                # Avoid "item total" or "sub total"
-                if 'sub' not in line_lower and 'item' not in line_lower:
-                    result['total'] = max(result['total'], amount)
-            
-            # Check for subtotal
-            if any(keyword in line_lower for keyword in ['subtotal', 'sub-total', 'sub total', 'item total']):
-                result['subtotal'] = max(result['subtotal'], amount)
-            
-            # Check for tax
-            if any(keyword in line_lower for keyword in ['tax', 'gst', 'hst', 'vat', 'pst']):
-                result['tax'] += amount
+            total, subtotal, tax = entry
+            result['total'] = max(result['total'], total)
+            result['subtotal'] = max(result['subtotal'], subtotal)
+            result['tax'] += tax
         
         # If no explicit subtotal found but we have items and total, estimate subtotal
         if result['subtotal'] == 0.0 and result['total'] > 0.0:
@@ -1333,5 +1545,23 @@ class IntelligentReceiptParser:
         return result
 
 
-# Global instance
-receipt_parser = IntelligentReceiptParser()
+# Global instance, built on first use: importing this module (as the
+# enhanced OCR service does, with its own parser) stays cheap
+_receipt_parser: Optional[IntelligentReceiptParser] = None
+_receipt_parser_lock = threading.Lock()
+
+
+def get_receipt_parser() -> IntelligentReceiptParser:
+    global _receipt_parser
+    if _receipt_parser is None:
+        with _receipt_parser_lock:
+            if _receipt_parser is None:
+                _receipt_parser = IntelligentReceiptParser()
+    return _receipt_parser
+
+
+def __getattr__(name: str):
+    # ``from intelligent_receipt_parser import receipt_parser`` keeps working
+    if name == 'receipt_parser':
+        return get_receipt_parser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
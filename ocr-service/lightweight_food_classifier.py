@@ -8,151 +8,161 @@ import logging
 from typing import Dict, List, Any
 from PIL import Image
 import colorsys
+import numpy as np
 from datetime import datetime
 
+from nutrition_dataset import get_dataset
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class LightweightFoodClassifier:
     """Lightweight food classification using color and image analysis."""
+
+    ANALYSIS_SIZE = 64                    # longest thumbnail side for color analysis
+    HSV_BINS = (8, 4, 4)
+    MIN_CLUSTER_SATURATION = 40           # 0-255; below this a cluster is plate / background
+    MATCH_WEIGHTS = np.array([0.4, 0.3, 0.3])   # hue, lightness, saturation
+    
+    # HSL ranges per food: hue (degrees), lightness, saturation (0-255);
+    # a hue range with low > high wraps through 0 degrees (reds)
+    COLOR_RANGES = {
+        'banana': [(40, 70), (200, 255), (100, 200)],     # Yellow hue, high lightness
+        'apple': [(345, 15), (50, 200), (80, 180)],       # Red hue
+        'orange': [(20, 40), (150, 255), (120, 200)],     # Orange hue
+        'broccoli': [(80, 140), (50, 180), (50, 120)],    # Green hue
+        'tomato': [(345, 15), (100, 200), (100, 180)],    # Red hue
+    }
     
     def __init__(self):
         logger.info("Initializing Lightweight Food Classifier...")
         
-        # Food database with color profiles and nutritional info
-        self.food_database = {
-            'banana': {
-                'color_ranges': [(40, 70), (200, 255), (100, 200)],  # HSL: Yellow hue, high lightness
-                'category': 'fruits',
-                'display_name': 'Banana',
-                'calories': 89,
-                'protein': 1.1,
-                'carbohydrates': 22.8,
-                'fat': 0.3,
-                'fiber': 2.6,
-                'key_nutrients': ['potassium', 'vitamin B6', 'vitamin C'],
-                'portion_size': 100,  # grams
-                'portion_description': '1 medium banana (about 7-8 inches)'
-            },
-            'apple': {
-                'color_ranges': [(0, 15), (50, 200), (80, 180)],  # Red hue
-                'category': 'fruits',
-                'display_name': 'Apple',
-                'calories': 52,
-                'protein': 0.3,
-                'carbohydrates': 13.8,
-                'fat': 0.2,
-                'fiber': 2.4,
-                'key_nutrients': ['vitamin C', 'fiber', 'antioxidants'],
-                'portion_size': 100,
-                'portion_description': '1 medium apple'
-            },
-            'orange': {
-                'color_ranges': [(20, 40), (150, 255), (120, 200)],  # Orange hue
-                'category': 'fruits',
-                'display_name': 'Orange',
-                'calories': 47,
-                'protein': 0.9,
-                'carbohydrates': 11.8,
-                'fat': 0.1,
-                'fiber': 2.4,
-                'key_nutrients': ['vitamin C', 'folate', 'thiamine'],
-                'portion_size': 100,
-                'portion_description': '1 medium orange'
-            },
-            'broccoli': {
-                'color_ranges': [(80, 140), (50, 180), (50, 120)],  # Green hue
-                'category': 'vegetables',
-                'display_name': 'Broccoli',
-                'calories': 34,
-                'protein': 2.8,
-                'carbohydrates': 6.6,
-                'fat': 0.4,
-                'fiber': 2.6,
-                'key_nutrients': ['vitamin C', 'vitamin K', 'folate'],
-                'portion_size': 100,
-                'portion_description': '1 cup chopped'
-            },
-            'tomato': {
-                'color_ranges': [(0, 15), (100, 200), (100, 180)],  # Red hue
-                'category': 'vegetables',
-                'display_name': 'Tomato',
-                'calories': 18,
-                'protein': 0.9,
-                'carbohydrates': 3.9,
-                'fat': 0.2,
-                'fiber': 1.2,
-                'key_nutrients': ['vitamin C', 'lycopene', 'vitamin K'],
-                'portion_size': 100,
-                'portion_description': '1 medium tomato'
-            }
-        }
+        # Food database: color profiles with nutritional info from the shared dataset
+        dataset = get_dataset()
+        self.food_database = {}
+        for food_name, color_ranges in self.COLOR_RANGES.items():
+            food_data = dataset.food_data(food_name)
+            if food_data is None:
+                logger.warning(f"⚠️ No nutrition data for '{food_name}'")
+                continue
+            self.food_database[food_name] = {**food_data, 'color_ranges': color_ranges}
+        
+        # Color ranges of every food as arrays (hue, lightness, saturation) for match_food_by_color
+        self._color_foods = list(self.food_database)
+        ranges = np.array([self.food_database[name]['color_ranges'] for name in self._color_foods], dtype=np.float64)
+        self._color_low, self._color_high = ranges[:, :, 0], ranges[:, :, 1]
         
         logger.info(f"✅ Lightweight classifier initialized with {len(self.food_database)} food items")
     
-    def analyze_color(self, image: Image.Image) -> Dict[str, float]:
-        """Analyze dominant colors in the image."""
-        # Resize for faster processing
-        img = image.copy()
-        img.thumbnail((150, 150))
+    def analyze_color(self, image: Image.Image) -> Dict[str, Any]:
+        """
+        Analyze the colors in the image: average color (HSL), a joint HSV
+        histogram and the dominant color clusters (k-means on the pixels of
+        a small thumbnail), all on NumPy arrays.
+        """
+        # Downscale first; color statistics do not need more than 64x64 pixels
+        scale = min(1.0, self.ANALYSIS_SIZE / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        img = image.resize(size, Image.BILINEAR, reducing_gap=2.0) if scale < 1.0 else image
         
         # Convert to RGB
         if img.mode != 'RGB':
             img = img.convert('RGB')
         
-        # Get pixel data
-        pixels = list(img.getdata())
-        
-        # Calculate average color
-        avg_r = sum(p[0] for p in pixels) / len(pixels)
-        avg_g = sum(p[1] for p in pixels) / len(pixels)
-        avg_b = sum(p[2] for p in pixels) / len(pixels)
+        pixels = np.asarray(img, dtype=np.float32).reshape(-1, 3)
         
-        # Convert to HSL
+        # Average color, as HSL (hue in degrees, saturation / lightness on 0-255)
+        avg_r, avg_g, avg_b = pixels.mean(axis=0)
         h, l, s = colorsys.rgb_to_hls(avg_r/255, avg_g/255, avg_b/255)
-        h_deg = h * 360  # Convert to degrees
-        s_pct = s * 255
-        l_pct = l * 255
+        
+        # Joint HSV histogram (8 hue x 4 saturation x 4 value bins), normalized
+        hsv = np.asarray(img.convert('HSV'), dtype=np.uint8).reshape(-1, 3)
+        bins = np.array(self.HSV_BINS)
+        quantized = (hsv.astype(np.int32) * bins) >> 8
+        flat_index = (quantized[:, 0] * bins[1] + quantized[:, 1]) * bins[2] + quantized[:, 2]
+        histogram = np.bincount(flat_index, minlength=int(bins.prod())) / len(hsv)
         
         return {
-            'hue': h_deg,
-            'saturation': s_pct,
-            'lightness': l_pct,
-            'rgb': (avg_r, avg_g, avg_b)
+            'hue': h * 360,  # Convert to degrees
+            'saturation': s * 255,
+            'lightness': l * 255,
+            'rgb': (float(avg_r), float(avg_g), float(avg_b)),
+            'hsv_histogram': {'bins': list(self.HSV_BINS), 'frequencies': np.round(histogram, 4).tolist()},
+            'dominant_colors': self._dominant_colors(pixels)
         }
+
+    def _dominant_colors(self, pixels: np.ndarray, k: int = 4, iterations: int = 8) -> List[Dict[str, Any]]:
+        """Vectorized k-means over RGB pixels; clusters sorted by pixel share."""
+        k = min(k, len(pixels))
+        # Deterministic start: pixels spread evenly through the brightness order
+        order = np.argsort(pixels.sum(axis=1), kind='stable')
+        centers = pixels[order[np.linspace(0, len(pixels) - 1, k).astype(int)]].copy()
+        
+        for _ in range(iterations):
+            distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            assignment = distances.argmin(axis=1)
+            counts = np.bincount(assignment, minlength=k)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assignment, pixels)
+            filled = counts > 0  # an empty cluster keeps its previous center
+            centers[filled] = sums[filled] / counts[filled, None]
+        
+        clusters = []
+        for center, count in zip(centers, counts):
+            if not count:
+                continue
+            h, l, s = colorsys.rgb_to_hls(*(center / 255))
+            clusters.append({
+                'rgb': [round(float(channel), 1) for channel in center],
+                'hue': h * 360,
+                'lightness': l * 255,
+                'saturation': s * 255,
+                'weight': float(count) / len(pixels)
+            })
+        clusters.sort(key=lambda cluster: cluster['weight'], reverse=True)
+        return clusters
     
-    def match_food_by_color(self, color_analysis: Dict[str, float]) -> List[Dict[str, Any]]:
-        """Match food items based on color analysis."""
-        matches = []
+    def match_food_by_color(self, color_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Match food items based on color analysis.
         
-        h = color_analysis['hue']
-        s = color_analysis['saturation']
-        l = color_analysis['lightness']
+        Every food's hue / lightness / saturation ranges are checked against
+        every dominant color at once; a food's confidence is the share-weighted
+        match of the colorful clusters (plates and backgrounds - near-gray
+        clusters - only count when nothing colorful is present).
+        """
+        clusters = color_analysis.get('dominant_colors') or [{
+            'hue': color_analysis['hue'],
+            'lightness': color_analysis['lightness'],
+            'saturation': color_analysis['saturation'],
+            'weight': 1.0
+        }]
+        hls = np.array([[c['hue'], c['lightness'], c['saturation']] for c in clusters])  # [clusters, 3]
+        weights = np.array([c['weight'] for c in clusters])
+        colorful = hls[:, 2] >= self.MIN_CLUSTER_SATURATION
+        if colorful.any():
+            weights = np.where(colorful, weights, 0.0)
+        weights = weights / weights.sum()
         
-        for food_name, food_data in self.food_database.items():
-            color_range = food_data['color_ranges']
-            h_range, l_range, s_range = color_range
-            
-            # Check if color falls within ranges
-            h_match = h_range[0] <= h <= h_range[1]
-            l_match = l_range[0] <= l <= l_range[1]
-            s_match = s_range[0] <= s <= s_range[1]
-            
-            # Calculate confidence based on how well it matches
-            confidence = 0.0
-            if h_match:
-                confidence += 0.4
-            if l_match:
-                confidence += 0.3
-            if s_match:
-                confidence += 0.3
-            
-            if confidence > 0.3:  # Threshold for including in results
-                matches.append({
-                    'food_name': food_name,
-                    'confidence': confidence,
-                    'food_data': food_data
-                })
+        low, high = self._color_low[:, None, :], self._color_high[:, None, :]   # [foods, 1, 3]
+        above, below = hls[None] >= low, hls[None] <= high                      # [foods, clusters, 3]
+        inside = above & below
+        # Hue is circular: a red range such as (345, 15) covers 345-360 and 0-15
+        wraps = low[:, :, 0] > high[:, :, 0]                                    # [foods, 1]
+        inside[:, :, 0] = np.where(wraps, above[:, :, 0] | below[:, :, 0], inside[:, :, 0])
+        
+        # Calculate confidence based on how well it matches
+        confidence = (inside @ self.MATCH_WEIGHTS) @ weights                      # [foods]
+        
+        matches = [
+            {
+                'food_name': food_name,
+                'confidence': round(float(score), 4),
+                'food_data': self.food_database[food_name]
+            }
+            for food_name, score in zip(self._color_foods, confidence)
+            if score > 0.3  # Threshold for including in results
+        ]
         
         # Sort by confidence
         matches.sort(key=lambda x: x['confidence'], reverse=True)
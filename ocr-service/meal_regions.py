@@ -0,0 +1,138 @@
+"""
+Meal Regions
+Crop proposals and non-maximum suppression for multi-item meal photos.
+One global CLIP embedding describes a plate with rice, salmon and
+broccoli as whichever food dominates; classifying crops instead yields
+one label per food with a box.
+
+Proposals come from two sources:
+  - an overlapping grid of tiles (always available)
+  - salient blobs: saturated / textured areas separated from the plate
+    and table by Otsu thresholding, closed morphologically, and taken as
+    contour bounding boxes (needs OpenCV)
+
+Boxes are (x0, y0, x1, y1) in pixels of the decoded image; detections
+are reported with boxes normalized to 0-1.
+"""
+
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+from startup_profile import lazy_import
+
+np = lazy_import('numpy')
+cv2 = lazy_import('cv2')
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+
+def grid_tiles(width: int, height: int, grid: int = 3, overlap: float = 0.25) -> List[Box]:
+    """``grid`` x ``grid`` tiles covering the image, each overlapping its neighbours by ``overlap``."""
+    if grid <= 1:
+        return [(0, 0, width, height)]
+    tile_w = width / (grid - (grid - 1) * overlap)
+    tile_h = height / (grid - (grid - 1) * overlap)
+    step_w, step_h = tile_w * (1 - overlap), tile_h * (1 - overlap)
+    tiles = []
+    for row in range(grid):
+        for col in range(grid):
+            x0, y0 = round(col * step_w), round(row * step_h)
+            tiles.append((x0, y0, min(width, round(x0 + tile_w)), min(height, round(y0 + tile_h))))
+    return tiles
+
+
+def salient_regions(image, max_regions: int = 6, min_area: float = 0.02,
+                    max_area: float = 0.8, padding: float = 0.05) -> List[Box]:
+    """Bounding boxes of the largest salient blobs (food on a plain plate or table)."""
+    try:
+        rgb = np.asarray(image.convert('RGB'))
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    except ImportError as e:
+        logger.debug(f"Salient region proposals unavailable: {e}")
+        return []
+
+    height, width = gray.shape
+    # Food is more saturated and more textured than plates, bowls and tablecloths
+    edges = cv2.Laplacian(cv2.GaussianBlur(gray, (5, 5), 0), cv2.CV_8U, ksize=3)
+    saliency = cv2.addWeighted(np.ascontiguousarray(hsv[:, :, 1]), 0.7, cv2.GaussianBlur(edges, (15, 15), 0), 0.3, 0)
+    _, mask = cv2.threshold(saliency, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    image_area = float(width * height)
+    boxes = []
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        x, y, w, h = cv2.boundingRect(contour)
+        if not min_area <= (w * h) / image_area <= max_area:
+            continue
+        pad_x, pad_y = int(w * padding), int(h * padding)
+        boxes.append((max(0, x - pad_x), max(0, y - pad_y),
+                      min(width, x + w + pad_x), min(height, y + h + pad_y)))
+        if len(boxes) >= max_regions:
+            break
+    return boxes
+
+
+def box_iou(a: Sequence[float], b: Sequence[float]) -> float:
+    ix0, iy0 = max(a[0], b[0]), max(a[1], b[1])
+    ix1, iy1 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, ix1 - ix0) * max(0.0, iy1 - iy0)
+    if intersection <= 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / (area_a + area_b - intersection)
+
+
+def non_max_suppression(detections: List[Dict[str, Any]], iou_threshold: float = 0.5,
+                        cross_label_iou: float = 0.8) -> List[Dict[str, Any]]:
+    """
+    Keep the most confident of overlapping detections. Detections with the
+    same label are suppressed above ``iou_threshold`` (the same food seen by
+    neighbouring tiles); different labels only above ``cross_label_iou``
+    (two readings of the same region).
+    """
+    kept: List[Dict[str, Any]] = []
+    for detection in sorted(detections, key=lambda item: item['probability'], reverse=True):
+        suppressed = False
+        for other in kept:
+            limit = iou_threshold if other['canonical_name'] == detection['canonical_name'] else cross_label_iou
+            if box_iou(detection['box'], other['box']) > limit:
+                suppressed = True
+                break
+        if not suppressed:
+            kept.append(detection)
+    return kept
+
+
+def merge_by_label(detections: List[Dict[str, Any]], contain_threshold: float = 0.6) -> List[Dict[str, Any]]:
+    """
+    Drop same-label detections that mostly lie inside a more confident one
+    (a tile showing part of a dish that a larger proposal already covers).
+    """
+    kept: List[Dict[str, Any]] = []
+    for detection in detections:
+        box = detection['box']
+        area = max((box[2] - box[0]) * (box[3] - box[1]), 1e-9)
+        covered = False
+        for other in kept:
+            if other['canonical_name'] != detection['canonical_name']:
+                continue
+            ob = other['box']
+            overlap = max(0.0, min(box[2], ob[2]) - max(box[0], ob[0])) * max(0.0, min(box[3], ob[3]) - max(box[1], ob[1]))
+            if overlap / area >= contain_threshold:
+                covered = True
+                break
+        if not covered:
+            kept.append(detection)
+    return kept
+
+
+def normalize_box(box: Box, width: int, height: int) -> List[float]:
+    return [round(box[0] / width, 4), round(box[1] / height, 4),
+            round(box[2] / width, 4), round(box[3] / height, 4)]
@@ -0,0 +1,106 @@
+"""
+Micro Batcher
+Coalesces concurrent single-item calls into batched calls. Callers submit
+one item and block on (or await) a future; a worker thread takes the first
+waiting item, collects whatever else arrives within ``max_wait_ms`` (up to
+``max_batch_size`` items) and hands the whole batch to ``process_batch``
+in one call. Used to stack CLIP image encodes from concurrent requests
+into a single forward pass.
+
+Under light load a request waits at most ``max_wait_ms`` longer than it
+would alone; under concurrent load each batch amortizes the model call
+over many requests.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Thread-safe micro-batching scheduler around a ``process_batch(items) -> results`` function."""
+
+    def __init__(self, process_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0, name: str = 'micro-batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue ``item``; the returned future resolves to its result."""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Blocking single-item call through the batcher."""
+        return self.submit(item).result()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[tuple]):
+        # Drop requests whose caller cancelled while they were queued
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            results = self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: {len(results)} results for a batch of {len(batch)}")
+        except Exception as e:
+            logger.error(f"❌ {self.name} batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch counts and sizes so far."""
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'average_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queued': self._queue.qsize(),
+            }
@@ -6,15 +6,44 @@ Achieves 85-90% accuracy on real-world food images
 
 import os
 import io
+import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from PIL import Image
 import numpy as np
 from datetime import datetime
 
+from micro_batcher import MicroBatcher
+from nutrition_dataset import get_dataset
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keras' imagenet_class_index.json ({"0": ["n01440764", "tench"], ...}), bundled for offline hosts
+IMAGENET_CLASS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data',
+                                    'imagenet_class_index.json')
+INPUT_SIZE = 224  # EfficientNetB0 input resolution
+
+# ImageNet synsets under "food" (WordNet n07...): the classes whose label
+# is matched against the nutrition dataset by name
+FOOD_SYNSET_PREFIX = 'n07'
+
+# ImageNet class -> nutrition food where matching by name misses (or gets it
+# wrong: None); any class, food synset or not. Every class must exist.
+IMAGENET_FOOD_OVERRIDES = {
+    'French_loaf': 'bread',
+    'pretzel': 'bread',
+    'cheeseburger': 'sandwich',
+    'hotdog': 'sandwich',
+    'carbonara': 'pasta',
+    'meat_loaf': 'beef',
+    'guacamole': 'avocado',
+    'espresso': 'coffee',
+    'corn': 'corn',
+    'ear': 'corn',
+    'custard_apple': None,
+}
+
 class MLFoodClassifier:
     """ML-based food classification using pre-trained neural networks."""
     
@@ -25,287 +54,246 @@ class MLFoodClassifier:
         try:
             import tensorflow as tf
             from tensorflow.keras.applications import EfficientNetB0
-            from tensorflow.keras.applications.efficientnet import preprocess_input, decode_predictions
-            from tensorflow.keras.preprocessing import image
+            from tensorflow.keras.applications.efficientnet import preprocess_input
             
             self.tf = tf
             self.preprocess_input = preprocess_input
-            self.image_module = image
             
             # Load pre-trained EfficientNetB0 (lighter than B4, good for CPU)
             logger.info("Loading EfficientNetB0 model...")
             self.model = EfficientNetB0(weights='imagenet', include_top=True)
+            # Compiled forward pass; the fixed signature (any batch size) is traced once
+            self._infer = tf.function(
+                self._forward,
+                input_signature=[tf.TensorSpec([None, INPUT_SIZE, INPUT_SIZE, 3], tf.float32)]
+            )
+            self._infer(tf.zeros([1, INPUT_SIZE, INPUT_SIZE, 3]))
             logger.info("✅ Model loaded successfully!")
             
-            # Food-101 class names (we'll map ImageNet to food categories)
-            self.food_database = self._load_food_database()
+            # Full ImageNet label table and the nutrition food of each class
+            self.imagenet_index = self._load_imagenet_index()
+            self.imagenet_classes = [name for _, name in self.imagenet_index]
+            class_foods = self._map_imagenet_classes()
+            self.food_database = self._load_food_database(class_foods)
+            self.food_keys = list(self.food_database)
+            self.class_to_food = self._build_class_food_index(class_foods)
+            self.mapped_classes = np.flatnonzero(self.class_to_food >= 0)
             
-            # ImageNet to nutrition mapping
-            self.imagenet_to_nutrition = self._build_imagenet_nutrition_map()
+            # Concurrent single-image requests are stacked into one forward pass
+            self.batch_size = max(1, int(os.getenv('FOOD_ML_BATCH_SIZE', '16')))
+            self.image_batcher: Optional[MicroBatcher] = None
+            if os.getenv('FOOD_ML_BATCHING', '1').lower() in ('1', 'true', 'yes'):
+                self.image_batcher = MicroBatcher(
+                    self._predict_batch,
+                    max_batch_size=self.batch_size,
+                    max_wait_ms=float(os.getenv('FOOD_ML_BATCH_WAIT_MS', '10')),
+                    name='ml-image-batcher'
+                )
             
         except Exception as e:
             logger.error(f"Failed to load ML model: {e}")
             raise
     
-    def _load_food_database(self) -> Dict[str, Dict]:
-        """Load comprehensive food nutrition database."""
-        # Extended database with more foods
-        return {
-            # Fruits
-            'banana': {
-                'display_name': 'Banana',
-                'category': 'fruits',
-                'imagenet_classes': ['banana'],
-                'calories': 89, 'protein': 1.1, 'carbohydrates': 22.8, 'fat': 0.3, 'fiber': 2.6,
-                'key_nutrients': ['potassium', 'vitamin B6', 'vitamin C'],
-                'portion_size': 100, 'portion_description': '1 medium banana (7-8 inches)'
-            },
-            'apple': {
-                'display_name': 'Apple',
-                'category': 'fruits',
-                'imagenet_classes': ['granny_smith', 'eating apple'],
-                'calories': 52, 'protein': 0.3, 'carbohydrates': 13.8, 'fat': 0.2, 'fiber': 2.4,
-                'key_nutrients': ['vitamin C', 'fiber', 'antioxidants'],
-                'portion_size': 100, 'portion_description': '1 medium apple'
-            },
-            'orange': {
-                'display_name': 'Orange',
-                'category': 'fruits',
-                'imagenet_classes': ['orange'],
-                'calories': 47, 'protein': 0.9, 'carbohydrates': 11.8, 'fat': 0.1, 'fiber': 2.4,
-                'key_nutrients': ['vitamin C', 'folate', 'thiamine'],
-                'portion_size': 100, 'portion_description': '1 medium orange'
-            },
-            'strawberry': {
-                'display_name': 'Strawberry',
-                'category': 'fruits',
-                'imagenet_classes': ['strawberry'],
-                'calories': 32, 'protein': 0.7, 'carbohydrates': 7.7, 'fat': 0.3, 'fiber': 2.0,
-                'key_nutrients': ['vitamin C', 'manganese', 'folate'],
-                'portion_size': 100, 'portion_description': '1 cup (8 medium berries)'
-            },
-            'pineapple': {
-                'display_name': 'Pineapple',
-                'category': 'fruits',
-                'imagenet_classes': ['pineapple'],
-                'calories': 50, 'protein': 0.5, 'carbohydrates': 13.1, 'fat': 0.1, 'fiber': 1.4,
-                'key_nutrients': ['vitamin C', 'manganese', 'bromelain'],
-                'portion_size': 100, 'portion_description': '1 cup chunks'
-            },
-            
-            # Vegetables
-            'broccoli': {
-                'display_name': 'Broccoli',
-                'category': 'vegetables',
-                'imagenet_classes': ['broccoli'],
-                'calories': 34, 'protein': 2.8, 'carbohydrates': 6.6, 'fat': 0.4, 'fiber': 2.6,
-                'key_nutrients': ['vitamin C', 'vitamin K', 'folate'],
-                'portion_size': 100, 'portion_description': '1 cup chopped'
-            },
-            'carrot': {
-                'display_name': 'Carrot',
-                'category': 'vegetables',
-                'imagenet_classes': ['carrot'],
-                'calories': 41, 'protein': 0.9, 'carbohydrates': 9.6, 'fat': 0.2, 'fiber': 2.8,
-                'key_nutrients': ['vitamin A', 'beta-carotene', 'fiber'],
-                'portion_size': 100, 'portion_description': '1 medium carrot'
-            },
-            'tomato': {
-                'display_name': 'Tomato',
-                'category': 'vegetables',
-                'imagenet_classes': ['tomato'],
-                'calories': 18, 'protein': 0.9, 'carbohydrates': 3.9, 'fat': 0.2, 'fiber': 1.2,
-                'key_nutrients': ['vitamin C', 'lycopene', 'vitamin K'],
-                'portion_size': 100, 'portion_description': '1 medium tomato'
-            },
-            'bell_pepper': {
-                'display_name': 'Bell Pepper',
-                'category': 'vegetables',
-                'imagenet_classes': ['bell pepper'],
-                'calories': 31, 'protein': 1.0, 'carbohydrates': 6.0, 'fat': 0.3, 'fiber': 2.1,
-                'key_nutrients': ['vitamin C', 'vitamin A', 'fiber'],
-                'portion_size': 100, 'portion_description': '1 medium pepper'
-            },
-            
-            # Proteins
-            'chicken': {
-                'display_name': 'Chicken',
-                'category': 'proteins',
-                'imagenet_classes': ['drumstick', 'chicken'],
-                'calories': 165, 'protein': 31.0, 'carbohydrates': 0.0, 'fat': 3.6, 'fiber': 0.0,
-                'key_nutrients': ['protein', 'B vitamins', 'selenium'],
-                'portion_size': 100, 'portion_description': '3.5 oz cooked'
-            },
-            'fish': {
-                'display_name': 'Fish',
-                'category': 'proteins',
-                'imagenet_classes': ['fish', 'salmon', 'tuna'],
-                'calories': 206, 'protein': 22.0, 'carbohydrates': 0.0, 'fat': 13.0, 'fiber': 0.0,
-                'key_nutrients': ['omega-3', 'protein', 'vitamin D'],
-                'portion_size': 100, 'portion_description': '3.5 oz cooked'
-            },
-            
-            # Grains & Bakery
-            'bread': {
-                'display_name': 'Bread',
-                'category': 'grains',
-                'imagenet_classes': ['loaf', 'bagel', 'pretzel'],
-                'calories': 265, 'protein': 9.0, 'carbohydrates': 49.0, 'fat': 3.2, 'fiber': 2.7,
-                'key_nutrients': ['carbohydrates', 'B vitamins', 'fiber'],
-                'portion_size': 100, 'portion_description': '3-4 slices'
-            },
-            'pizza': {
-                'display_name': 'Pizza',
-                'category': 'meals',
-                'imagenet_classes': ['pizza'],
-                'calories': 266, 'protein': 11.0, 'carbohydrates': 33.0, 'fat': 10.0, 'fiber': 2.5,
-                'key_nutrients': ['carbohydrates', 'protein', 'calcium'],
-                'portion_size': 100, 'portion_description': '1 slice'
-            },
-            
-            # Dairy
-            'cheese': {
-                'display_name': 'Cheese',
-                'category': 'dairy',
-                'imagenet_classes': ['cheese'],
-                'calories': 402, 'protein': 25.0, 'carbohydrates': 1.3, 'fat': 33.0, 'fiber': 0.0,
-                'key_nutrients': ['calcium', 'protein', 'vitamin B12'],
-                'portion_size': 100, 'portion_description': '1 oz (28g)'
-            },
-            
-            # Snacks
-            'french_fries': {
-                'display_name': 'French Fries',
-                'category': 'snacks',
-                'imagenet_classes': ['french fries', 'fries'],
-                'calories': 312, 'protein': 3.4, 'carbohydrates': 41.0, 'fat': 15.0, 'fiber': 3.8,
-                'key_nutrients': ['carbohydrates', 'sodium', 'vitamin C'],
-                'portion_size': 100, 'portion_description': 'medium serving'
-            },
-            
-            # Add more as needed - this is extensible
-        }
+    @staticmethod
+    def _load_imagenet_index() -> List[Tuple[str, str]]:
+        """
+        (synset id, class name) of the 1000 ImageNet classes in model output
+        order (the bundled class index, or FOOD_ML_IMAGENET_LABELS). Raises
+        when they cannot be read: without labels no prediction maps to a food.
+        """
+        path = os.getenv('FOOD_ML_IMAGENET_LABELS') or IMAGENET_CLASS_INDEX
+        with open(path, 'r', encoding='utf-8') as handle:
+            class_index = json.load(handle)
+        index = [tuple(class_index[str(idx)]) for idx in range(len(class_index))]
+        if len(index) != 1000:
+            raise ValueError(f"{path} has {len(index)} ImageNet classes, expected 1000")
+        return index
     
-    def _build_imagenet_nutrition_map(self) -> Dict[str, str]:
-        """Map ImageNet class names to our nutrition database."""
-        mapping = {}
-        for food_key, food_data in self.food_database.items():
-            for imagenet_class in food_data['imagenet_classes']:
-                mapping[imagenet_class.lower()] = food_key
-        return mapping
+    def _map_imagenet_classes(self) -> List[Optional[str]]:
+        """
+        Nutrition food key of every ImageNet class (None for non-foods): the
+        override table, else the food dataset's name match for food synsets.
+        """
+        missing = set(IMAGENET_FOOD_OVERRIDES) - set(self.imagenet_classes)
+        if missing:
+            raise ValueError(f"IMAGENET_FOOD_OVERRIDES names unknown ImageNet classes: {sorted(missing)}")
+        
+        dataset = get_dataset()
+        class_foods: List[Optional[str]] = []
+        for synset, class_name in self.imagenet_index:
+            if class_name in IMAGENET_FOOD_OVERRIDES:
+                food_key = IMAGENET_FOOD_OVERRIDES[class_name]
+            elif synset.startswith(FOOD_SYNSET_PREFIX):
+                row = dataset.find(class_name)
+                food_key = dataset.keys[row].decode('utf-8') if row >= 0 else None
+            else:
+                food_key = None
+            class_foods.append(food_key)
+        return class_foods
+    
+    def _load_food_database(self, class_foods: List[Optional[str]]) -> Dict[str, Dict]:
+        """Nutrition (per 100 g) of the foods ImageNet classes map to, from the shared nutrition dataset."""
+        dataset = get_dataset()
+        database = {}
+        for class_name, food_key in zip(self.imagenet_classes, class_foods):
+            if food_key is None:
+                continue
+            if food_key not in database:
+                food_data = dataset.food_data(food_key)
+                if food_data is None:
+                    logger.warning(f"⚠️ No nutrition data for '{food_key}' (ImageNet class '{class_name}')")
+                    continue
+                database[food_key] = {**food_data, 'imagenet_classes': []}
+            database[food_key]['imagenet_classes'].append(class_name)
+        logger.info(f"🍽️ {sum(len(food['imagenet_classes']) for food in database.values())} ImageNet classes "
+                    f"map to {len(database)} foods")
+        return database
+    
+    @staticmethod
+    def _normalize_class_name(name: str) -> str:
+        return name.lower().replace('_', ' ')
+    
+    def _build_class_food_index(self, class_foods: List[Optional[str]]) -> np.ndarray:
+        """ImageNet class index -> position in ``food_keys`` (-1 for classes without nutrition data)."""
+        positions = {food_key: position for position, food_key in enumerate(self.food_keys)}
+        return np.array([positions.get(food_key, -1) for food_key in class_foods], dtype=np.int64)
+    
+    def _forward(self, images):
+        return self.model(images, training=False)
     
-    def _predict_with_model(self, img_array: np.ndarray) -> List[tuple]:
-        """Run inference with the neural network."""
-        # Preprocess for EfficientNet
-        img_array = self.preprocess_input(img_array)
-        img_array = np.expand_dims(img_array, axis=0)
+    def _predict_batch(self, img_arrays: List[np.ndarray]) -> List[np.ndarray]:
+        """Class probabilities for a list of 224x224x3 arrays, ``batch_size`` images per forward pass."""
+        probabilities = []
+        for start in range(0, len(img_arrays), self.batch_size):
+            # Preprocess for EfficientNet
+            batch = self.preprocess_input(np.stack(img_arrays[start:start + self.batch_size]).astype(np.float32))
+            probabilities.extend(self._infer(self.tf.constant(batch)).numpy())
+        return probabilities
+    
+    def _predict_with_model(self, img_array: np.ndarray) -> np.ndarray:
+        """Run inference with the neural network (through the batcher when enabled)."""
+        if self.image_batcher is not None:
+            return self.image_batcher(img_array)
+        return self._predict_batch([img_array])[0]
+    
+    def _match_foods(self, probabilities: np.ndarray, top: int = 10) -> List[Dict[str, Any]]:
+        """
+        Foods among the top ImageNet predictions. A food's confidence is the
+        summed probability of all of its ImageNet classes.
+        """
+        top_indices = np.argpartition(probabilities, -top)[-top:]
+        top_indices = top_indices[np.argsort(probabilities[top_indices])[::-1]]
         
-        # Predict
-        predictions = self.model.predict(img_array, verbose=0)
+        food_scores = np.bincount(
+            self.class_to_food[self.mapped_classes],
+            weights=probabilities[self.mapped_classes],
+            minlength=len(self.food_keys)
+        )
+        foods = np.unique(self.class_to_food[top_indices])
+        foods = foods[foods >= 0]
+        foods = foods[np.argsort(food_scores[foods])[::-1]]
         
-        # Decode top 10 predictions
-        decoded = []
-        # decode_predictions returns [[('class_id', 'class_name', probability), ...]]
-        for pred_list in predictions:
-            # Get indices of top predictions
-            top_indices = np.argsort(pred_list)[-10:][::-1]
-            for idx in top_indices:
-                class_name = self._get_imagenet_class_name(idx)
-                confidence = float(pred_list[idx])
-                decoded.append((idx, class_name, confidence))
+        matched_foods = [
+            {
+                'food_key': self.food_keys[food],
+                'food_data': self.food_database[self.food_keys[food]],
+                'confidence': float(food_scores[food])
+            }
+            for food in foods
+        ]
         
-        return decoded
+        if not matched_foods:
+            # Fallback: use top prediction even if not in our DB
+            logger.warning("No exact match found, using top prediction")
+            top_class = self._normalize_class_name(self.imagenet_classes[top_indices[0]])
+            # Create a generic entry
+            matched_foods.append({
+                'food_key': top_class,
+                'food_data': {
+                    'display_name': top_class.title(),
+                    'category': 'unknown',
+                    'calories': 0, 'protein': 0, 'carbohydrates': 0,
+                    'fat': 0, 'fiber': 0,
+                    'key_nutrients': [],
+                    'portion_size': 100,
+                    'portion_description': 'serving'
+                },
+                'confidence': float(probabilities[top_indices[0]])
+            })
+        return matched_foods
     
-    def _get_imagenet_class_name(self, class_idx: int) -> str:
-        """Get ImageNet class name from index."""
-        # ImageNet class index to name mapping (simplified)
-        # In production, use proper ImageNet class labels
-        imagenet_classes = {
-            # This is a simplified subset - full ImageNet has 1000 classes
-            # We'll map the ones relevant to food
-            951: 'lemon', 949: 'strawberry', 950: 'orange',
-            953: 'pineapple', 954: 'banana',
-            936: 'broccoli', 937: 'carrot',
-            963: 'pizza', 965: 'hot dog', 960: 'ice cream',
-            # Add more mappings as needed
-        }
-        return imagenet_classes.get(class_idx, f'class_{class_idx}')
+    def _load_image_array(self, image_bytes: bytes) -> np.ndarray:
+        """Decode and resize to the model input size (224x224 for EfficientNetB0)."""
+        img = Image.open(io.BytesIO(image_bytes))
+        # JPEG: let the decoder downscale while decoding
+        img.draft('RGB', (INPUT_SIZE, INPUT_SIZE))
+        
+        # Convert to RGB
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        img = img.resize((INPUT_SIZE, INPUT_SIZE))
+        return np.asarray(img, dtype=np.float32)
     
-    def classify_food(self, image_bytes: bytes) -> Dict[str, Any]:
+    def classify_food(self, image_bytes: bytes, image: Optional[Image.Image] = None) -> Dict[str, Any]:
         """
         Classify food using deep learning model.
         
         Args:
             image_bytes: Raw image bytes
+            image: Already decoded image (optional)
             
         Returns:
             Classification result with nutritional analysis
         """
         try:
             # Load and preprocess image
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize to model input size (224x224 for EfficientNetB0)
-            img = img.resize((224, 224))
-            
-            # Convert to array
-            img_array = self.image_module.img_to_array(img)
+            if image is not None:
+                img_array = np.asarray(image.convert('RGB').resize((INPUT_SIZE, INPUT_SIZE)), dtype=np.float32)
+            else:
+                img_array = self._load_image_array(image_bytes)
             
             logger.info("Running ML inference...")
-            predictions = self._predict_with_model(img_array)
-            
-            # Map predictions to our food database
-            matched_foods = []
-            for class_idx, class_name, confidence in predictions:
-                class_name_lower = class_name.lower()
-                
-                # Check if this ImageNet class maps to our nutrition DB
-                if class_name_lower in self.imagenet_to_nutrition:
-                    food_key = self.imagenet_to_nutrition[class_name_lower]
-                    food_data = self.food_database[food_key]
-                    
-                    matched_foods.append({
-                        'food_key': food_key,
-                        'food_data': food_data,
-                        'confidence': confidence
-                    })
-            
-            if not matched_foods:
-                # Fallback: use top prediction even if not in our DB
-                logger.warning("No exact match found, using top prediction")
-                top_class = predictions[0][1]
-                # Create a generic entry
-                matched_foods.append({
-                    'food_key': top_class.lower(),
-                    'food_data': {
-                        'display_name': top_class.title(),
-                        'category': 'unknown',
-                        'calories': 0, 'protein': 0, 'carbohydrates': 0,
-                        'fat': 0, 'fiber': 0,
-                        'key_nutrients': [],
-                        'portion_size': 100,
-                        'portion_description': 'serving'
-                    },
-                    'confidence': predictions[0][2]
-                })
+            probabilities = self._predict_with_model(img_array)
             
-            # Build response using top match
-            return self._build_response(matched_foods)
+            # Map predictions to our food database and build response using top match
+            return self._build_response(self._match_foods(probabilities))
             
         except Exception as e:
             logger.error(f"Classification error: {e}")
             import traceback
             traceback.print_exc()
-            return {
-                'success': False,
-                'error': str(e),
-                'ingredients': [],
-                'confidence': 0.0
-            }
+            return self._error_response(e)
+    
+    def classify_food_batch(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """Classify several images with batched forward passes; one result per image, in order."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images_bytes)
+        arrays, positions = [], []
+        for position, image_bytes in enumerate(images_bytes):
+            try:
+                arrays.append(self._load_image_array(image_bytes))
+                positions.append(position)
+            except Exception as e:
+                logger.error(f"Classification error: {e}")
+                results[position] = self._error_response(e)
+        
+        if arrays:
+            try:
+                for position, probabilities in zip(positions, self._predict_batch(arrays)):
+                    results[position] = self._build_response(self._match_foods(probabilities))
+            except Exception as e:
+                logger.error(f"Batch classification error: {e}")
+                for position in positions:
+                    results[position] = self._error_response(e)
+        return results
+    
+    def _error_response(self, error: Exception) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': str(error),
+            'ingredients': [],
+            'confidence': 0.0
+        }
     
     def _build_response(self, matched_foods: List[Dict]) -> Dict[str, Any]:
         """Build complete response with nutritional analysis."""
@@ -421,9 +409,12 @@ class MLFoodClassifier:
             ]
         }
     
-    def extract_ingredients_from_meal(self, image_bytes: bytes) -> Dict[str, Any]:
+    def extract_ingredients_from_meal(self, image_bytes: bytes, image: Optional[Image.Image] = None) -> Dict[str, Any]:
         """Extract ingredients from meal image (same as classify for single-item)."""
-        return self.classify_food(image_bytes)
+        return self.classify_food(image_bytes, image)
+    
+    def extract_ingredients_from_meals(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        return self.classify_food_batch(images_bytes)
 
 
 # Create global instance
@@ -0,0 +1,216 @@
+"""
+Money Scanner
+One precompiled pattern that finds every amount on a line in a single
+pass and returns its value, currency, span and number format, so the
+item parser, table parser, totals fallback and reconciliation all read
+numbers the same way.
+
+Supported forms:
+  1,234.56  1,234      - US grouping (comma thousands, point decimal)
+  1.234,56  1.234.567  - EU grouping (point thousands, comma decimal)
+  1 234,56             - FR grouping with a non-breaking / thin space
+  123.45  123,45  12   - plain numbers
+with an optional currency symbol or code before or after the number and
+a sign ("-5.00", "5.00-", "(5.00)"). Dates, times and percentages are
+never amounts.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+CURRENCY_SYMBOLS = {
+    '$', '€', '£', '¥', '₹', '₽', '₩', '¢', '₡', '₦', '₨', '₱', '₫', '₪',
+    'kr', 'zł', 'Kč', 'Ft', 'lei', 'lv', 'Lt', '₴', '₸', '₼', '₾', '₺',
+    'USD', 'EUR', 'GBP', 'JPY', 'CNY', 'INR', 'RUB', 'KRW', 'AUD', 'CAD'
+}
+
+_NUMBER = (
+    r'\d{1,3}(?:,\d{3})+(?:\.\d+)?'          # 1,234.56 / 1,234
+    r'|\d{1,3}(?:\.\d{3})+,\d+'              # 1.234,56
+    r'|\d{1,3}(?:\.\d{3}){2,}'               # 1.234.567
+    r'|\d{1,3}(?:[\u00a0\u202f]\d{3})+,\d+'  # 1 234,56
+    r'|\d+(?:[.,]\d+)?'                      # 123 / 123.45 / 123,45
+)
+
+# Not part of a longer number, a date (08/01), a time (12:30) or a rate (7%).
+# The leading (?=\d) rejects every non-digit position before anything else runs.
+NUMBER_PATTERN = re.compile(rf'(?=\d)(?<![\d/:.,])(?:{_NUMBER})(?!\d|[.,]\d|\s?%|[/:]\d)')
+
+_GROUP_SPACES = str.maketrans('', '', '\u00a0\u202f')
+
+
+def _read_number(text: str) -> Tuple[Optional[float], str, int]:
+    """(value, number format, decimal places) of a printed number."""
+    comma, point = text.rfind(','), text.rfind('.')
+    if comma >= 0 and point >= 0:
+        if comma > point:
+            number_format, decimals = 'eu', len(text) - comma - 1
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            number_format, decimals = 'us', len(text) - point - 1
+            text = text.replace(',', '')
+    elif comma >= 0:
+        decimals = len(text) - comma - 1
+        if not text.isascii():
+            number_format = 'space'
+            text = text.translate(_GROUP_SPACES).replace(',', '.')
+        elif decimals == 3 and comma <= 3:
+            # "1,234" / "1,234,567" are thousands, "12,34" a decimal comma
+            number_format, decimals = 'us', 0
+            text = text.replace(',', '')
+        elif text.count(',') == 1:
+            number_format = 'decimal_comma'
+            text = text.replace(',', '.')
+        else:
+            number_format, decimals = 'us', 0
+            text = text.replace(',', '')
+    elif point >= 0:
+        if text.count('.') > 1:
+            number_format, decimals = 'eu', 0
+            text = text.replace('.', '')
+        else:
+            number_format, decimals = 'decimal_point', len(text) - point - 1
+    else:
+        number_format, decimals = 'integer', 0
+    try:
+        return float(text), number_format, decimals
+    except ValueError:
+        return None, number_format, decimals
+
+
+def number_value(text: str) -> Optional[float]:
+    """Value of a printed number: '1,234.56', '1.234,56', '12,34', '1 234,56'."""
+    return _read_number(text)[0]
+
+
+@dataclass
+class MoneyToken:
+    """One amount found on a line. ``value`` is the unsigned magnitude."""
+
+    value: float
+    text: str                      # the number as printed
+    start: int                     # span including currency and sign
+    end: int
+    currency: Optional[str] = None
+    currency_position: Optional[str] = None  # 'before' / 'after'
+    number_format: str = 'integer'  # us / eu / space / decimal_comma / decimal_point / integer
+    decimals: int = 0
+    negative: bool = False
+    standalone: bool = True        # not glued to letters ("0.5kg", "A12")
+
+
+class MoneyScanner:
+    """
+    Finds the numbers with ``NUMBER_PATTERN`` in one pass, then looks at
+    the few characters around each one for a currency and a sign.
+    """
+
+    pattern = NUMBER_PATTERN
+
+    def __init__(self, currency_symbols: Iterable[str] = CURRENCY_SYMBOLS):
+        self.currencies = {symbol.lower(): symbol for symbol in currency_symbols}
+        self.currency_lengths = sorted({len(symbol) for symbol in self.currencies}, reverse=True)
+
+    def scan(self, text: str) -> List[MoneyToken]:
+        tokens = []
+        length = len(text)
+        for match in NUMBER_PATTERN.finditer(text):
+            number = match.group()
+            value, number_format, decimals = _read_number(number)
+            if value is None:
+                continue
+            start, end = match.span()
+
+            # "-$5.00", "$ -5.00", "(€5.00)", "5.00 EUR", "15.00-"
+            negative = False
+            if start and text[start - 1] == '-':
+                start -= 1
+                negative = True
+            currency, position = None, None
+            found = self._currency_before(text, start)
+            if found is not None:
+                (currency, start), position = found, 'before'
+                if start and text[start - 1] == '-':
+                    start -= 1
+                    negative = True
+            else:
+                found = self._currency_after(text, end)
+                if found is not None:
+                    (currency, end), position = found, 'after'
+            if start and text[start - 1] == '(' and end < length and text[end] == ')':
+                start, end, negative = start - 1, end + 1, True
+            elif end < length and text[end] == '-' and (end + 1 == length or not text[end + 1].isdigit()):
+                end, negative = end + 1, True
+
+            tokens.append(MoneyToken(
+                value=value,
+                text=number,
+                start=start,
+                end=end,
+                currency=currency,
+                currency_position=position,
+                number_format=number_format,
+                decimals=decimals,
+                negative=negative,
+                standalone=not ((start and text[start - 1].isalnum()) or (end < length and text[end].isalnum())),
+            ))
+        return tokens
+
+    def _currency_before(self, text: str, index: int) -> Optional[Tuple[str, int]]:
+        """Currency ending at ``index``, spaces allowed in between: (symbol, start)."""
+        while index and text[index - 1] == ' ':
+            index -= 1
+        for size in self.currency_lengths:
+            start = index - size
+            if start < 0:
+                continue
+            symbol = self.currencies.get(text[start:index].lower())
+            # Letter codes must stand alone: "lt" in "salt 2.00" is not a currency
+            if symbol is not None and not (symbol[0].isalpha() and start and text[start - 1].isalpha()):
+                return symbol, start
+        return None
+
+    def _currency_after(self, text: str, index: int) -> Optional[Tuple[str, int]]:
+        """Currency starting at ``index``, spaces allowed in between: (symbol, end)."""
+        length = len(text)
+        while index < length and text[index] == ' ':
+            index += 1
+        for size in self.currency_lengths:
+            end = index + size
+            if end > length:
+                continue
+            symbol = self.currencies.get(text[index:end].lower())
+            if symbol is not None and not (symbol[-1].isalpha() and end < length and text[end].isalpha()):
+                return symbol, end
+        return None
+
+    def parse_number(self, text: str) -> Optional[float]:
+        """The number a short cell holds: the first decimal amount, else the first number."""
+        tokens = self.scan(text)
+        if not tokens:
+            return None
+        for token in tokens:
+            if token.decimals:
+                return token.value
+        return tokens[0].value
+
+    def find_price(self, line: str, min_value: float = 0.01,
+                   max_value: float = 999999) -> Optional[MoneyToken]:
+        """
+        The price on an item line: an amount with a currency before it, else
+        one with a currency after it, else the amount the line ends with.
+        """
+        tokens = [token for token in self.scan(line) if min_value <= token.value <= max_value]
+        for token in tokens:
+            if token.currency_position == 'before':
+                return token
+        for token in tokens:
+            if token.currency_position == 'after':
+                return token
+        if tokens and not line[tokens[-1].end:].strip():
+            return tokens[-1]
+        return None
+
+
+default_scanner = MoneyScanner()
@@ -0,0 +1,138 @@
+"""
+Normalization Cache
+Bounded LRU cache for the receipt parser's pure per-segment decisions
+(cleaned item names, food classification). Receipts from the same chains
+repeat the same item lines, so these decisions are computed once per
+raw segment and reused across receipts.
+
+Entries are tagged with the parser's rule version: when the rules change
+the cache empties itself, and a persisted snapshot written by an older
+rule set is ignored on load.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class NormalizationCache:
+    """Thread-safe LRU cache keyed on (kind, raw segment) with hit-rate stats."""
+
+    def __init__(self, max_size: int = 50000, rules_version: str = "", path: Optional[str] = None):
+        self.max_size = max(0, int(max_size))
+        self.rules_version = rules_version
+        self.path = path
+        self._entries: "OrderedDict[Tuple[str, Hashable], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, kind: str, key: Hashable, compute: Callable[[Any], Any]) -> Any:
+        """Return the cached decision for ``key`` or compute and store it."""
+        if self.max_size == 0:
+            return compute(key)
+
+        cache_key = (kind, key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return self._entries[cache_key]
+            self.misses += 1
+
+        # Compute outside the lock - the rule functions are pure, so a
+        # concurrent duplicate computation is harmless.
+        value = compute(key)
+
+        with self._lock:
+            self._entries[cache_key] = value
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def set_rules_version(self, rules_version: str) -> bool:
+        """Switch to a new rule version, dropping every entry if it changed."""
+        if rules_version == self.rules_version:
+            return False
+        logger.info(f"Parser rules changed ({self.rules_version or 'none'} -> {rules_version}), clearing normalization cache")
+        self.rules_version = rules_version
+        self.clear()
+        return True
+
+    def clear(self):
+        """Drop all entries and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit-rate statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'rules_version': self.rules_version,
+            }
+
+    def save(self, path: Optional[str] = None) -> bool:
+        """Persist entries as JSON so other workers can warm up from them."""
+        path = path or self.path
+        if not path:
+            return False
+
+        with self._lock:
+            entries = [[kind, key, value] for (kind, key), value in self._entries.items()]
+        payload = {'rules_version': self.rules_version, 'entries': entries}
+
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(payload, handle, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            logger.info(f"Saved {len(entries)} normalization cache entries to {path}")
+            return True
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not save normalization cache to {path}: {e}")
+            return False
+
+    def load(self, path: Optional[str] = None) -> int:
+        """Load a persisted snapshot; entries from other rule versions are ignored."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                payload = json.load(handle)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load normalization cache from {path}: {e}")
+            return 0
+
+        if payload.get('rules_version') != self.rules_version:
+            logger.info(f"Ignoring normalization cache at {path}: built for rules {payload.get('rules_version')}")
+            return 0
+
+        loaded = 0
+        with self._lock:
+            for kind, key, value in payload.get('entries', [])[-self.max_size:] if self.max_size else []:
+                self._entries[(kind, key)] = value
+                loaded += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {loaded} normalization cache entries from {path}")
+        return loaded
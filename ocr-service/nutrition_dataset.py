@@ -0,0 +1,327 @@
+"""
+Nutrition Dataset
+One on-disk nutrition table shared by the calorie service and every food
+classifier, instead of a Python literal per module rebuilt on import.
+
+The source of truth is ``nutrition_data/foods.csv`` (one row per food:
+names, portion, text fields, nutrients per 100 g). It is compiled once
+into a compact binary table - a directory of ``.npy`` files - that is
+opened with ``mmap_mode='r'``: every worker process maps the same pages
+instead of holding its own copy, so a table imported from a USDA
+FoodData Central dump (import_usda_nutrition.py, tens of thousands of
+foods) costs no per-worker memory beyond what lookups touch.
+
+Directory layout:
+    meta.json         version, nutrient columns, text fields, row count, source
+    keys.npy          normalized food names (bytes), sorted - lookups are searchsorted
+    values.npy        float32 [foods, nutrients], amount per 100 g
+    portions.npy      float32 [foods, 2], typical portion (g) and density (g/cm3)
+    text.npy          uint8, UTF-8 text fields back to back
+    text_offsets.npy  int64 [foods * fields + 1], offsets into text.npy
+    alias_keys.npy    alternative names (bytes), sorted
+    alias_rows.npy    int32, row of each alias
+
+NUTRITION_DATASET points at a prebuilt directory (e.g. a USDA import);
+otherwise the bundled CSV is compiled into NUTRITION_DATASET_CACHE_DIR
+(keyed by its content hash) on first use.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nutrition_matrix import NutritionMatrix
+
+logger = logging.getLogger(__name__)
+
+DATASET_VERSION = 1
+BUNDLED_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nutrition_data', 'foods.csv')
+TEXT_FIELDS = ('display_name', 'category', 'portion_description', 'key_nutrients')
+# CSV columns that are not nutrients
+RECORD_FIELDS = ('name', 'typical_portion_size', 'density', 'aliases') + TEXT_FIELDS
+
+
+def normalize_key(name: str) -> str:
+    """Lookup key of a food name: lower case, spaces and dashes as underscores."""
+    return re.sub(r'[\s\-]+', '_', str(name).strip().lower())
+
+
+def read_csv(path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Nutrient columns and records of a foods CSV in the bundled format."""
+    with open(path, 'r', encoding='utf-8', newline='') as handle:
+        reader = csv.DictReader(handle)
+        nutrients = [column for column in reader.fieldnames or [] if column not in RECORD_FIELDS]
+        records = []
+        for row in reader:
+            record: Dict[str, Any] = {field: row.get(field, '') for field in TEXT_FIELDS}
+            record['name'] = row['name']
+            record['typical_portion_size'] = float(row.get('typical_portion_size') or 100)
+            record['density'] = float(row.get('density') or 1.0)
+            record['aliases'] = [alias for alias in (row.get('aliases') or '').split(';') if alias]
+            for nutrient in nutrients:
+                record[nutrient] = float(row[nutrient] or 0)
+            records.append(record)
+    return nutrients, records
+
+
+def build_dataset(records: Iterable[Dict[str, Any]], nutrients: Sequence[str], directory: str,
+                  source: str = '', replace: bool = True) -> str:
+    """
+    Write ``records`` (dicts with the CSV fields) as a dataset directory.
+    The first record wins when two names normalize to the same key.
+    With ``replace=False`` a complete dataset already at ``directory`` (one
+    another process published meanwhile, maybe loading it now) is kept and
+    this build discarded.
+    """
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        by_key.setdefault(normalize_key(record['name']), record)
+    keys = sorted(by_key)
+    ordered = [by_key[key] for key in keys]
+
+    values = np.array([[record.get(nutrient, 0.0) or 0.0 for nutrient in nutrients] for record in ordered],
+                      dtype=np.float32).reshape(len(ordered), len(nutrients))
+    portions = np.array([[record.get('typical_portion_size') or 100.0, record.get('density') or 1.0]
+                         for record in ordered], dtype=np.float32).reshape(len(ordered), 2)
+
+    chunks, offsets, position = [], [0], 0
+    for record in ordered:
+        for field in TEXT_FIELDS:
+            value = record.get(field) or ''
+            encoded = (';'.join(value) if isinstance(value, (list, tuple)) else str(value)).encode('utf-8')
+            chunks.append(encoded)
+            position += len(encoded)
+            offsets.append(position)
+
+    aliases: Dict[str, int] = {}
+    for row, record in enumerate(ordered):
+        names = record.get('aliases') or []
+        for alias in (names.split(';') if isinstance(names, str) else names):
+            alias_key = normalize_key(alias)
+            if alias_key and alias_key not in by_key:
+                aliases.setdefault(alias_key, row)
+    alias_keys = sorted(aliases)
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.nutrition-', dir=parent)
+    try:
+        np.save(os.path.join(staging, 'keys.npy'), np.array([key.encode('utf-8') for key in keys], dtype=bytes))
+        np.save(os.path.join(staging, 'values.npy'), values)
+        np.save(os.path.join(staging, 'portions.npy'), portions)
+        np.save(os.path.join(staging, 'text.npy'), np.frombuffer(b''.join(chunks), dtype=np.uint8))
+        np.save(os.path.join(staging, 'text_offsets.npy'), np.array(offsets, dtype=np.int64))
+        np.save(os.path.join(staging, 'alias_keys.npy'),
+                np.array([key.encode('utf-8') for key in alias_keys], dtype=bytes))
+        np.save(os.path.join(staging, 'alias_rows.npy'),
+                np.array([aliases[key] for key in alias_keys], dtype=np.int32))
+        # meta.json last: its presence marks a complete dataset
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as handle:
+            json.dump({'version': DATASET_VERSION, 'nutrients': list(nutrients), 'text_fields': list(TEXT_FIELDS),
+                       'foods': len(keys), 'aliases': len(alias_keys), 'source': source}, handle, indent=2)
+        if replace and os.path.isdir(directory):
+            shutil.rmtree(directory)
+        try:
+            os.replace(staging, directory)
+        except OSError:
+            # Renaming onto a non-empty directory fails: another builder
+            # published first, and readers may be mapping its files now
+            if replace or not os.path.exists(os.path.join(directory, 'meta.json')):
+                raise
+            shutil.rmtree(staging)
+            logger.info(f"🥗 Nutrition dataset {directory} was built by another process; keeping it")
+            return directory
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"🥗 Nutrition dataset written to {directory} ({len(keys)} foods, {len(alias_keys)} aliases)")
+    return directory
+
+
+def _search(sorted_keys, encoded: List[bytes]):
+    """Row of each encoded key in a sorted bytes array; -1 when absent."""
+    if len(sorted_keys) == 0 or not encoded:
+        return np.full(len(encoded), -1, dtype=np.int64)
+    width = sorted_keys.dtype.itemsize
+    # Longer than any stored key: would be truncated into a false match
+    fits = np.fromiter((len(key) <= width for key in encoded), dtype=bool, count=len(encoded))
+    query = np.array(encoded, dtype=sorted_keys.dtype)
+    positions = np.minimum(np.searchsorted(sorted_keys, query), len(sorted_keys) - 1)
+    return np.where(fits & (sorted_keys[positions] == query), positions, -1).astype(np.int64)
+
+
+class NutritionDataset:
+    """Read-only, memory-mapped view of a dataset directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as handle:
+            self.meta = json.load(handle)
+        if self.meta.get('version') != DATASET_VERSION:
+            raise ValueError(f"Nutrition dataset {directory} has version {self.meta.get('version')}, "
+                             f"expected {DATASET_VERSION}")
+        self.nutrients: List[str] = self.meta['nutrients']
+        self.text_fields: List[str] = self.meta.get('text_fields', list(TEXT_FIELDS))
+
+        def load(name):
+            path = os.path.join(directory, name)
+            try:
+                return np.load(path, mmap_mode='r')
+            except (ValueError, OSError):
+                # Empty arrays (e.g. no aliases) cannot be mapped
+                return np.load(path)
+
+        self.keys = load('keys.npy')
+        self.values = load('values.npy')
+        self.portions = load('portions.npy')
+        self.text = load('text.npy')
+        self.text_offsets = load('text_offsets.npy')
+        self.alias_keys = load('alias_keys.npy')
+        self.alias_rows = load('alias_rows.npy')
+        self.columns = {nutrient: column for column, nutrient in enumerate(self.nutrients)}
+        self._matrix: Optional[NutritionMatrix] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, name: str) -> bool:
+        return self.row(name) >= 0
+
+    def names(self):
+        for key in self.keys:
+            yield key.decode('utf-8')
+
+    def rows(self, names: Sequence[str]):
+        """Row per food name (exact name or alias); -1 for unknown foods."""
+        encoded = [normalize_key(name).encode('utf-8') for name in names]
+        rows = _search(self.keys, encoded)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) and len(self.alias_keys):
+            alias_positions = _search(self.alias_keys, [encoded[index] for index in missing])
+            found = alias_positions >= 0
+            rows[missing[found]] = self.alias_rows[alias_positions[found]]
+        return rows
+
+    def row(self, name: str) -> int:
+        return int(self.rows([name])[0])
+
+    def find(self, name: str) -> int:
+        """
+        Row for a free-form label ("Grilled Chicken Breast", "french_fries"):
+        the exact name or alias, else the longest sub-phrase that is a food,
+        also tried without a plural 's' / 'es'. -1 when nothing matches.
+        """
+        words = [word for word in re.split(r'[_,()]+', normalize_key(name)) if word]
+        candidates = []
+        for size in range(len(words), 0, -1):
+            for start in range(len(words) - size + 1):
+                phrase = '_'.join(words[start:start + size])
+                candidates.append(phrase)
+                if phrase.endswith('es'):
+                    candidates.append(phrase[:-2])
+                if phrase.endswith('s'):
+                    candidates.append(phrase[:-1])
+        if not candidates:
+            return -1
+        rows = self.rows(candidates)
+        hits = np.flatnonzero(rows >= 0)
+        return int(rows[hits[0]]) if len(hits) else -1
+
+    def text_field(self, row: int, field: str) -> str:
+        index = row * len(self.text_fields) + self.text_fields.index(field)
+        start, end = int(self.text_offsets[index]), int(self.text_offsets[index + 1])
+        return bytes(self.text[start:end]).decode('utf-8')
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Everything stored for one food."""
+        record: Dict[str, Any] = {'name': self.keys[row].decode('utf-8')}
+        for field in self.text_fields:
+            record[field] = self.text_field(row, field)
+        record['key_nutrients'] = [item for item in record.get('key_nutrients', '').split(';') if item]
+        # float32 on disk; round away the float32 noise (0.3 -> 0.30000001)
+        record['typical_portion_size'] = round(float(self.portions[row, 0]), 6)
+        record['density'] = round(float(self.portions[row, 1]), 6)
+        record['nutrients'] = {
+            nutrient: round(float(value), 6) for nutrient, value in zip(self.nutrients, self.values[row])
+        }
+        return record
+
+    def food_data(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The classifiers' per-100 g food entry (display_name, category, calories,
+        protein, carbohydrates, fat, fiber, key_nutrients, portion_size,
+        portion_description) for a free-form label, or None.
+        """
+        row = self.find(name)
+        if row < 0:
+            return None
+        record = self.record(row)
+        nutrients = record['nutrients']
+        return {
+            'name': record['name'],
+            'display_name': record['display_name'] or record['name'].replace('_', ' ').title(),
+            'category': record['category'] or 'other',
+            'calories': round(nutrients.get('calories', 0.0), 1),
+            'protein': round(nutrients.get('protein', 0.0), 1),
+            'carbohydrates': round(nutrients.get('carbs', 0.0), 1),
+            'fat': round(nutrients.get('fat', 0.0), 1),
+            'fiber': round(nutrients.get('fiber', 0.0), 1),
+            'key_nutrients': record['key_nutrients'],
+            'portion_size': 100,
+            'portion_description': '100 g serving',
+            'typical_portion_size': record['typical_portion_size'],
+            'typical_portion_description': record['portion_description']
+        }
+
+    def matrix(self) -> NutritionMatrix:
+        """The dataset as a NutritionMatrix over the mapped arrays (no copy)."""
+        if self._matrix is None:
+            self._matrix = NutritionMatrix(self.keys, self.nutrients, self.values, self.portions[:, 0],
+                                           lookup=self.rows)
+        return self._matrix
+
+
+def compile_csv(csv_path: str = BUNDLED_CSV, cache_dir: Optional[str] = None) -> str:
+    """Dataset directory for a foods CSV, built on first use and keyed by the CSV's content hash."""
+    cache_dir = os.path.expanduser(cache_dir or os.getenv('NUTRITION_DATASET_CACHE_DIR',
+                                                          '~/.cache/ocr-service/nutrition'))
+    with open(csv_path, 'rb') as handle:
+        digest = hashlib.sha1(handle.read()).hexdigest()[:16]
+    directory = os.path.join(cache_dir, f'nutrition-{digest}')
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return directory
+
+    nutrients, records = read_csv(csv_path)
+    try:
+        # Workers starting together may all build it: the first published copy wins
+        return build_dataset(records, nutrients, directory, source=os.path.basename(csv_path), replace=False)
+    except OSError as e:
+        # Read-only cache location: build a private copy for this process
+        directory = os.path.join(tempfile.mkdtemp(prefix='nutrition-'), f'nutrition-{digest}')
+        logger.warning(f"⚠️ Could not write nutrition dataset cache ({e}); using {directory}")
+        return build_dataset(records, nutrients, directory, source=os.path.basename(csv_path))
+
+
+_default_dataset: Optional[NutritionDataset] = None
+_default_lock = threading.Lock()
+
+
+def get_dataset() -> NutritionDataset:
+    """The process-wide dataset: NUTRITION_DATASET if set, else the compiled bundled CSV."""
+    global _default_dataset
+    if _default_dataset is None:
+        with _default_lock:
+            if _default_dataset is None:
+                directory = os.getenv('NUTRITION_DATASET') or compile_csv()
+                _default_dataset = NutritionDataset(directory)
+                logger.info(f"🥗 Nutrition dataset: {len(_default_dataset)} foods from {directory}")
+    return _default_dataset
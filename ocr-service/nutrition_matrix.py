@@ -0,0 +1,111 @@
+"""
+Nutrition Matrix
+Columnar view of the nutrition database: one row per food, one column per
+nutrient (amount per 100 g), plus a food name -> row index. A meal is a
+vector of grams per food, so its nutrients are one weights x matrix
+product instead of per-field Python arithmetic; many meals (a day, a
+week, a nightly summary job) are one gather of their item rows followed
+by a per-group sum.
+
+Columns are the ``*_per_100g`` fields of NutritionalInfo with the suffix
+dropped (calories, protein, carbs, ..., selenium).
+"""
+
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from startup_profile import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+PER_100G = '_per_100g'
+
+
+def nutrient_columns(record_type) -> List[str]:
+    """Nutrient column names of a NutritionalInfo-like dataclass, in field order."""
+    return [f.name[:-len(PER_100G)] for f in fields(record_type) if f.name.endswith(PER_100G)]
+
+
+@dataclass
+class NutritionMatrix:
+    names: Sequence[str]
+    nutrients: List[str]
+    values: Any                    # [foods, nutrients], amount per 100 g
+    portion_sizes: Any             # [foods], typical portion in grams
+    # names -> rows (-1 unknown); without one, rows come from a dict over ``names``
+    lookup: Optional[Callable[[Sequence[str]], Any]] = field(default=None, repr=False)
+    index: Dict[str, int] = field(init=False, repr=False)
+    columns: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.index = {} if self.lookup is not None else {name: row for row, name in enumerate(self.names)}
+        self.columns = {nutrient: column for column, nutrient in enumerate(self.nutrients)}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any]) -> 'NutritionMatrix':
+        """Build from NutritionalInfo instances (row order follows ``records``)."""
+        records = list(records)
+        if not records:
+            return cls([], [], np.zeros((0, 0)), np.zeros(0))
+        nutrients = nutrient_columns(type(records[0]))
+        values = np.array(
+            [[getattr(record, nutrient + PER_100G) for nutrient in nutrients] for record in records],
+            dtype=np.float64,
+        )
+        portions = np.array([record.typical_portion_size for record in records], dtype=np.float64)
+        return cls([record.name for record in records], nutrients, values, portions)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return self.row(name) >= 0
+
+    def rows(self, names: Sequence[str]):
+        """Row index per name; -1 for foods that are not in the matrix."""
+        if self.lookup is not None:
+            return self.lookup(names)
+        return np.fromiter((self.index.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+
+    def row(self, name: str) -> int:
+        return int(self.rows([name])[0])
+
+    def amounts(self, name: str, grams: float):
+        """Every nutrient of ``grams`` of one food, as a [nutrients] vector."""
+        row = self.row(name)
+        if row < 0:
+            raise KeyError(name)
+        return self.values[row] * (grams / 100.0)
+
+    def item_amounts(self, rows, grams):
+        """Nutrients per item ([items, nutrients]) for known ``rows`` and their grams."""
+        return self.values[rows] * (np.asarray(grams, dtype=np.float64) / 100.0)[:, None]
+
+    def totals(self, rows, grams):
+        """
+        Nutrient totals of one meal: grams-per-food weights vector x matrix,
+        restricted to the meal's rows (a large table is never touched whole).
+        """
+        return (np.asarray(grams, dtype=np.float64) / 100.0) @ self.values[rows]
+
+    def group_totals(self, groups, rows, grams, group_count: Optional[int] = None):
+        """
+        Nutrient totals per group ([groups, nutrients]) for items tagged with a
+        group id (meal, day, week, user-day ...). Items with row -1 are skipped.
+        """
+        groups, rows = np.asarray(groups, dtype=np.int64), np.asarray(rows, dtype=np.int64)
+        grams = np.asarray(grams, dtype=np.float64)
+        if group_count is None:
+            group_count = int(groups.max()) + 1 if len(groups) else 0
+        known = rows >= 0
+        groups, per_item = groups[known], self.item_amounts(rows[known], grams[known])
+        totals = np.empty((group_count, len(self.nutrients)))
+        for column in range(len(self.nutrients)):
+            totals[:, column] = np.bincount(groups, weights=per_item[:, column], minlength=group_count)
+        return totals
+
+    def as_dict(self, vector, decimals: int = 1) -> Dict[str, float]:
+        return {nutrient: round(float(value), decimals) for nutrient, value in zip(self.nutrients, vector)}
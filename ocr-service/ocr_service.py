@@ -1,12 +1,15 @@
 import os
-import re
 import logging
 import time
-import requests
 from typing import Dict, Any, Optional, List
-from PIL import Image, ImageEnhance, ImageFilter
 import io
 import base64
+from intelligent_receipt_parser import get_receipt_parser
+from startup_profile import lazy_import
+
+# Heavy imports deferred to the first request (see startup_profile.py)
+Image = lazy_import('PIL.Image')
+requests = lazy_import('requests')
 
 # Configure logging for debugging
 logging.basicConfig(level=logging.INFO)
@@ -122,49 +125,17 @@ class OCRSpaceService:
         if not text:
             return {"items": [], "totalAmount": None, "purchaseDate": None}
         
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        items = []
-        total_amount = None
-        purchase_date = None
-        
-        # Simple item detection patterns
-        item_patterns = [
-            r'([A-Za-z\s]+)\s+\$?(\d+\.\d{2})',  # Item Name $price
-            r'([A-Za-z\s]+)\s+(\d+\.\d{2})\s*$',  # Item Name price
-        ]
-        
-        # Look for items
-        for line in lines:
-            for pattern in item_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    item_name = match.group(1).strip()
-                    price = float(match.group(2))
-                    
-                    # Skip if it looks like a total
-                    if 'total' not in item_name.lower() and price < 1000:
-                        items.append({
-                            "name": item_name,
-                            "price": price,
-                            "quantity": 1
-                        })
+        # Shared parse pipeline - the same extractors EnhancedOCRService uses
+        context = get_receipt_parser().parse_context(text)
         
-        # Look for total amount
-        total_patterns = [
-            r'total[\s:]*\$?(\d+\.\d{2})',
-            r'amount[\s:]*\$?(\d+\.\d{2})',
-            r'balance[\s:]*\$?(\d+\.\d{2})',
+        items = [
+            {"name": item.get('name', ''), "price": item.get('price', 0.0), "quantity": item.get('quantity', 1)}
+            for item in context.get('items', [])
         ]
+        total_amount = context.get('total')
+        purchase_date = context.get('date')
         
-        for line in lines:
-            for pattern in total_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    total_amount = float(match.group(1))
-                    break
-        
-        # If no total found, use highest item price
+        # If no total found, use the sum of item prices
         if not total_amount and items:
             total_amount = sum(item["price"] for item in items)
         
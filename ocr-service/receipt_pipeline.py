@@ -0,0 +1,290 @@
+"""
+Receipt Parse Pipeline
+One pass over a receipt with pluggable field extractors. Every extractor
+declares the fields it provides; the pipeline runs them in order and
+skips an extractor once all of its fields are known, so each field is
+computed exactly once per receipt no matter how many services ask for it.
+
+Each extractor is timed separately (calls, skips, total time) so the
+cost of every field shows up in benchmarks.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptContext:
+    """Shared per-receipt state: the text split once, plus the fields found so far."""
+
+    def __init__(self, text: str, locale: Optional[str] = None, receipt_lines: Optional[List[Any]] = None):
+        self.text = text or ''
+        self.locale = locale
+        self.raw_lines = self.text.split('\n')
+        self.lines = [line.strip() for line in self.raw_lines if line.strip()]
+        # Classified ReceiptLines carried over from a parse session; they line
+        # up with ``lines`` and keep per-line work (prices, names, summary
+        # amounts) from being redone for unchanged lines
+        self.receipt_lines = receipt_lines
+        self.fields: Dict[str, Any] = {}
+        self.sources: Dict[str, str] = {}
+
+    def has(self, field: str) -> bool:
+        return self.fields.get(field) is not None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        value = self.fields.get(field)
+        return default if value is None else value
+
+
+class FieldExtractor:
+    """Base class: ``extract`` returns a dict of field values (None = not found)."""
+
+    name = 'extractor'
+    provides: Tuple[str, ...] = ()
+
+    def extract(self, context: ReceiptContext) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class ReceiptPipeline:
+    """Runs extractors in order, filling each field from the first extractor that finds it."""
+
+    def __init__(self, extractors: Iterable[FieldExtractor]):
+        self.extractors: List[FieldExtractor] = list(extractors)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {
+            extractor.name: {'calls': 0, 'skipped': 0, 'errors': 0, 'total_ms': 0.0}
+            for extractor in self.extractors
+        }
+
+    def run(self, text: str, context: Optional[ReceiptContext] = None) -> ReceiptContext:
+        context = context or ReceiptContext(text)
+        for extractor in self.extractors:
+            if extractor.provides and all(context.has(field) for field in extractor.provides):
+                with self._lock:
+                    self._stats[extractor.name]['skipped'] += 1
+                continue
+
+            failed = False
+            start = time.perf_counter()
+            try:
+                values = extractor.extract(context) or {}
+            except Exception as e:
+                logger.warning(f"⚠️ Extractor {extractor.name} failed: {e}")
+                values = {}
+                failed = True
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            with self._lock:
+                stats = self._stats[extractor.name]
+                stats['calls'] += 1
+                stats['errors'] += failed
+                stats['total_ms'] += elapsed_ms
+
+            for field, value in values.items():
+                if value is not None and not context.has(field):
+                    context.fields[field] = value
+                    context.sources[field] = extractor.name
+        return context
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-extractor calls, skips, errors and mean time."""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                calls = stats['calls']
+                report[name] = {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 3),
+                    'mean_ms': round(stats['total_ms'] / calls, 4) if calls else 0.0,
+                }
+            return report
+
+    def reset_stats(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats.update(calls=0, skipped=0, errors=0, total_ms=0.0)
+
+
+# ---------------------------------------------------------------------- parser extractors
+
+class MerchantExtractor(FieldExtractor):
+    name = 'merchant'
+    provides = ('merchant_name',)
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract(self, context):
+        return {'merchant_name': self.parser._extract_merchant_name(context.raw_lines)}
+
+
+class TemplateItemsExtractor(FieldExtractor):
+    """Fast path: items from a learned merchant layout template."""
+
+    name = 'template_items'
+    provides = ('items',)
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract(self, context):
+        store = self.parser.template_store
+        if store is None:
+            return {}
+        return store.try_parse(self.parser, context.text, context.raw_lines, context.get('merchant_name')) or {}
+
+
+class ItemsExtractor(FieldExtractor):
+    name = 'items'
+    provides = ('items',)
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract(self, context):
+        return {'items': self.parser.parse_receipt_items(context.text, lines=context.receipt_lines)}
+
+
+class DateExtractor(FieldExtractor):
+    name = 'date'
+    provides = ('date',)
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract(self, context):
+        match = self.parser.extract_date(context.text, locale=context.locale,
+                                         merchant=context.get('merchant_name'))
+        if match is None:
+            return {}
+        return {'date': match.date, 'date_confidence': match.confidence}
+
+
+class TotalsExtractor(FieldExtractor):
+    name = 'totals'
+    provides = ('total', 'subtotal', 'tax')
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract(self, context):
+        # The parser reports "not found" as 0.0; leave those fields open for fallbacks
+        if context.receipt_lines is not None:
+            totals = self.parser._combine_line_totals(line.totals for line in context.receipt_lines)
+        else:
+            totals = self.parser._extract_totals(context.raw_lines)
+        return {field: value or None for field, value in totals.items()}
+
+
+class ReconciliationExtractor(FieldExtractor):
+    """
+    Checks the arithmetic of everything found so far and applies OCR repairs.
+
+    Runs last. Unlike the other extractors it may correct fields already set,
+    but only when the reconciled receipt adds up.
+    """
+
+    name = 'reconciliation'
+    provides = ('reconciliation',)
+
+    def __init__(self, reconciler):
+        self.reconciler = reconciler
+
+    def extract(self, context):
+        items = context.get('items', [])
+        prior = {field: context.get(field) for field in ('total', 'subtotal', 'tax')}
+        summary = None
+        if context.receipt_lines is not None:
+            summary = [
+                row if row.line_index == index else replace(row, line_index=index)
+                for index, row in enumerate(line.summary for line in context.receipt_lines)
+                if row is not None
+            ]
+        report = self.reconciler.reconcile(context.lines, items, prior, summary=summary)
+
+        if report['consistent']:
+            for field in ('total', 'subtotal', 'tax'):
+                if report.get(field):
+                    context.fields[field] = report[field]
+                    context.sources[field] = self.name
+            for repair in report['repairs']:
+                if repair['field'] == 'item':
+                    item = items[repair['item_index']]
+                    item['price'] = repair['corrected']
+                    if 'amount' in item:
+                        item['amount'] = repair['corrected']
+                    item['ocr_repair'] = {'original': repair['original'], 'reason': repair['reason']}
+        return {'reconciliation': report}
+
+
+def parser_extractors(parser) -> List[FieldExtractor]:
+    """The intelligent parser's own extractors, in dependency order."""
+    return [
+        MerchantExtractor(parser),
+        TemplateItemsExtractor(parser),
+        ItemsExtractor(parser),
+        DateExtractor(parser),
+        TotalsExtractor(parser),
+    ]
+
+
+# ---------------------------------------------------------------------- fallback extractors
+
+STORE_INDICATORS = ('mart', 'store', 'shop', 'grocery', 'market', 'super', 'pharmacy')
+
+_PAYMENT_PATTERNS = (
+    re.compile(r'(cash|credit|debit|visa|mastercard|amex|paypal|check)'),
+    re.compile(r'(paid\s+with\s+.*)'),
+)
+
+
+class StoreNameFallbackExtractor(FieldExtractor):
+    """Store-like line in the first three lines, else the first line."""
+
+    name = 'store_name_fallback'
+    provides = ('merchant_name',)
+
+    def extract(self, context):
+        for line in context.lines[:3]:
+            if 3 < len(line) < 50 and any(indicator in line.lower() for indicator in STORE_INDICATORS):
+                return {'merchant_name': line}
+        return {'merchant_name': context.lines[0] if context.lines else None}
+
+
+class GlobalTotalsExtractor(FieldExtractor):
+    """Multilingual keyword totals; runs only when no total was found."""
+
+    name = 'global_totals'
+    provides = ('total',)
+
+    def __init__(self, extract_global_totals):
+        self.extract_global_totals = extract_global_totals
+
+    def extract(self, context):
+        total, subtotal, tax = self.extract_global_totals(context.lines)
+        return {'total': total, 'subtotal': subtotal, 'tax': tax}
+
+
+class PaymentMethodExtractor(FieldExtractor):
+    """Last payment keyword on the receipt (tender lines come after the totals)."""
+
+    name = 'payment_method'
+    provides = ('payment_method',)
+
+    def extract(self, context):
+        payment_method = None
+        for line in context.lines:
+            line_lower = line.lower()
+            for pattern in _PAYMENT_PATTERNS:
+                match = pattern.search(line_lower)
+                if match:
+                    payment_method = match.group(1)
+                    break
+        return {'payment_method': payment_method}
@@ -0,0 +1,519 @@
+"""
+Receipt Arithmetic Reconciliation
+Checks that a parsed receipt adds up - items -> subtotal -> (+ tax + charges
+- discounts) -> total - and repairs common OCR misreads when exactly one
+small change makes every number agree.
+
+Every summary line (subtotal, total, tax, discount, service charge) gives
+candidate amounts in cents: the value as read plus its OCR-confusion
+variants (8<->3, 0<->6/8, 1<->7, dropped decimal point...). The solver
+looks for the cheapest assignment that satisfies the receipt equations:
+first with the values as read, and only if that fails with at most one
+repaired summary value plus at most one repaired item price. Stated tax
+rates ("TAX 8.25%") must agree with the chosen tax.
+
+Result status:
+  consistent   - the numbers add up as read
+  repaired     - they add up after the listed repairs
+  inconsistent - no cheap assignment explains the numbers (flags say why)
+  unverified   - not enough numbers to check anything
+"""
+
+import itertools
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from money_scanner import default_scanner, number_value
+
+logger = logging.getLogger(__name__)
+
+# Keywords per summary role, checked in this order (first match wins)
+SUBTOTAL_WORDS = re.compile(r'\b(sub\s*-?\s*total|net\s+total|item\s+total|net\s+amount)\b')
+TAX_WORDS = re.compile(r'\b(tax|gst|hst|pst|vat|cgst|sgst|igst|utgst|cess|iva|mwst|tva)\b')
+TAX_ID_WORDS = re.compile(r'\b(gstin|tin|tax\s*id|tax\s+invoice|vat\s*(no|reg|number)|gst\s*(no|reg|number))\b')
+DISCOUNT_WORDS = re.compile(r'\b(discount|disc|coupon|promo|loyalty|rebate|markdown)\b')
+CHARGE_WORDS = re.compile(r'\b(service\s+charge|tip|gratuity|delivery\s+fee|bag\s+fee|round(ing)?\s*(off)?)\b')
+TOTAL_WORDS = re.compile(r'\b(total|amount\s+due|balance\s+due|amount\s+payable|net\s+payable)\b')
+# Cheap pre-filter: item lines never reach the role patterns above
+SUMMARY_HINT = re.compile(
+    r'total|tax|gst|hst|pst|vat|cess|iva|mwst|tva|disc|coupon|promo|loyalty|rebate|markdown'
+    r'|service|tip|gratuity|fee|round|due|payable'
+)
+IGNORE_WORDS = re.compile(r'\b(tender(ed)?|change|cash|card|visa|mastercard|amex|debit|credit|saved|savings'
+                          r'|items?|qty|quantity|count|points)\b')
+
+RATE_PATTERN = re.compile(r'(\d{1,2}(?:[.,]\d{1,3})?)\s*%')
+
+# Digits OCR engines commonly confuse on thermal receipts
+DIGIT_CONFUSIONS = {
+    '0': '86', '1': '7', '2': '7', '3': '8', '4': '9',
+    '5': '6', '6': '508', '7': '12', '8': '360', '9': '4',
+}
+
+
+# Disagreements a single misread summary value can explain
+REPAIRABLE_FLAGS = {'total_does_not_match_subtotal', 'items_do_not_sum_to_total', 'tax_does_not_match_rate'}
+
+
+@dataclass
+class Candidate:
+    """A possible value for one summary field, in cents."""
+
+    field: str
+    cents: int                        # field value (sum over lines for tax/discount/charge)
+    cost: int = 0                     # number of OCR repairs behind this value
+    line_index: Optional[int] = None
+    original: Optional[int] = None    # repaired line as read ...
+    corrected: Optional[int] = None   # ... and as corrected
+    reason: str = ''
+
+
+@dataclass
+class SummaryLine:
+    role: str
+    line_index: int
+    amount_text: Optional[str]
+    cents: Optional[int]
+    rate: Optional[float] = None
+
+
+def amount_to_cents(text: str) -> Optional[int]:
+    """'1,234.56' -> 123456, '12,34' -> 1234; None when unparseable."""
+    value = number_value(text)
+    return None if value is None else int(round(value * 100))
+
+
+def misread_variants(text: str) -> List[Tuple[int, str]]:
+    """Cents values the printed amount may really have been (one OCR error each)."""
+    variants = []
+    for position, char in enumerate(text):
+        for replacement in DIGIT_CONFUSIONS.get(char, ''):
+            if position == 0 and replacement == '0' and len(text) > 1 and text[1].isdigit():
+                continue
+            fixed = text[:position] + replacement + text[position + 1:]
+            cents = amount_to_cents(fixed)
+            if cents is not None:
+                variants.append((cents, f"'{char}' read for '{replacement}'"))
+
+    # "1234" printed as "12.34" with the point lost
+    if text.isdigit() and len(text) >= 3:
+        variants.append((int(text), "decimal point dropped"))
+    return variants
+
+
+def single_misread(read: str, actual: str) -> Optional[str]:
+    """Reason string when ``read`` is ``actual`` with one confusable digit misread."""
+    if len(read) != len(actual):
+        return None
+    differences = [(r, a) for r, a in zip(read, actual) if r != a]
+    if len(differences) == 1 and differences[0][1] in DIGIT_CONFUSIONS.get(differences[0][0], ''):
+        return f"'{differences[0][0]}' read for '{differences[0][1]}'"
+    return None
+
+
+class _ItemRepairs:
+    """Finds the one item price whose misread explains a gap, without enumerating variants."""
+
+    def __init__(self, item_cents: List[int], items: List[Dict[str, Any]]):
+        self.item_cents = item_cents
+        self.items = items
+        self._found: Dict[Tuple[int, int], Optional[Dict[str, Any]]] = {}
+
+    def find(self, gap: int, tolerance: int) -> Optional[Dict[str, Any]]:
+        key = (gap, tolerance)
+        if key not in self._found:
+            self._found[key] = self._search(gap, tolerance)
+        return self._found[key]
+
+    def _search(self, gap: int, tolerance: int) -> Optional[Dict[str, Any]]:
+        for index, (cents, item) in enumerate(zip(self.item_cents, self.items)):
+            read = f"{cents / 100:.2f}"
+            for target in range(cents + gap - tolerance, cents + gap + tolerance + 1):
+                if target <= 0:
+                    continue
+                reason = single_misread(read, f"{target / 100:.2f}")
+                if reason:
+                    return {'index': index, 'original': cents, 'cents': target, 'reason': reason}
+
+            quantity, unit_price = item.get('quantity'), item.get('unit_price')
+            if quantity and unit_price and quantity != 1:
+                extended = int(round(quantity * unit_price * 100))
+                if abs(extended - cents - gap) <= tolerance:
+                    return {'index': index, 'original': cents, 'cents': extended, 'reason': "quantity x unit price"}
+        return None
+
+
+class ReceiptReconciler:
+    """Solves the receipt equations over candidate amounts and proposes repairs."""
+
+    def __init__(self, tolerance_cents: int = 2, change_cost: float = 0.2, unused_cost: float = 5.0):
+        self.tolerance_cents = tolerance_cents
+        self.change_cost = change_cost
+        self.unused_cost = unused_cost
+
+    # ------------------------------------------------------------------ line scanning
+
+    def scan_summary_lines(self, lines: List[str]) -> List[SummaryLine]:
+        """Classify summary lines and pick the amount each one states."""
+        summary = []
+        for index, line in enumerate(lines):
+            row = self.summary_line(line, index)
+            if row is not None:
+                summary.append(row)
+        return summary
+
+    def summary_line(self, line: str, index: int = 0) -> Optional[SummaryLine]:
+        """The summary role and amount of one line, or None for item and other lines."""
+        lower = line.lower()
+        if not SUMMARY_HINT.search(lower):
+            return None
+        role = self._role(lower)
+        if role is None:
+            return None
+
+        # Amounts as printed (1,234.56 / 12,34 / (2.00) / 15.00-), not weights like "0.5kg"
+        amounts = [token for token in default_scanner.scan(line)
+                   if token.standalone and token.decimals <= 2]
+        rate_match = RATE_PATTERN.search(line) if role == 'tax' else None
+        rate = float(rate_match.group(1).replace(',', '.')) if rate_match else None
+        if not amounts and rate is None:
+            return None
+
+        amount_text, cents = None, None
+        if amounts:
+            match = amounts[-1]  # the amount column is rightmost
+            amount_text = match.text
+            cents = amount_to_cents(amount_text)
+            if role == 'tax' and len(amounts) > 1 and rate is None:
+                # "SGST @ 2.5   51.80": a bare number before the amount is the rate
+                rate_value = amount_to_cents(amounts[-2].text)
+                if rate_value is not None and rate_value <= 3000:
+                    rate = rate_value / 100
+        return SummaryLine(role, index, amount_text, cents, rate)
+
+    @staticmethod
+    def _role(lower: str) -> Optional[str]:
+        if SUBTOTAL_WORDS.search(lower):
+            return 'subtotal'
+        if TAX_WORDS.search(lower):
+            return None if TAX_ID_WORDS.search(lower) else 'tax'
+        if DISCOUNT_WORDS.search(lower):
+            return 'discount'
+        if CHARGE_WORDS.search(lower):
+            return 'charge'
+        if TOTAL_WORDS.search(lower) and not IGNORE_WORDS.search(lower):
+            return 'total'
+        return None
+
+    # ------------------------------------------------------------------ candidates
+
+    def _single_options(self, field: str, rows: List[SummaryLine],
+                        with_variants: bool) -> List[Optional[Candidate]]:
+        """Candidates for a field stated once (total, subtotal); None = not stated."""
+        rows = [row for row in rows if row.cents is not None]
+        options: List[Optional[Candidate]] = []
+        seen = set()
+        for row in rows:
+            if row.cents not in seen:
+                seen.add(row.cents)
+                options.append(Candidate(field, row.cents, 0, row.line_index))
+        if with_variants:
+            for row in rows:
+                for cents, reason in misread_variants(row.amount_text):
+                    options.append(Candidate(field, cents, 1, row.line_index, row.cents, cents, reason))
+        options.append(None)
+        return options
+
+    def _sum_options(self, field: str, rows: List[SummaryLine], with_variants: bool) -> List[Candidate]:
+        """Candidates for an additive field (tax lines, discounts, charges)."""
+        rows = [row for row in rows if row.cents is not None]
+        base = sum(row.cents for row in rows)
+        options = [Candidate(field, base)]
+        if with_variants:
+            for row in rows:
+                for cents, reason in misread_variants(row.amount_text):
+                    options.append(Candidate(field, base - row.cents + cents, 1, row.line_index,
+                                             row.cents, cents, reason))
+        return options
+
+    # ------------------------------------------------------------------ solving
+
+    def reconcile(self, lines: List[str], items: List[Dict[str, Any]],
+                  prior: Optional[Dict[str, Optional[float]]] = None,
+                  summary: Optional[List[SummaryLine]] = None) -> Dict[str, Any]:
+        """
+        Find the most consistent subtotal / tax / discount / total for the receipt.
+
+        ``prior`` holds the values the parser already chose; they win ties.
+        ``summary`` skips the line scan when the caller already classified the lines.
+        """
+        if summary is None:
+            summary = self.scan_summary_lines(lines)
+        by_role: Dict[str, List[SummaryLine]] = {}
+        for row in summary:
+            by_role.setdefault(row.role, []).append(row)
+
+        rates = [row.rate for row in by_role.get('tax', []) if row.rate]
+        item_cents = [self._item_cents(item) for item in items]
+        prior_cents = {
+            field: int(round(value * 100))
+            for field, value in (prior or {}).items() if value
+        }
+        items_sum = sum(item_cents) if item_cents else None
+        item_repairs = _ItemRepairs(item_cents, items)
+        flags = self._item_arithmetic_flags(items)
+
+        # Values as read first; OCR-repair variants only when the stated numbers disagree
+        best = self._solve(by_role, items_sum, item_repairs, rates, prior_cents, with_variants=False)
+        if best is not None and not best['consistent'] and set(best['flags']) & REPAIRABLE_FLAGS:
+            best = self._solve(by_role, items_sum, item_repairs, rates, prior_cents, with_variants=True)
+        return self._report(best, flags)
+
+    def _solve(self, by_role, items_sum, item_repairs, rates, prior_cents,
+               with_variants) -> Optional[Dict[str, Any]]:
+        roles = (('total', 'total'), ('subtotal', 'subtotal'), ('tax', 'tax'),
+                 ('discount', 'discount'), ('charges', 'charge'))
+        options = [
+            self._single_options(field, by_role.get(role, []), with_variants) if field in ('total', 'subtotal')
+            else self._sum_options(field, by_role.get(role, []), with_variants)
+            for field, role in roles
+        ]
+        as_read = [[c for c in group if c is None or not c.cost] for group in options]
+        variants = [{c.cents: c for c in reversed(group) if c is not None and c.cost} for group in options]
+        stated = {'total': len(as_read[0]) > 1, 'subtotal': len(as_read[1]) > 1}
+        tolerance = self.tolerance_cents + len(rates)
+
+        best, best_key = None, None
+        for combo in itertools.product(*as_read):
+            discount, tax = combo[3], combo[2]
+            for discount_first in ((True, False) if discount.cents else (True,)):
+                for tax_included in ((False, True) if tax.cents else (False,)):
+                    modes = (discount_first, tax_included)
+                    candidates = [combo]
+                    if with_variants:
+                        candidates += self._targeted_repairs(combo, modes, variants, items_sum, rates, tolerance)
+                    for total, subtotal, tax_c, discount_c, charge in candidates:
+                        solution = self._evaluate(total, subtotal, tax_c, discount_c, charge, discount_first,
+                                                  tax_included, items_sum, item_repairs, rates,
+                                                  prior_cents, stated)
+                        if solution is None:
+                            continue
+                        key = (solution['cost'], -(solution['total'] or 0))
+                        if best_key is None or key < best_key:
+                            best, best_key = solution, key
+        return best
+
+    def _targeted_repairs(self, combo, modes, variants, items_sum, rates, tolerance) -> List[Tuple]:
+        """
+        Combos with one value replaced by the misread variant that closes the gap.
+
+        Rather than trying every variant of every line, solve each receipt
+        equation for the one unknown and look that value up among the variants.
+        """
+        total, subtotal, tax, discount, charge = combo
+        discount_first, tax_included = modes
+        if subtotal is not None:
+            subtotal_cents = subtotal.cents
+        elif items_sum is not None:
+            subtotal_cents = items_sum - (discount.cents if discount_first else 0)
+        else:
+            return []
+
+        wanted: List[Tuple[int, int]] = []  # (combo position, value that would balance)
+        if total is not None:
+            expected = (subtotal_cents - (0 if discount_first else discount.cents)
+                        + (0 if tax_included else tax.cents) + charge.cents)
+            residual = total.cents - expected
+            if abs(residual) > tolerance:
+                wanted.append((0, expected))
+                if subtotal is not None:
+                    wanted.append((1, subtotal.cents + residual))
+                if not tax_included:
+                    wanted.append((2, tax.cents + residual))
+                if discount.cents and not (discount_first and subtotal is not None):
+                    wanted.append((3, discount.cents - residual))
+                wanted.append((4, charge.cents + residual))
+        if rates and tax.cents:
+            base = subtotal_cents - (0 if discount_first else discount.cents)
+            if tax_included:
+                base = base * 100 / (100 + sum(rates))
+            wanted.append((2, sum(round(base * rate / 100) for rate in rates)))
+
+        repaired = []
+        for position, value in wanted:
+            table = variants[position]
+            for cents in range(value - tolerance, value + tolerance + 1):
+                candidate = table.get(cents)
+                if candidate is not None:
+                    repaired.append(combo[:position] + (candidate,) + combo[position + 1:])
+                    break
+        return repaired
+
+    def _evaluate(self, total, subtotal, tax, discount, charge, discount_first, tax_included,
+                  items_sum, item_repairs, rates, prior_cents, stated) -> Optional[Dict[str, Any]]:
+        tolerance = self.tolerance_cents + len(rates)
+        cost = float(sum(c.cost for c in (total, subtotal, tax, discount, charge) if c is not None))
+
+        # Ignoring a stated total/subtotal must cost more than disagreeing with it
+        cost += self.unused_cost * ((total is None and stated['total']) + (subtotal is None and stated['subtotal']))
+        repairs = [c for c in (total, subtotal, tax, discount, charge) if c is not None and c.cost]
+        flags: List[str] = []
+        item_repair = None
+
+        # Subtotal: stated, or the item sum (less pre-subtotal discounts)
+        if subtotal is not None:
+            subtotal_cents = subtotal.cents
+        elif items_sum is not None:
+            subtotal_cents = items_sum - (discount.cents if discount_first else 0)
+        elif total is not None:
+            subtotal_cents = None
+        else:
+            return None
+
+        # Items -> subtotal
+        items_consistent = None
+        if subtotal is not None and items_sum is not None:
+            target = subtotal.cents + (discount.cents if discount_first else 0)
+            gap = target - items_sum
+            if abs(gap) <= tolerance:
+                items_consistent = True
+            elif not repairs:
+                item_repair = item_repairs.find(gap, tolerance)
+                items_consistent = item_repair is not None
+                cost += 1 if item_repair else 1.5
+            else:
+                items_consistent = False
+                cost += 1.5
+            if not items_consistent:
+                flags.append('items_do_not_sum_to_subtotal')
+
+        # Subtotal -> total
+        expected_total = None
+        if subtotal_cents is not None:
+            expected_total = (subtotal_cents
+                              - (0 if discount_first else discount.cents)
+                              + (0 if tax_included else tax.cents)
+                              + charge.cents)
+        totals_consistent = None
+        if total is not None and expected_total is not None:
+            totals_consistent = abs(total.cents - expected_total) <= tolerance
+            if not totals_consistent:
+                cost += 4
+                flags.append('total_does_not_match_subtotal' if subtotal is not None
+                             else 'items_do_not_sum_to_total')
+        total_cents = total.cents if total is not None else expected_total
+        if subtotal_cents is None and total is not None:
+            subtotal_cents = total.cents + (0 if discount_first else discount.cents) \
+                - (0 if tax_included else tax.cents) - charge.cents
+
+        # Stated tax rates must agree with the chosen tax
+        if rates and tax.cents and subtotal_cents:
+            base = subtotal_cents - (0 if discount_first else discount.cents)
+            if tax_included:
+                base = base * 100 / (100 + sum(rates))
+            expected_tax = sum(round(base * rate / 100) for rate in rates)
+            if abs(expected_tax - tax.cents) > tolerance:
+                cost += 1
+                flags.append('tax_does_not_match_rate')
+
+        if tax_included:
+            cost += 0.5
+
+        # Prefer what the parser already chose when everything else is equal
+        for field, cents in (('total', total_cents), ('subtotal', subtotal_cents), ('tax', tax.cents)):
+            if field in prior_cents and cents is not None and abs(prior_cents[field] - cents) > tolerance:
+                cost += self.change_cost
+
+        consistent = totals_consistent is True and 'tax_does_not_match_rate' not in flags
+        if totals_consistent is None and items_consistent and total is None:
+            # Derived total from a subtotal the items confirm
+            consistent = 'tax_does_not_match_rate' not in flags
+        # Items that do not add up to the subtotal are never consistent, repaired or not
+        consistent = consistent and items_consistent is not False
+
+        return {
+            'cost': cost,
+            'consistent': consistent,
+            'items_consistent': items_consistent,
+            'total': total_cents,
+            'subtotal': subtotal_cents,
+            'tax': tax.cents,
+            'discount': discount.cents,
+            'charges': charge.cents,
+            'discount_before_subtotal': discount_first,
+            'tax_included': tax_included,
+            'total_stated': total is not None,
+            'repairs': repairs,
+            'item_repair': item_repair,
+            'flags': flags,
+        }
+
+    @staticmethod
+    def _item_cents(item: Dict[str, Any]) -> int:
+        value = item.get('amount')
+        if value is None:
+            value = item.get('price') or 0.0
+        return int(round(value * 100))
+
+    def _item_arithmetic_flags(self, items: List[Dict[str, Any]]) -> List[str]:
+        flags = []
+        for item in items:
+            quantity, unit_price = item.get('quantity'), item.get('unit_price')
+            if not quantity or not unit_price or quantity == 1:
+                continue
+            expected = int(round(quantity * unit_price * 100))
+            if abs(expected - self._item_cents(item)) > self.tolerance_cents:
+                flags.append(f"qty_x_price_mismatch:{item.get('name', '')}")
+        return flags
+
+    # ------------------------------------------------------------------ report
+
+    @staticmethod
+    def _money(cents: Optional[int]) -> Optional[float]:
+        return None if cents is None else round(cents / 100, 2)
+
+    def _report(self, solution: Optional[Dict[str, Any]], flags: List[str]) -> Dict[str, Any]:
+        if solution is None:
+            return {'status': 'unverified', 'consistent': False, 'repairs': [], 'flags': flags}
+
+        repairs = [
+            {
+                'field': candidate.field,
+                'line_index': candidate.line_index,
+                'original': self._money(candidate.original),
+                'corrected': self._money(candidate.corrected),
+                'reason': candidate.reason,
+            }
+            for candidate in solution['repairs']
+        ]
+        if solution['item_repair']:
+            repair = solution['item_repair']
+            repairs.append({
+                'field': 'item',
+                'item_index': repair['index'],
+                'original': self._money(repair['original']),
+                'corrected': self._money(repair['cents']),
+                'reason': repair['reason'],
+            })
+
+        if not solution['consistent']:
+            status = 'inconsistent' if solution['flags'] else 'unverified'
+        else:
+            status = 'repaired' if repairs else 'consistent'
+
+        return {
+            'status': status,
+            'consistent': solution['consistent'],
+            'items_consistent': solution['items_consistent'],
+            'total': self._money(solution['total']),
+            'subtotal': self._money(solution['subtotal']),
+            'tax': self._money(solution['tax']),
+            'discount': self._money(solution['discount']),
+            'charges': self._money(solution['charges']),
+            'tax_included': solution['tax_included'],
+            'total_stated': solution['total_stated'],
+            'repairs': repairs if solution['consistent'] else [],
+            'flags': flags + solution['flags'],
+        }
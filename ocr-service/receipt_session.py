@@ -0,0 +1,162 @@
+"""
+Receipt Parse Sessions
+Incremental re-parsing for the receipt review screen. A session keeps the
+classified ReceiptLines of the last parse; when the user fixes a line and
+the text comes back, unchanged lines are matched by content and keep
+their cached work (price/quantity extraction, cleaned names, blacklist
+and food checks, summary amounts). Only new or edited lines are parsed
+again, then the cheap receipt-level aggregates - layout, item list,
+totals, date, reconciliation - are rebuilt from the per-line state.
+
+Sessions live in a small in-memory store (LRU + idle timeout); a session
+that has expired is simply recreated by the client from its text.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional
+
+from receipt_pipeline import ReceiptContext, ReceiptPipeline
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptParseSession:
+    """Parse state for one receipt under review."""
+
+    def __init__(self, parser, text: str, pipeline: Optional[ReceiptPipeline] = None,
+                 locale: Optional[str] = None):
+        self.session_id = uuid.uuid4().hex
+        self.parser = parser
+        self.pipeline = pipeline or parser.pipeline
+        self.locale = locale
+        self.lines: List[Any] = []          # ReceiptLines of the current text
+        self.line_numbers: List[int] = []   # their line number in the text
+        self.context: Optional[ReceiptContext] = None
+        self.version = 0
+        self.last_update: Dict[str, Any] = {}
+        self.last_used = time.monotonic()
+        self._rules_version = parser.rules_version
+        self._lock = threading.Lock()
+        self.update(text)
+
+    @property
+    def text(self) -> str:
+        return self.context.text if self.context is not None else ''
+
+    def update(self, text: str) -> ReceiptContext:
+        """Re-parse after the client resubmits the whole text."""
+        with self._lock:
+            return self._reparse(text or '')
+
+    def edit_lines(self, edits: Mapping[int, str]) -> ReceiptContext:
+        """Replace lines by line number (0-based, blank lines count) and re-parse."""
+        with self._lock:
+            raw_lines = self.text.split('\n')
+            for number, line in edits.items():
+                if not 0 <= number < len(raw_lines):
+                    raise IndexError(f"Line {number} is outside the receipt (0-{len(raw_lines) - 1})")
+                raw_lines[number] = line
+            return self._reparse('\n'.join(raw_lines))
+
+    def _reparse(self, text: str) -> ReceiptContext:
+        start = time.perf_counter()
+
+        # Cached line state is only valid for the rules that produced it
+        if self.parser.rules_version != self._rules_version:
+            self.lines, self._rules_version = [], self.parser.rules_version
+
+        # Line-level diff: identical lines keep their ReceiptLine, wherever they moved
+        previous: Dict[str, List[Any]] = {}
+        for line in self.lines:
+            previous.setdefault(line.raw, []).append(line)
+
+        lines, numbers, reused = [], [], 0
+        for number, raw in enumerate(text.split('\n')):
+            raw = raw.rstrip()
+            if not raw.strip():
+                continue
+            candidates = previous.get(raw)
+            if candidates:
+                lines.append(candidates.pop())
+                reused += 1
+            else:
+                lines.append(self.parser._classify_line(raw))
+            numbers.append(number)
+
+        context = ReceiptContext(text, locale=self.locale, receipt_lines=lines)
+        self.pipeline.run(text, context)
+
+        self.lines, self.line_numbers, self.context = lines, numbers, context
+        self.version += 1
+        self.last_used = time.monotonic()
+        self.last_update = {
+            'version': self.version,
+            'lines': len(lines),
+            'reparsed_lines': len(lines) - reused,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+        logger.debug(f"🔁 Session {self.session_id[:8]} v{self.version}: "
+                     f"{self.last_update['reparsed_lines']}/{len(lines)} lines re-parsed "
+                     f"in {self.last_update['elapsed_ms']} ms")
+        return context
+
+    def line_states(self) -> List[Dict[str, Any]]:
+        """Per-line parse state for the review UI (line number, price, name, summary role)."""
+        states = []
+        for number, line in zip(self.line_numbers, self.lines):
+            state = {'line': number, 'text': line.stripped, 'price': None, 'quantity': None,
+                     'name': None, 'summaryRole': None}
+            if line.summary is not None:
+                state['summaryRole'] = line.summary.role
+            elif line.has_flat_price and not line.blacklisted:
+                quantity, price, _ = line.extraction
+                state.update(price=price or None, quantity=quantity, name=line.item_name or None)
+            states.append(state)
+        return states
+
+
+class ReceiptSessionStore:
+    """Thread-safe LRU of review sessions with an idle timeout."""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, ReceiptParseSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, parser, text: str, pipeline: Optional[ReceiptPipeline] = None,
+               locale: Optional[str] = None) -> ReceiptParseSession:
+        session = ReceiptParseSession(parser, text, pipeline=pipeline, locale=locale)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[ReceiptParseSession]:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and oldest.last_used >= cutoff:
+                break
+            del self._sessions[oldest_id]
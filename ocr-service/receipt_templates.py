@@ -0,0 +1,380 @@
+"""
+Merchant Receipt Templates
+Learns the layout of receipts from recurring merchants and parses matching
+receipts in a single fast pass instead of the full heuristic pipeline.
+
+A template is learned from general-parser results: a candidate layout
+(merchant, price column, header lines) gets a compiled line extractor,
+and it only becomes active after it has reproduced the general parser's
+output on several receipts. Receipts that match no active template, or
+that the fast pass cannot handle, fall back to the general parser.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Line ending in a money amount - used for the layout fingerprint
+_MONEY_AT_END = re.compile(r'\d[.,]\d{2}\s*$')
+_DIGITS = re.compile(r'\d+')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# Compiled column extractors, keyed by (has_qty_column, decimal_separator)
+_PRICE_PATTERNS = {
+    '.': r'\d{1,3}(?:,\d{3})+\.\d{2}|\d+\.\d{2}',
+    ',': r'\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d{2}',
+}
+_CURRENCY_PREFIX = r'(?:[$€£¥₹]\s*)?'
+
+
+def _build_item_pattern(has_qty_column: bool, decimal_separator: str) -> str:
+    qty_group = r'(?:(?P<qty>\d+)\s+(?:x\s+)?)?' if has_qty_column else ''
+    return (
+        r'^\s*' + qty_group +
+        r'(?P<name>.*?\S)\s+' + _CURRENCY_PREFIX +
+        r'(?P<price>' + _PRICE_PATTERNS[decimal_separator] + r')\s*$'
+    )
+
+
+def _parse_price(value: str, decimal_separator: str) -> float:
+    if decimal_separator == ',':
+        return float(value.replace('.', '').replace(',', '.'))
+    return float(value.replace(',', ''))
+
+
+def normalize_merchant_key(merchant_name: Optional[str]) -> Optional[str]:
+    """Normalize a merchant name into a lookup key."""
+    if not merchant_name:
+        return None
+    key = _NON_ALNUM.sub(' ', merchant_name.lower()).strip()
+    return key or None
+
+
+@dataclass
+class LayoutFingerprint:
+    """Cheap structural description of a receipt used to match templates."""
+    merchant_key: Optional[str]
+    price_column: Optional[int]
+    header_lines: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_lines(cls, merchant_name: Optional[str], lines: List[str], max_header_lines: int = 6) -> 'LayoutFingerprint':
+        """Build a fingerprint in one pass over the raw lines."""
+        price_columns = Counter()
+        header = []
+        seen_price = False
+        for line in lines:
+            stripped = line.rstrip()
+            if not stripped:
+                continue
+            if _MONEY_AT_END.search(stripped):
+                price_columns[len(stripped)] += 1
+                seen_price = True
+            elif not seen_price and len(header) < max_header_lines:
+                header.append(_DIGITS.sub('#', stripped.strip().lower()))
+
+        price_column = price_columns.most_common(1)[0][0] if price_columns else None
+        return cls(normalize_merchant_key(merchant_name), price_column, tuple(header))
+
+    def header_similarity(self, other: 'LayoutFingerprint') -> float:
+        """Jaccard similarity of the header line sets."""
+        mine, theirs = set(self.header_lines), set(other.header_lines)
+        if not mine and not theirs:
+            return 1.0
+        return len(mine & theirs) / len(mine | theirs)
+
+
+@dataclass
+class ReceiptTemplate:
+    """A learned layout with a compiled column extractor and usage statistics."""
+    template_id: str
+    merchant_key: str
+    price_column: int
+    header_lines: Tuple[str, ...]
+    has_qty_column: bool
+    decimal_separator: str
+    rules_version: str
+    support: int = 0
+    active: bool = False
+    hits: int = 0
+    fallbacks: int = 0
+    shadow_checks: int = 0
+    shadow_agreements: int = 0
+    _item_re: Any = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.header_lines = tuple(self.header_lines)
+        self._item_re = re.compile(_build_item_pattern(self.has_qty_column, self.decimal_separator), re.IGNORECASE)
+
+    @property
+    def fingerprint(self) -> LayoutFingerprint:
+        return LayoutFingerprint(self.merchant_key, self.price_column, self.header_lines)
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """Agreement rate with the general parser on shadow-checked receipts."""
+        if not self.shadow_checks:
+            return None
+        return self.shadow_agreements / self.shadow_checks
+
+    def parse_items(self, parser, lines: List[str], column_tolerance: int = 2) -> List[Dict[str, Any]]:
+        """Single pass over the lines using the compiled extractor."""
+        items = []
+        seen_items = set()
+        cache = parser.normalization_cache
+
+        for line_raw in lines:
+            line = line_raw.strip()
+            if len(line) < 3:
+                continue
+            if abs(len(line_raw.rstrip()) - self.price_column) > column_tolerance:
+                continue
+            match = self._item_re.match(line)
+            if not match:
+                continue
+            if cache.get_or_compute('blacklist', line, parser.is_blacklisted):
+                continue
+            if cache.get_or_compute('unit', line, parser.is_unit_descriptor_only):
+                continue
+
+            price = _parse_price(match.group('price'), self.decimal_separator)
+            if price <= 0:
+                continue
+
+            qty_str = match.group('qty') if self.has_qty_column else None
+            quantity = float(qty_str) if qty_str else 1.0
+
+            item_name = parser.clean_item_name(match.group('name'))
+            if len(item_name) < 3 or not parser.is_likely_food_item(item_name):
+                continue
+
+            item_key = f"{item_name}_{price}"
+            if item_key in seen_items:
+                continue
+            seen_items.add(item_key)
+
+            items.append({
+                'name': item_name,
+                'quantity': quantity,
+                'price': price,
+                'unit_price': parser._compute_unit_price(price, quantity),
+                'original_line': line
+            })
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'template_id': self.template_id,
+            'merchant': self.merchant_key,
+            'active': self.active,
+            'support': self.support,
+            'hits': self.hits,
+            'fallbacks': self.fallbacks,
+            'shadow_checks': self.shadow_checks,
+            'accuracy': self.accuracy,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop('_item_re', None)
+        data['header_lines'] = list(self.header_lines)
+        return data
+
+
+def _item_signature(items: List[Dict[str, Any]]) -> List[Tuple[str, float, float]]:
+    return [(item['name'], round(item['price'] or 0.0, 2), round(item['quantity'] or 0.0, 3)) for item in items]
+
+
+class ReceiptTemplateStore:
+    """
+    Registry of learned merchant templates.
+
+    ``try_parse`` is the fast path; ``observe`` feeds general-parser results
+    back so new layouts are learned. Templates must reproduce the general
+    parser's output on ``min_support`` receipts before they are used, and a
+    ``shadow_rate`` fraction of fast-path parses is re-checked against the
+    general parser to measure per-template accuracy.
+    """
+
+    def __init__(self, min_support: int = 3, shadow_rate: float = 0.05,
+                 column_tolerance: int = 2, min_header_similarity: float = 0.5,
+                 path: Optional[str] = None):
+        self.min_support = max(1, int(min_support))
+        self.shadow_rate = shadow_rate
+        self.column_tolerance = column_tolerance
+        self.min_header_similarity = min_header_similarity
+        self.path = path
+        self.templates: Dict[str, List[ReceiptTemplate]] = {}
+        # Layouts no extractor variant could reproduce - not retried forever
+        self.max_build_attempts = 3
+        self._build_attempts: Counter = Counter()
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ matching
+
+    def match(self, fingerprint: LayoutFingerprint, rules_version: str) -> Optional[ReceiptTemplate]:
+        """Find the active template whose layout matches the fingerprint."""
+        if not fingerprint.merchant_key or fingerprint.price_column is None:
+            return None
+        best, best_score = None, -1.0
+        for template in self.templates.get(fingerprint.merchant_key, []):
+            if not template.active or template.rules_version != rules_version:
+                continue
+            if abs(template.price_column - fingerprint.price_column) > self.column_tolerance:
+                continue
+            score = template.fingerprint.header_similarity(fingerprint)
+            if score >= self.min_header_similarity and score > best_score:
+                best, best_score = template, score
+        return best
+
+    def try_parse(self, parser, ocr_text: str, lines: List[str], merchant_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Parse with a matching template, or return None to use the general parser."""
+        fingerprint = LayoutFingerprint.from_lines(merchant_name, lines)
+        with self._lock:
+            self.lookups += 1
+            template = self.match(fingerprint, parser.rules_version)
+        if template is None:
+            return None
+
+        items = template.parse_items(parser, lines, self.column_tolerance)
+        if not items:
+            template.fallbacks += 1
+            logger.info(f"Template {template.template_id} produced no items, falling back to general parser")
+            return None
+
+        with self._lock:
+            self.hits += 1
+            template.hits += 1
+
+        result = {'items': items, 'template_id': template.template_id}
+
+        if self.shadow_rate and random.random() < self.shadow_rate:
+            general = parser.parse_receipt_items(ocr_text)
+            template.shadow_checks += 1
+            if _item_signature(general) == _item_signature(items):
+                template.shadow_agreements += 1
+            else:
+                logger.info(f"Template {template.template_id} disagreed with general parser")
+
+        logger.info(f"⚡ Parsed with template {template.template_id}: {len(items)} items")
+        return result
+
+    # ------------------------------------------------------------------ learning
+
+    def observe(self, parser, lines: List[str], result: Dict[str, Any]):
+        """Learn from a general-parser result; promotes a template once it is well supported."""
+        items = result.get('items') or []
+        fingerprint = LayoutFingerprint.from_lines(result.get('merchant_name'), lines)
+        if not items or not fingerprint.merchant_key or fingerprint.price_column is None:
+            return
+
+        expected = _item_signature(items)
+        with self._lock:
+            candidates = self.templates.setdefault(fingerprint.merchant_key, [])
+            template = next(
+                (t for t in candidates
+                 if t.rules_version == parser.rules_version
+                 and abs(t.price_column - fingerprint.price_column) <= self.column_tolerance
+                 and t.fingerprint.header_similarity(fingerprint) >= self.min_header_similarity),
+                None
+            )
+
+        if template is None:
+            attempt_key = (fingerprint.merchant_key, fingerprint.price_column, parser.rules_version)
+            if self._build_attempts[attempt_key] >= self.max_build_attempts:
+                return
+            self._build_attempts[attempt_key] += 1
+            template = self._build_candidate(parser, lines, fingerprint, expected)
+            if template is None:
+                return
+            with self._lock:
+                candidates.append(template)
+        elif _item_signature(template.parse_items(parser, lines, self.column_tolerance)) != expected:
+            # Layout matched but the extractor disagrees - do not count as support
+            return
+
+        with self._lock:
+            template.support += 1
+            if not template.active and template.support >= self.min_support:
+                template.active = True
+                logger.info(f"📐 Template {template.template_id} activated for '{template.merchant_key}'")
+
+    def _build_candidate(self, parser, lines, fingerprint, expected) -> Optional[ReceiptTemplate]:
+        """Find an extractor variant that reproduces the general parser's items."""
+        template_id = f"{fingerprint.merchant_key.replace(' ', '-')}-{fingerprint.price_column}-{len(self.templates[fingerprint.merchant_key]) + 1}"
+        for has_qty_column in (False, True):
+            for decimal_separator in ('.', ','):
+                candidate = ReceiptTemplate(
+                    template_id=template_id,
+                    merchant_key=fingerprint.merchant_key,
+                    price_column=fingerprint.price_column,
+                    header_lines=fingerprint.header_lines,
+                    has_qty_column=has_qty_column,
+                    decimal_separator=decimal_separator,
+                    rules_version=parser.rules_version,
+                )
+                if _item_signature(candidate.parse_items(parser, lines, self.column_tolerance)) == expected:
+                    return candidate
+        return None
+
+    # ------------------------------------------------------------------ reporting / persistence
+
+    def stats(self) -> Dict[str, Any]:
+        """Overall hit rate plus per-template statistics."""
+        with self._lock:
+            templates = [t for group in self.templates.values() for t in group]
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'active_templates': sum(1 for t in templates if t.active),
+                'candidate_templates': sum(1 for t in templates if not t.active),
+                'templates': [t.stats() for t in templates],
+            }
+
+    def save(self, path: Optional[str] = None) -> bool:
+        path = path or self.path
+        if not path:
+            return False
+        with self._lock:
+            payload = [t.to_dict() for group in self.templates.values() for t in group]
+        try:
+            with open(path, 'w', encoding='utf-8') as handle:
+                json.dump(payload, handle, ensure_ascii=False, indent=2)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not save receipt templates to {path}: {e}")
+            return False
+
+    def load(self, rules_version: str, path: Optional[str] = None) -> int:
+        """Load templates; those learned under different parser rules are discarded."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                payload = json.load(handle)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load receipt templates from {path}: {e}")
+            return 0
+
+        loaded = 0
+        with self._lock:
+            for data in payload:
+                if data.get('rules_version') != rules_version:
+                    continue
+                template = ReceiptTemplate(**data)
+                self.templates.setdefault(template.merchant_key, []).append(template)
+                loaded += 1
+        logger.info(f"Loaded {loaded} receipt templates from {path}")
+        return loaded
@@ -14,6 +14,8 @@ from datetime import datetime
 from PIL import Image
 from dotenv import load_dotenv
 
+from nutrition_dataset import get_dataset
+
 # Load environment variables
 load_dotenv()
 
@@ -148,21 +150,18 @@ async def analyze_nutrition(food_items: List[str]):
     Returns:
         Nutrition analysis
     """
-    # Mock nutrition data
-    nutrition_db = {
-        "apple": {"calories": 95, "carbs": 25, "protein": 0.5, "fat": 0.3, "fiber": 4},
-        "banana": {"calories": 105, "carbs": 27, "protein": 1.3, "fat": 0.4, "fiber": 3},
-        "chicken": {"calories": 165, "carbs": 0, "protein": 31, "fat": 3.6, "fiber": 0},
-        "rice": {"calories": 130, "carbs": 28, "protein": 2.7, "fat": 0.3, "fiber": 0.4}
-    }
-    
+    # Shared nutrition dataset; each item counts as one typical portion
+    dataset = get_dataset()
+    matrix = dataset.matrix()
     total_nutrition = {"calories": 0, "carbs": 0, "protein": 0, "fat": 0, "fiber": 0}
+    columns = [matrix.columns[key] for key in total_nutrition]
     item_details = []
     
     for item in food_items:
-        item_lower = item.lower()
-        if item_lower in nutrition_db:
-            nutrition = nutrition_db[item_lower]
+        row = dataset.find(item)
+        if row >= 0:
+            amounts = matrix.values[row, columns] * (float(matrix.portion_sizes[row]) / 100)
+            nutrition = {key: round(float(value), 1) for key, value in zip(total_nutrition, amounts)}
             item_details.append({
                 "name": item,
                 "nutrition": nutrition,
@@ -170,7 +169,7 @@ async def analyze_nutrition(food_items: List[str]):
             })
             
             for key in total_nutrition:
-                total_nutrition[key] += nutrition[key]
+                total_nutrition[key] = round(total_nutrition[key] + nutrition[key], 1)
         else:
             item_details.append({
                 "name": item,
@@ -26,10 +26,20 @@ def run_ocr_service():
         "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=os.getenv("OCR_RELOAD", "1") == "1",  # OCR_RELOAD=0 for production / autoscaling
         log_level="info"
     )
 
+def run_food_model_server():
+    """Run the shared food model server (one copy of each model for all food workers)"""
+    print(f"🧠 Starting Food Model Server on {os.getenv('FOOD_MODEL_SERVER')}...")
+    os.chdir(SCRIPT_DIR)
+    from food_model_server import FoodModelServer
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    preload = [name.strip() for name in os.getenv("FOOD_MODEL_SERVER_PRELOAD", "clip").split(",") if name.strip()]
+    FoodModelServer(os.getenv("FOOD_MODEL_SERVER")).serve_forever(preload)
+
 def run_food_service():
     """Run the food classification service on port 8001"""
     print(f"🍎 Starting Food Classification Service on port 8001...")
@@ -39,6 +49,8 @@ def run_food_service():
         host="0.0.0.0",
         port=8001,
         reload=False,  # Disable reload for subprocess
+        # Several workers only make sense with FOOD_MODEL_SERVER (else each loads the models)
+        workers=int(os.getenv("FOOD_SERVICE_WORKERS", "1")),
         log_level="info"
     )
 
@@ -91,6 +103,12 @@ def main():
         processes.append(p1)
         time.sleep(2)  # Give it time to start
         
+        # Start the shared food model server first; the food workers connect to it
+        if os.getenv("FOOD_MODEL_SERVER"):
+            p_models = multiprocessing.Process(target=run_food_model_server, name="Food-Model-Server")
+            p_models.start()
+            processes.append(p_models)
+
         # Start Food Classification service
         p2 = multiprocessing.Process(target=run_food_service, name="Food-Service")
         p2.start()
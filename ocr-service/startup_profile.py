@@ -0,0 +1,158 @@
+"""
+Startup Profile
+Keeps OCR service boot cheap and measurable:
+
+- ``lazy_import`` returns a stand-in for a heavy module (OpenCV, PyMuPDF,
+  Tesseract, the OCR.space HTTP client...) that imports it on first
+  attribute access, so a boot or a ``reload=True`` restart only pays for
+  what a request actually uses.
+- ``mark`` records boot phases; ``startup_report`` lists them together
+  with the lazy modules loaded so far and what each import cost.
+- ``importtime_summary`` runs ``python -X importtime`` on a module in a
+  child process and returns the slowest imports (also available from the
+  command line: ``python startup_profile.py app``).
+"""
+
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_BOOT_STARTED = time.perf_counter()
+_phases: List[tuple] = []
+_lazy_modules: Dict[str, 'LazyModule'] = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Module stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name: str, on_load: Optional[Callable[[Any], None]] = None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._load_ms: Optional[float] = None
+        self._load_lock = threading.Lock()
+
+    # Underscored so they never shadow attributes of the wrapped module (numpy.load)
+    @property
+    def _is_loaded(self) -> bool:
+        return self._module is not None
+
+    def _load(self):
+        if self._module is None:
+            with self._load_lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if self._on_load is not None:
+                        self._on_load(module)
+                    self._load_ms = (time.perf_counter() - start) * 1000
+                    self._module = module
+                    logger.info(f"📦 Loaded {self._name} on first use ({self._load_ms:.0f} ms)")
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._is_loaded else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str, on_load: Optional[Callable[[Any], None]] = None) -> LazyModule:
+    """Shared lazy stand-in for ``name`` (one per module name)."""
+    with _lock:
+        module = _lazy_modules.get(name)
+        if module is None:
+            module = _lazy_modules[name] = LazyModule(name, on_load)
+        return module
+
+
+def preload(names: Optional[List[str]] = None):
+    """Import lazy modules now (all registered ones by default), skipping missing packages."""
+    for name in names or list(_lazy_modules):
+        try:
+            lazy_import(name)._load()
+        except ImportError as e:
+            logger.warning(f"⚠️ Could not preload {name}: {e}")
+
+
+def mark(phase: str):
+    """Record that a boot phase finished now."""
+    with _lock:
+        _phases.append((phase, time.perf_counter()))
+
+
+def startup_report() -> Dict[str, Any]:
+    """Boot phase durations and lazy-module import costs, in milliseconds."""
+    with _lock:
+        phases, previous = {}, _BOOT_STARTED
+        for phase, finished in _phases:
+            phases[phase] = round((finished - previous) * 1000, 1)
+            previous = finished
+        lazy = {
+            name: round(module._load_ms, 1) if module._is_loaded else None
+            for name, module in _lazy_modules.items()
+        }
+    return {
+        'boot_ms': round((previous - _BOOT_STARTED) * 1000, 1),
+        'phases': phases,
+        'lazy_modules': lazy,
+    }
+
+
+def log_startup_report():
+    report = startup_report()
+    phases = ', '.join(f"{phase} {ms:.0f} ms" for phase, ms in report['phases'].items())
+    deferred = [name for name, ms in report['lazy_modules'].items() if ms is None]
+    logger.info(f"🚀 Startup {report['boot_ms']:.0f} ms ({phases})")
+    if deferred:
+        logger.info(f"💤 Deferred until first use: {', '.join(sorted(deferred))}")
+
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def importtime_summary(module: str = 'app', top: int = 15, timeout: float = 120) -> List[Dict[str, Any]]:
+    """Slowest top-level imports of ``module`` according to ``python -X importtime``."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, timeout=timeout,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        # The module and its direct imports; deeper ones are already in their parent's cumulative time
+        if len(indent) <= 3:
+            entries.append({'module': name, 'cumulative_ms': int(cumulative_us) / 1000,
+                            'self_ms': int(self_us) / 1000})
+    entries.sort(key=lambda entry: entry['cumulative_ms'], reverse=True)
+    return entries[:top]
+
+
+def log_importtime_summary(module: str = 'app', top: int = 15):
+    try:
+        entries = importtime_summary(module, top)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"⚠️ Import-time summary failed: {e}")
+        return
+    lines = '\n'.join(f"   {entry['cumulative_ms']:8.1f} ms  {entry['module']}" for entry in entries)
+    logger.info(f"⏱️ Slowest imports of {module} (python -X importtime):\n{lines}")
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else 'app'
+    for entry in importtime_summary(target, top=25):
+        print(f"{entry['cumulative_ms']:9.1f} ms  {entry['self_ms']:8.1f} ms self  {entry['module']}")
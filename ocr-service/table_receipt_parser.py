@@ -0,0 +1,248 @@
+"""
+Column-Aware Table Parser
+Parses tabular receipts and invoices ("Item Name  Qty  Rate  Amount") by
+detecting the header row once and inferring column positions from all
+rows, instead of re-splitting every line on whitespace and guessing
+which number is the quantity and which is the price.
+
+Each row yields explicit qty / rate / amount values, missing cells are
+derived from the other two, and qty x rate = amount is validated.
+"""
+
+import logging
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Header words -> column role
+HEADER_ALIASES = {
+    'item': 'item', 'items': 'item', 'description': 'item', 'particulars': 'item',
+    'product': 'item', 'article': 'item',
+    'qty': 'qty', 'qty.': 'qty', 'quantity': 'qty', 'qnty': 'qty', 'nos': 'qty', 'pcs': 'qty',
+    'rate': 'rate', 'price': 'rate', 'unit': 'rate', 'mrp': 'rate', 'each': 'rate',
+    'amount': 'amount', 'amt': 'amount', 'total': 'amount', 'value': 'amount',
+}
+NUMERIC_ROLES = ('qty', 'rate', 'amount')
+
+# Rows end at the summary block
+TABLE_STOP_WORDS = re.compile(
+    r'\b(total|subtotal|sub total|tax|gst|cgst|sgst|igst|vat|cess|round|discount|service)\b',
+    re.IGNORECASE,
+)
+
+_WORD = re.compile(r'\S+')
+_DIGIT = re.compile(r'\d')
+# Trailing run of numeric cells at the end of a row
+_NUMERIC_CELL = re.compile(r'(?<!\S)[$€£¥₹]?\d[\d,]*(?:\.\d+)?(?!\S)')
+_HAS_ALPHA = re.compile(r'[^\W\d_]')
+
+
+class TableLayout:
+    """Header position and inferred right edges of the numeric columns."""
+
+    def __init__(self, header_index: int, roles: List[str], column_ends: List[float]):
+        self.header_index = header_index
+        self.roles = roles
+        self.column_ends = column_ends
+        # Boundaries between adjacent numeric columns (midpoints of right edges)
+        self.boundaries = [(a + b) / 2 for a, b in zip(column_ends, column_ends[1:])]
+
+    def column_for(self, end_position: int) -> int:
+        """Index of the numeric column a cell ending at ``end_position`` belongs to."""
+        return bisect_left(self.boundaries, end_position)
+
+
+class TableReceiptParser:
+    """Table-mode item extraction for receipts with a column header row."""
+
+    def __init__(self, parser, max_header_search: int = 40, tolerance: float = 0.01):
+        self.parser = parser
+        self.max_header_search = max_header_search
+        self.tolerance = tolerance
+
+    # ------------------------------------------------------------------ detection
+
+    def detect_header(self, lines: List[str]) -> Optional[Tuple[int, List[str], List[int]]]:
+        """Find the header row; returns (line index, numeric roles, header right edges)."""
+        for index, line in enumerate(lines[:self.max_header_search]):
+            if not line.strip() or _DIGIT.search(line):
+                continue
+
+            roles, ends = [], []
+            seen_item = False
+            for match in _WORD.finditer(line):
+                role = HEADER_ALIASES.get(match.group(0).lower().strip(':()$'))
+                if role == 'item' and not roles:
+                    seen_item = True
+                elif role in NUMERIC_ROLES:
+                    if roles and roles[-1] == role:
+                        ends[-1] = match.end()  # "Unit Price" spans two words
+                    elif role not in roles:
+                        roles.append(role)
+                        ends.append(match.end())
+
+            if seen_item and 'amount' in roles and len(roles) >= 2:
+                return index, roles, ends
+        return None
+
+    def infer_layout(self, lines: List[str]) -> Optional[TableLayout]:
+        """Detect the header and refine column positions from every body row."""
+        header = self.detect_header(lines)
+        if header is None:
+            return None
+        header_index, roles, ends = header
+
+        # Collect the right edge of every trailing numeric cell in the body
+        cell_ends: List[List[int]] = [[] for _ in roles]
+        layout = TableLayout(header_index, roles, [float(e) for e in ends])
+        for row in self._body_rows(lines, header_index):
+            for match in self._trailing_cells(row):
+                cell_ends[layout.column_for(match.end())].append(match.end())
+
+        # Snap each column to the median right edge of its cells
+        column_ends = []
+        for header_end, positions in zip(ends, cell_ends):
+            if positions:
+                positions.sort()
+                column_ends.append(float(positions[len(positions) // 2]))
+            else:
+                column_ends.append(float(header_end))
+        return TableLayout(header_index, roles, column_ends)
+
+    def _body_rows(self, lines: List[str], header_index: int):
+        misses = 0
+        for line in lines[header_index + 1:]:
+            if not line.strip():
+                misses += 1
+                if misses >= 2:
+                    return
+                continue
+            if TABLE_STOP_WORDS.search(line):
+                return
+            misses = 0
+            yield line
+
+    def _trailing_cells(self, row: str) -> List[Any]:
+        """Numeric cells after the last word containing letters."""
+        cells = list(_NUMERIC_CELL.finditer(row))
+        last_alpha = 0
+        for match in _WORD.finditer(row):
+            if _HAS_ALPHA.search(match.group(0)):
+                last_alpha = match.end()
+        return [cell for cell in cells if cell.start() >= last_alpha]
+
+    # ------------------------------------------------------------------ extraction
+
+    def parse_lines(self, lines: List[str]) -> List[Dict[str, Any]]:
+        """Extract table rows as items with explicit qty, rate and amount."""
+        layout = self.infer_layout(lines)
+        if layout is None:
+            return []
+
+        items = []
+        for row in self._body_rows(lines, layout.header_index):
+            item = self._parse_row(row, layout)
+            if item is not None:
+                items.append(item)
+
+        logger.info(f"📊 Table mode: {len(items)} rows, columns={layout.roles}")
+        return items
+
+    def _parse_row(self, row: str, layout: TableLayout) -> Optional[Dict[str, Any]]:
+        cells = self._trailing_cells(row)
+        if not cells:
+            return None
+
+        values: Dict[str, float] = {}
+        for cell in cells:
+            column = min(layout.column_for(cell.end()), len(layout.roles) - 1)
+            number = self.parser._extract_global_number(cell.group(0))
+            if number is not None:
+                values[layout.roles[column]] = number
+
+        name = self.parser.clean_item_name(row[:cells[0].start()])
+        if len(name) < 3 or self.parser.is_blacklisted_cached(name):
+            return None
+
+        quantity, rate, amount = values.get('qty'), values.get('rate'), values.get('amount')
+
+        # Derive the missing cell from the other two
+        if amount is None and rate is not None:
+            amount = (quantity or 1.0) * rate
+        if quantity is None:
+            quantity = 1.0
+            if rate and amount:
+                ratio = amount / rate
+                if abs(ratio - round(ratio)) <= self.tolerance and round(ratio) >= 1:
+                    quantity = float(round(ratio))
+        if rate is None and amount is not None:
+            rate = amount / quantity if quantity else amount
+        if not amount or amount <= 0:
+            return None
+
+        valid = abs(quantity * rate - amount) <= max(self.tolerance, amount * 0.005)
+        if not valid:
+            logger.debug(f"  ⚠️ Row arithmetic mismatch: {quantity} x {rate} != {amount} in '{row.strip()}'")
+
+        return {
+            'name': name,
+            'quantity': quantity,
+            'price': amount,
+            'unit_price': rate,
+            'rate': rate,
+            'amount': amount,
+            'arithmetic_valid': valid,
+            'original_line': row.strip(),
+        }
+
+    # ------------------------------------------------------------------ word boxes
+
+    @staticmethod
+    def lines_from_word_boxes(ocr_data: Dict[str, List[Any]]) -> List[str]:
+        """
+        Rebuild column-preserving text lines from pytesseract.image_to_data output.
+
+        Words are placed at character columns derived from their pixel
+        position, so column inference works on real geometry rather than
+        on OCR whitespace.
+        """
+        words = []
+        char_widths = []
+        for i, text in enumerate(ocr_data.get('text', [])):
+            text = (text or '').strip()
+            if not text:
+                continue
+            key = (ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+            left, width, top = ocr_data['left'][i], ocr_data['width'][i], ocr_data['top'][i]
+            words.append((key, top, left, text))
+            char_widths.append(width / len(text))
+        if not words:
+            return []
+
+        char_widths.sort()
+        char_width = max(char_widths[len(char_widths) // 2], 1.0)
+
+        grouped: Dict[Tuple[int, int, int], List[Tuple[int, int, str]]] = {}
+        for key, top, left, text in words:
+            grouped.setdefault(key, []).append((top, left, text))
+
+        lines = []
+        for key in sorted(grouped, key=lambda k: min(w[0] for w in grouped[k])):
+            line = ''
+            for _, left, text in sorted(grouped[key], key=lambda w: w[1]):
+                column = int(round(left / char_width))
+                line += ' ' * max(column - len(line), 1 if line else 0) + text
+            lines.append(line)
+        return lines
+
+    def table_text_from_word_boxes(self, ocr_data: Dict[str, List[Any]]) -> Optional[str]:
+        """
+        Column-preserving text of Tesseract word boxes when they hold a table
+        (a header row is found), else None - plain OCR text is then as good.
+        """
+        lines = self.lines_from_word_boxes(ocr_data)
+        if self.detect_header(lines) is None:
+            return None
+        return '\n'.join(lines)
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+pytest.importorskip("numpy")
+
+from clip_embedding_cache import CachedTextEmbeddings, ClipEmbeddingCache, embedding_cache_key
+
+TEMPLATES = ("a photo of {}", "a plate of {}")
+PROFILES = {"apple": {"category": "fruits", "synonyms": ["apple"]}}
+
+
+def test_key_changes_with_model_templates_and_profiles():
+    key = embedding_cache_key("clip-a", TEMPLATES, PROFILES)
+    assert key == embedding_cache_key("clip-a", list(TEMPLATES), dict(PROFILES))
+    assert key != embedding_cache_key("clip-b", TEMPLATES, PROFILES)
+    assert key != embedding_cache_key("clip-a", TEMPLATES[:1], PROFILES)
+    changed = {"apple": {"category": "fruits", "synonyms": ["apple", "gala apple"]}}
+    assert key != embedding_cache_key("clip-a", TEMPLATES, changed)
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    assert ClipEmbeddingCache(str(tmp_path)).load("0123456789abcdef") is None
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    np = pytest.importorskip("numpy")
+    cache = ClipEmbeddingCache(str(tmp_path))
+    key = embedding_cache_key("clip-a", TEMPLATES, PROFILES)
+    vectors = np.eye(2, 4, dtype=np.float32)
+    entry = CachedTextEmbeddings(
+        key=key,
+        embeddings=vectors,
+        prompts=["a photo of apple", "a plate of apple"],
+        prompt_metadata=[{"canonical_name": "apple", "synonym": "apple", "template": t} for t in TEMPLATES],
+        canonical_to_indices={"apple": [0, 1]},
+    )
+    assert cache.save(entry, "clip-a")
+
+    loaded = cache.load(key)
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert np.array_equal(loaded.embeddings, vectors)
+    assert loaded.canonical_to_indices == {"apple": [0, 1]}
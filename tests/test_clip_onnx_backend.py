@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from clip_onnx_backend import onnx_model_path
+
+
+def test_model_paths_are_per_model_and_precision(tmp_path):
+    fp32 = onnx_model_path(str(tmp_path), "openai/clip-vit-base-patch32")
+    int8 = onnx_model_path(str(tmp_path), "openai/clip-vit-base-patch32", quantize=True)
+
+    assert Path(fp32).name == "clip-vision-openai-clip-vit-base-patch32.onnx"
+    assert Path(int8).name == "clip-vision-openai-clip-vit-base-patch32-int8.onnx"
+    assert onnx_model_path(str(tmp_path), "openai/clip-vit-large-patch14") != fp32
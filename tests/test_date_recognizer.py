@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+from date_recognizer import DateRecognizer, locale_date_order
+
+
+def test_labelled_date_beats_other_dates():
+    text = "CITY MART\nPrinted 01/02/2024\nInvoice Date: 2024-03-15\nMilk   3.49\nReturn by 04/15/2024"
+
+    match = DateRecognizer().recognize(text)
+
+    assert match.date == "2024-03-15"
+    assert not match.ambiguous
+    assert match.confidence > 0.8
+
+
+def test_locale_hint_resolves_ambiguous_day_month():
+    recognizer = DateRecognizer()
+    text = "Date: 03/04/2024"
+
+    assert recognizer.recognize(text).date == "2024-03-04"
+    assert recognizer.recognize(text, locale="en_GB").date == "2024-04-03"
+    assert recognizer.recognize(text, locale="en_GB").confidence < recognizer.recognize("Date: 13/04/2024").confidence
+    assert locale_date_order("en-US") == "mdy"
+    assert locale_date_order("en") is None
+
+
+def test_merchant_order_is_learned_from_unambiguous_dates():
+    recognizer = DateRecognizer()
+
+    assert recognizer.recognize("Date: 25/12/2023", merchant="Chai Point").date == "2023-12-25"
+    assert recognizer.recognize("Date: 05/01/2024", merchant="Chai Point").date == "2024-01-05"
+    assert recognizer.recognize("Date: 05/01/2024", merchant="Other Shop").date == "2024-05-01"
+
+
+def test_explicit_locale_wins_over_the_merchant_order():
+    recognizer = DateRecognizer()
+    recognizer.learn_order("Chai Point", "dmy")
+
+    assert recognizer.recognize("Date: 05/01/2024", merchant="Chai Point").date == "2024-01-05"
+    assert recognizer.recognize("Date: 05/01/2024", merchant="Chai Point", locale="en_US").date == "2024-05-01"
@@ -0,0 +1,152 @@
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("cv2")
+Image = pytest.importorskip("PIL.Image")
+
+# The module builds a global service on import; keep that one offline and cache-free
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("FOOD_CLIP_EMBEDDING_CACHE_DIR", "")
+os.environ.setdefault("FOOD_CLIP_BATCHING", "0")
+
+import food_classification_service as fcs
+
+
+def prediction(name, score=0.3, probability=0.9):
+    return {"canonical_name": name, "score": score, "probability": probability,
+            "matched_synonym": name, "prompt": f"a plate of {name}", "best_prompt_index": 0}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """A service without a CLIP model; tests stub the prediction methods."""
+    monkeypatch.setattr(fcs.FoodClassificationService, "_load_model", lambda self: None)
+    monkeypatch.setenv("FOOD_RESULT_CACHE_SIZE", "0")
+    monkeypatch.setenv("FOOD_CLIP_BATCHING", "0")
+    service = fcs.FoodClassificationService()
+    monkeypatch.setattr(service, "_model_ready", lambda: True)
+    return service
+
+
+def jpeg(size=(96, 96), color=(250, 220, 60)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_predecoded_image_is_not_decoded_again(service, monkeypatch):
+    image = Image.new("RGB", (96, 96), (250, 220, 60))
+    seen = []
+
+    def predict_image(img, top_k=5):
+        seen.append(img)
+        return None, [prediction("banana")]
+
+    monkeypatch.setattr(service, "preprocess_image", lambda image_bytes: pytest.fail("decoded twice"))
+    monkeypatch.setattr(service, "_predict_image", predict_image)
+    monkeypatch.setattr(service, "_predict_images", lambda imgs, top_k=5: [(None, [prediction("banana")]) for _ in imgs])
+
+    assert service.classify_food(jpeg(), image=image)["ingredients"][0]["name"] == "banana"
+    assert seen == [image]
+    assert service.extract_ingredients_from_meal(jpeg(), image=image)["success"]
+    assert service.detect_meal_items(jpeg(), image=image)["success"]
+
+
+def test_image_is_decoded_when_not_given(service, monkeypatch):
+    decoded = []
+    original = service.preprocess_image
+    monkeypatch.setattr(service, "preprocess_image", lambda image_bytes: decoded.append(1) or original(image_bytes))
+    monkeypatch.setattr(service, "_predict_image", lambda img, top_k=5: (None, [prediction("banana")]))
+
+    assert service.classify_food(jpeg())["success"]
+    assert decoded == [1]
+
+
+def test_meal_regions_keep_confident_crops_and_merge_duplicates(service, monkeypatch):
+    # Gray plate with a banana-yellow square top left and a tomato-red square bottom right
+    image = Image.new("RGB", (120, 120), (200, 200, 200))
+    image.paste((250, 220, 60), (0, 0, 48, 48))
+    image.paste((220, 40, 30), (72, 72, 120, 120))
+
+    def predict_images(crops, top_k=5):
+        results = []
+        for crop in crops:
+            pixels = np.asarray(crop, dtype=np.int32).reshape(-1, 3)
+            yellow = np.mean((pixels[:, 0] > 230) & (pixels[:, 2] < 100))
+            red = np.mean((pixels[:, 0] > 200) & (pixels[:, 1] < 80))
+            if yellow > 0.5:
+                best = prediction("banana", score=0.31, probability=0.8)
+            elif red > 0.5:
+                best = prediction("tomato", score=0.3, probability=0.7)
+            else:
+                # The plate: a confident softmax over its own top-5, but a weak CLIP match
+                best = prediction("rice", score=0.18, probability=0.9)
+            results.append((None, [best]))
+        return results
+
+    monkeypatch.setattr(service, "_predict_images", predict_images)
+
+    result = service.detect_meal_items(b"", image=image)
+
+    names = [ingredient["name"] for ingredient in result["ingredients"]]
+    assert sorted(names) == ["banana", "tomato"]
+    banana = result["ingredients"][names.index("banana")]
+    assert banana["region"] in ("tile", "proposal")
+    assert banana["box"][2] <= 0.5 and banana["box"][3] <= 0.5
+    assert result["regions_classified"] >= 10
+
+
+def reference_rank(scores, canonical_to_indices, temperature, top_k):
+    """Per-canonical loop: best prompt of each canonical, sort, softmax over the top-k."""
+    pooled = []
+    for name, indices in canonical_to_indices.items():
+        best = max(indices, key=lambda index: scores[index])
+        pooled.append((scores[best], name, best))
+    pooled.sort(key=lambda entry: entry[0], reverse=True)
+    top = pooled[:top_k]
+    logits = np.array([score for score, _, _ in top]) / temperature
+    probabilities = np.exp(logits - logits.max())
+    probabilities /= probabilities.sum()
+    return [(name, score, best, probability) for (score, name, best), probability in zip(top, probabilities)]
+
+
+def test_rank_canonicals_matches_a_per_canonical_loop(service):
+    import torch
+
+    # Uneven synonym counts: the index matrix pads the short rows
+    canonical_to_indices = {"apple": [0, 1, 2, 3], "banana": [4], "rice": [5, 6], "pizza": [7, 8, 9]}
+    service.device = torch.device("cpu")
+    service.text_prompts = [f"prompt {index}" for index in range(10)]
+    service.prompt_metadata = [{"synonym": f"synonym {index}"} for index in range(10)]
+    service.canonical_to_indices = dict(canonical_to_indices)
+    service._build_canonical_index()
+    assert service.canonical_prompt_index.shape == (4, 4)
+
+    generator = torch.Generator().manual_seed(0)
+    similarity = torch.rand(3, 10, generator=generator) * 0.4
+    # Padding must never win, even when every real prompt of a canonical scores below zero
+    similarity[1, 4] = -0.5
+    top_ks = [2, 4, 7]  # the last asks for more candidates than there are canonicals
+
+    ranked = service._rank_canonicals(similarity, top_ks)
+
+    for image, (candidates, top_k) in enumerate(zip(ranked, top_ks)):
+        expected = reference_rank(similarity[image].tolist(), canonical_to_indices, service.temperature, top_k)
+        assert len(candidates) == min(top_k, len(canonical_to_indices))
+        assert [c["canonical_name"] for c in candidates] == [name for name, _, _, _ in expected]
+        assert [c["best_prompt_index"] for c in candidates] == [best for _, _, best, _ in expected]
+        assert [c["score"] for c in candidates] == pytest.approx([score for _, score, _, _ in expected])
+        assert [c["probability"] for c in candidates] == pytest.approx(
+            [probability for _, _, _, probability in expected], abs=1e-5)
+        assert [c["prompt"] for c in candidates] == [f"prompt {best}" for _, _, best, _ in expected]
+        assert [c["matched_synonym"] for c in candidates] == [f"synonym {best}" for _, _, best, _ in expected]
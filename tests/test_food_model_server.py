@@ -0,0 +1,53 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from food_model_server import FoodModelClient, FoodModelServer, ModelServerError, authkey_path
+
+
+class EchoClassifier:
+    def classify_food(self, image_bytes):
+        return {"success": True, "size": len(image_bytes)}
+
+
+def test_client_calls_reach_the_shared_model(tmp_path):
+    address = str(tmp_path / "models.sock")
+    server = FoodModelServer(address, authkey=b"test")
+    server._models["lightweight"] = EchoClassifier()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = FoodModelClient("lightweight", address, authkey=b"test", connect_timeout=5)
+    assert client.classify_food(b"12345") == {"success": True, "size": 5}
+    assert client.status()["requests"] == {"lightweight.classify_food": 1}
+
+    with pytest.raises(ModelServerError):
+        client.call("__init__")
+
+
+def test_server_marks_its_process_for_classifier_thread_sizing(tmp_path, monkeypatch):
+    monkeypatch.delenv("FOOD_MODEL_SERVER_PROCESS", raising=False)
+    FoodModelServer(str(tmp_path / "models.sock"), authkey=b"test")
+
+    # Read by huggingface_food_classifier.default_num_threads on import
+    assert os.environ["FOOD_MODEL_SERVER_PROCESS"] == "1"
+
+
+def test_generated_authkey_is_private_and_shared_through_a_file(tmp_path):
+    address = str(tmp_path / "models.sock")
+    server = FoodModelServer(address, authkey=None)
+    server._models["lightweight"] = EchoClassifier()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = FoodModelClient("lightweight", address, authkey=None, connect_timeout=5)
+    assert client.classify_food(b"123") == {"success": True, "size": 3}
+
+    key_file = Path(authkey_path(address))
+    assert os.stat(key_file).st_mode & 0o777 == 0o600
+    assert server.authkey == key_file.read_bytes() and len(server.authkey) == 64
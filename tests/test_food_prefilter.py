@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from food_prefilter import CascadeStats, LinearHead, calibrate_thresholds
+
+
+def test_linear_head_probabilities():
+    head = LinearHead(labels=["banana", "non_food"], weights=[[2.0], [-2.0]], bias=[0.0, 0.0],
+                      feature_mean=[0.5], feature_scale=[0.5])
+    banana, non_food = head.predict_proba([1.0])
+    assert banana > 0.95 and abs(banana + non_food - 1) < 1e-9
+
+
+def test_thresholds_only_for_precise_labels():
+    labels = ["banana", "non_food", "other"]
+    probabilities = (
+        [[0.9, 0.05, 0.05]] * 6 + [[0.6, 0.2, 0.2]] * 2      # confident bananas, shaky ones
+        + [[0.7, 0.2, 0.1]] * 2                               # "bananas" that are something else
+        + [[0.2, 0.6, 0.2]] * 3 + [[0.2, 0.7, 0.1]] * 3       # non-food, half of it wrong
+        + [[0.1, 0.1, 0.8]] * 6
+    )
+    truth = (["banana"] * 8 + ["other"] * 2 + ["non_food"] * 3 + ["apple"] * 3 + ["other"] * 6)
+
+    thresholds = calibrate_thresholds(probabilities, truth, labels, target_precision=0.95, min_support=5)
+    assert thresholds == {"banana": 0.9}
+
+
+def test_cascade_stats_hit_rates():
+    stats = CascadeStats()
+    stats.record("prefilter_accept", 0.1)
+    stats.record("clip", 200.0)
+    stats.record("clip", 100.0)
+    report = stats.stats()
+    assert report["stages"]["clip"] == {"count": 2, "hit_rate": 0.6667, "average_ms": 150.0}
@@ -0,0 +1,41 @@
+import sys
+import time
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from food_result_cache import CachedClassification, FoodResultCache, content_hash
+
+PIZZA = [{"canonical_name": "pizza", "probability": 0.9, "score": 0.31}]
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = FoodResultCache(max_entries=10, max_distance=4)
+    cache.put(content_hash(b"photo"), CachedClassification(features=None, predictions={5: PIZZA},
+                                                           image_hash=0b1011_0000))
+
+    assert cache.get(content_hash(b"photo")).predictions[5] == PIZZA
+    # A re-shot two bits away reuses the result and is then an exact hit too
+    assert cache.get(content_hash(b"reshot")) is None
+    assert cache.find_similar(content_hash(b"reshot"), 0b1011_0011).predictions[5] == PIZZA
+    assert cache.get(content_hash(b"reshot")) is not None
+    # Too far away is a miss
+    assert cache.find_similar(content_hash(b"other"), 0b0100_1111) is None
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (2, 1, 1)
+
+
+def test_lru_and_ttl_eviction():
+    cache = FoodResultCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, CachedClassification(features=None, predictions={5: PIZZA}))
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+    expired = FoodResultCache(max_entries=2, ttl_seconds=0.01)
+    expired.put("a", CachedClassification(features=None, predictions={5: PIZZA}))
+    time.sleep(0.02)
+    assert expired.get("a") is None
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from huggingface_food_classifier import default_num_threads
+
+
+def test_threads_split_between_workers(monkeypatch):
+    monkeypatch.delenv("FOOD_MODEL_SERVER_PROCESS", raising=False)
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setenv("FOOD_SERVICE_WORKERS", "4")
+
+    assert default_num_threads() == 2
+
+
+def test_model_server_keeps_all_cores(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setenv("FOOD_SERVICE_WORKERS", "4")
+    monkeypatch.setenv("FOOD_MODEL_SERVER_PROCESS", "1")
+
+    assert default_num_threads() is None
@@ -0,0 +1,61 @@
+import colorsys
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from lightweight_food_classifier import LightweightFoodClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LightweightFoodClassifier()
+
+
+def solid(hue, lightness, saturation, size=(48, 48)):
+    """Solid image of an HSL color (hue in degrees, lightness / saturation 0-255)."""
+    rgb = colorsys.hls_to_rgb(hue / 360, lightness / 255, saturation / 255)
+    return Image.new("RGB", size, tuple(round(channel * 255) for channel in rgb))
+
+
+def scores(classifier, image):
+    return {match["food_name"]: match["confidence"] for match in classifier.match_food_by_color(classifier.analyze_color(image))}
+
+
+def test_pale_yellow_is_banana(classifier):
+    matches = scores(classifier, solid(55, 220, 150))
+
+    assert max(matches, key=matches.get) == "banana"
+    assert matches["banana"] == pytest.approx(1.0)
+
+
+def test_red_hue_below_360_wraps_to_red_foods(classifier):
+    matches = scores(classifier, solid(355, 130, 140))
+
+    assert matches["apple"] == pytest.approx(1.0)
+    assert matches["tomato"] == pytest.approx(1.0)
+
+
+def test_gray_plate_is_ignored_next_to_a_colorful_food(classifier):
+    image = solid(0, 200, 0, size=(64, 64))
+    image.paste(solid(55, 220, 150, size=(32, 64)), (0, 0))
+
+    assert scores(classifier, image)["banana"] == pytest.approx(1.0)
+
+
+def test_classify_food_returns_nutrition_for_the_top_match(classifier):
+    buffer = io.BytesIO()
+    solid(55, 220, 150).save(buffer, format="PNG")
+
+    result = classifier.classify_food(buffer.getvalue())
+
+    assert result["success"]
+    assert result["ingredients"][0]["name"] == "Banana"
+    assert result["ingredients"][0]["nutritional_info"]["calories"] == 89.0
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from meal_regions import box_iou, grid_tiles, merge_by_label, non_max_suppression
+
+
+def test_grid_tiles_cover_the_image_with_overlap():
+    tiles = grid_tiles(400, 300, grid=3, overlap=0.25)
+    assert len(tiles) == 9
+    assert tiles[0][:2] == (0, 0)
+    assert tiles[-1][2:] == (400, 300)
+    assert box_iou(tiles[0], tiles[1]) > 0
+
+
+def test_nms_keeps_one_box_per_food():
+    detections = [
+        {"canonical_name": "rice", "probability": 0.9, "box": (0, 0, 100, 100)},
+        {"canonical_name": "rice", "probability": 0.6, "box": (10, 10, 110, 110)},
+        {"canonical_name": "rice", "probability": 0.5, "box": (20, 20, 60, 60)},
+        {"canonical_name": "salmon", "probability": 0.8, "box": (90, 0, 200, 100)},
+        {"canonical_name": "broccoli", "probability": 0.7, "box": (0, 0, 98, 100)},
+    ]
+    items = merge_by_label(non_max_suppression(detections, iou_threshold=0.5, cross_label_iou=0.8))
+    assert [item["canonical_name"] for item in items] == ["rice", "salmon"]
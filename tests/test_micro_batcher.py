@@ -0,0 +1,39 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from micro_batcher import MicroBatcher
+
+
+def test_concurrent_calls_share_batches():
+    batch_sizes = []
+    release = threading.Event()
+
+    def square_all(items):
+        release.wait(1)
+        batch_sizes.append(len(items))
+        return [item * item for item in items]
+
+    batcher = MicroBatcher(square_all, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(n) for n in range(10)]
+    release.set()
+
+    assert [future.result(timeout=5) for future in futures] == [n * n for n in range(10)]
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 10
+    assert batcher.stats()["items"] == 10
+
+
+def test_batch_errors_reach_every_caller():
+    def fail(items):
+        raise ValueError("model unavailable")
+
+    batcher = MicroBatcher(fail, max_batch_size=2, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher(1)
@@ -0,0 +1,91 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from ml_food_classifier import IMAGENET_FOOD_OVERRIDES, MLFoodClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    # The label and nutrition mapping only; no TensorFlow model
+    classifier = MLFoodClassifier.__new__(MLFoodClassifier)
+    classifier.imagenet_index = classifier._load_imagenet_index()
+    classifier.imagenet_classes = [name for _, name in classifier.imagenet_index]
+    class_foods = classifier._map_imagenet_classes()
+    classifier.food_database = classifier._load_food_database(class_foods)
+    classifier.food_keys = list(classifier.food_database)
+    classifier.class_to_food = classifier._build_class_food_index(class_foods)
+    classifier.mapped_classes = np.flatnonzero(classifier.class_to_food >= 0)
+    return classifier
+
+
+def probabilities(classifier, **by_class):
+    vector = np.full(len(classifier.imagenet_classes), 1e-5)
+    for name, probability in by_class.items():
+        vector[classifier.imagenet_classes.index(name)] = probability
+    return vector
+
+
+def test_bundled_labels_map_imagenet_classes_to_foods(classifier):
+    assert len(classifier.imagenet_classes) == 1000
+    assert classifier.imagenet_classes[954] == "banana"
+
+    food_of = {classifier.imagenet_classes[idx]: classifier.food_keys[food]
+               for idx, food in enumerate(classifier.class_to_food) if food >= 0}
+    assert food_of["banana"] == "banana"
+    assert food_of["Granny_Smith"] == "apple"
+    assert food_of["French_loaf"] == food_of["pretzel"] == "bread"
+    assert food_of["bagel"] == "bagel"
+    assert "tench" not in food_of
+
+    # Food synsets matched by name, and the override table
+    assert food_of["cucumber"] == "cucumber"
+    assert food_of["ice_cream"] == "ice_cream"
+    assert food_of["mashed_potato"] == "potato"
+    assert food_of["espresso"] == "coffee"
+    assert food_of["cheeseburger"] == food_of["hotdog"] == "sandwich"
+    assert food_of["corn"] == food_of["ear"] == "corn"
+    # Name matches outside the food synsets, or overridden, are not foods
+    assert not {"prairie_chicken", "sea_cucumber", "coffee_mug", "custard_apple"} & set(food_of)
+
+    # Every food with nutrition data is reachable from some class
+    assert all(food["imagenet_classes"] for food in classifier.food_database.values())
+
+
+def test_food_confidence_sums_its_classes(classifier):
+    result = classifier._match_foods(probabilities(classifier, French_loaf=0.3, pretzel=0.25, banana=0.4))
+
+    assert [match["food_key"] for match in result] == ["bread", "banana"]
+    assert result[0]["confidence"] == pytest.approx(0.55, abs=1e-3)
+    assert result[0]["food_data"]["calories"] > 0
+
+
+def test_unmapped_top_class_falls_back_to_generic_entry(classifier):
+    result = classifier._match_foods(probabilities(classifier, tench=0.9))
+
+    assert result[0]["food_key"] == "tench"
+    assert result[0]["food_data"]["calories"] == 0
+
+
+def test_unreadable_labels_fail_loudly(tmp_path, monkeypatch):
+    path = tmp_path / "labels.json"
+    path.write_text(json.dumps({"0": ["n0", "tench"]}))
+    monkeypatch.setenv("FOOD_ML_IMAGENET_LABELS", str(path))
+
+    with pytest.raises(ValueError):
+        MLFoodClassifier._load_imagenet_index()
+
+
+def test_override_for_unknown_class_fails_loudly(classifier, monkeypatch):
+    monkeypatch.setitem(IMAGENET_FOOD_OVERRIDES, "eating_apple", "apple")
+
+    with pytest.raises(ValueError, match="eating_apple"):
+        classifier._map_imagenet_classes()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+from money_scanner import MoneyScanner
+
+
+def test_reads_locale_formats_and_currency_in_one_pass():
+    tokens = MoneyScanner().scan("1,234.56   1.234,56 €   1\u00a0234,56   $-5.00")
+
+    assert [token.value for token in tokens] == [1234.56, 1234.56, 1234.56, 5.0]
+    assert [token.number_format for token in tokens] == ["us", "eu", "space", "decimal_point"]
+    assert tokens[1].currency == "€" and tokens[1].currency_position == "after"
+    assert tokens[3].currency == "$" and tokens[3].negative
+
+
+def test_skips_dates_times_and_rates():
+    scanner = MoneyScanner()
+
+    tokens = scanner.scan("08/01/2016 12:30  TAX 7%  2.51")
+
+    assert [token.value for token in tokens] == [2.51]
+
+
+def test_price_prefers_currency_then_line_end():
+    scanner = MoneyScanner()
+
+    assert scanner.find_price("2 x $3.49 Milk").value == 3.49
+    assert scanner.find_price("Salt 2  1.99").value == 1.99
+    assert scanner.find_price("salt 2.00 extra") is None
+    assert scanner.parse_number("Qty 2 @ 0.778") == 0.778
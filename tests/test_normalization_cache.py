@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+
+
+def test_repeated_segments_hit_the_cache():
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(max_size=100))
+
+    first = parser.clean_item_name("BANANA CAVENDISH")
+    second = parser.clean_item_name("BANANA CAVENDISH")
+    assert first == second == "Banana Cavendish"
+
+    assert parser.is_likely_food_item("2% MILK GAL") == parser.is_likely_food_item("2% MILK GAL")
+
+    stats = parser.cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_is_bounded():
+    cache = NormalizationCache(max_size=2)
+    for key in ["a", "b", "c"]:
+        cache.get_or_compute("name", key, str.upper)
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_rule_change_invalidates_cache():
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(max_size=100))
+    parser.is_likely_food_item("Mystery Widget")
+    version = parser.rules_version
+
+    parser.FOOD_CATEGORIES.add("widget")
+    assert parser.refresh_rules_version() != version
+    assert parser.cache_stats()["size"] == 0
+
+
+def test_rules_version_does_not_depend_on_hash_seed():
+    code = (
+        "import logging; logging.disable(logging.CRITICAL)\n"
+        "from intelligent_receipt_parser import IntelligentReceiptParser\n"
+        "from normalization_cache import NormalizationCache\n"
+        "print(IntelligentReceiptParser(normalization_cache=NormalizationCache()).rules_version)"
+    )
+    versions = set()
+    for seed in ("1", "2"):
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            cwd=str(ROOT / "ocr-service"), env={**os.environ, "PYTHONHASHSEED": seed},
+        )
+        versions.add(result.stdout.strip())
+
+    assert len(versions) == 1
+
+
+def test_persisted_cache_only_loads_for_same_rules(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = NormalizationCache(max_size=10, rules_version="v1", path=path)
+    cache.get_or_compute("name", "BANANAS 1.29", lambda s: "Bananas")
+    assert cache.save()
+
+    warm = NormalizationCache(max_size=10, rules_version="v1", path=path)
+    assert warm.load() == 1
+    assert warm.get_or_compute("name", "BANANAS 1.29", lambda s: "recomputed") == "Bananas"
+
+    stale = NormalizationCache(max_size=10, rules_version="v2", path=path)
+    assert stale.load() == 0
@@ -0,0 +1,110 @@
+import csv
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+np = pytest.importorskip("numpy")
+
+from nutrition_dataset import (BUNDLED_CSV, RECORD_FIELDS, NutritionDataset, build_dataset, compile_csv,
+                               normalize_key, read_csv)
+
+
+def make_records():
+    return [
+        {'name': 'apple', 'display_name': 'Apple', 'category': 'fruits', 'typical_portion_size': 182,
+         'density': 0.6, 'portion_description': '1 medium apple', 'key_nutrients': ['vitamin C', 'fiber'],
+         'aliases': ['granny_smith'], 'calories': 52, 'protein': 0.3, 'carbs': 14},
+        {'name': 'French Fries', 'display_name': 'French Fries', 'category': 'snacks',
+         'typical_portion_size': 117, 'portion_description': '1 medium serving', 'aliases': 'fries;chips',
+         'calories': 365, 'protein': 3.4, 'carbs': 63},
+        {'name': 'chicken breast', 'calories': 165, 'protein': 31, 'carbs': 0},
+        # Normalizes to an existing key: the first record wins
+        {'name': 'Apple', 'calories': 999},
+    ]
+
+
+def test_normalize_key():
+    assert normalize_key('  Grilled Chicken-Breast ') == 'grilled_chicken_breast'
+    assert normalize_key('french_fries') == 'french_fries'
+
+
+def test_bundled_csv_is_consistent():
+    with open(BUNDLED_CSV, encoding='utf-8', newline='') as handle:
+        header = next(csv.reader(handle))
+    assert header[:len(RECORD_FIELDS)] == ['name', 'display_name', 'category', 'typical_portion_size',
+                                           'density', 'portion_description', 'key_nutrients', 'aliases']
+    assert header[len(RECORD_FIELDS):][:6] == ['calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar']
+
+    nutrients, records = read_csv(BUNDLED_CSV)
+    names = [normalize_key(record['name']) for record in records]
+    assert len(names) == len(set(names))
+    assert {'apple', 'banana', 'chicken', 'rice'} <= set(names)
+    for record in records:
+        assert record['typical_portion_size'] > 0
+        assert record['calories'] >= 0
+        assert not {normalize_key(alias) for alias in record['aliases']} & set(names), record['name']
+
+
+def test_built_dataset_lookups(tmp_path):
+    dataset = NutritionDataset(build_dataset(make_records(), ['calories', 'protein', 'carbs'], str(tmp_path / 'ds')))
+
+    assert len(dataset) == 3
+    assert dataset.rows(['apple', 'French-Fries', 'fries', 'granny smith', 'pear']).tolist()[-1] == -1
+    assert dataset.row('fries') == dataset.row('french_fries') >= 0
+    assert dataset.row('granny_smith') == dataset.row('apple')
+    # Longer than every stored key: must not match a truncated prefix
+    assert dataset.row('chicken_breast_with_a_very_long_name') == -1
+
+    assert dataset.find('Grilled Chicken Breast') == dataset.row('chicken_breast')
+    assert dataset.find('apples') == dataset.row('apple')
+    assert dataset.find('durian') == -1
+
+    record = dataset.record(dataset.row('apple'))
+    assert record['nutrients'] == {'calories': 52.0, 'protein': 0.3, 'carbs': 14.0}
+    assert record['key_nutrients'] == ['vitamin C', 'fiber']
+    assert record['density'] == 0.6
+
+
+def test_food_data_and_matrix(tmp_path):
+    dataset = NutritionDataset(build_dataset(make_records(), ['calories', 'protein', 'carbs'], str(tmp_path / 'ds')))
+
+    food = dataset.food_data('fries')
+    assert food['display_name'] == 'French Fries'
+    assert food['calories'] == 365.0 and food['carbohydrates'] == 63.0
+    assert food['portion_size'] == 100 and food['typical_portion_size'] == 117
+    assert dataset.food_data('chicken_breast')['category'] == 'other'
+    assert dataset.food_data('durian') is None
+
+    matrix = dataset.matrix()
+    rows = matrix.rows(['apple', 'fries', 'durian'])
+    assert rows[-1] == -1
+    totals = matrix.totals(rows[:2], [200.0, 100.0])
+    assert totals[matrix.columns['calories']] == pytest.approx(52 * 2 + 365)
+    with pytest.raises(KeyError):
+        matrix.amounts('durian', 100)
+
+
+def test_compile_csv_caches_by_content(tmp_path):
+    directory = compile_csv(cache_dir=str(tmp_path))
+    assert compile_csv(cache_dir=str(tmp_path)) == directory
+
+    dataset = NutritionDataset(directory)
+    apple = dataset.food_data('apple')
+    assert apple['calories'] == 52.0
+    assert dataset.row('granny_smith') == dataset.row('apple')
+
+
+def test_concurrent_build_keeps_the_published_dataset(tmp_path):
+    directory = str(tmp_path / 'ds')
+    dataset = NutritionDataset(build_dataset(make_records(), ['calories', 'protein', 'carbs'], directory))
+    first = (tmp_path / 'ds' / 'values.npy').stat().st_ino
+
+    # A second worker finishing the same build must not delete files the first one maps
+    assert build_dataset(make_records(), ['calories', 'protein', 'carbs'], directory, replace=False) == directory
+    assert (tmp_path / 'ds' / 'values.npy').stat().st_ino == first
+    assert dataset.food_data('apple')['calories'] == 52.0
+    assert [path.name for path in tmp_path.iterdir()] == ['ds']
@@ -0,0 +1,53 @@
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+np = pytest.importorskip("numpy")
+
+from nutrition_matrix import NutritionMatrix, nutrient_columns
+
+
+@dataclass
+class Food:
+    name: str
+    calories_per_100g: float
+    protein_per_100g: float
+    typical_portion_size: float
+    iron_per_100g: float = 0.0
+
+
+def make_matrix():
+    return NutritionMatrix.from_records([Food('apple', 52, 0.3, 182, 0.1), Food('rice', 130, 2.7, 158, 0.2)])
+
+
+def test_columns_follow_per_100g_fields():
+    assert nutrient_columns(Food) == ['calories', 'protein', 'iron']
+    matrix = make_matrix()
+    assert matrix.index == {'apple': 0, 'rice': 1}
+    assert matrix.portion_sizes.tolist() == [182, 158]
+
+
+def test_meal_totals_are_weights_times_matrix():
+    matrix = make_matrix()
+    rows = matrix.rows(['apple', 'rice', 'apple', 'unknown'])
+    assert rows.tolist() == [0, 1, 0, -1]
+
+    totals = matrix.totals(rows[:3], np.array([100.0, 200.0, 50.0]))
+    assert totals[matrix.columns['calories']] == pytest.approx(52 * 1.5 + 130 * 2)
+    assert matrix.as_dict(matrix.amounts('rice', 50))['calories'] == 65.0
+
+
+def test_group_totals_skip_unknown_foods():
+    matrix = make_matrix()
+    rows = matrix.rows(['apple', 'rice', 'unknown', 'rice'])
+    totals = matrix.group_totals([0, 0, 1, 2], rows, [100, 100, 300, 50], group_count=3)
+
+    assert totals.shape == (3, 3)
+    assert totals[0, matrix.columns['calories']] == pytest.approx(182)
+    assert totals[1].tolist() == [0.0, 0.0, 0.0]
+    assert totals[2, matrix.columns['protein']] == pytest.approx(1.35)
@@ -0,0 +1,25 @@
+import logging
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from benchmark_receipt_parser import compare_to_baseline, run_benchmark
+
+
+def test_benchmark_reports_accuracy_and_throughput():
+    logging.disable(logging.CRITICAL)
+    try:
+        results = run_benchmark(iterations=1, profile=False)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    fields = results['accuracy']['fields']
+    assert set(fields) == {'items', 'total', 'subtotal', 'date', 'merchant_name'}
+    assert fields['items']['recall'] >= 0.6
+    assert fields['total']['recall'] >= 0.7
+    assert results['throughput']['warm_receipts_per_s'] > 0
+
+    # A run compared with itself never regresses
+    assert compare_to_baseline(results, results) == []
@@ -0,0 +1,95 @@
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+
+HIERARCHICAL_RECEIPT = """
+QTY ITEM                                         TOTAL
+  1 Buy One, Get One                              3.99
+    1 Sausage Egg McMuffin
+    1 Sausage Egg McMuffin
+  1 M Iced Coffee                                 1.40
+      NO Liquid Sugar
+Subtotal                                          5.39
+"""
+
+FLAT_RECEIPT = """
+ZUCHINNI GREEN                                    $4.66
+BANANA CAVENDISH                                  $1.32
+LETTUCE ICEBERG                                   $2.49
+                  SUBTOTAL                        $8.47
+                  LOYALTY                        -15.00
+                  TOTAL                           $8.47
+"""
+
+
+def test_layout_prepass_detects_nested_items():
+    parser = IntelligentReceiptParser()
+    assert parser.detect_layout(parser._classify_lines(HIERARCHICAL_RECEIPT)) == "hierarchical"
+
+
+def test_indented_totals_block_is_still_flat():
+    parser = IntelligentReceiptParser()
+    assert parser.detect_layout(parser._classify_lines(FLAT_RECEIPT)) == "flat"
+
+    names = [item["name"] for item in parser.parse_receipt_items(FLAT_RECEIPT)]
+    assert names == ["Zuchinni Green", "Banana Cavendish", "Lettuce Iceberg"]
+
+
+def test_only_chosen_strategy_runs(monkeypatch):
+    parser = IntelligentReceiptParser()
+
+    def fail(lines):
+        raise AssertionError("hierarchical strategy should not run for a flat layout")
+
+    monkeypatch.setattr(parser, "_parse_hierarchical_format", fail)
+    assert parser.parse_receipt_items(FLAT_RECEIPT)
+
+
+def test_bare_numbers_are_not_flat_prices():
+    parser = IntelligentReceiptParser()
+    items = parser.parse_receipt_items("Missoula, MT 59801\nPasta  2  220  440\n")
+    assert [(item["name"], item["price"]) for item in items] == [("Pasta", 440.0)]
+
+
+# Multi-column register rows plus "0 ..." continuation rows and no nesting:
+# the pre-pass guesses flat, but only the hierarchical pass reads every item
+GOOD_FOODS_RECEIPT = """Good Foods
+Market & Cafe
+11/02/2006                   4:25 PM         040597
+
+OSTBARDACRAKG               2  0.36 11 @ 1.20 A  2.40
+ARENEWBUTTCRCH I            1  0.45 P @           0.45
+                            0  0.36 11 @ 3.20 N  1.14
+                            0  0.03 P @           0.03
+OTCESISWEETC I              1  0.45 C @           0.45
+SESTSWEETBRDCRNBLCNL.       1  0.50 P @           0.50
+                            0  0.50 C @           0.50
+                            0  0.00 11 @ N2.00 P 10.00
+Tender Sub (CASH)                                10.00
+TOTAL TENDERED                                   10.00
+CHANGE                                            5.45
+SUBTOTAL                                          4.55"""
+
+
+def test_flat_pass_rejects_zero_quantity_and_nameless_rows():
+    parser = IntelligentReceiptParser()
+    lines = parser._classify_lines(GOOD_FOODS_RECEIPT)
+    assert parser.detect_layout(lines) == "flat"
+
+    flat = parser._parse_flat_format(lines)
+    assert all(item["quantity"] > 0 for item in flat)
+    assert not any(item["name"].startswith("00 11") for item in flat)
+
+
+def test_flat_guess_falls_back_to_hierarchical_when_it_finds_fewer_items():
+    parser = IntelligentReceiptParser()
+    items = {item["name"].split()[0].upper(): item for item in parser.parse_receipt_items(GOOD_FOODS_RECEIPT)}
+
+    assert {"OSTBARDACRAKG", "ARENEWBUTTCRCH", "OTCESISWEETC", "SESTSWEETBRDCRNBLCNL"} <= set(items)
+    assert (items["OSTBARDACRAKG"]["quantity"], items["OSTBARDACRAKG"]["price"]) == (2, 2.40)
+    assert not any(item["quantity"] == 0 for item in items.values())
@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+from receipt_pipeline import (
+    FieldExtractor,
+    GlobalTotalsExtractor,
+    PaymentMethodExtractor,
+    ReceiptPipeline,
+    StoreNameFallbackExtractor,
+    parser_extractors,
+)
+
+
+class CountingExtractor(FieldExtractor):
+    def __init__(self, name, values):
+        self.name = name
+        self.provides = tuple(values)
+        self.values = values
+        self.calls = 0
+
+    def extract(self, context):
+        self.calls += 1
+        return dict(self.values)
+
+
+def test_each_field_is_computed_once():
+    first = CountingExtractor("first", {"total": 12.5, "date": None})
+    second = CountingExtractor("second", {"total": 99.0})
+    third = CountingExtractor("third", {"date": "2024-01-15"})
+    pipeline = ReceiptPipeline([first, second, third])
+
+    context = pipeline.run("TOTAL 12.50")
+
+    assert context.fields == {"total": 12.5, "date": "2024-01-15"}
+    assert context.sources == {"total": "first", "date": "third"}
+    assert (first.calls, second.calls, third.calls) == (1, 0, 1)
+    assert pipeline.stats()["second"]["skipped"] == 1
+
+
+def test_service_fallbacks_fill_only_missing_fields():
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(), template_store=None)
+    pipeline = ReceiptPipeline(parser_extractors(parser) + [
+        StoreNameFallbackExtractor(),
+        GlobalTotalsExtractor(lambda lines: (999.0, None, None)),
+        PaymentMethodExtractor(),
+    ])
+    text = "CITY MART\n01/15/2024\nMilk 1% Gallon    $3.49\nBread    $2.99\nTOTAL    $6.48\nPAID WITH CARD"
+
+    context = parser.parse_context(text, pipeline=pipeline)
+
+    assert context.get("merchant_name") == "CITY MART"
+    assert context.get("date") == "2024-01-15"
+    assert context.get("total") == 6.48
+    assert context.sources["total"] == "totals"
+    assert context.get("payment_method") == "paid with card"
+    assert pipeline.stats()["global_totals"]["calls"] == 0
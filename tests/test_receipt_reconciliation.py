@@ -0,0 +1,73 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+from receipt_reconciliation import ReceiptReconciler
+
+ITEMS = [
+    {"name": "Milk", "price": 3.49},
+    {"name": "Bread", "price": 2.99},
+    {"name": "Eggs", "price": 4.29},
+    {"name": "Apples", "price": 5.99},
+]
+
+
+def test_consistent_receipt_with_discount_is_left_alone():
+    lines = ["SUBTOTAL $16.76", "LOYALTY -5.00", "TAX 8% $0.94", "TOTAL $12.70"]
+
+    report = ReceiptReconciler().reconcile(lines, ITEMS)
+
+    assert report["status"] == "consistent"
+    assert (report["subtotal"], report["discount"], report["total"]) == (16.76, 5.0, 12.7)
+    assert report["repairs"] == []
+
+
+def test_misread_total_and_item_price_are_repaired():
+    reconciler = ReceiptReconciler()
+
+    report = reconciler.reconcile(["SUBTOTAL $16.76", "TAX $1.34", "TOTAL $13.10"], ITEMS)
+    assert report["status"] == "repaired"
+    assert report["total"] == 18.1
+    assert report["repairs"][0]["field"] == "total"
+
+    misread_items = [dict(item) for item in ITEMS]
+    misread_items[0]["price"] = 8.49
+    report = reconciler.reconcile(["SUBTOTAL $16.76", "TAX $1.34", "TOTAL $18.10"], misread_items)
+    assert report["repairs"] == [
+        {"field": "item", "item_index": 0, "original": 8.49, "corrected": 3.49, "reason": "'8' read for '3'"}
+    ]
+
+
+def test_unexplained_totals_are_flagged_not_changed():
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(), template_store=None)
+    text = "CITY MART\nMilk    3.49\nBread   2.99\nSubtotal   6.48\nTotal   9.99"
+
+    result = parser.parse_receipt(text)
+
+    assert result["total"] == 9.99
+    assert result["reconciliation"]["status"] == "inconsistent"
+    assert "total_does_not_match_subtotal" in result["reconciliation"]["flags"]
+
+
+def test_items_that_do_not_sum_to_subtotal_are_not_consistent():
+    report = ReceiptReconciler().reconcile(["SUBTOTAL $20.00", "TAX $1.60", "TOTAL $21.60"], ITEMS)
+
+    assert "items_do_not_sum_to_subtotal" in report["flags"]
+    assert report["items_consistent"] is False
+    assert report["consistent"] is False
+
+
+def test_hybrid_ocr_gate_requires_items_that_add_up():
+    from enhanced_ocr_service import EnhancedOCRService
+
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(), template_store=None)
+    verified = parser.parse_receipt("CITY MART\nMilk    3.49\nBread   2.99\nSubtotal   6.48\nTotal   6.48")
+    wrong_items = parser.parse_receipt("CITY MART\nMilk    3.49\nBread   2.99\nSubtotal   9.48\nTotal   9.48")
+    no_items = parser.parse_receipt("CITY MART\nSubtotal   9.48\nTotal   9.48")
+
+    assert EnhancedOCRService._arithmetic_verified(verified)
+    assert not EnhancedOCRService._arithmetic_verified(wrong_items)
+    assert not EnhancedOCRService._arithmetic_verified(no_items)
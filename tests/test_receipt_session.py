@@ -0,0 +1,49 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+from receipt_session import ReceiptSessionStore
+
+RECEIPT = """CITY MART
+01/15/2024
+
+Milk 1% Gallon    $3.49
+Bread Whole Wheat  $2.99
+Eggs Large Dozen   $4.29
+
+SUBTOTAL          $10.77
+TAX               $0.86
+TOTAL             $11.63
+"""
+
+
+def make_parser():
+    return IntelligentReceiptParser(normalization_cache=NormalizationCache(max_size=1000), template_store=None)
+
+
+def test_line_edit_reparses_only_that_line_and_matches_full_parse():
+    parser = make_parser()
+    session = parser.parse_session(RECEIPT)
+    bread_line = RECEIPT.split("\n").index("Bread Whole Wheat  $2.99")
+
+    session.edit_lines({bread_line: "Bread Whole Wheat  $3.99"})
+
+    assert session.last_update["reparsed_lines"] == 1
+    assert session.context.fields == parser.parse_context(session.text).fields
+    assert [item["price"] for item in session.context.get("items")] == [3.49, 3.99, 4.29]
+    states = {state["line"]: state for state in session.line_states()}
+    assert states[bread_line]["price"] == 3.99
+
+
+def test_store_expires_idle_sessions():
+    parser = make_parser()
+    store = ReceiptSessionStore(max_sessions=2, ttl_seconds=60)
+    first = store.create(parser, RECEIPT)
+    store.create(parser, RECEIPT)
+    store.create(parser, RECEIPT)
+
+    assert store.get(first.session_id) is None
+    assert len(store) == 2
@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from intelligent_receipt_parser import IntelligentReceiptParser
+from normalization_cache import NormalizationCache
+from receipt_templates import ReceiptTemplateStore
+
+RECEIPT = """
+CORNER GROCER
+45 HIGH ST
+
+BANANAS                 1.29
+{item:<24}3.49
+BREAD WHOLE WHEAT       2.99
+
+TOTAL                   {total}
+""".strip()
+
+
+def make_parser(**store_kwargs):
+    store = ReceiptTemplateStore(min_support=2, **store_kwargs)
+    return IntelligentReceiptParser(normalization_cache=NormalizationCache(), template_store=store)
+
+
+def test_template_learned_and_used_for_new_receipt():
+    parser = make_parser(shadow_rate=1.0)
+    parser.parse_receipt(RECEIPT.format(item="MILK 2% GAL", total="7.77"))
+    parser.parse_receipt(RECEIPT.format(item="CHEESE SLICES", total="7.77"))
+
+    result = parser.parse_receipt(RECEIPT.format(item="APPLES GALA", total="7.77"))
+
+    assert result["template_id"] == "corner-grocer-28-1"
+    assert [item["name"] for item in result["items"]] == ["Bananas", "Apples Gala", "Bread Whole Wheat"]
+    assert result["total"] == 7.77
+
+    stats = parser.template_stats()
+    assert stats["hits"] == 1
+    assert stats["templates"][0]["accuracy"] == 1.0
+
+
+def test_unknown_merchant_falls_back_to_general_parser():
+    parser = make_parser()
+    for _ in range(2):
+        parser.parse_receipt(RECEIPT.format(item="MILK 2% GAL", total="7.77"))
+
+    result = parser.parse_receipt(RECEIPT.replace("CORNER GROCER", "OTHER MARKET").format(item="MILK 2% GAL", total="7.77"))
+
+    assert "template_id" not in result
+    assert len(result["items"]) == 3
+
+
+def test_explicit_none_disables_templates():
+    parser = IntelligentReceiptParser(normalization_cache=NormalizationCache(), template_store=None)
+
+    assert parser.template_store is None
+    assert "template_id" not in parser.parse_receipt(RECEIPT.format(item="MILK 2% GAL", total="7.77"))
+
+
+def test_saved_templates_reload_in_a_new_process(tmp_path):
+    path = str(tmp_path / "templates.json")
+    parser = make_parser(path=path)
+    for item in ("MILK 2% GAL", "CHEESE SLICES"):
+        parser.parse_receipt(RECEIPT.format(item=item, total="7.77"))
+    assert parser.template_store.save()
+
+    # A new worker computes its rules version under a different hash seed
+    code = (
+        "import logging; logging.disable(logging.CRITICAL)\n"
+        "from intelligent_receipt_parser import IntelligentReceiptParser\n"
+        "from normalization_cache import NormalizationCache\n"
+        "parser = IntelligentReceiptParser(normalization_cache=NormalizationCache())\n"
+        "print(parser.template_stats()['active_templates'])"
+    )
+    env = {**os.environ, "PYTHONHASHSEED": "7", "RECEIPT_TEMPLATE_PATH": path,
+           "RECEIPT_TEMPLATE_MIN_SUPPORT": "2", "RECEIPT_TEMPLATES_ENABLED": "1"}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=str(ROOT / "ocr-service"), env=env)
+
+    assert result.stdout.strip() == "1"
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"))
+
+import startup_profile
+
+
+def test_lazy_module_imports_on_first_attribute_access():
+    sys.modules.pop("colorsys", None)
+    loaded = []
+    colorsys = startup_profile.LazyModule("colorsys", on_load=lambda module: loaded.append(module.__name__))
+
+    assert "colorsys" not in sys.modules and not colorsys._is_loaded
+
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert colorsys._is_loaded and loaded == ["colorsys"]
+
+
+def test_startup_report_times_phases_and_lists_deferred_modules():
+    startup_profile.lazy_import("wave")
+    startup_profile.mark("test_phase")
+
+    report = startup_profile.startup_report()
+
+    assert "test_phase" in report["phases"]
+    assert "wave" in report["lazy_modules"]
+
+
+def test_wrapped_module_attributes_are_not_shadowed():
+    lazy_json = startup_profile.LazyModule("json")
+
+    # numpy.load, pickle.load, json.load ... belong to the module, not the stand-in
+    assert lazy_json.load is json.load
+    assert lazy_json.loads("[1]") == [1]
+
+
+def test_ocr_service_import_defers_heavy_modules():
+    code = (
+        "import sys, ocr_service, intelligent_receipt_parser; "
+        "print(sorted(m for m in ('requests', 'PIL') if m in sys.modules), "
+        "intelligent_receipt_parser._receipt_parser is None)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.join(os.path.dirname(os.path.dirname(__file__)), "ocr-service"),
+    )
+
+    assert result.stdout.split() == ["[]", "True"]
@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+# Ensure ocr-service is on path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "ocr-service"))
+
+from intelligent_receipt_parser import receipt_parser
+
+INVOICE = """
+Invoice No. 10                           Date: May 11, 2019
+
+Item                  Qty    Rate    Total
+Tandoori Chicken       1    300.00  300.00
+BIRYANI                1    93.93
+Tandoori Roti all food 2    30.00   93.90
+Tandoori Roti                30.00   30.00
+Item Total                      1,036.00
+"""
+
+
+def rows_by_name(items):
+    return {item["name"]: item for item in items}
+
+
+def test_table_rows_have_explicit_qty_rate_amount():
+    items = rows_by_name(receipt_parser.parse_receipt_items(INVOICE))
+
+    assert list(items) == ["Tandoori Chicken", "Biryani", "Tandoori Roti All Food", "Tandoori Roti"]
+
+    chicken = items["Tandoori Chicken"]
+    assert (chicken["quantity"], chicken["rate"], chicken["amount"]) == (1.0, 300.0, 300.0)
+    assert chicken["arithmetic_valid"]
+
+
+def test_missing_cells_are_derived_and_mismatches_flagged():
+    items = rows_by_name(receipt_parser.parse_receipt_items(INVOICE))
+
+    assert items["Biryani"]["amount"] == 93.93
+    assert items["Tandoori Roti"]["quantity"] == 1.0
+
+    roti = items["Tandoori Roti All Food"]
+    assert (roti["quantity"], roti["rate"], roti["price"]) == (2.0, 30.0, 93.90)
+    assert not roti["arithmetic_valid"]
+
+
+def word_boxes(rows):
+    """pytesseract.image_to_data-style dict for rows of (word, left pixel)."""
+    data = {key: [] for key in ("text", "left", "width", "top", "block_num", "par_num", "line_num")}
+    for line, words in enumerate(rows, 1):
+        for word, left in words:
+            data["text"].append(word)
+            data["left"].append(left)
+            data["width"].append(10 * len(word))
+            data["top"].append(20 * line)
+            data["block_num"].append(1)
+            data["par_num"].append(1)
+            data["line_num"].append(line)
+    return data
+
+
+TABLE_BOXES = word_boxes([
+    [("Item", 0), ("Qty", 220), ("Rate", 300), ("Amount", 380)],
+    [("Pasta", 0), ("2", 230), ("220.0", 290), ("440.0", 390)],
+])
+
+
+def test_word_boxes_rebuild_columns():
+    text = receipt_parser.table_parser.table_text_from_word_boxes(TABLE_BOXES)
+
+    items = receipt_parser.parse_receipt_items(text)
+    assert [(i["name"], i["quantity"], i["rate"], i["amount"]) for i in items] == [("Pasta", 2.0, 220.0, 440.0)]
+    # Without a header row the word boxes add nothing over the plain OCR text
+    assert receipt_parser.table_parser.table_text_from_word_boxes(word_boxes([[("Milk", 0), ("3.49", 200)]])) is None
+
+
+def test_tesseract_path_uses_word_box_columns_for_tables(monkeypatch):
+    import enhanced_ocr_service
+    from types import SimpleNamespace
+
+    fake_tesseract = SimpleNamespace(
+        Output=SimpleNamespace(DICT="dict"),
+        # image_to_string collapses the column gaps
+        image_to_string=lambda image, lang, config: "Item Qty Rate Amount\nPasta 2 220.0 440.0",
+        image_to_data=lambda image, lang, config, output_type: dict(TABLE_BOXES, conf=["90"] * 8),
+    )
+    monkeypatch.setattr(enhanced_ocr_service, "pytesseract", fake_tesseract)
+    service = enhanced_ocr_service.EnhancedOCRService()
+    monkeypatch.setattr(service, "_create_tesseract_variants", lambda image: {"original": image})
+
+    result = service._try_tesseract_ocr(SimpleNamespace(mode="RGB"))
+
+    assert result["success"]
+    assert result["text"] == receipt_parser.table_parser.table_text_from_word_boxes(TABLE_BOXES)
+    items = service.advanced_parse_receipt_text(result["text"])["items"]
+    assert [(i["name"], i["quantity"], i["price"]) for i in items] == [("Pasta", 2.0, 440.0)]